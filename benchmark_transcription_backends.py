@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк бэкендов транскрибации: Whisper API против локального faster-whisper.
+Запускать из корня проекта: python benchmark_transcription_backends.py audio1.wav [audio2.mp3 ...]
+
+Каждый файл (или первые --chunks чанков) распознается обоими бэкендами через
+transcribe_audio_raw с их параллелизмом. Печатается время, RTF (время
+распознавания / длительность аудио, <1 - быстрее реального времени) и WER
+относительно эталона. Эталон - файл <имя аудио>.txt рядом с аудио, иначе
+транскрипция Whisper API. Параметры локальной модели - LOCAL_WHISPER_*.
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# Добавляем src в путь
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from benchmark_transcription_upload import word_error_rate
+from transcription import plan_transcription_chunks, probe_duration, transcribe_chunks_parallel
+from transcription_backends import BACKEND_LOCAL, BACKEND_OPENAI, get_transcription_backend
+
+
+def run_backend(backend, file_path: str, chunks) -> dict:
+    """Распознает чанки файла бэкендом (параллельно, как transcribe_audio_raw)."""
+    started = time.perf_counter()
+    texts = transcribe_chunks_parallel(
+        chunks,
+        lambda chunk: backend.transcribe_chunk(file_path, chunk),
+        concurrency=backend.concurrency
+    )
+    return {"seconds": time.perf_counter() - started, "text": " ".join(texts).strip()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение Whisper API и локального faster-whisper")
+    parser.add_argument("files", nargs="+", help="Аудиофайлы для проверки")
+    parser.add_argument("--chunks", type=int, default=0, help="Сколько чанков каждого файла распознавать (0 - весь файл)")
+    parser.add_argument("--chunk-seconds", type=int, default=180, help="Длина чанка (сек)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    backends = {
+        BACKEND_OPENAI: get_transcription_backend(BACKEND_OPENAI),
+        BACKEND_LOCAL: get_transcription_backend(BACKEND_LOCAL),
+    }
+    local = backends[BACKEND_LOCAL]
+    print(
+        f"Локальная модель {local.model_name} ({local.compute_type}, {local.concurrency} x "
+        f"{local.threads_per_worker} потоков) загружена за {time.perf_counter() - started:.1f} с"
+    )
+
+    for file_path in args.files:
+        duration_s = probe_duration(file_path)
+        chunks = plan_transcription_chunks(file_path, duration_s, args.chunk_seconds)
+        if args.chunks:
+            chunks = chunks[:args.chunks]
+        audio_s = sum(chunk.duration_s for chunk in chunks)
+        print(f"\n{file_path}: {len(chunks)} чанков, {audio_s / 60:.1f} мин аудио")
+
+        results = {name: run_backend(backend, file_path, chunks) for name, backend in backends.items()}
+
+        reference_path = Path(file_path).with_suffix(".txt")
+        if reference_path.exists():
+            reference, reference_name = reference_path.read_text(encoding="utf-8"), reference_path.name
+        else:
+            reference, reference_name = results[BACKEND_OPENAI]["text"], BACKEND_OPENAI
+
+        print(f"{'Бэкенд':<10}{'Время, с':>10}{'RTF':>8}{'WER':>8}   (эталон: {reference_name})")
+        for name, result in results.items():
+            print(
+                f"{name:<10}{result['seconds']:>10.1f}{result['seconds'] / (audio_s or 1):>8.3f}"
+                f"{word_error_rate(reference, result['text']):>8.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
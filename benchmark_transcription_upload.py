@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк профилей кодирования чанков для Whisper.
+Запускать из корня проекта: python benchmark_transcription_upload.py audio1.wav [audio2.mp3 ...]
+
+Для каждого файла и профиля (UPLOAD_PROFILES) кодирует первые --chunks чанков,
+отправляет их в Whisper и печатает объем загрузки, время запроса и WER
+относительно эталона. Эталон - файл <имя аудио>.txt рядом с аудио, иначе
+транскрипция профилем legacy (прежний стерео MP3).
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+# Добавляем src в путь
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from openai import OpenAI
+
+from config import OPENAI_API_KEY, OPENAI_BASE_URL, TRANSCRIPTION_MODEL_NAME
+from transcription import UPLOAD_PROFILES, export_chunk, plan_chunks, probe_duration
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """WER: расстояние Левенштейна по словам / число слов эталона."""
+    ref = reference.lower().split()
+    hyp = hypothesis.lower().split()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, start=1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            )
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def run_profile(client: OpenAI, file_path: str, chunks, profile) -> dict:
+    """Кодирует и распознает чанки одним профилем."""
+    upload_bytes, request_s, texts = 0, 0.0, []
+    for chunk in chunks:
+        data = export_chunk(file_path, chunk, profile)
+        upload_bytes += len(data)
+        chunk_io = io.BytesIO(data)
+        chunk_io.name = f"chunk.{profile.extension}"
+
+        started = time.perf_counter()
+        response = client.audio.transcriptions.create(model=TRANSCRIPTION_MODEL_NAME or "whisper-1", file=chunk_io)
+        request_s += time.perf_counter() - started
+        texts.append(response.text)
+    return {"bytes": upload_bytes, "seconds": request_s, "text": " ".join(texts).strip()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение профилей кодирования чанков для Whisper")
+    parser.add_argument("files", nargs="+", help="Аудиофайлы для проверки")
+    parser.add_argument("--chunks", type=int, default=2, help="Сколько чанков каждого файла отправлять")
+    parser.add_argument("--chunk-seconds", type=int, default=180, help="Длина чанка (сек)")
+    args = parser.parse_args()
+
+    client = OpenAI(api_key=OPENAI_API_KEY or "", base_url=OPENAI_BASE_URL)
+
+    for file_path in args.files:
+        chunks = plan_chunks(probe_duration(file_path), args.chunk_seconds)[:args.chunks]
+        print(f"\n{file_path}: {len(chunks)} чанков по {args.chunk_seconds} сек")
+
+        results = {name: run_profile(client, file_path, chunks, profile) for name, profile in UPLOAD_PROFILES.items()}
+
+        reference_path = Path(file_path).with_suffix(".txt")
+        if reference_path.exists():
+            reference, reference_name = reference_path.read_text(encoding="utf-8"), reference_path.name
+        else:
+            reference, reference_name = results["legacy"]["text"], "legacy"
+
+        legacy_bytes = results["legacy"]["bytes"] or 1
+        print(f"{'Профиль':<14}{'Загрузка, КБ':>14}{'Доля':>8}{'Запросы, с':>12}{'WER':>8}   (эталон: {reference_name})")
+        for name, result in results.items():
+            print(
+                f"{name:<14}{result['bytes'] / 1024:>14.1f}{result['bytes'] / legacy_bytes:>8.0%}"
+                f"{result['seconds']:>12.2f}{word_error_rate(reference, result['text']):>8.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Скрипт для генерации кратких описаний отчетов для JSON-контейнера.
+Запускать из корня проекта: python generate_report_summaries.py
+
+Каждое описание один раз сжимается Claude Haiku до длины, которую
+JSONSizeEstimator рекомендует для RELEVANCE_CONTAINER_TOKEN_BUDGET.
+Результат - Description/report_summaries.json, который get_cached_json_container()
+использует вместо обрезки описаний. Краткие описания привязаны к хэшу исходного
+описания: после редактирования описания скрипт нужно запустить снова.
+"""
+
+import json
+import sys
+import os
+
+# Добавляем src в путь
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from analysis import send_msg_to_model
+from config import RELEVANCE_CONTAINER_TOKEN_BUDGET
+from relevance_evaluator import (
+    load_report_descriptions, load_report_summaries, text_hash,
+    CHARS_PER_TOKEN, HAIKU_MODEL, REPORT_SUMMARIES_PATH
+)
+from utils_pkg import JSONSizeEstimator
+
+SUMMARY_PROMPT = """Сократи описание отчета до {max_chars} символов.
+Сохрани назначение отчета, какие темы и вопросы он покрывает и ключевые термины,
+по которым аналитик может искать информацию в этом отчете.
+Верни только сокращенное описание, без пояснений.
+
+ОПИСАНИЕ ОТЧЕТА "{name}":
+{description}"""
+
+
+def main():
+    # Загружаем описания
+    print("Загружаю описания отчетов...")
+    descriptions = load_report_descriptions()
+    print(f"Загружено отчетов: {len(descriptions)}")
+
+    if RELEVANCE_CONTAINER_TOKEN_BUDGET <= 0:
+        print("RELEVANCE_CONTAINER_TOKEN_BUDGET=0 - контейнер использует полные описания, краткие не нужны")
+        return
+
+    estimator = JSONSizeEstimator(chars_per_token=CHARS_PER_TOKEN, token_limit=RELEVANCE_CONTAINER_TOKEN_BUDGET)
+    estimation = estimator.estimate_from_descriptions(descriptions)
+    print(f"Оценка токенов: ~{estimation.estimated_tokens:,} (бюджет {RELEVANCE_CONTAINER_TOKEN_BUDGET:,})")
+    if estimation.within_limit:
+        print("Описания помещаются в бюджет - краткие описания не нужны")
+        return
+
+    max_chars = estimation.recommended_truncation
+    summaries = load_report_summaries()
+
+    for name, description in descriptions.items():
+        source_hash = text_hash(description)
+        existing = summaries.get(name) or {}
+        if existing.get("source_hash") == source_hash and len(existing.get("summary", "")) <= max_chars:
+            print(f"  {name}: актуально")
+            continue
+
+        print(f"  {name}: сжимаю {len(description):,} -> {max_chars:,} символов...")
+        summary = send_msg_to_model(
+            messages=[{"role": "user", "content": SUMMARY_PROMPT.format(
+                max_chars=max_chars, name=name, description=description
+            )}],
+            max_tokens=2000,
+            model=HAIKU_MODEL
+        ).strip()
+        summaries[name] = {"source_hash": source_hash, "summary": summary}
+
+    # Краткие описания удаленных отчетов не сохраняем
+    summaries = {name: summaries[name] for name in descriptions if name in summaries}
+
+    with open(REPORT_SUMMARIES_PATH, 'w', encoding='utf-8') as f:
+        json.dump(summaries, f, ensure_ascii=False, indent=2)
+
+    print(f"\nСоздан: {REPORT_SUMMARIES_PATH}")
+    print(f"Кратких описаний: {len(summaries)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import io
+import os
 import threading
 from asyncio import BoundedSemaphore
 import asyncio
@@ -6,27 +6,48 @@ import aiohttp
 import queue
 import time
 import logging
-from openai import OpenAI
 import anthropic
-from pydub import AudioSegment
 import json
 import re
 from anthropic import RateLimitError
-from typing import Any
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
 from langchain_community.vectorstores import FAISS
 
-from config import OPENAI_API_KEY, OPENAI_BASE_URL, ANTHROPIC_API_KEY, TRANSCRIPTION_MODEL_NAME, REPORT_MODEL_NAME
+from config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, ANTHROPIC_API_KEY, TRANSCRIPTION_MODEL_NAME, REPORT_MODEL_NAME,
+    DEEP_SEARCH_PACK_TOKEN_BUDGET, DEEP_SEARCH_PACK_MAX_BLOCKS,
+    ASSIGN_ROLES_WINDOW_CHARS, ASSIGN_ROLES_CONCURRENCY
+)
 from constants import CLAUDE_ERROR_MESSAGE
 from db_handler.db import fetch_prompt_by_name
 from utils import count_tokens
-
-def analyze_methodology(text: str, prompt_list: list[tuple[str, int]]) -> str | None:
+from llm_clients import get_anthropic_client, get_async_anthropic_client
+from transcription import (
+    transcribe_chunks_parallel, probe_duration, plan_transcription_chunks, AudioChunk, DEFAULT_CHUNK_LENGTH_MS
+)
+from transcription_backends import TranscriptionBackend, get_transcription_backend
+from transcription_jobs import transcribe_chunks_resumable
+from role_windows import assign_roles_windowed
+from llm_cache import get_llm_cache, CACHE_SITE_CLASSIFY_QUERY, CACHE_SITE_CLASSIFY_REPORT_TYPE
+from request_context import RequestContext, RequestCancelledError, get_current_request_context
+from llm_scheduler import (
+    get_llm_scheduler, LANE_INTERACTIVE, LANE_ROUTER, LANE_DEEP_SEARCH, LANE_BATCH,
+    KEY_TOKEN_LIMITS_PER_MIN, KEY_REQUEST_LIMITS_PER_MIN, SchedulerMisuseError
+)
+
+def analyze_methodology(
+    text: str,
+    prompt_list: list[tuple[str, int]],
+    api_key: str | None = ANTHROPIC_API_KEY
+) -> str | None:
     """
     Последовательно отправляет промпты из списка в модель.
     Если в списке несколько элементов, то ответ от предыдущего промпта
     передается как вход для следующего.
 
     :param prompt_list: Список кортежей вида (prompt, order)
+    :param api_key: Ключ Anthropic из пула (параллельные проходы - разные ключи)
     :return: Финальный ответ модели после обработки всех промптов
     """
     current_response = None
@@ -46,7 +67,7 @@ def analyze_methodology(text: str, prompt_list: list[tuple[str, int]]) -> str |
                     ]
                 }
             ]
-            current_response = send_msg_to_model(messages=messages)
+            current_response = send_msg_to_model(messages=messages, api_key=api_key or ANTHROPIC_API_KEY, lane=LANE_BATCH)
         else:
             combined_prompt = f"{prompt}\n\nТекст:{current_response}"
             messages = [
@@ -60,7 +81,7 @@ def analyze_methodology(text: str, prompt_list: list[tuple[str, int]]) -> str |
                     ]
                 }
             ]
-            current_response = send_msg_to_model(messages=messages)
+            current_response = send_msg_to_model(messages=messages, api_key=api_key or ANTHROPIC_API_KEY, lane=LANE_BATCH)
     return current_response if current_response != CLAUDE_ERROR_MESSAGE else None
 
 def transcribe_audio_raw(
@@ -68,70 +89,71 @@ def transcribe_audio_raw(
     model_name: str | None = TRANSCRIPTION_MODEL_NAME,
     api_key: str | None = OPENAI_API_KEY,
     base_url: str | None = OPENAI_BASE_URL,
-    chunk_length_ms: int =3 * 60_000,  # 3 минуты
+    chunk_length_ms: int = DEFAULT_CHUNK_LENGTH_MS,  # 3 минуты
+    concurrency: int | None = None,
+    upload_profile: str | None = None,
+    job_id: str | None = None,
+    chat_id: int | None = None,
+    backend: TranscriptionBackend | None = None
 ) -> str:
     """
-    Разбивает аудиофайл на чанки по chunk_length_ms, конвертирует каждый в MP3, отправляет в OpenAI Whisper,
-    возвращает объединённый текст.
+    Разбивает аудиофайл на чанки ~chunk_length_ms (границы в паузах речи), распознает каждый
+    бэкендом backend (None - TRANSCRIPTION_BACKEND: Whisper API с параметрами model_name/api_key/
+    base_url/upload_profile или локальный faster-whisper), возвращает объединённый текст.
+
+    Чанки экспортируются и распознаются параллельно (до concurrency одновременно,
+    None - сколько допускает бэкенд), тексты собираются в исходном порядке.
+    Упавший чанк повторяется отдельно.
+    Файл целиком в память не декодируется: каждый чанк вырезает ffmpeg.
+    С job_id результаты чанков сохраняются в чекпоинт задачи: повторный вызов
+    после сбоя распознает только оставшиеся чанки.
+
+    Raises:
+        AudioDurationError: ffprobe не определил длительность записи
+        TranscriptionError: Часть чанков не распознана после всех повторов
+        PermissionDeniedError/AuthenticationError/BadRequestError: Whisper недоступен или отклонил запрос
     """
 
-    try:
-        # Загружаем исходное аудио (любого поддерживаемого формата)
-        sound = AudioSegment.from_file(file_path)
-        duration_ms = len(sound)
-        out_texts = []
-
-        client = OpenAI(api_key=api_key or "", base_url=base_url)
-
-        start_ms = 0
-        end_ms = chunk_length_ms
-
-        while start_ms < duration_ms:
-            chunk = sound[start_ms:end_ms]
-            start_ms = end_ms
-            end_ms += chunk_length_ms
-
-            # Конвертируем чанк в MP3
-            chunk_io = io.BytesIO()
-            chunk.export(chunk_io, format="mp3")
-            chunk_io.seek(0)
-            chunk_io.name = "chunk.mp3"
-
-            try:
-                # Отправляем MP3 на транскрипцию
-                response = client.audio.transcriptions.create(
-                    model=model_name or "whisper-1",
-                    file=chunk_io
-                )
-                text_part = response.text
-            except Exception as e:
-                logging.error(f"Ошибка транскрибирования чанка: {e}")
-                text_part = ""
+    # Длительность из метаданных: файл (до 2 ГБ) не декодируется целиком
+    duration_s = probe_duration(file_path)
 
-            out_texts.append(text_part)
+    if backend is None:
+        backend = get_transcription_backend(
+            model_name=model_name, api_key=api_key, base_url=base_url, upload_profile=upload_profile
+        )
+    concurrency = concurrency or backend.concurrency
+    chunks = plan_transcription_chunks(file_path, duration_s, chunk_length_ms / 1000)
 
-        return " ".join(out_texts).strip()
+    def transcribe_chunk(chunk: AudioChunk) -> str:
+        return backend.transcribe_chunk(file_path, chunk)
 
-    except Exception as e:
-        logging.error(f"Ошибка при обработке аудио: {e}")
-        return ""
+    if job_id:
+        out_texts = transcribe_chunks_resumable(
+            job_id, chunks, transcribe_chunk,
+            chat_id=chat_id, file_name=os.path.basename(file_path), concurrency=concurrency
+        )
+    else:
+        out_texts = transcribe_chunks_parallel(chunks, transcribe_chunk, concurrency=concurrency)
+    return " ".join(out_texts).strip()
 
-def transcribe_audio(path_: str) -> str:
-    return transcribe_audio_raw(path_)
+def transcribe_audio(path_: str, job_id: str | None = None, chat_id: int | None = None) -> str:
+    return transcribe_audio_raw(path_, job_id=job_id, chat_id=chat_id)
 
 def aggregate_citations(text: str, citations: str, aggregation_prompt: str):
     try:
         citations_text = "\n\n".join(citations)
-        aggregation_result = send_msg_to_model(system=aggregation_prompt, messages=[{"role": "user", "content": f"Вопрос пользователя: {text}\n\nЦитаты:\n{citations_text}"}])
+        aggregation_result = send_msg_to_model(system=aggregation_prompt, messages=[{"role": "user", "content": f"Вопрос пользователя: {text}\n\nЦитаты:\n{citations_text}"}], lane=LANE_DEEP_SEARCH)
         aggregation_result = aggregation_result.strip()
         return aggregation_result
+    except RequestCancelledError:
+        raise
     except Exception as e:
         logging.error(f"Ошибка при агрегации цитат: {str(e)}")
         return "Произошла ошибка при агрегации цитат."
 
 def extract_from_chunk(text: str, chunk: str, extract_prompt: str) -> str:
     try:
-        extract_result = send_msg_to_model(system=extract_prompt, messages=[{"role": "user", "content": f"Документ:\n{chunk}\n\n{text}"}])
+        extract_result = send_msg_to_model(system=extract_prompt, messages=[{"role": "user", "content": f"Документ:\n{chunk}\n\n{text}"}], lane=LANE_DEEP_SEARCH)
         logging.info(f"Результат извлечения: {extract_result}")
         extract_result = extract_result.strip()
         return extract_result
@@ -140,12 +162,13 @@ def extract_from_chunk(text: str, chunk: str, extract_prompt: str) -> str:
         logging.error(f"Ошибка при извлечении из чанка: {str(e)}")
         return "##not_found##"
 
-def generate_db_answer(query: str,
-                       db_index: FAISS, # векторная база знаний
-                       k: int=50,      # используемое к-во чанков
-                       verbose: bool=True, # выводить ли на экран выбранные чанки
-                       model: str | None=REPORT_MODEL_NAME
-                       ):
+def _build_db_answer_request(
+    query: str,
+    db_index: FAISS,
+    k: int = 50,
+    verbose: bool = True
+) -> tuple[str, list[dict[str, Any]]]:
+    """Подбирает релевантные чанки и формирует (system, messages) для ответа по БД."""
     system_prompt = """Перед тобой отчеты из бд. Это малая часть отчетов, которые подобраны при помощи поиска по релевантности
     из большого набора отчетов. Пользователем задан вопрос. Тебе нужно как можно
     более четко и понятно ответить на данный вопрос. Если в данных тебе отчетах
@@ -181,11 +204,108 @@ def generate_db_answer(query: str,
         logging.info("-"*100)
 
     messages = [{"role": "user", "content": f'Вопрос пользователя: {query}'}]
+    system = f'{system_prompt} Вот наиболее релевантные отчеты из бд: \n{message_content}'
+    return system, messages
+
+
+def generate_db_answer(query: str,
+                       db_index: FAISS, # векторная база знаний
+                       k: int=50,      # используемое к-во чанков
+                       verbose: bool=True, # выводить ли на экран выбранные чанки
+                       model: str | None=REPORT_MODEL_NAME
+                       ):
+    system, messages = _build_db_answer_request(query, db_index, k=k, verbose=verbose)
 
     # Используется актуальная модель Claude Sonnet 4.5 (fallback если model/REPORT_MODEL_NAME не заданы)
-    response = send_msg_to_model(messages=messages, model=model or REPORT_MODEL_NAME or "claude-haiku-4-5-20251001", system=f'{system_prompt} Вот наиболее релевантные отчеты из бд: \n{message_content}')
+    response = send_msg_to_model(messages=messages, model=model or REPORT_MODEL_NAME or "claude-haiku-4-5-20251001", system=system)
     return response
 
+
+StreamTextCallback = Callable[[str], Awaitable[None]]
+
+# Пометка для ответа, поток которого оборвался после начала генерации
+STREAM_INTERRUPTED_NOTE = "\n\n_(ответ прерван из-за ошибки API)_"
+
+
+async def stream_db_answer(
+    query: str,
+    db_index: FAISS,
+    on_text: StreamTextCallback,
+    k: int = 50,
+    verbose: bool = True,
+    model: str | None = REPORT_MODEL_NAME,
+    max_tokens: int = 20000,
+    request_context: RequestContext | None = None
+) -> str:
+    """
+    Ответ по БД с потоковой выдачей (SSE через Anthropic SDK).
+
+    Поиск чанков выполняется в отдельном потоке, затем ответ модели читается
+    потоком: on_text вызывается с накопленным текстом после каждого фрагмента
+    (частоту обновления сообщения ограничивает вызывающая сторона).
+
+    Если поток не удалось начать из-за rate limit, ответ запрашивается
+    обычным send_msg_to_model (с его backoff).
+
+    Returns:
+        str: Полный текст ответа (или CLAUDE_ERROR_MESSAGE при ошибке до первого фрагмента)
+
+    Raises:
+        RequestCancelledError: Запрос отменен пользователем или истек дедлайн
+    """
+    ctx = request_context or get_current_request_context()
+    model = model or REPORT_MODEL_NAME or "claude-haiku-4-5-20251001"
+
+    system, messages = await asyncio.to_thread(
+        _build_db_answer_request, query, db_index, k=k, verbose=verbose
+    )
+    if ctx is not None:
+        ctx.check()
+
+    client = get_async_anthropic_client(ANTHROPIC_API_KEY)
+    model_args = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "temperature": 0.1,
+        "system": system,
+        "messages": messages
+    }
+    if ctx is not None and ctx.deadline is not None:
+        model_args["timeout"] = ctx.remaining()
+
+    text = ""
+    try:
+        async with get_llm_scheduler().slot_async(
+            LANE_INTERACTIVE, ANTHROPIC_API_KEY, _estimate_request_tokens(messages, system), request_context=ctx
+        ):
+            async with client.messages.stream(**model_args) as stream:
+                async for delta in stream.text_stream:
+                    if ctx is not None:
+                        ctx.check()
+                    text += delta
+                    try:
+                        await on_text(text)
+                    except Exception as e:
+                        # Ошибка отображения не должна прерывать генерацию ответа
+                        logging.warning(f"[Stream] Ошибка on_text: {e}")
+        return text
+    except RequestCancelledError:
+        raise
+    except RateLimitError as e:
+        if text:
+            logging.warning(f"[Stream] Rate limit после начала ответа, возвращаем частичный ответ: {e}")
+            return text + STREAM_INTERRUPTED_NOTE
+        logging.warning(f"[Stream] Rate limit до начала ответа, повтор без стриминга: {e}")
+        return await asyncio.to_thread(
+            send_msg_to_model, messages=messages, system=system, model=model,
+            max_tokens=max_tokens, request_context=ctx
+        )
+    except Exception as e:
+        if ctx is not None:
+            ctx.check()
+        logging.exception(f"[Stream] Ошибка потокового ответа: {e}")
+        return text + STREAM_INTERRUPTED_NOTE if text else CLAUDE_ERROR_MESSAGE
+
 async def send_msg_to_model_async(
     session: aiohttp.ClientSession,
     messages: list[dict[str, Any]],
@@ -194,8 +314,21 @@ async def send_msg_to_model_async(
     api_key: str,
     err: str = CLAUDE_ERROR_MESSAGE,
     max_tokens: int = 20000,
-    max_retries: int = 5
+    max_retries: int = 5,
+    request_context: RequestContext | None = None,
+    lane: int = LANE_DEEP_SEARCH
 ):
+    """
+    Асинхронный запрос к Claude API через aiohttp.
+
+    request_context (по умолчанию - контекст текущего запроса) ограничивает
+    таймаут каждой попытки оставшимся временем и прерывает backoff при отмене.
+    Каждая попытка проходит через глобальный LLM-планировщик в полосе lane.
+
+    Raises:
+        RequestCancelledError: Запрос отменен пользователем или истек дедлайн
+    """
+    ctx = request_context or get_current_request_context()
     url = "https://api.anthropic.com/v1/messages"
     headers = {
         "x-api-key": api_key,
@@ -210,87 +343,337 @@ async def send_msg_to_model_async(
         "messages": messages
     }
 
+    async def _sleep(seconds: float):
+        if ctx is not None:
+            await ctx.asleep(seconds)
+        else:
+            await asyncio.sleep(seconds)
+
+    scheduler = get_llm_scheduler()
+    tokens = _estimate_request_tokens(messages, system)
+
     backoff = 1
     for _ in range(1, max_retries + 1):
+        request_kwargs = {}
+        if ctx is not None:
+            ctx.check()
         try:
-            async with session.post(url, headers=headers, json=data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result["content"][0]["text"]
-                elif response.status in [429, 529]:
-                    logging.warning(f"[{err}] Получен статус {response.status}, ждём {backoff}s перед повтором...")
-                    await asyncio.sleep(backoff)
-                    backoff *= 2
-                else:
+            async with scheduler.slot_async(lane, api_key, tokens, request_context=ctx):
+                if ctx is not None and ctx.deadline is not None:
+                    request_kwargs["timeout"] = aiohttp.ClientTimeout(total=ctx.remaining())
+                async with session.post(url, headers=headers, json=data, **request_kwargs) as response:
+                    if response.status == 200:
+                        result = await response.json()
+                        return result["content"][0]["text"]
+                    status = response.status
                     text = await response.text()
-                    logging.error(f"[{err}] Ошибка {response.status}: {text}")
-                    return f"[ERROR] {response.status}: {text}"
+            # Backoff вне слота планировщика - не занимаем слот во время ожидания
+            if status in [429, 529]:
+                logging.warning(f"[{err}] Получен статус {status}, ждём {backoff}s перед повтором...")
+                await _sleep(backoff)
+                backoff *= 2
+            else:
+                logging.error(f"[{err}] Ошибка {status}: {text}")
+                return f"[ERROR] {status}: {text}"
+        except RequestCancelledError:
+            raise
         except Exception as e:
+            if ctx is not None:
+                ctx.check()
             logging.exception(f"[{err}] Исключение при запросе: {e}")
-            await asyncio.sleep(backoff)
+            await _sleep(backoff)
             backoff *= 2
 
     return f"[ERROR] Превышено число попыток ({max_retries})"
 
 
+def _estimate_request_tokens(messages: list[dict[str, Any]], system: str | None = None) -> int:
+    """Оценка входных токенов запроса для учета лимитов ключа в LLM-планировщике."""
+    parts = [system or ""]
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, list):
+            parts.extend(block.get("text", "") for block in content if isinstance(block, dict))
+        else:
+            parts.append(str(content))
+    return count_tokens("\n".join(parts))
+
+
 def _calculate_rate_limits():
     """Вычисляет лимиты скорости для токенов и запросов."""
-    token_limits_per_min = [80000, 20000, 20000, 20000, 20000, 20000, 20000]
-    req_limits_per_min =   [2000,    50,    50,    50,    50,    50,    50]
-
-    token_rates = [tl / 60.0 for tl in token_limits_per_min]
-    req_rates = [rl / 60.0 for rl in req_limits_per_min]
+    token_rates = [tl / 60.0 for tl in KEY_TOKEN_LIMITS_PER_MIN]
+    req_rates = [rl / 60.0 for rl in KEY_REQUEST_LIMITS_PER_MIN]
 
     return token_rates, req_rates
 
-def _calculate_delay(tokens: int, token_rate: float, req_rate: float) -> float:
-    """Вычисляет задержку на основе токенов и лимитов скорости."""
-    req_delay = 1.0 / req_rate if req_rate > 0 else float("inf")
-    token_delay = tokens / token_rate if token_rate > 0 else float("inf")
-    return max(token_delay, req_delay)
+DEEP_SEARCH_NOT_FOUND = "##not_found##"
+
+
+def is_citation(result: str | None) -> bool:
+    """Проверяет, что ответ модели по чанку содержит цитату (не пусто, не ##not_found##, не ошибка)."""
+    return bool(result) and result != DEEP_SEARCH_NOT_FOUND and not result.startswith("[ERROR]")
+
+
+@dataclass
+class DeepSearchProgress:
+    """
+    Прогресс глубокого исследования (извлечение цитат по чанкам).
+
+    Attributes:
+        total: Общее количество чанков
+        done: Количество обработанных чанков
+        citations: Количество найденных цитат
+        eta_seconds: Оценка оставшегося времени в секундах
+        pending_tokens: Суммарные токены еще не обработанных чанков
+        token_rate: Суммарный лимит токенов/сек по всем ключам
+        req_rate: Суммарный лимит запросов/сек по всем ключам
+        started_at: Время старта (time.monotonic())
+        results: Ссылка на список результатов по чанкам (заполняется по мере обработки)
+    """
+    total: int
+    done: int = 0
+    citations: int = 0
+    eta_seconds: float = 0.0
+    pending_tokens: int = 0
+    token_rate: float = 0.0
+    req_rate: float = 0.0
+    started_at: float = field(default_factory=time.monotonic)
+    results: list[str | None] = field(default_factory=list)
+
+    def estimate_eta(self) -> float:
+        """
+        Оценивает оставшееся время.
+
+        Нижняя граница берется из rate limiter (оставшиеся токены и запросы
+        при суммарных лимитах всех ключей), после первых ответов - уточняется
+        по фактической скорости обработки.
+        """
+        remaining = self.total - self.done
+        if remaining <= 0:
+            return 0.0
+
+        limiter_eta = max(
+            self.pending_tokens / self.token_rate if self.token_rate > 0 else 0.0,
+            remaining / self.req_rate if self.req_rate > 0 else 0.0
+        )
+
+        if self.done == 0:
+            return limiter_eta
+
+        observed_eta = (time.monotonic() - self.started_at) / self.done * remaining
+        return max(limiter_eta, observed_eta)
+
+    def mark_done(self, result: str | None, tokens: int) -> None:
+        """Учитывает обработанный чанк и пересчитывает ETA."""
+        self.done += 1
+        if is_citation(result):
+            self.citations += 1
+        self.pending_tokens = max(0, self.pending_tokens - tokens)
+        self.eta_seconds = self.estimate_eta()
+
+    def partial_citations(self) -> list[str]:
+        """Возвращает цитаты, найденные к текущему моменту (в порядке чанков)."""
+        return [r for r in self.results if is_citation(r)]
+
+
+DeepSearchProgressCallback = Callable[[DeepSearchProgress], Awaitable[None]]
+
+# Инструкция для упакованных запросов извлечения (добавляется к prompt_extract)
+PACKED_EXTRACT_INSTRUCTIONS = """
+
+В сообщении несколько документов, каждый начинается с заголовка "Документ N:".
+Обработай каждый документ независимо по инструкциям выше и верни ТОЛЬКО JSON без пояснений:
+{"results": [{"document": 1, "result": "<цитаты из документа или ##not_found##>"}]}
+В массиве results должен быть ровно один элемент для каждого документа."""
+
+
+def pack_chunks(chunk_tokens: list[int], token_budget: int, max_blocks: int) -> list[list[int]]:
+    """
+    Упаковывает блоки транскрибаций в запросы извлечения (first-fit decreasing).
+
+    Блоки больше token_budget отправляются отдельным запросом. При
+    token_budget <= 0 или max_blocks <= 1 упаковка отключена.
+
+    Args:
+        chunk_tokens: Размер каждого блока в токенах
+        token_budget: Максимум токенов документов в одном запросе
+        max_blocks: Максимум блоков в одном запросе
+
+    Returns:
+        list[list[int]]: Пакеты индексов блоков (по возрастанию), упорядоченные по первому блоку
+    """
+    if token_budget <= 0 or max_blocks <= 1:
+        return [[idx] for idx in range(len(chunk_tokens))]
+
+    packs: list[list[int]] = []
+    loads: list[int] = []
+    for idx in sorted(range(len(chunk_tokens)), key=lambda i: chunk_tokens[i], reverse=True):
+        tokens = chunk_tokens[idx]
+        for pack_idx, load in enumerate(loads):
+            if load + tokens <= token_budget and len(packs[pack_idx]) < max_blocks:
+                packs[pack_idx].append(idx)
+                loads[pack_idx] += tokens
+                break
+        else:
+            packs.append([idx])
+            loads.append(tokens)
+
+    packs = [sorted(pack) for pack in packs]
+    packs.sort(key=lambda pack: pack[0])
+    return packs
+
+
+def _build_packed_content(chunks: list[str], indices: list[int], text: str) -> str:
+    """Формирует сообщение упакованного запроса: пронумерованные документы и вопрос."""
+    documents = "\n\n".join(
+        f"Документ {number}:\n{chunks[idx]}" for number, idx in enumerate(indices, start=1)
+    )
+    return f"{documents}\n\n{text}"
+
+
+def parse_packed_extraction(response: str | None, count: int) -> dict[int, str]:
+    """
+    Разбирает JSON-ответ упакованного запроса извлечения.
+
+    Args:
+        response: Ответ модели
+        count: Количество документов в запросе
+
+    Returns:
+        dict[int, str]: Позиция документа в пакете (с 0) -> результат.
+                        Пустой dict, если ответ не удалось разобрать.
+    """
+    if not response:
+        return {}
+
+    match = re.search(r"\{.*\}", response, re.DOTALL)
+    if not match:
+        return {}
+
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+
+    items = data.get("results") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return {}
+
+    parsed: dict[int, str] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        number = item.get("document")
+        result = item.get("result")
+        if isinstance(number, int) and 1 <= number <= count and isinstance(result, str):
+            parsed[number - 1] = result.strip() or DEEP_SEARCH_NOT_FOUND
+    return parsed
+
 
 async def _process_single_chunk_async(
-    q: asyncio.Queue[tuple[int, str]],
+    q: asyncio.Queue[list[int]],
+    chunks: list[str],
+    chunk_tokens: list[int],
     text: str,
     extract_prompt: str,
     model_idx: int,
     api_key: str,
-    token_rate: float,
-    req_rate: float,
     model_semaphore: BoundedSemaphore,
     session: aiohttp.ClientSession,
-    results: list[str | None]
+    results: list[str | None],
+    progress: DeepSearchProgress | None = None,
+    progress_callback: DeepSearchProgressCallback | None = None,
+    request_context: RequestContext | None = None
 ):
-    """Обрабатывает один чанк асинхронно."""
+    """
+    Обрабатывает пакеты чанков асинхронно. При наличии progress_callback сообщает о прогрессе.
+
+    Пакет из одного чанка отправляется как обычный запрос извлечения. Пакет из
+    нескольких чанков отправляется одним запросом с PACKED_EXTRACT_INSTRUCTIONS;
+    чанки, для которых модель не вернула результат в JSON, возвращаются в
+    очередь поодиночке.
+
+    При отмене/истечении request_context воркер опустошает очередь
+    (чтобы q.join() завершился) и прекращает работу.
+    """
     while True:
         try:
-            idx, chunk = q.get_nowait()
+            pack = q.get_nowait()
         except asyncio.QueueEmpty:
             break
 
-        user_content = f"Документ:\n{chunk}\n\n{text}"
-        tokens = count_tokens(user_content)
-        delay = _calculate_delay(tokens, token_rate, req_rate)
+        if request_context is not None and (request_context.cancelled or request_context.expired):
+            q.task_done()
+            _drain_queue(q)
+            break
 
-        logging.info(
-            f"[Model#{model_idx}] Чанк #{idx}: {tokens} токенов → "
-            f"delay={delay:.1f}s"
-        )
+        if len(pack) == 1:
+            user_content = f"Документ:\n{chunks[pack[0]]}\n\n{text}"
+            system = extract_prompt
+            label = f"Чанк #{pack[0]}"
+        else:
+            user_content = _build_packed_content(chunks, pack, text)
+            system = extract_prompt + PACKED_EXTRACT_INSTRUCTIONS
+            label = f"Чанки #{pack[0]}..#{pack[-1]} ({len(pack)} шт.)"
 
-        async with model_semaphore:
-            await asyncio.sleep(delay)
+        logging.info(f"[Model#{model_idx}] {label}: {count_tokens(user_content)} токенов")
 
-        messages = [{"role": "user", "content": user_content}]
-        response = await send_msg_to_model_async(
-            session=session,
-            messages=messages,
-            system=extract_prompt,
-            model=REPORT_MODEL_NAME or "claude-haiku-4-5-20251001",  # Исправлено: актуальная модель Claude Sonnet 4.5
-            api_key=api_key,
-            err=f"Ошибка при извлечении чанка #{idx}"
-        )
+        try:
+            # Темп запросов по ключу задает общий LLM-планировщик (лимиты ключа
+            # учитываются вместе с остальными вызовами, а не только этим воркером)
+            async with model_semaphore:
+                messages = [{"role": "user", "content": user_content}]
+                response = await send_msg_to_model_async(
+                    session=session,
+                    messages=messages,
+                    system=system,
+                    model=REPORT_MODEL_NAME or "claude-haiku-4-5-20251001",  # Исправлено: актуальная модель Claude Sonnet 4.5
+                    api_key=api_key,
+                    err=f"Ошибка при извлечении: {label}",
+                    request_context=request_context,
+                    lane=LANE_DEEP_SEARCH
+                )
+        except RequestCancelledError:
+            logging.info(f"[Model#{model_idx}] {label}: запрос отменен, воркер остановлен")
+            q.task_done()
+            _drain_queue(q)
+            break
+
+        if len(pack) == 1 or (response or "").startswith("[ERROR]"):
+            resolved = {idx: response for idx in pack}
+        else:
+            parsed = parse_packed_extraction(response, len(pack))
+            resolved = {pack[pos]: result for pos, result in parsed.items()}
+            missing = [idx for idx in pack if idx not in resolved]
+            if missing:
+                logging.warning(
+                    f"[Model#{model_idx}] {label}: нет результата для {len(missing)} чанков, "
+                    f"повтор поодиночке"
+                )
+                for idx in missing:
+                    q.put_nowait([idx])
+
+        for idx, result in resolved.items():
+            results[idx] = result
+            if progress is not None:
+                progress.mark_done(result, chunk_tokens[idx])
+
+        if progress is not None and progress_callback is not None and resolved:
+            try:
+                await progress_callback(progress)
+            except Exception as e:
+                # Ошибка отображения прогресса не должна прерывать извлечение
+                logging.warning(f"[Model#{model_idx}] Ошибка progress_callback: {e}")
 
-        results[idx] = response
+        q.task_done()
+
+def _drain_queue(q: asyncio.Queue) -> None:
+    """Снимает оставшиеся элементы очереди, чтобы q.join() не зависал после отмены."""
+    while True:
+        try:
+            q.get_nowait()
+        except asyncio.QueueEmpty:
+            break
         q.task_done()
 
 async def extract_from_chunk_parallel_async(
@@ -298,26 +681,64 @@ async def extract_from_chunk_parallel_async(
     chunks: list[str],
     extract_prompt: str,
     api_keys: list[str],
-    session: aiohttp.ClientSession
+    session: aiohttp.ClientSession,
+    progress_callback: DeepSearchProgressCallback | None = None,
+    request_context: RequestContext | None = None,
+    pack_token_budget: int = DEEP_SEARCH_PACK_TOKEN_BUDGET,
+    pack_max_blocks: int = DEEP_SEARCH_PACK_MAX_BLOCKS
 ) -> list[str | None]:
     """
     Асинхронная обработка чанков с контролем RPM и TPM.
     Чанки равномерно распределяются между моделями через очередь.
+
+    Мелкие чанки упаковываются в один запрос до pack_token_budget токенов
+    (не более pack_max_blocks чанков), что сокращает число запросов и
+    повторную отправку prompt_extract. Результаты возвращаются по чанкам.
+
+    Если передан progress_callback, он вызывается после каждого обработанного
+    запроса с DeepSearchProgress (done/total по чанкам, найденные цитаты, ETA).
+
+    Raises:
+        RequestCancelledError: request_context (по умолчанию - текущий) отменен или истек
     """
+    request_context = request_context or get_current_request_context()
     token_rates, req_rates = _calculate_rate_limits()
 
+    # Подсчет токенов сотен чанков - в отдельном потоке, чтобы не блокировать event loop
+    question_tokens = count_tokens(text)
+    block_tokens = await asyncio.to_thread(lambda: [count_tokens(chunk) for chunk in chunks])
+    chunk_tokens = [tokens + question_tokens for tokens in block_tokens]
+
+    packs = pack_chunks(block_tokens, pack_token_budget, pack_max_blocks)
+    logging.info(f"Извлечение: {len(chunks)} чанков упаковано в {len(packs)} запросов")
+
     q = asyncio.Queue()
-    for idx, chunk in enumerate(chunks):
-        await q.put((idx, chunk))
+    for pack in packs:
+        await q.put(pack)
 
     results: list[str | None] = [None] * len(chunks)
     model_semaphores = [BoundedSemaphore(1) for _ in range(len(api_keys))]
 
+    progress = None
+    if progress_callback is not None:
+        progress = DeepSearchProgress(
+            total=len(chunks),
+            pending_tokens=sum(chunk_tokens),
+            token_rate=sum(token_rates[:len(api_keys)]),
+            req_rate=sum(req_rates[:len(api_keys)]),
+            results=results
+        )
+        progress.eta_seconds = progress.estimate_eta()
+        try:
+            await progress_callback(progress)
+        except Exception as e:
+            logging.warning(f"Ошибка progress_callback: {e}")
+
     workers = [
         asyncio.create_task(_process_single_chunk_async(
-            q, text, extract_prompt, model_idx, api_key,
-            token_rates[model_idx], req_rates[model_idx],
-            model_semaphores[model_idx], session, results
+            q, chunks, chunk_tokens, text, extract_prompt, model_idx, api_key,
+            model_semaphores[model_idx], session, results,
+            progress, progress_callback, request_context
         ))
         for model_idx, api_key in enumerate(api_keys)
     ]
@@ -327,6 +748,9 @@ async def extract_from_chunk_parallel_async(
     for task in workers:
         _ = task.cancel()
 
+    if request_context is not None:
+        request_context.check()
+
     return results
 
 def _process_single_chunk_sync(
@@ -416,7 +840,7 @@ def extract_from_chunk_parallel(
 
 def classify_report_type(text: str, prompt_name: str) -> int | None:
     classification_prompt: str = fetch_prompt_by_name(prompt_name=prompt_name)
-    classification_result = send_msg_to_model(system=classification_prompt, messages=[{"role": "user", "content": text}], max_tokens=1000)
+    classification_result = send_msg_to_model(system=classification_prompt, messages=[{"role": "user", "content": text}], max_tokens=1000, lane=LANE_BATCH, cache_site=CACHE_SITE_CLASSIFY_REPORT_TYPE)
     classification_result = classification_result.strip()
     try:
         for char in classification_result:
@@ -431,7 +855,7 @@ def classify_report_type(text: str, prompt_name: str) -> int | None:
 
 def classify_query(text: str) -> str:
     classification_prompt: str = fetch_prompt_by_name(prompt_name="prompt_classify")
-    classification_result = send_msg_to_model(system=classification_prompt, messages=[{"role": "user", "content": text}])
+    classification_result = send_msg_to_model(system=classification_prompt, messages=[{"role": "user", "content": text}], lane=LANE_ROUTER, cache_site=CACHE_SITE_CLASSIFY_QUERY)
     classification_result = classification_result.strip()
     try:
         result_json = json.loads(classification_result)
@@ -450,7 +874,10 @@ def send_msg_to_model(
         max_tokens: int=20000,
         model: str | None=REPORT_MODEL_NAME,
         api_key: str | None=ANTHROPIC_API_KEY,
-        return_usage: bool = False
+        return_usage: bool = False,
+        request_context: RequestContext | None = None,
+        lane: int = LANE_INTERACTIVE,
+        cache_site: str | None = None
         ) -> str | tuple[str, dict[str, int]]:
     """
     Отправляет сообщения в модель Claude API.
@@ -464,12 +891,21 @@ def send_msg_to_model(
         api_key: API ключ Anthropic
         return_usage: Если True, возвращает tuple (text, usage_dict)
                      где usage_dict = {"input_tokens": N, "output_tokens": N}
+        request_context: Дедлайн и токен отмены (по умолчанию - контекст текущего запроса)
+        lane: Полоса приоритета LLM-планировщика (LANE_INTERACTIVE, LANE_ROUTER, LANE_DEEP_SEARCH, LANE_BATCH)
+        cache_site: Место вызова для кэша ответов (None - без кэша). Только для
+                    детерминированных вызовов; при попадании usage = 0 токенов
 
     Returns:
         str: Текст ответа модели (если return_usage=False)
         tuple[str, dict]: (текст, {"input_tokens": N, "output_tokens": N}) (если return_usage=True)
+
+    Raises:
+        RequestCancelledError: Запрос отменен пользователем или истек дедлайн
+        SchedulerMisuseError: Синхронный вызов из потока event loop (нужен asyncio.to_thread)
     """
-    client = anthropic.Anthropic(api_key=api_key or "")
+    ctx = request_context or get_current_request_context()
+    client = get_anthropic_client(api_key)
 
     # Fallback на актуальную модель Claude Sonnet 4.5 если model не задана
     # Исправлено: ранее использовалась несуществующая модель claude-sonnet-4-20250514
@@ -487,11 +923,32 @@ def send_msg_to_model(
     if system:
         model_args["system"] = system
 
+    cache = get_llm_cache() if cache_site else None
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(model, system, messages, max_tokens)
+        cached = cache.get(cache_key, cache_site)
+        if cached is not None:
+            logging.info(f"[LLMCache] {cache_site}: ответ из кэша")
+            if return_usage:
+                return (cached, {"input_tokens": 0, "output_tokens": 0})
+            return cached
+
+    scheduler = get_llm_scheduler()
+    tokens = _estimate_request_tokens(messages, system)
+
     backoff = 1
     while True:
+        if ctx is not None:
+            ctx.check()
         try:
-            response = client.messages.create(**model_args)
+            with scheduler.slot_sync(lane, api_key, tokens, request_context=ctx):
+                if ctx is not None and ctx.deadline is not None:
+                    model_args["timeout"] = ctx.remaining()
+                response = client.messages.create(**model_args)
             text = response.content[0].text
+            if cache is not None:
+                cache.set(cache_key, text, cache_site)
 
             # Извлечение информации о использовании токенов
             if return_usage:
@@ -507,9 +964,17 @@ def send_msg_to_model(
                 logging.exception(f"Rate limit persists after backoff: {e}")
                 raise
             logging.warning(f"Rate limit hit, ожидаем {backoff}s перед повтором...")
-            time.sleep(backoff)
+            if ctx is not None:
+                ctx.sleep(backoff)
+            else:
+                time.sleep(backoff)
             backoff *= 2
+        except (RequestCancelledError, SchedulerMisuseError):
+            # Отмена и синхронный вызов из event loop (ошибка программы) - не ответ Claude
+            raise
         except Exception as e:
+            if ctx is not None:
+                ctx.check()
             logging.exception(f"{err}: {e}")
             if return_usage:
                 return (err, {"input_tokens": 0, "output_tokens": 0})
@@ -528,9 +993,7 @@ def auto_detect_category(text: str) -> str:
         return "hotel"
     return "hotel"
 
-def assign_roles(text: str) -> str:
-    logging.info(f"[assign_roles] Длина исходного текста: {len(text)} символов.")
-    prompt_roles: str = fetch_prompt_by_name(prompt_name="assign_roles")
+def _assign_roles_request(prompt_roles: str, text: str) -> str:
     messages = [
                 {
                     "role": "user",
@@ -542,6 +1005,23 @@ def assign_roles(text: str) -> str:
                     ]
                 }
             ]
-    result = send_msg_to_model(messages=messages, err="Ошибка assign_roles")
+    return send_msg_to_model(messages=messages, err="Ошибка assign_roles", lane=LANE_BATCH)
+
+def assign_roles(text: str, window_chars: int = ASSIGN_ROLES_WINDOW_CHARS, concurrency: int = ASSIGN_ROLES_CONCURRENCY) -> str:
+    """
+    Расставляет роли [Сотрудник:]/[Клиент:] в транскрипции.
+
+    Текст длиннее window_chars размечается перекрывающимися окнами параллельно
+    (до concurrency одновременно) и сшивается с согласованием меток (role_windows).
+    """
+    logging.info(f"[assign_roles] Длина исходного текста: {len(text)} символов.")
+    prompt_roles: str = fetch_prompt_by_name(prompt_name="assign_roles")
+
+    result = assign_roles_windowed(
+        text,
+        lambda window_text: _assign_roles_request(prompt_roles, window_text),
+        window_chars=window_chars,
+        concurrency=concurrency
+    )
     logging.info(f"[assign_roles] Длина результата: {len(result)} символов.")
     return result
@@ -0,0 +1,142 @@
+"""
+Параллельное выполнение цепочек промптов анализа методологии.
+
+ПРОБЛЕМА:
+- run_analysis_with_spinner выполнял проходы анализа строго по очереди
+  (для "Общих факторов" - part1, затем part2, затем JSON-промпты), хотя
+  part1 и part2 не зависят друг от друга, а analyze_methodology -
+  синхронный вызов Claude внутри async обработчика
+
+РЕШЕНИЕ:
+1. Отчет описывается графом проходов (AnalysisNode): промпты внутри прохода
+   остаются последовательной цепочкой, зависимости между проходами задаются
+   depends_on
+2. Проход без зависимостей получает исходный текст, проход с зависимостями -
+   результаты зависимостей через перевод строки (в порядке depends_on)
+3. Независимые проходы выполняются одновременно; каждому проходу назначается
+   свой ключ из пула ANTHROPIC_API_KEY..._7 (по кругу, в топологическом порядке)
+4. Время отчета ~ время самой длинной цепочки
+
+ИСПОЛЬЗОВАНИЕ:
+```python
+nodes = [
+    AnalysisNode("part1", part1),
+    AnalysisNode("part2", part2),
+    AnalysisNode("json", json_prompts, depends_on=("part1", "part2")),
+]
+results = await run_analysis_dag(nodes, source_text, run_node, api_keys)
+```
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnalysisNode:
+    """Проход анализа: последовательная цепочка промптов."""
+    name: str
+    prompts: list[tuple[str, int]]
+    depends_on: tuple[str, ...] = ()
+    is_show_analysis: bool = False
+
+
+# run_node(node, source_text, api_key) -> результат прохода
+RunNode = Callable[[AnalysisNode, str, str | None], Awaitable[str | None]]
+
+
+def topological_order(nodes: list[AnalysisNode]) -> list[AnalysisNode]:
+    """
+    Упорядочивает проходы так, что каждый идет после своих зависимостей.
+
+    Raises:
+        ValueError: Повтор имени, неизвестная зависимость или цикл
+    """
+    by_name: dict[str, AnalysisNode] = {}
+    for node in nodes:
+        if node.name in by_name:
+            raise ValueError(f"Проход '{node.name}' объявлен дважды")
+        by_name[node.name] = node
+
+    for node in nodes:
+        unknown = [dep for dep in node.depends_on if dep not in by_name]
+        if unknown:
+            raise ValueError(f"Проход '{node.name}' зависит от неизвестных проходов: {unknown}")
+
+    ordered: list[AnalysisNode] = []
+    state: dict[str, str] = {}  # имя -> "visiting" | "done"
+
+    def visit(node: AnalysisNode) -> None:
+        if state.get(node.name) == "done":
+            return
+        if state.get(node.name) == "visiting":
+            raise ValueError(f"Цикл в зависимостях проходов анализа: '{node.name}'")
+        state[node.name] = "visiting"
+        for dep in node.depends_on:
+            visit(by_name[dep])
+        state[node.name] = "done"
+        ordered.append(node)
+
+    for node in nodes:
+        visit(node)
+    return ordered
+
+
+async def run_analysis_dag(
+    nodes: list[AnalysisNode],
+    source_text: str,
+    run_node: RunNode,
+    api_keys: list[str | None] | None = None
+) -> dict[str, str | None]:
+    """
+    Выполняет граф проходов анализа, запуская независимые проходы одновременно.
+
+    Args:
+        nodes: Проходы анализа (пустые проходы без промптов пропускаются,
+               зависимые от них проходы получают только остальные результаты)
+        source_text: Исходный текст (транскрипция) для проходов без зависимостей
+        run_node: Корутина выполнения одного прохода
+        api_keys: Пул ключей Anthropic (None/пустые ключи отбрасываются)
+
+    Returns:
+        dict[str, str | None]: {имя прохода: результат}
+
+    Raises:
+        ValueError: Некорректный граф (см. topological_order)
+    """
+    ordered = topological_order(nodes)
+    keys = [key for key in (api_keys or []) if key] or [None]
+    assigned_keys = {node.name: keys[i % len(keys)] for i, node in enumerate(ordered)}
+
+    tasks: dict[str, asyncio.Task] = {}
+
+    async def execute(node: AnalysisNode) -> str | None:
+        if node.depends_on:
+            dep_results = [await tasks[dep] for dep in node.depends_on]
+            node_source = "\n".join(result for result in dep_results if result)
+        else:
+            node_source = source_text
+
+        if not node.prompts:
+            return None
+
+        logger.info(f"[AnalysisDAG] Старт прохода '{node.name}' ({len(node.prompts)} промптов)")
+        result = await run_node(node, node_source, assigned_keys[node.name])
+        logger.info(f"[AnalysisDAG] Проход '{node.name}' завершен")
+        return result
+
+    # Задачи создаются в топологическом порядке: зависимости уже в tasks
+    for node in ordered:
+        tasks[node.name] = asyncio.create_task(execute(node))
+
+    try:
+        results = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return dict(zip(tasks.keys(), results))
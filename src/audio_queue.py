@@ -0,0 +1,271 @@
+"""
+Фоновая очередь обработки аудио.
+
+ПРОБЛЕМА:
+- handle_audio_msg выполнял скачивание, загрузку в MinIO, Whisper и
+  assign_roles прямо в async обработчике синхронными вызовами: один длинный
+  файл блокировал event loop и сообщения всех остальных пользователей
+
+РЕШЕНИЕ:
+1. Обработчик только ставит задачу в очередь (submit) и сообщает позицию
+2. Задачи выполняются в пуле потоков (синхронный конвейер обработки
+   не блокирует event loop); asyncio-диспетчер запускает задачи в порядке
+   поступления с лимитами: AUDIO_QUEUE_MAX_CONCURRENT всего и
+   AUDIO_QUEUE_PER_USER_LIMIT на пользователя (задачи пользователя сверх
+   лимита ждут, не задерживая задачи других пользователей)
+3. По завершении вызываются колбэки on_complete/on_error (в event loop) -
+   отправка результата в чат
+4. Таблица незавершенных задач хранится в JSON (AUDIO_QUEUE_JOBS_PATH):
+   после рестарта бота restore() возвращает их в очередь (транскрибация
+   продолжается с чекпоинта - см. transcription_jobs). Задача, запускавшаяся
+   уже AUDIO_QUEUE_MAX_ATTEMPTS раз (бот падал на ней), не возвращается в
+   очередь - пользователь получает on_error с AudioJobAttemptsError
+5. hold_after_complete: после успешной задачи следующие задачи пользователя
+   не запускаются до release(chat_id) - результат предыдущей еще не принят
+
+ИСПОЛЬЗОВАНИЕ:
+```python
+queue = AudioJobQueue(process_job, on_complete=send_result, on_error=send_error)
+await queue.restore()
+job = await queue.submit(chat_id, {"message_id": message.id})
+position = queue.position(job.job_id)  # 0 - уже выполняется
+```
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from config import (
+    AUDIO_QUEUE_MAX_CONCURRENT,
+    AUDIO_QUEUE_PER_USER_LIMIT,
+    AUDIO_QUEUE_MAX_ATTEMPTS,
+    AUDIO_QUEUE_JOBS_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class AudioJobAttemptsError(Exception):
+    """Задача не завершилась за AUDIO_QUEUE_MAX_ATTEMPTS запусков."""
+    pass
+
+
+@dataclass
+class AudioJob:
+    """Задача обработки аудио (payload должен сериализоваться в JSON)."""
+    job_id: str
+    chat_id: int
+    payload: dict[str, Any]
+    status: str = JOB_QUEUED
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    started_at: str | None = None
+    finished_at: str | None = None
+    # Сколько раз задача запускалась (>1 - возобновлена после рестарта)
+    attempts: int = 0
+    error: str | None = None
+
+
+# process(job) -> результат; выполняется в пуле потоков
+ProcessJob = Callable[[AudioJob], Any]
+OnComplete = Callable[[AudioJob, Any], Awaitable[None]]
+OnError = Callable[[AudioJob, BaseException], Awaitable[None]]
+
+
+class AudioJobQueue:
+    """
+    Очередь задач с глобальным и пользовательским лимитом одновременных задач.
+
+    Args:
+        process: Синхронная обработка задачи (выполняется в пуле потоков)
+        on_complete: Корутина после успешной обработки (job, результат)
+        on_error: Корутина после ошибки обработки (job, исключение)
+        max_concurrent: Максимум одновременно выполняемых задач
+        per_user_limit: Максимум одновременно выполняемых задач одного пользователя
+        jobs_path: JSON файл незавершенных задач (None - без сохранения)
+        max_attempts: Максимум запусков задачи (restore() не возвращает исчерпавшие)
+        hold_after_complete: Не запускать задачи пользователя после успешной до release()
+    """
+
+    def __init__(
+        self,
+        process: ProcessJob,
+        on_complete: OnComplete | None = None,
+        on_error: OnError | None = None,
+        max_concurrent: int = AUDIO_QUEUE_MAX_CONCURRENT,
+        per_user_limit: int = AUDIO_QUEUE_PER_USER_LIMIT,
+        jobs_path: str | Path | None = AUDIO_QUEUE_JOBS_PATH,
+        max_attempts: int = AUDIO_QUEUE_MAX_ATTEMPTS,
+        hold_after_complete: bool = False
+    ):
+        self.process = process
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.max_concurrent = max(1, max_concurrent)
+        self.per_user_limit = max(1, per_user_limit)
+        self.jobs_path = Path(jobs_path) if jobs_path else None
+        self.max_attempts = max(1, max_attempts)
+        self.hold_after_complete = hold_after_complete
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="audio-job")
+        # Незавершенные задачи в порядке поступления
+        self._jobs: dict[str, AudioJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+        # Пользователи, чьи задачи не запускаются до release()
+        self._held: set[int] = set()
+        self._closed = False
+
+    async def submit(self, chat_id: int, payload: dict[str, Any]) -> AudioJob:
+        """Ставит задачу в очередь и запускает ее, если лимиты позволяют."""
+        job = AudioJob(job_id=uuid.uuid4().hex, chat_id=chat_id, payload=payload)
+        self._jobs[job.job_id] = job
+        logger.info(f"[AudioQueue] Задача {job.job_id[:8]} пользователя {chat_id} в очереди")
+        self._dispatch()
+        self._save()
+        return job
+
+    async def restore(self) -> int:
+        """Возвращает в очередь задачи, не завершенные до рестарта."""
+        if self.jobs_path is None or not self.jobs_path.exists():
+            return 0
+        try:
+            records = json.loads(self.jobs_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"[AudioQueue] Поврежденная таблица задач {self.jobs_path.name}: {e}")
+            return 0
+
+        restored = 0
+        exhausted: list[AudioJob] = []
+        for record in records:
+            try:
+                job = AudioJob(**record)
+            except TypeError as e:
+                logger.warning(f"[AudioQueue] Пропущена некорректная задача: {e}")
+                continue
+            if job.job_id in self._jobs:
+                continue
+            if job.attempts >= self.max_attempts:
+                exhausted.append(job)
+                continue
+            job.status = JOB_QUEUED
+            self._jobs[job.job_id] = job
+            restored += 1
+
+        if restored:
+            logger.info(f"[AudioQueue] Восстановлено задач после рестарта: {restored}")
+            self._dispatch()
+            self._save()
+        for job in exhausted:
+            job.status = JOB_FAILED
+            job.error = f"не завершилась за {job.attempts} запусков"
+            logger.error(f"[AudioQueue] Задача {job.job_id[:8]} снята: {job.error}")
+            await self._finish(job, self.on_error, AudioJobAttemptsError(job.error))
+        return restored
+
+    def position(self, job_id: str) -> int:
+        """Позиция задачи в очереди (1 - следующая), 0 - выполняется или завершена."""
+        waiting = [job_id_ for job_id_, job in self._jobs.items() if job.status == JOB_QUEUED]
+        return waiting.index(job_id) + 1 if job_id in waiting else 0
+
+    def user_jobs(self, chat_id: int) -> list[AudioJob]:
+        """Незавершенные задачи пользователя в порядке поступления."""
+        return [job for job in self._jobs.values() if job.chat_id == chat_id]
+
+    def release(self, chat_id: int) -> None:
+        """Снимает удержание пользователя (hold_after_complete) и запускает его задачи."""
+        self._held.discard(chat_id)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Запускает ожидающие задачи в порядке поступления в пределах лимитов."""
+        if self._closed:
+            return
+        running = [job for job in self._jobs.values() if job.status == JOB_RUNNING]
+        running_by_user: dict[int, int] = {}
+        for job in running:
+            running_by_user[job.chat_id] = running_by_user.get(job.chat_id, 0) + 1
+
+        free = self.max_concurrent - len(running)
+        for job in list(self._jobs.values()):
+            if free <= 0:
+                break
+            if job.status != JOB_QUEUED or job.chat_id in self._held:
+                continue
+            if running_by_user.get(job.chat_id, 0) >= self.per_user_limit:
+                continue
+            job.status = JOB_RUNNING
+            job.started_at = datetime.now().isoformat()
+            job.attempts += 1
+            running_by_user[job.chat_id] = running_by_user.get(job.chat_id, 0) + 1
+            free -= 1
+
+            task = asyncio.create_task(self._run(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: AudioJob) -> None:
+        if self._closed:
+            # Очередь остановлена до старта задачи - задача остается в таблице до рестарта
+            return
+        logger.info(f"[AudioQueue] Старт задачи {job.job_id[:8]} (попытка {job.attempts})")
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, self.process, job)
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e) or type(e).__name__
+            logger.exception(f"[AudioQueue] Задача {job.job_id[:8]} завершилась ошибкой: {e}")
+            await self._finish(job, self.on_error, e)
+        else:
+            job.status = JOB_DONE
+            if self.hold_after_complete:
+                self._held.add(job.chat_id)
+            logger.info(f"[AudioQueue] Задача {job.job_id[:8]} выполнена")
+            await self._finish(job, self.on_complete, result)
+
+    async def _finish(self, job: AudioJob, callback: Callable[[AudioJob, Any], Awaitable[None]] | None, value: Any) -> None:
+        job.finished_at = datetime.now().isoformat()
+        self._jobs.pop(job.job_id, None)
+        self._save()
+        self._dispatch()
+        if callback is None:
+            return
+        try:
+            await callback(job, value)
+        except Exception as e:
+            logger.exception(f"[AudioQueue] Ошибка колбэка задачи {job.job_id[:8]}: {e}")
+
+    def _save(self) -> None:
+        """Сохраняет незавершенные задачи (атомарная запись)."""
+        if self.jobs_path is None:
+            return
+        try:
+            self.jobs_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.jobs_path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump([asdict(job) for job in self._jobs.values()], f, ensure_ascii=False)
+            os.replace(tmp_path, self.jobs_path)
+        except OSError as e:
+            logger.warning(f"[AudioQueue] Не удалось сохранить таблицу задач: {e}")
+
+    async def join(self) -> None:
+        """Ждет завершения всех задач (в том числе запущенных по ходу ожидания)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def shutdown(self) -> None:
+        """Останавливает пул потоков (незавершенные задачи остаются в таблице)."""
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
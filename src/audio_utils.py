@@ -1,9 +1,12 @@
 
 from pyrogram.types import Message
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Callable
 import os
 
 from analysis import transcribe_audio
+from transcription_cache import transcribe_with_cache
 
 def extract_audio_filename(message: Message) -> str:
     """
@@ -40,11 +43,37 @@ def define_audio_file_params(message: Message) -> int:
     
     raise ValueError("Сообщение не содержит аудио или войс")
     
-def transcribe_audio_and_save(downloaded_path: str, chat_id: int, processed_texts: dict[int, str]):
+def transcribe_audio_and_save(downloaded_path: str, chat_id: int, processed_texts: dict[int, str], audio_hash: str | None = None):
     """
     Выполняет транскрибацию и сохраняет результат в processed_texts[chat_id].
     Без расстановки ролей — только «сырое» распознавание.
+    Повторно загруженная запись (тот же SHA-256) берется из кэша транскрипций,
+    после сбоя транскрибация продолжается с готовых чанков.
     """
-    raw_text = transcribe_audio(downloaded_path)
+    raw_text = transcribe_with_cache(downloaded_path, transcribe_audio, audio_hash=audio_hash, chat_id=chat_id)
     processed_texts[chat_id] = raw_text
+    return raw_text
+
+def transcribe_audio_with_upload(
+    downloaded_path: str,
+    chat_id: int,
+    processed_texts: dict[int, str],
+    upload: Callable[[], None],
+    on_upload_error: Callable[[Exception], None],
+    audio_hash: str | None = None
+) -> str:
+    """
+    transcribe_audio_and_save, пока upload (загрузка записи в хранилище) идет в фоновом потоке.
+
+    Возврат (и проброс ошибки транскрибации) - только после завершения загрузки:
+    после вызова временный файл можно удалять. Ошибка загрузки не отменяет
+    готовую транскрипцию - передается в on_upload_error.
+    """
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="minio-upload") as upload_executor:
+        upload_future = upload_executor.submit(upload)
+        raw_text = transcribe_audio_and_save(downloaded_path, chat_id, processed_texts, audio_hash=audio_hash)
+        try:
+            upload_future.result()
+        except Exception as e:
+            on_upload_error(e)
     return raw_text
\ No newline at end of file
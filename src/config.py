@@ -182,6 +182,144 @@ THROTTLE_DATA_DIR = os.getenv(
 # Preview text configuration
 PREVIEW_TEXT_LENGTH = int(os.getenv("PREVIEW_TEXT_LENGTH", "300"))
 
+# Fast search streaming configuration
+# Минимальный интервал (сек) между редактированиями сообщения при потоковой выдаче ответа (flood limit Telegram)
+FAST_SEARCH_STREAM_INTERVAL = float(os.getenv("FAST_SEARCH_STREAM_INTERVAL", "1.0"))
+
+# Deep search progress configuration
+# Минимальный интервал (сек) между обновлениями статуса глубокого исследования (защита от flood limit)
+DEEP_SEARCH_PROGRESS_INTERVAL = float(os.getenv("DEEP_SEARCH_PROGRESS_INTERVAL", "5"))
+
+# Dialog request budget
+# Дедлайн (сек) на весь пайплайн диалога: expand_query, Router Agent, поиск, глубокое исследование
+DIALOG_REQUEST_TIMEOUT = float(os.getenv("DIALOG_REQUEST_TIMEOUT", "600"))
+
+# LLM scheduler configuration
+# Максимум одновременных запросов к Claude API по всему процессу
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "10"))
+# Слоты, которые глубокое исследование и пакетный анализ не могут занять (для быстрого поиска и Router Agent)
+LLM_RESERVED_INTERACTIVE_SLOTS = int(os.getenv("LLM_RESERVED_INTERACTIVE_SLOTS", "2"))
+
+# Anthropic client pool configuration
+# Максимум соединений в пуле одного клиента Anthropic (клиенты общие для всех модулей, по одному на ключ)
+ANTHROPIC_POOL_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_POOL_MAX_CONNECTIONS", "20"))
+# Максимум keep-alive соединений, которые остаются открытыми между запросами
+ANTHROPIC_POOL_MAX_KEEPALIVE = int(os.getenv("ANTHROPIC_POOL_MAX_KEEPALIVE", "10"))
+# Время жизни простаивающего keep-alive соединения (сек)
+ANTHROPIC_POOL_KEEPALIVE_EXPIRY = float(os.getenv("ANTHROPIC_POOL_KEEPALIVE_EXPIRY", "120"))
+
+# LLM response cache configuration
+# Кэш ответов классификации, query expansion и Router Agent (в тестах по умолчанию выключен)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false" if IS_TESTING else "true").lower() == "true"
+# Размер LRU кэша в памяти (записей)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+# Директория дискового уровня кэша (пусто - только память)
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "")
+
+# Embedding router configuration
+# Локальная оценка релевантности отчетов по эмбеддингам bge-m3 до обращения к LLM (в тестах по умолчанию выключена)
+ROUTER_EMBEDDING_ENABLED = os.getenv("ROUTER_EMBEDDING_ENABLED", "false" if IS_TESTING else "true").lower() == "true"
+# Минимальный отрыв (п.п.) лучшего индекса от второго, при котором LLM не вызывается
+ROUTER_EMBEDDING_MARGIN = float(os.getenv("ROUTER_EMBEDDING_MARGIN", "8"))
+# Минимальная оценка лучшего индекса для решения без LLM
+ROUTER_EMBEDDING_MIN_SCORE = float(os.getenv("ROUTER_EMBEDDING_MIN_SCORE", "30"))
+
+# Speculative routing configuration
+# Router Agent по исходному вопросу параллельно с expand_query (в тестах по умолчанию выключено)
+SPECULATIVE_ROUTING_ENABLED = os.getenv("SPECULATIVE_ROUTING_ENABLED", "false" if IS_TESTING else "true").lower() == "true"
+# Число лучших индексов, которые должны совпасть до и после улучшения вопроса
+SPECULATIVE_ROUTING_TOP_K = int(os.getenv("SPECULATIVE_ROUTING_TOP_K", "3"))
+
+# Enhancement prefetch configuration
+# Улучшение вопроса под каждый рекомендованный индекс заранее, пока показано меню (в тестах по умолчанию выключено)
+ENHANCEMENT_PREFETCH_ENABLED = os.getenv("ENHANCEMENT_PREFETCH_ENABLED", "false" if IS_TESTING else "true").lower() == "true"
+# Время жизни заранее улучшенных вопросов в user_states (сек)
+ENHANCEMENT_PREFETCH_TTL = int(os.getenv("ENHANCEMENT_PREFETCH_TTL", "900"))
+
+# Relevance container configuration
+# Бюджет токенов описаний отчетов в JSON-контейнере Router Agent (0 - полные описания без обрезки)
+RELEVANCE_CONTAINER_TOKEN_BUDGET = int(os.getenv("RELEVANCE_CONTAINER_TOKEN_BUDGET", "15000"))
+
+# Descry retrieval configuration
+# Отправлять в expand_query только релевантные вопросу разделы descry.md (в тестах по умолчанию выключено)
+DESCRY_RETRIEVAL_ENABLED = os.getenv("DESCRY_RETRIEVAL_ENABLED", "false" if IS_TESTING else "true").lower() == "true"
+# Максимум разделов descry.md в промпте улучшения вопроса
+DESCRY_RETRIEVAL_TOP_N = int(os.getenv("DESCRY_RETRIEVAL_TOP_N", "8"))
+# Бюджет токенов выбранных разделов (файл меньше бюджета отправляется целиком)
+DESCRY_RETRIEVAL_TOKEN_BUDGET = int(os.getenv("DESCRY_RETRIEVAL_TOKEN_BUDGET", "3000"))
+
+# Semantic answer cache configuration
+# Выдача недавнего ответа на похожий вопрос без expand_query, Router Agent и поиска (в тестах по умолчанию выключена)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false" if IS_TESTING else "true").lower() == "true"
+# Минимальное косинусное сходство эмбеддингов вопросов (bge-m3) для выдачи ответа из кэша
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+# Время жизни ответа в кэше (сек)
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "21600"))
+# Максимум ответов на один индекс (старые вытесняются)
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "200"))
+
+# Transcription configuration
+# Максимум одновременно транскрибируемых чанков аудио (экспорт + запрос к Whisper)
+TRANSCRIPTION_CONCURRENCY = int(os.getenv("TRANSCRIPTION_CONCURRENCY", "4"))
+# Повторы транскрибации одного чанка при ошибке (с экспоненциальной паузой)
+TRANSCRIPTION_CHUNK_RETRIES = int(os.getenv("TRANSCRIPTION_CHUNK_RETRIES", "3"))
+# Границы чанков по паузам речи (ffmpeg silencedetect) вместо жестких разрезов каждые 3 минуты
+TRANSCRIPTION_SILENCE_SPLIT_ENABLED = os.getenv("TRANSCRIPTION_SILENCE_SPLIT_ENABLED", "false" if IS_TESTING else "true").lower() == "true"
+# Окно поиска паузы вокруг целевой границы чанка (сек, в обе стороны)
+TRANSCRIPTION_SILENCE_WINDOW_S = int(os.getenv("TRANSCRIPTION_SILENCE_WINDOW_S", "20"))
+# Минимальная и максимальная длина чанка (сек)
+TRANSCRIPTION_MIN_CHUNK_S = int(os.getenv("TRANSCRIPTION_MIN_CHUNK_S", "120"))
+TRANSCRIPTION_MAX_CHUNK_S = int(os.getenv("TRANSCRIPTION_MAX_CHUNK_S", "210"))
+# Порог тишины (дБ) и минимальная длительность паузы (сек) для silencedetect
+TRANSCRIPTION_SILENCE_NOISE_DB = int(os.getenv("TRANSCRIPTION_SILENCE_NOISE_DB", "-35"))
+TRANSCRIPTION_SILENCE_MIN_S = float(os.getenv("TRANSCRIPTION_SILENCE_MIN_S", "0.3"))
+# Профиль кодирования чанков для Whisper: speech_opus, speech_mp3 (моно 16 кГц) или legacy (MP3 без пережатия)
+TRANSCRIPTION_UPLOAD_PROFILE = os.getenv("TRANSCRIPTION_UPLOAD_PROFILE", "speech_mp3")
+# Кэш транскрипций в MinIO по SHA-256 аудио (повторная загрузка той же записи не идет в Whisper)
+TRANSCRIPTION_CACHE_ENABLED = os.getenv("TRANSCRIPTION_CACHE_ENABLED", "false" if IS_TESTING else "true").lower() == "true"
+# Чекпоинты транскрибации по чанкам: после сбоя повторная обработка файла продолжает с готовых чанков
+TRANSCRIPTION_JOBS_ENABLED = os.getenv("TRANSCRIPTION_JOBS_ENABLED", "false" if IS_TESTING else "true").lower() == "true"
+# Директория чекпоинтов (в постоянном томе data)
+TRANSCRIPTION_JOBS_DIR = os.getenv("TRANSCRIPTION_JOBS_DIR", "/home/voxpersona_user/VoxPersona/data/transcription_jobs")
+# Срок хранения чекпоинтов (дней)
+TRANSCRIPTION_JOBS_TTL_DAYS = int(os.getenv("TRANSCRIPTION_JOBS_TTL_DAYS", "7"))
+# Бэкенд транскрибации: openai (Whisper API) или local (faster-whisper на CPU, без лимитов API)
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "openai")
+# Модель faster-whisper для local: tiny, base, small, medium, large-v3 или путь к сконвертированной модели
+LOCAL_WHISPER_MODEL = os.getenv("LOCAL_WHISPER_MODEL", "medium")
+# Квантование весов local модели (int8 - быстрее всего на CPU)
+LOCAL_WHISPER_COMPUTE_TYPE = os.getenv("LOCAL_WHISPER_COMPUTE_TYPE", "int8")
+# Параллельно распознаваемых чанков local моделью; ядра CPU делятся между ними поровну
+LOCAL_WHISPER_WORKERS = int(os.getenv("LOCAL_WHISPER_WORKERS", "2"))
+# Потоков CPU на local модель (0 - все ядра)
+LOCAL_WHISPER_CPU_THREADS = int(os.getenv("LOCAL_WHISPER_CPU_THREADS", "0"))
+# Язык записей (пусто - автоопределение по каждому чанку) и ширина beam search
+LOCAL_WHISPER_LANGUAGE = os.getenv("LOCAL_WHISPER_LANGUAGE", "ru")
+LOCAL_WHISPER_BEAM_SIZE = int(os.getenv("LOCAL_WHISPER_BEAM_SIZE", "5"))
+
+# Role assignment configuration
+# Размер окна расстановки ролей (символов; 0 - весь текст одним запросом)
+ASSIGN_ROLES_WINDOW_CHARS = int(os.getenv("ASSIGN_ROLES_WINDOW_CHARS", "12000"))
+# Перекрытие соседних окон (символов) - по нему согласуются метки говорящих
+ASSIGN_ROLES_OVERLAP_CHARS = int(os.getenv("ASSIGN_ROLES_OVERLAP_CHARS", "1500"))
+# Максимум одновременно размечаемых окон
+ASSIGN_ROLES_CONCURRENCY = int(os.getenv("ASSIGN_ROLES_CONCURRENCY", "4"))
+
+# Audio queue configuration
+# Максимум одновременно обрабатываемых аудио (всего и на одного пользователя)
+AUDIO_QUEUE_MAX_CONCURRENT = int(os.getenv("AUDIO_QUEUE_MAX_CONCURRENT", "2"))
+AUDIO_QUEUE_PER_USER_LIMIT = int(os.getenv("AUDIO_QUEUE_PER_USER_LIMIT", "1"))
+# Максимум запусков одной задачи: задача, на которой бот падает, не повторяется после каждого рестарта
+AUDIO_QUEUE_MAX_ATTEMPTS = int(os.getenv("AUDIO_QUEUE_MAX_ATTEMPTS", "3"))
+# Таблица незавершенных задач обработки аудио (восстанавливается после рестарта)
+AUDIO_QUEUE_JOBS_PATH = os.getenv("AUDIO_QUEUE_JOBS_PATH", "/home/voxpersona_user/VoxPersona/data/audio_jobs.json")
+
+# Deep search packing
+# Бюджет токенов запроса извлечения: мелкие блоки транскрибаций объединяются до этого размера (0 - без упаковки)
+DEEP_SEARCH_PACK_TOKEN_BUDGET = int(os.getenv("DEEP_SEARCH_PACK_TOKEN_BUDGET", "6000"))
+# Максимум блоков в одном упакованном запросе
+DEEP_SEARCH_PACK_MAX_BLOCKS = int(os.getenv("DEEP_SEARCH_PACK_MAX_BLOCKS", "10"))
+
 
 if not IS_TESTING:
     # Production environment requires all API keys
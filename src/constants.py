@@ -21,6 +21,7 @@ INDEX_FILE_NAME = "index.json"
 COMMAND_HISTORY = "/history"
 COMMAND_STATS = "/stats"
 COMMAND_REPORTS = "/reports"
+COMMAND_TRANSCRIPTION = "/transcription"
 
 # Error messages for smart send
 ERROR_FILE_SEND_FAILED = "Не удалось отправить файл, отправляю текстом"
@@ -0,0 +1,263 @@
+"""
+Выбор релевантных разделов descry.md для улучшения вопроса.
+
+ПРОБЛЕМА:
+- expand_query отправлял в каждом промпте весь Description/descry.md (~30 KB,
+  ~9k токенов): входные токены и задержка улучшения вопроса растут вместе
+  с файлом
+
+РЕШЕНИЕ:
+1. descry.md разбивается на разделы по markdown заголовкам; у каждого раздела
+   сохраняется путь заголовков ("СЦЕНАРИЙ: ДИЗАЙН > Структура отчетов > ...")
+   как контекст, длинные разделы дробятся по абзацам
+2. Разделы один раз векторизуются уже загруженной моделью bge-m3 (кэш векторов
+   в памяти и в cache/ по хэшу содержимого файла)
+3. В промпт попадают DESCRY_RETRIEVAL_TOP_N самых близких к вопросу разделов
+   в пределах DESCRY_RETRIEVAL_TOKEN_BUDGET токенов, в порядке файла
+4. Fallback на весь файл: поиск выключен, модель недоступна или файл
+   помещается в бюджет целиком
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from config import DESCRY_RETRIEVAL_ENABLED, DESCRY_RETRIEVAL_TOP_N, DESCRY_RETRIEVAL_TOKEN_BUDGET
+from utils import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Кэш векторов разделов (рядом с векторами описаний отчетов)
+EMBEDDINGS_CACHE_DIR = Path(__file__).parent.parent / "cache"
+
+# Разделы длиннее этого порога дробятся по абзацам
+MAX_SECTION_CHARS = 2500
+
+# Разделитель выбранных разделов в промпте
+SECTION_SEPARATOR = "\n\n---\n\n"
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*\S)\s*$")
+
+
+@dataclass
+class DescrySection:
+    """Раздел descry.md."""
+    title: str
+    text: str
+
+    def render(self) -> str:
+        """Текст раздела для промпта (с путем заголовков)."""
+        return f"[{self.title}]\n{self.text}" if self.title else self.text
+
+
+def _split_long(text: str) -> list[str]:
+    """Дробит длинный текст раздела по абзацам на части до MAX_SECTION_CHARS."""
+    if len(text) <= MAX_SECTION_CHARS:
+        return [text]
+
+    parts, current = [], ""
+    for paragraph in text.split("\n\n"):
+        if current and len(current) + len(paragraph) + 2 > MAX_SECTION_CHARS:
+            parts.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_descry_sections(content: str) -> list[DescrySection]:
+    """
+    Разбивает descry.md на разделы по markdown заголовкам.
+
+    Раздел = заголовок и текст до следующего заголовка. Заголовки без текста
+    (например, "## СЦЕНАРИЙ: ДИЗАЙН" перед "### Назначение") входят в путь
+    заголовков вложенных разделов; заголовок документа (#) в путь не входит.
+    """
+    sections: list[DescrySection] = []
+    stack: list[tuple[int, str]] = []
+    body: list[str] = []
+
+    def flush():
+        text = "\n".join(body).strip()
+        body.clear()
+        if not text:
+            return
+        # Заголовок документа (#) не повторяется в пути каждого раздела
+        path = [heading for level, heading in stack if level > 1] or [heading for _, heading in stack]
+        title = " > ".join(path)
+        for part in _split_long(text):
+            sections.append(DescrySection(title=title, text=part))
+
+    for line in content.splitlines():
+        match = _HEADING_RE.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, match.group(2)))
+        else:
+            body.append(line)
+    flush()
+    return sections
+
+
+class DescryRetriever:
+    """
+    Поиск разделов descry.md, близких к вопросу.
+
+    Args:
+        model: Модель с методом encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+               (SentenceTransformer). None - модель загружается через utils.get_embedding_model()
+        cache_dir: Директория дискового кэша векторов (None - только память)
+    """
+
+    def __init__(self, model=None, cache_dir: Path | None = EMBEDDINGS_CACHE_DIR):
+        self._model = model
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._fitted_hash: str | None = None
+        self._sections: list[DescrySection] = []
+        self._vectors: np.ndarray | None = None
+
+    def _get_model(self):
+        if self._model is None:
+            # Ленивый импорт: utils тянет pyrogram и langchain
+            from utils import get_embedding_model
+            self._model = get_embedding_model()
+        return self._model
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        model = self._get_model()
+        if model is None:
+            raise RuntimeError("Модель эмбеддингов недоступна")
+        return np.asarray(model.encode(texts, normalize_embeddings=True, convert_to_numpy=True), dtype=np.float32)
+
+    def fit(self, content: str) -> None:
+        """Разбивает и векторизует descry.md (no-op, если файл не изменился)."""
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self._lock:
+            if self._fitted_hash == content_hash:
+                return
+
+            sections = split_descry_sections(content)
+            cache_path = self.cache_dir / f"descry_embeddings_{content_hash[:16]}.npy" if self.cache_dir else None
+
+            vectors = None
+            if cache_path is not None and cache_path.exists():
+                try:
+                    vectors = np.load(cache_path, allow_pickle=False)
+                    if len(vectors) != len(sections):
+                        vectors = None
+                except (OSError, ValueError) as e:
+                    logger.warning(f"[DescryRetriever] Поврежденный кэш векторов {cache_path.name}: {e}")
+
+            if vectors is None:
+                logger.info(f"[DescryRetriever] Векторизация {len(sections)} разделов descry.md...")
+                vectors = self._encode([section.render() for section in sections])
+                if cache_path is not None:
+                    try:
+                        cache_path.parent.mkdir(parents=True, exist_ok=True)
+                        np.save(cache_path, vectors)
+                    except OSError as e:
+                        logger.warning(f"[DescryRetriever] Не удалось сохранить кэш векторов: {e}")
+
+            self._sections = sections
+            self._vectors = vectors
+            self._fitted_hash = content_hash
+
+    def select(self, question: str, content: str, top_n: int, token_budget: int) -> str:
+        """
+        Собирает самые близкие к вопросу разделы в пределах бюджета токенов.
+
+        Returns:
+            str: Выбранные разделы в порядке файла, разделенные SECTION_SEPARATOR
+        """
+        self.fit(content)
+        if not self._sections:
+            return content
+
+        query = self._encode([question])[0]
+        ranked = np.argsort(-(self._vectors @ query))
+
+        selected: list[int] = []
+        used_tokens = 0
+        for idx in ranked:
+            if len(selected) >= top_n:
+                break
+            tokens = count_tokens(self._sections[idx].render())
+            if used_tokens + tokens > token_budget:
+                continue
+            selected.append(int(idx))
+            used_tokens += tokens
+
+        logger.info(
+            f"[DescryRetriever] Выбрано {len(selected)}/{len(self._sections)} разделов "
+            f"descry.md (~{used_tokens} токенов)"
+        )
+        return SECTION_SEPARATOR.join(self._sections[idx].render() for idx in sorted(selected))
+
+
+_retriever: DescryRetriever | None = None
+
+
+def get_descry_retriever() -> DescryRetriever:
+    """Возвращает общий экземпляр поиска по descry.md."""
+    global _retriever
+    if _retriever is None:
+        _retriever = DescryRetriever()
+    return _retriever
+
+
+def select_descry_content(
+    question: str,
+    content: str,
+    top_n: int | None = None,
+    token_budget: int | None = None
+) -> str:
+    """
+    Возвращает часть descry.md, релевантную вопросу (или весь файл при fallback).
+
+    Args:
+        question: Вопрос пользователя
+        content: Полное содержимое descry.md
+        top_n: Максимум разделов (None - DESCRY_RETRIEVAL_TOP_N)
+        token_budget: Бюджет токенов выбранных разделов (None - DESCRY_RETRIEVAL_TOKEN_BUDGET)
+
+    Returns:
+        str: Выбранные разделы или content целиком (поиск выключен, модель
+             недоступна, ничего не выбрано или файл помещается в бюджет)
+    """
+    if not DESCRY_RETRIEVAL_ENABLED or not content:
+        return content
+
+    top_n = top_n if top_n is not None else DESCRY_RETRIEVAL_TOP_N
+    token_budget = token_budget if token_budget is not None else DESCRY_RETRIEVAL_TOKEN_BUDGET
+    try:
+        if count_tokens(content) <= token_budget:
+            return content
+        selected = get_descry_retriever().select(question, content, top_n, token_budget)
+    except Exception as e:
+        logger.warning(f"[DescryRetriever] Поиск разделов недоступен, используется весь descry.md: {e}")
+        return content
+
+    return selected or content
+
+
+async def warm_up_descry_retriever(content: str) -> None:
+    """Векторизует разделы descry.md заранее (при старте бота), чтобы первый вопрос не ждал."""
+    if not DESCRY_RETRIEVAL_ENABLED or not content:
+        return
+    try:
+        await asyncio.to_thread(get_descry_retriever().fit, content)
+        logger.info("[DescryRetriever] Векторы разделов descry.md готовы")
+    except Exception as e:
+        logger.warning(f"[DescryRetriever] Не удалось подготовить векторы: {e}")
@@ -0,0 +1,251 @@
+"""
+Локальный Router Agent на эмбеддингах (BAAI/bge-m3).
+
+ПРОБЛЕМА:
+- evaluate_report_relevance отправляет в Claude Haiku JSON-контейнер
+  (~55k токенов) с описаниями 22 отчетов на каждый вопрос: 5-15 секунд
+  и заметный расход лимита ключа
+
+РЕШЕНИЕ:
+1. Описания отчетов (Description/Report content) один раз разбиваются на
+   абзацы и векторизуются уже загруженной моделью bge-m3
+   (кэш векторов в памяти и в cache/ по хэшу содержимого описаний)
+2. Вопрос векторизуется, релевантность отчета = среднее косинусное
+   сходство двух самых близких абзацев, приведенное к шкале 0-100
+3. Если лучшие индексы слишком близки по оценке (меньше
+   ROUTER_EMBEDDING_MARGIN) или лучшая оценка ниже ROUTER_EMBEDDING_MIN_SCORE,
+   решение остается за LLM (evaluate_batch_relevance)
+
+Формат результата - Dict[str, float], как у evaluate_report_relevance, поэтому
+get_top_relevant_indices и select_most_relevant_index работают без изменений.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+from config import ROUTER_EMBEDDING_ENABLED, ROUTER_EMBEDDING_MARGIN, ROUTER_EMBEDDING_MIN_SCORE
+from index_selector import get_top_relevant_indices
+
+logger = logging.getLogger(__name__)
+
+# Кэш векторов описаний (рядом с json_container_cache.json)
+EMBEDDINGS_CACHE_DIR = Path(__file__).parent.parent / "cache"
+
+# Абзацы короче этого порога (заголовки) не векторизуются
+MIN_SECTION_CHARS = 80
+
+# Косинусное сходство bge-m3, соответствующее 0% и 100% релевантности
+SIMILARITY_FLOOR = 0.35
+SIMILARITY_CEIL = 0.75
+
+# Сколько самых близких абзацев отчета усредняется в оценку
+TOP_SECTIONS_PER_REPORT = 2
+
+
+def split_description(text: str) -> list[str]:
+    """Разбивает описание отчета на абзацы (без коротких заголовков)."""
+    sections = [part.strip() for part in text.split("\n\n")]
+    sections = [part for part in sections if len(part) >= MIN_SECTION_CHARS]
+    return sections or [text.strip()]
+
+
+def descriptions_hash(report_descriptions: Dict[str, str]) -> str:
+    """Хэш содержимого описаний (меняется при редактировании любого файла)."""
+    digest = hashlib.sha256()
+    for name in sorted(report_descriptions):
+        digest.update(name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(report_descriptions[name].encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def similarity_to_score(similarity: float) -> float:
+    """Переводит косинусное сходство в процент релевантности 0-100."""
+    score = (similarity - SIMILARITY_FLOOR) / (SIMILARITY_CEIL - SIMILARITY_FLOOR) * 100
+    return float(min(100.0, max(0.0, score)))
+
+
+class EmbeddingRouter:
+    """
+    Оценка релевантности отчетов по косинусному сходству эмбеддингов.
+
+    Args:
+        model: Модель с методом encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+               (SentenceTransformer). None - модель загружается через utils.get_embedding_model()
+        cache_dir: Директория дискового кэша векторов (None - только память)
+    """
+
+    def __init__(self, model=None, cache_dir: Path | None = EMBEDDINGS_CACHE_DIR):
+        self._model = model
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._fitted_hash: str | None = None
+        self._vectors: np.ndarray | None = None
+        self._owners: list[str] = []
+
+    def _get_model(self):
+        if self._model is None:
+            # Ленивый импорт: utils тянет pyrogram и langchain
+            from utils import get_embedding_model
+            self._model = get_embedding_model()
+        return self._model
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        model = self._get_model()
+        if model is None:
+            raise RuntimeError("Модель эмбеддингов недоступна")
+        return np.asarray(model.encode(texts, normalize_embeddings=True, convert_to_numpy=True), dtype=np.float32)
+
+    def _cache_path(self, content_hash: str) -> Path | None:
+        return self.cache_dir / f"report_embeddings_{content_hash[:16]}.npz" if self.cache_dir else None
+
+    def fit(self, report_descriptions: Dict[str, str]) -> None:
+        """Векторизует описания отчетов (no-op, если описания не изменились)."""
+        content_hash = descriptions_hash(report_descriptions)
+        with self._lock:
+            if self._fitted_hash == content_hash:
+                return
+
+            cache_path = self._cache_path(content_hash)
+            if cache_path is not None and cache_path.exists():
+                try:
+                    data = np.load(cache_path, allow_pickle=False)
+                    self._vectors = data["vectors"]
+                    self._owners = [str(owner) for owner in data["owners"]]
+                    self._fitted_hash = content_hash
+                    logger.info(f"[EmbeddingRouter] Векторы описаний загружены из кэша: {cache_path.name}")
+                    return
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"[EmbeddingRouter] Поврежденный кэш векторов {cache_path.name}: {e}")
+
+            owners: list[str] = []
+            sections: list[str] = []
+            for name, text in report_descriptions.items():
+                for section in split_description(text):
+                    owners.append(name)
+                    sections.append(section)
+
+            logger.info(
+                f"[EmbeddingRouter] Векторизация {len(sections)} абзацев "
+                f"{len(report_descriptions)} описаний отчетов..."
+            )
+            self._vectors = self._encode(sections)
+            self._owners = owners
+            self._fitted_hash = content_hash
+
+            if cache_path is not None:
+                try:
+                    cache_path.parent.mkdir(parents=True, exist_ok=True)
+                    np.savez(cache_path, vectors=self._vectors, owners=np.array(owners))
+                except OSError as e:
+                    logger.warning(f"[EmbeddingRouter] Не удалось сохранить кэш векторов: {e}")
+
+    def score(self, question: str, report_descriptions: Dict[str, str]) -> Dict[str, float]:
+        """
+        Оценивает релевантность всех отчетов для вопроса.
+
+        Returns:
+            Dict[str, float]: {имя_отчета: релевантность 0-100}
+        """
+        self.fit(report_descriptions)
+        query = self._encode([question])[0]
+        similarities = self._vectors @ query
+
+        per_report: dict[str, list[float]] = {}
+        for owner, similarity in zip(self._owners, similarities):
+            per_report.setdefault(owner, []).append(float(similarity))
+
+        scores = {}
+        for name, values in per_report.items():
+            top = sorted(values, reverse=True)[:TOP_SECTIONS_PER_REPORT]
+            scores[name] = round(similarity_to_score(sum(top) / len(top)), 1)
+        return scores
+
+
+def is_confident(
+    scores: Dict[str, float],
+    margin: float = ROUTER_EMBEDDING_MARGIN,
+    min_score: float = ROUTER_EMBEDDING_MIN_SCORE
+) -> bool:
+    """
+    Достаточно ли уверена оценка эмбеддингов для выбора индекса без LLM.
+
+    Сравниваются оценки индексов (как их агрегирует index_selector): лучший
+    индекс должен набрать не менее min_score и опережать второй на margin.
+    """
+    top = get_top_relevant_indices(scores, top_k=2, min_score=0.0)
+    if not top or top[0][1] < min_score:
+        return False
+    return len(top) == 1 or top[0][1] - top[1][1] >= margin
+
+
+_router: EmbeddingRouter | None = None
+
+
+def get_embedding_router() -> EmbeddingRouter:
+    """Возвращает общий экземпляр роутера."""
+    global _router
+    if _router is None:
+        _router = EmbeddingRouter()
+    return _router
+
+
+async def route_by_embeddings(question: str, report_descriptions: Dict[str, str]) -> Dict[str, float] | None:
+    """
+    Локальная оценка релевантности отчетов.
+
+    Returns:
+        Dict[str, float] | None: Оценки отчетов или None, если локальный роутер
+                                 выключен, недоступен или не уверен (нужен LLM)
+    """
+    if not ROUTER_EMBEDDING_ENABLED:
+        return None
+
+    try:
+        scores = await asyncio.to_thread(get_embedding_router().score, question, report_descriptions)
+    except Exception as e:
+        logger.warning(f"[EmbeddingRouter] Локальная оценка недоступна, используется LLM: {e}")
+        return None
+
+    if not is_confident(scores):
+        logger.info("[EmbeddingRouter] Лучшие индексы слишком близки - решение за LLM")
+        return None
+
+    return scores
+
+
+def top_indices_agree(
+    original: str,
+    expanded: str,
+    report_descriptions: Dict[str, str],
+    top_k: int = 3
+) -> bool:
+    """
+    Совпадают ли top_k индексов для исходного и улучшенного вопроса.
+
+    Используется для проверки спекулятивной маршрутизации: если улучшение
+    вопроса не меняет набор лучших индексов, рекомендации Router Agent
+    по исходному вопросу остаются верными.
+    """
+    router = get_embedding_router()
+    before = get_top_relevant_indices(router.score(original, report_descriptions), top_k=top_k, min_score=0.0)
+    after = get_top_relevant_indices(router.score(expanded, report_descriptions), top_k=top_k, min_score=0.0)
+    return {name for name, _ in before} == {name for name, _ in after}
+
+
+async def warm_up_embedding_router(report_descriptions: Dict[str, str]) -> None:
+    """Векторизует описания заранее (при старте бота), чтобы первый вопрос не ждал."""
+    if not ROUTER_EMBEDDING_ENABLED:
+        return
+    try:
+        await asyncio.to_thread(get_embedding_router().fit, report_descriptions)
+        logger.info("[EmbeddingRouter] Векторы описаний отчетов готовы")
+    except Exception as e:
+        logger.warning(f"[EmbeddingRouter] Не удалось подготовить векторы: {e}")
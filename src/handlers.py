@@ -22,7 +22,7 @@ from config import (
     get_auth_manager
 )
 from utils import run_loading_animation, openai_audio_filter, get_username_from_chat
-from constants import COMMAND_HISTORY, COMMAND_STATS, COMMAND_REPORTS
+from constants import COMMAND_HISTORY, COMMAND_STATS, COMMAND_REPORTS, COMMAND_TRANSCRIPTION
 from conversation_manager import conversation_manager
 from md_storage import md_storage_manager
 from validators import validate_date_format, check_audio_file_size, check_state, check_file_detection, check_valid_data, validate_building_type, _validate_username
@@ -44,7 +44,8 @@ from markups import (
     design_menu_markup,
     building_type_menu_markup,
     make_dialog_markup,
-    edit_menu_markup
+    edit_menu_markup,
+    pending_audio_markup
 )
 
 from menus import (
@@ -84,8 +85,14 @@ INDEX_SELECTION_MENU_TEXT_FULL = (
 )
 
 from run_analysis import run_analysis_with_spinner, run_dialog_mode, ROUTER_TO_RAG_MAPPING, _get_router_recommendations
+from request_context import cancel_request
+from semantic_cache import get_semantic_cache
 
-from audio_utils import extract_audio_filename, define_audio_file_params, transcribe_audio_and_save
+from audio_utils import extract_audio_filename, define_audio_file_params, transcribe_audio_with_upload
+from transcription import AudioDurationError
+from transcription_cache import file_sha256, audio_object_name
+from transcription_jobs import get_transcription_job_store, format_job_progress
+from audio_queue import AudioJob, AudioJobQueue, AudioJobAttemptsError
 
 from openai import PermissionDeniedError as OpenAIPermissionError
 
@@ -178,8 +185,9 @@ minio_manager = get_minio_manager()
 
 filter_wav_document = filters.create(openai_audio_filter)
 
-audio_file_name_to_save = ""
-transcription_text = ""
+
+# Временная директория скачанных аудио (поддиректория на каждую задачу очереди)
+AUDIO_TMP_DIR = "/root/Vox/VoxPersona/temp_audio"
 
 rags = {}
 rags_lock = asyncio.Lock()
@@ -190,6 +198,8 @@ async def set_rags(new_rags: dict[str, Any]) -> None:
     global rags
     async with rags_lock:
         rags = new_rags
+        # Пересобранные индексы получают новую версию - старые ответы семантического кэша не выдаются
+        get_semantic_cache().sync_index_versions(new_rags)
 
 async def ask_client(data: dict[str, Any], text: str, state: dict[str, Any], chat_id: int, app: Client):
     data["client"] = parse_name(text)
@@ -374,6 +384,29 @@ async def handle_stats_command(message: Message, app: Client) -> None:
         await app.send_message(chat_id, "❌ Произошла ошибка при получении статистики.")
 
 
+async def handle_transcription_command(message: Message, app: Client) -> None:
+    """Обработчик команды /transcription: очередь аудио и прогресс задач транскрибации."""
+    chat_id = message.chat.id
+
+    try:
+        queued = [
+            f"🕐 {job.payload.get('file_name', '')}: в очереди, позиция {audio_job_queue.position(job.job_id)}"
+            for job in (audio_job_queue.user_jobs(chat_id) if audio_job_queue is not None else [])
+            if audio_job_queue.position(job.job_id)
+        ]
+        jobs = get_transcription_job_store().list_jobs(chat_id)
+        if not jobs and not queued:
+            await app.send_message(chat_id, "📭 У вас нет задач транскрибации.")
+            return
+
+        text = "🎙 **Транскрибация:**\n\n" + "\n\n".join(queued + [format_job_progress(job) for job in jobs])
+        await app.send_message(chat_id, text)
+
+    except Exception as e:
+        logging.error(f"Error handling transcription command: {e}")
+        await app.send_message(chat_id, "❌ Произошла ошибка при получении прогресса транскрибации.")
+
+
 async def handle_reports_command(message: Message, app: Client) -> None:
     """Обработчик команды /reports."""
     chat_id = message.chat.id
@@ -491,6 +524,9 @@ async def handle_authorized_text(app: Client, user_states: dict[int, dict[str, A
     elif text_.startswith(COMMAND_REPORTS):
         await handle_reports_command(message, app)
         return
+    elif text_.startswith(COMMAND_TRANSCRIPTION):
+        await handle_transcription_command(message, app)
+        return
 
     # === МУЛЬТИЧАТЫ: Проверка переименования чата ===
     if c_id in user_states and user_states[c_id].get("step") == "renaming_chat":
@@ -577,12 +613,11 @@ async def handle_authorized_text(app: Client, user_states: dict[int, dict[str, A
 
 
     if st.get("step") == "dialog_mode":
-        deep = st.get("deep_search", False)
-
         # НОВАЯ ЛОГИКА: Сохраняем вопрос и показываем меню выбора
         user_states[c_id] = {
             **st,  # Сохраняем существующее состояние
             "pending_question": message.text,  # ← Сохраняем вопрос
+            "dialog_question": message.text,  # ← Исходный вопрос для семантического кэша
             "step": "awaiting_expansion_choice"  # ← Новый шаг
         }
 
@@ -768,7 +803,8 @@ async def process_selected_file(chat_id: int, category: str, filename: str, app:
     spinner_thread.start()
 
     try:
-        result = process_stored_file(category, filename, chat_id, app)
+        # В отдельном потоке: транскрибация и assign_roles не блокируют event loop
+        result = await asyncio.to_thread(process_stored_file, category, filename, chat_id, app)
         if result is not None:
             processed_texts[chat_id] = result
             # app.edit_message_text(chat_id, msg.id, "✅ Файл обработан.")
@@ -895,6 +931,11 @@ async def handle_confirm_data(chat_id: int, app: Client):
             reply_markup=markup
         )
 
+    # Поля файла сохранены - можно обрабатывать следующее аудио пользователя
+    get_audio_job_queue(app).release(chat_id)
+    if st.get("pending_audio"):
+        await app.send_message(chat_id, "✅ Есть обработанное аудио, ожидающее ввода данных.", reply_markup=pending_audio_markup())
+
 async def handle_back_to_confirm(chat_id: int, app: Client):
     st = user_states.get(chat_id)
     if not st:
@@ -912,6 +953,8 @@ async def handle_mode_selection(chat_id: int, mode: str, app: Client):
         "data": {}
     }
     st = user_states[chat_id]
+    # Новый сценарий: ввод полей прежнего файла прерван, очередь пользователя не удерживается
+    get_audio_job_queue(app).release(chat_id)
     await send_menu(chat_id, app, "📦 Меню хранилища:", storage_menu_markup())
 
 async def preprocess_report_without_buildings(chat_id: int, data: str, app: Client, building_name: str = "non-building"):
@@ -920,7 +963,7 @@ async def preprocess_report_without_buildings(chat_id: int, data: str, app: Clie
     mode = st.get("mode")
     data_ = cast(dict[str, Any], st.get("data", {}))
 
-    data_["audio_file_name"] = audio_file_name_to_save
+    data_["audio_file_name"] = st.get("audio_file_name", "")
 
     validate_datas.append(mode)
     validate_datas.append(data_)
@@ -936,7 +979,7 @@ async def preprocess_report_without_buildings(chat_id: int, data: str, app: Clie
             app=app,
             callback_data=data,
             data=data_,
-            transcription_text=transcription_text
+            transcription_text=st.get("transcription_text", "")
         )
     except Exception as e:
         logging.error(f"Ошибка при обработке отчёта {data}: {e}")
@@ -973,6 +1016,218 @@ async def handle_report(chat_id: int, callback_data : str, app: Client):
             data['building_type'] = building_type
             preprocess_report_without_buildings(chat_id, callback_data , app, building_name=building_type)
 
+def process_audio_job(app: Client, job: AudioJob) -> tuple[str, str, str]:
+    """
+    Обработка аудио из очереди (в потоке пула AudioJobQueue):
+    скачивание → транскрибация (параллельно с загрузкой в MinIO) → assign_roles.
+
+    Синхронные вызовы Pyrogram из рабочего потока выполняются в event loop бота.
+    Состояние чата здесь не меняется: пока файл обрабатывается, пользователь может
+    вводить данные предыдущего - результат применяет on_audio_job_complete.
+
+    Returns:
+        (имя файла, транскрипция, текст с расставленными ролями)
+    """
+    c_id = job.chat_id
+    payload = job.payload
+    mode = payload.get("mode")
+    file_name = payload["file_name"]
+
+    # Своя временная директория у каждой задачи: задачи выполняются параллельно
+    tmpdir = os.path.join(payload["tmpdir"], job.job_id)
+    os.makedirs(tmpdir, exist_ok=True)
+    path = os.path.join(tmpdir, file_name)
+
+    status_text = "🔄 Продолжаю обработку аудио после перезапуска..." if job.attempts > 1 else "🎙️ Обрабатываю аудио, подождите..."
+    msg_ = app.send_message(c_id, status_text)
+    st_ev = threading.Event()
+    sp_th = threading.Thread(target=run_loading_animation, args=(c_id, msg_.id, st_ev, app))
+    sp_th.start()
+
+    downloaded = None
+    try:
+        # Скачиваем аудиофайл во временную директорию
+        message = app.get_messages(c_id, payload["message_id"])
+        downloaded = app.download_media(message, file_name=path)
+        if downloaded is None:
+            raise ValueError("Не удалось скачать файл")
+
+        # Объект в MinIO называется хэшем содержимого: одна запись хранится один раз
+        audio_hash = file_sha256(downloaded)
+        object_name = audio_object_name(audio_hash, file_name)
+
+        def on_upload_error(error: Exception) -> None:
+            # Ошибка загрузки не отменяет готовую транскрипцию
+            logging.error(f"❌ Аудиофайл {file_name} не сохранен в MinIO: {error}")
+            app.send_message(
+                c_id,
+                "⚠️ Аудиофайл не удалось сохранить в хранилище, но транскрипция готова - продолжаем."
+            )
+
+        # Загрузка в MinIO не нужна транскрибации - идет в фоне параллельно с ней
+        # и завершается до выхода из transcribe_audio_with_upload
+        job_texts: dict[int, str] = {}
+        transcription_text = transcribe_audio_with_upload(
+            downloaded, c_id, job_texts,
+            upload=lambda: upload_audio_to_minio(c_id, downloaded, object_name, file_name, audio_hash),
+            on_upload_error=on_upload_error,
+            audio_hash=audio_hash
+        )
+
+        app.edit_message_text(c_id, msg_.id, "✅ Аудио обработано!")
+        # Если пользователь выбрал «Интервью» — расставляем роли
+        if isinstance(mode, str):
+            handle_assign_roles(c_id, app, mode, job_texts)
+        return os.path.basename(downloaded), transcription_text, job_texts.get(c_id, transcription_text)
+    finally:
+        # Останавливаем спиннер
+        st_ev.set()
+        sp_th.join()
+
+        if downloaded:
+            delete_tmp_params(msg=msg_, tmp_file=downloaded, tmp_dir=tmpdir, client_id=c_id, app=app)
+
+
+def upload_audio_to_minio(c_id: int, file_path: str, object_name: str, file_name: str, audio_hash: str) -> None:
+    """
+    Загружает аудио в MinIO (пропускает, если объект с таким хэшем уже есть).
+
+    Raises:
+        MinIOUploadError: Загрузка не удалась
+    """
+    if minio_manager.audio_object_exists(object_name):
+        logging.info(f"Аудиофайл {file_name} уже есть в MinIO ({object_name}), загрузка пропущена.")
+        return
+
+    # Используем новый MinIOManager для загрузки
+    metadata = {
+        'user_id': str(c_id),
+        'upload_timestamp': datetime.now().isoformat(),
+        'file_type': 'audio',
+        'processing_status': 'uploaded',
+        'audio_sha256': audio_hash
+    }
+
+    success = minio_manager.upload_audio_file(
+        file_path=file_path,
+        object_name=object_name,
+        metadata=metadata
+    )
+
+    if success:
+        logging.info(f"Аудиофайл {file_name} успешно загружен в MinIO ({object_name}).")
+    else:
+        raise MinIOUploadError(f"Не удалось загрузить {file_name}")
+
+
+async def on_audio_job_complete(app: Client, job: AudioJob, result: tuple[str, str, str]) -> None:
+    """
+    Аудио обработано (в event loop): переход к вводу данных по файлу.
+
+    Если пользователь в диалоге или вводит данные другого файла, результат
+    откладывается до кнопки «Ввести данные». Следующие аудио пользователя
+    не обрабатываются, пока данные файла не сохранены (handle_confirm_data).
+    """
+    c_id = job.chat_id
+    file_name, transcription_text, processed_text = result
+    audio = {
+        "file_name": file_name,
+        "transcription_text": transcription_text,
+        "processed_text": processed_text,
+        "mode": job.payload.get("mode"),
+        "caption": job.payload.get("caption"),
+    }
+    st = user_states.setdefault(c_id, {})
+    if st.get("step"):
+        st.setdefault("pending_audio", []).append(audio)
+        await app.send_message(
+            c_id,
+            f"✅ Аудио «{file_name}» обработано. Введите данные по нему, когда закончите текущее действие.",
+            reply_markup=pending_audio_markup()
+        )
+        return
+
+    await start_audio_fields_input(c_id, audio, app)
+
+
+async def handle_pending_audio(chat_id: int, app: Client) -> None:
+    """Кнопка «Ввести данные»: ввод данных по отложенному аудио."""
+    pending = user_states.get(chat_id, {}).get("pending_audio")
+    if not pending:
+        await app.send_message(chat_id, "Нет обработанных аудио, ожидающих ввода данных.")
+        return
+    await start_audio_fields_input(chat_id, pending.pop(0), app)
+
+
+async def start_audio_fields_input(c_id: int, audio: dict[str, Any], app: Client) -> None:
+    """Результат обработки аудио в состоянии чата и ввод данных (из подписи к файлу или вручную)."""
+    mode = audio["mode"]
+    caption = audio["caption"]
+    st = user_states.setdefault(c_id, {})
+    st["audio_file_name"] = audio["file_name"]
+    st["transcription_text"] = audio["transcription_text"]
+    processed_texts[c_id] = audio["processed_text"]
+    st["step"] = "inputing_fields"
+
+    if caption:
+        try:
+            if isinstance(mode, str):
+                parsed_data = parse_message_text(caption, mode)
+                st["data"] = parsed_data
+                await show_confirmation_menu(c_id, st, app)
+                return
+        except Exception as e:
+            logging.error(f"Ошибка парсинга данных: {e}")
+
+    await app.send_message(c_id, "Не удалось автоматически спарсить данные, необходимо заполнить вручную поля.\n Пожалуйста, введите номер файла:")
+
+
+async def on_audio_job_error(app: Client, job: AudioJob, error: BaseException) -> None:
+    """Ошибка обработки аудио: сообщение пользователю и главное меню."""
+    c_id = job.chat_id
+    if isinstance(error, (MinIOError, MinIOConnectionError, MinIOUploadError)):
+        logging.error(f"❌ Ошибка MinIO: {error}")
+        text = "❌ Ошибка загрузки в хранилище"
+    elif isinstance(error, S3Error):
+        logging.error(f"❌ Ошибка: Не удалось загрузить файл в MinIO.: {error}")
+        text = "❌ Ошибка обработки аудио"
+    elif isinstance(error, OpenAIPermissionError):
+        logging.error("🚫 Ошибка: Whisper недоступен (ключ/регион).")
+        text = "❌ Ошибка обработки аудио"
+    elif isinstance(error, AudioJobAttemptsError):
+        logging.error(f"❌ Задача аудио снята: {error}")
+        text = "❌ Не удалось обработать аудио после нескольких попыток. Отправьте файл заново"
+    elif isinstance(error, AudioDurationError):
+        logging.error(f"❌ Ошибка: {error}")
+        text = "❌ Не удалось определить длительность аудио: файл поврежден или формат не поддерживается"
+    else:
+        text = "❌ Ошибка обработки аудио"
+
+    await app.send_message(c_id, text)
+    await send_main_menu(c_id, app)
+
+
+audio_job_queue: AudioJobQueue | None = None
+
+
+def get_audio_job_queue(app: Client) -> AudioJobQueue:
+    """Очередь обработки аудио (создается при первом обращении)."""
+    global audio_job_queue
+    if audio_job_queue is None:
+        audio_job_queue = AudioJobQueue(
+            process=lambda job: process_audio_job(app, job),
+            on_complete=lambda job, result: on_audio_job_complete(app, job, result),
+            on_error=lambda job, error: on_audio_job_error(app, job, error),
+            hold_after_complete=True
+        )
+    return audio_job_queue
+
+
+async def start_audio_job_queue(app: Client) -> None:
+    """Создает очередь аудио и возвращает в нее задачи, прерванные рестартом."""
+    await get_audio_job_queue(app).restore()
+
+
 def handle_assign_roles(chat_id: int, app: Client, mode: str, processed_texts: dict[int, str]):
     # Если пользователь выбрал «Интервью» — расставляем роли
     if mode == "interview":
@@ -1019,7 +1274,7 @@ async def handle_choose_building(chat_id: int, data: str, app: Client):
         logging.error("mode не является строкой")
         return
 
-    data_["audio_file_name"] = audio_file_name_to_save
+    data_["audio_file_name"] = st.get("audio_file_name", "")
 
     # Преобразуем short_name из callback в нормальное название
     building_name = mapping_building_names.get(short_name, short_name)
@@ -1039,7 +1294,7 @@ async def handle_choose_building(chat_id: int, data: str, app: Client):
         app=app,
         callback_data=pending_report,
         data=data_,
-        transcription_text=transcription_text
+        transcription_text=st.get("transcription_text", "")
     )
 
     st["pending_report"] = None
@@ -1081,6 +1336,64 @@ async def handle_mode_fast(callback: CallbackQuery, app: Client):
     )
 
 
+async def handle_deep_preliminary(callback: CallbackQuery, app: Client):
+    """
+    Обработчик кнопки "Предварительный ответ" в статусе глубокого исследования.
+
+    Ставит флаг в user_states - run_deep_search проверяет его при следующем
+    обработанном чанке и агрегирует уже найденные цитаты.
+    """
+    chat_id = callback.message.chat.id
+    st = user_states.setdefault(chat_id, {})
+    st["deep_search_preliminary"] = True
+
+    await callback.answer("📝 Готовлю предварительный ответ по найденным цитатам...")
+    logging.info(f"Пользователь {chat_id} запросил предварительный ответ глубокого исследования")
+
+
+async def handle_cancel_request(callback: CallbackQuery, app: Client):
+    """
+    Обработчик кнопки "Отменить" выполняющегося запроса диалога.
+
+    Отменяет RequestContext пользователя - вызовы Claude API и воркеры
+    глубокого исследования останавливаются при ближайшей проверке.
+    """
+    chat_id = callback.message.chat.id
+
+    if cancel_request(chat_id):
+        await callback.answer("⏹ Останавливаю запрос...")
+        logging.info(f"Пользователь {chat_id} отменил запрос диалога")
+    else:
+        await callback.answer("Нет активного запроса", show_alert=True)
+
+
+async def handle_semantic_cache_bypass(callback: CallbackQuery, app: Client):
+    """
+    Обработчик кнопки "Искать заново" под ответом из семантического кэша.
+
+    Запускает для вопроса обычный путь (меню выбора: как есть / улучшить)
+    мимо кэша - новый ответ заменит закэшированный для следующих вопросов.
+    """
+    chat_id = callback.message.chat.id
+    st = user_states.get(chat_id, {})
+    question = st.pop("semantic_cache_question", None)
+
+    if not question or st.get("step") != "dialog_mode":
+        await callback.answer("⚠️ Вопрос не найден, задайте его заново", show_alert=True)
+        return
+
+    user_states[chat_id] = {
+        **st,
+        "pending_question": question,
+        "dialog_question": question,
+        "semantic_cache_bypass": True,
+        "step": "awaiting_expansion_choice"
+    }
+    await callback.answer("🔄 Ищу заново")
+    logging.info(f"Пользователь {chat_id} запросил поиск мимо семантического кэша")
+    await show_query_choice_menu(chat_id, question, app)
+
+
 async def handle_mode_deep(callback: CallbackQuery, app: Client):
     """Обработчик выбора глубокого исследования."""
     # ВРЕМЕННО ОТКЛЮЧЕНО: Функция не оптимизирована (дорогая и долгая)
@@ -1857,17 +2170,15 @@ def register_handlers(app: Client):
 
     # === AUTH: Применение auth_filter к аудио сообщениям (ИЗМЕНЕНИЕ 3) ===
     @app.on_message((filters.voice | filters.audio | filter_wav_document) & auth_filter)  # type: ignore[misc,reportUntypedFunctionDecorator]
-    async def handle_audio_msg(app: Client, message: Message, tmpdir: str="/root/Vox/VoxPersona/temp_audio", max_size: int=2 * 1024 * 1024 * 1024):
+    async def handle_audio_msg(app: Client, message: Message, tmpdir: str=AUDIO_TMP_DIR, max_size: int=2 * 1024 * 1024 * 1024):
         """
         Приём голосового или аудио-сообщения, до 2 ГБ.
-        Транскрибируем → assign_roles → сохраняем в processed_texts для дальнейшего анализа.
-        Аудиофайл сохраняется в MinIO, временная директория удаляется.
+        Обработка (скачивание → транскрибация параллельно с загрузкой в MinIO → assign_roles) ставится
+        в фоновую очередь, пользователь получает позицию в очереди.
 
         ✅ ОБНОВЛЕНО: Используется auth_filter для автоматической проверки авторизации
         """
         c_id = message.chat.id
-        global audio_file_name_to_save
-        global transcription_text
         st = user_states.get(c_id, {})
         mode = st.get("mode")
 
@@ -1886,97 +2197,22 @@ def register_handlers(app: Client):
             logging.exception(e)
             return
 
-        os.makedirs(tmpdir, exist_ok=True)
-
-        file_name = extract_audio_filename(message)
-        path = os.path.join(tmpdir, file_name)
-
-        msg_ = app.send_message(c_id, "🎙️ Обрабатываю аудио, подождите...")
-        st_ev = threading.Event()
-        sp_th = threading.Thread(target=run_loading_animation, args=(c_id, msg_.id, st_ev, app))
-        sp_th.start()
-
-        try:
-            # Скачиваем аудиофайл во временную директорию
-            downloaded = app.download_media(message, file_name=path)
-            if downloaded is None:
-                raise ValueError("Не удалось скачать файл")
-            audio_file_name_to_save = os.path.basename(downloaded)
-
-            # Используем новый MinIOManager для загрузки
-            metadata = {
-                'user_id': str(c_id),
-                'upload_timestamp': datetime.now().isoformat(),
-                'file_type': 'audio',
-                'processing_status': 'uploaded'
-            }
-
-            success = minio_manager.upload_audio_file(
-                file_path=downloaded,
-                object_name=file_name,
-                metadata=metadata
+        queue = get_audio_job_queue(app)
+        job = await queue.submit(c_id, {
+            "message_id": message.id,
+            "file_name": extract_audio_filename(message),
+            "mode": mode,
+            "caption": message.caption.strip() if message.caption else None,
+            "tmpdir": tmpdir,
+        })
+
+        position = queue.position(job.job_id)
+        if position:
+            await app.send_message(
+                c_id,
+                f"🕐 Аудио в очереди на обработку (позиция {position}). Пришлю результат, когда обработка завершится."
             )
 
-            if success:
-                logging.info(f"Аудиофайл {file_name} успешно загружен в MinIO.")
-            else:
-                raise MinIOUploadError(f"Не удалось загрузить {file_name}")
-
-            transcription_text = transcribe_audio_and_save(downloaded, c_id, processed_texts)
-
-            app.edit_message_text(c_id, msg_.id, "✅ Аудио обработано!")
-            # Если пользователь выбрал «Интервью» — расставляем роли
-            if isinstance(mode, str):
-                handle_assign_roles(c_id, app, mode, processed_texts)
-            st["step"] = "inputing_fields"
-            if message.caption:
-                text = message.caption.strip()
-                try:
-                    if isinstance(mode, str):
-                        parsed_data = parse_message_text(text, mode)
-                        st["data"] = parsed_data
-                        await show_confirmation_menu(c_id, st, app)
-                    else:
-                        app.send_message(c_id, "Не удалось автоматически спарсить данные, необходимо заполнить вручную поля.\n Пожалуйста, введите номер файла:")
-                except Exception as e:
-                    app.send_message(c_id, "Не удалось автоматически спарсить данные, необходимо заполнить вручную поля.\n Пожалуйста, введите номер файла:")
-                    logging.error(f"Ошибка парсинга данных: {e}")
-                return
-            else:
-                app.send_message(c_id, "Не удалось автоматически спарсить данные, необходимо заполнить вручную поля.\n Пожалуйста, введите номер файла:")
-
-        except (MinIOError, MinIOConnectionError, MinIOUploadError) as e:
-            logging.error(f"❌ Ошибка MinIO: {e}")
-            app.edit_message_text(c_id, msg_.id, "❌ Ошибка загрузки в хранилище")
-            send_main_menu(c_id, app)
-            return
-
-        except S3Error as e:
-            logging.error(f"❌ Ошибка: Не удалось загрузить файл в MinIO.: {e}")
-            app.edit_message_text(c_id, msg_.id, "❌ Ошибка обработки аудио")
-            send_main_menu(c_id, app)
-            return
-
-        except OpenAIPermissionError:
-            logging.exception("🚫 Ошибка: Whisper недоступен (ключ/регион).")
-            # app.edit_message_text(c_id, msg_.id, "🚫 Ошибка: Whisper недоступен (ключ/регион).")
-            app.edit_message_text(c_id, msg_.id, "❌ Ошибка обработки аудио")
-            send_main_menu(c_id, app)
-        except Exception as e:
-            logging.exception(f"❌Ошибка обработки аудио: {e}")
-            # app.edit_message_text(c_id, msg_.id, f"❌ Ошибка: {e}")
-            app.edit_message_text(c_id, msg_.id, "❌ Ошибка обработки аудио")
-            send_main_menu(c_id, app)
-        finally:
-            # Останавливаем спиннер
-            st_ev.set()
-            sp_th.join()
-
-            # Проверяем, что downloaded был создан в try блоке
-            downloaded_file = locals().get('downloaded')
-            if downloaded_file:
-                delete_tmp_params(msg=msg_, tmp_file=downloaded_file, tmp_dir=tmpdir, client_id=c_id, app=app)
-
     # === AUTH: Применение auth_filter к документам (ИЗМЕНЕНИЕ 3) ===
     @app.on_message(filters.document & auth_filter)  # type: ignore[misc,reportUntypedFunctionDecorator]
     def handle_document_msg(app: Client, message: Message):
@@ -2176,6 +2412,19 @@ def register_handlers(app: Client):
                 return
             # === END INDEX MODE SELECTION CALLBACKS ===
 
+            # === DEEP SEARCH PROGRESS CALLBACKS ===
+            elif data == "deep_preliminary":
+                await handle_deep_preliminary(callback, app)
+                return
+
+            elif data == "cancel_request":
+                await handle_cancel_request(callback, app)
+                return
+
+            elif data == "semantic_cache_bypass":
+                await handle_semantic_cache_bypass(callback, app)
+                return
+
             # === КОНЕЦ QUERY EXPANSION ===
 
             # Главное меню
@@ -2371,7 +2620,9 @@ def register_handlers(app: Client):
 
             # Подтверждение данных
             elif data == "confirm_data":
-                handle_confirm_data(c_id, app)
+                await handle_confirm_data(c_id, app)
+            elif data == "pending_audio":
+                await handle_pending_audio(c_id, app)
             elif data == "edit_data":
                 current_state = user_states.get(c_id, {})
                 await show_edit_menu(c_id, current_state, app)
@@ -2699,44 +2950,21 @@ async def handle_expand_refine(callback: CallbackQuery, app: Client):
         selected_index = expansion_data.get("selected_index", None)
 
         # Рекурсивно вызываем expand_query (с исходным вопросом!)
-        from query_expander import expand_query
-        expansion_result = expand_query(original_question)
+        # FIX R1: Пересчитываем top_indices для нового улучшенного вопроса
+        # Это необходимо для актуальных рекомендаций в меню
+        # expand_and_route: expand_query вне event loop, Router Agent параллельно (спекулятивно)
+        from run_analysis import expand_and_route
+        expansion_result, new_top_indices, total_tokens = await expand_and_route(original_question, chat_id)
 
         # Увеличиваем счетчик попыток
         expansion_result["refine_count"] = refine_count + 1
 
-        # Токены от expand_query
-        expansion_tokens = expansion_result.get("tokens_used", {"input_tokens": 0, "output_tokens": 0})
-
-        # FIX R1: Пересчитываем top_indices для нового улучшенного вопроса
-        # Это необходимо для актуальных рекомендаций в меню
-        from relevance_evaluator import evaluate_report_relevance, load_report_descriptions
-        from index_selector import get_top_relevant_indices
-
-        new_top_indices = None
-        router_tokens = {"input_tokens": 0, "output_tokens": 0}
-        try:
-            # ВАЖНО: Используем load_report_descriptions() из relevance_evaluator.py
-            # который возвращает ПОЛНЫЕ имена отчетов, соответствующие REPORT_TO_INDEX_MAPPING
-            report_descriptions = load_report_descriptions()
-            # evaluate_report_relevance теперь возвращает tuple (results, tokens_used)
-            report_relevance, router_tokens = await evaluate_report_relevance(
-                expansion_result["expanded"],
-                report_descriptions
-            )
-            new_top_indices = get_top_relevant_indices(report_relevance, top_k=3, min_score=10.0)
+        if new_top_indices:
             logger.info(f"[Refine] Пересчитаны top_indices: {len(new_top_indices)} рекомендаций")
-        except Exception as e:
-            logger.warning(f"[Refine] Ошибка пересчета top_indices: {e}")
+        else:
             # При ошибке используем старые top_indices если есть
             new_top_indices = expansion_data.get("top_indices", None)
-
-        # Агрегация токенов для показа пользователю
-        total_tokens = {
-            "input_tokens": expansion_tokens["input_tokens"] + router_tokens["input_tokens"],
-            "output_tokens": expansion_tokens["output_tokens"] + router_tokens["output_tokens"]
-        }
-        logger.info(f"[Refine] Токены: expand={expansion_tokens}, router={router_tokens}, total={total_tokens}")
+        logger.info(f"[Refine] Токены: expand + router = {total_tokens}")
 
         # Показываем новый улучшенный вопрос
         from run_analysis import show_expanded_query_menu
@@ -2984,7 +3212,8 @@ async def handle_query_improve(callback: CallbackQuery, app: Client):
         report_descriptions = load_report_descriptions()
 
         # enhance_question_for_index теперь возвращает tuple (expanded_question, tokens_used)
-        expanded_question, enhance_tokens = enhance_question_for_index(
+        expanded_question, enhance_tokens = await asyncio.to_thread(
+            enhance_question_for_index,
             original_question=original_question,
             selected_index=best_index,
             report_descriptions=report_descriptions,
@@ -0,0 +1,61 @@
+"""
+Общая aiohttp-сессия для асинхронных запросов к Claude API.
+
+ПРОБЛЕМА:
+- run_deep_search создавал новую aiohttp.ClientSession на каждый запрос
+  пользователя: заново открывались TCP/TLS соединения к api.anthropic.com
+
+РЕШЕНИЕ:
+Одна сессия на event loop, создается лениво и переиспользуется всеми
+вызовами (keep-alive пул соединений). Сессия привязана к loop, в котором
+создана: при смене loop (например, asyncio.run в тестах и скриптах)
+создается новая.
+
+ИСПОЛЬЗОВАНИЕ:
+```python
+session = await get_http_session()
+await send_msg_to_model_async(session=session, ...)
+
+# При остановке бота:
+await close_http_session()
+```
+"""
+
+import asyncio
+import logging
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Максимум одновременных соединений в пуле сессии
+HTTP_POOL_LIMIT = 100
+# Время жизни keep-alive соединения в пуле (сек)
+HTTP_KEEPALIVE_TIMEOUT = 60
+
+_session: aiohttp.ClientSession | None = None
+_session_loop: asyncio.AbstractEventLoop | None = None
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """Возвращает общую aiohttp-сессию текущего event loop (создает при необходимости)."""
+    global _session, _session_loop
+
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_LIMIT, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT)
+        )
+        _session_loop = loop
+        logger.info("[HTTP] Создана общая aiohttp-сессия")
+    return _session
+
+
+async def close_http_session() -> None:
+    """Закрывает общую сессию (вызывается при остановке бота)."""
+    global _session, _session_loop
+
+    if _session is not None and not _session.closed and _session_loop is asyncio.get_running_loop():
+        await _session.close()
+    _session = None
+    _session_loop = None
@@ -0,0 +1,213 @@
+"""
+Кэш детерминированных ответов Claude API.
+
+ПРОБЛЕМА:
+- classify_query, classify_report_type, expand_query и evaluate_batch_relevance
+  работают с temperature 0-0.1 и часто вызываются с одинаковыми входными
+  данными (повторные вопросы, цикл уточнения handle_expand_refine,
+  возврат в меню handle_back_to_query_menu) - каждый раз полный round-trip к API
+
+РЕШЕНИЕ:
+Ключ кэша - (модель, хэш system промпта, хэш messages, max_tokens).
+1. Память: LRU на LLM_CACHE_MAX_ENTRIES записей
+2. Диск (опционально, LLM_CACHE_DIR): один JSON файл на запись, переживает рестарт
+3. TTL задается для каждого места вызова (CACHE_SITE_TTLS)
+4. Метрики попаданий по местам вызова (get_stats)
+
+Изменение промпта (например, descry.md или описаний отчетов) меняет хэш,
+поэтому устаревшие ответы не возвращаются.
+
+ИСПОЛЬЗОВАНИЕ:
+```python
+cache = get_llm_cache()
+key = cache.make_key(model, system, messages, max_tokens)
+text = cache.get(key, CACHE_SITE_CLASSIFY_QUERY)
+if text is None:
+    text = ...  # запрос к API
+    cache.set(key, text, CACHE_SITE_CLASSIFY_QUERY)
+```
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from config import LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Места вызова (используются в ключах метрик и для выбора TTL)
+CACHE_SITE_CLASSIFY_QUERY = "classify_query"
+CACHE_SITE_CLASSIFY_REPORT_TYPE = "classify_report_type"
+CACHE_SITE_EXPAND_QUERY = "expand_query"
+CACHE_SITE_BATCH_RELEVANCE = "evaluate_batch_relevance"
+
+# TTL ответов по местам вызова (сек)
+CACHE_SITE_TTLS: dict[str, float] = {
+    CACHE_SITE_CLASSIFY_QUERY: 24 * 3600,
+    CACHE_SITE_CLASSIFY_REPORT_TYPE: 7 * 24 * 3600,
+    CACHE_SITE_EXPAND_QUERY: 6 * 3600,
+    CACHE_SITE_BATCH_RELEVANCE: 24 * 3600,
+}
+DEFAULT_CACHE_TTL = 3600
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheSiteStats:
+    """Метрики кэша одного места вызова."""
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LLMResponseCache:
+    """
+    Двухуровневый (память + диск) кэш ответов модели с TTL.
+
+    Args:
+        max_entries: Размер LRU в памяти
+        disk_dir: Директория дискового уровня (None - только память)
+        enabled: False - get всегда промах, set ничего не делает
+    """
+
+    def __init__(self, max_entries: int = 1000, disk_dir: str | Path | None = None, enabled: bool = True):
+        self.max_entries = max(1, max_entries)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.enabled = enabled
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._stats: dict[str, CacheSiteStats] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str | None, system: str | None, messages: list[dict[str, Any]], max_tokens: int) -> str:
+        """Ключ кэша: (модель, хэш system, хэш messages, max_tokens)."""
+        system_hash = _sha256(system or "")
+        messages_hash = _sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True))
+        return _sha256(f"{model}|{system_hash}|{messages_hash}|{max_tokens}")
+
+    def _site_stats(self, site: str) -> CacheSiteStats:
+        stats = self._stats.get(site)
+        if stats is None:
+            stats = self._stats[site] = CacheSiteStats()
+        return stats
+
+    def _disk_path(self, key: str) -> Path | None:
+        return self.disk_dir / f"{key}.json" if self.disk_dir else None
+
+    def _read_disk(self, key: str) -> tuple[float, str] | None:
+        path = self._disk_path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            return float(data["expires_at"]), str(data["value"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"[LLMCache] Поврежденная запись {path.name}: {e}")
+            return None
+
+    def _write_disk(self, key: str, expires_at: float, value: str, site: str) -> None:
+        path = self._disk_path(key)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Атомарная запись: временный файл + rename
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "site": site, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[LLMCache] Не удалось записать {path.name}: {e}")
+
+    def get(self, key: str, site: str) -> str | None:
+        """Возвращает закэшированный ответ или None (промах/истек TTL)."""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            stats = self._site_stats(site)
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    stats.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is not None and entry[0] > now:
+                self._put_memory_locked(key, entry)
+                stats.disk_hits += 1
+                logger.debug(f"[LLMCache] {site}: попадание (диск)")
+                return entry[1]
+            stats.misses += 1
+        return None
+
+    def set(self, key: str, value: str, site: str, ttl: float | None = None) -> None:
+        """Сохраняет ответ с TTL места вызова (или явным ttl)."""
+        if not self.enabled or not value:
+            return
+
+        ttl = ttl if ttl is not None else CACHE_SITE_TTLS.get(site, DEFAULT_CACHE_TTL)
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._put_memory_locked(key, (expires_at, value))
+        self._write_disk(key, expires_at, value, site)
+
+    def _put_memory_locked(self, key: str, entry: tuple[float, str]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        """Очищает память (дисковые записи остаются до истечения TTL)."""
+        with self._lock:
+            self._memory.clear()
+
+    def get_stats(self) -> dict[str, CacheSiteStats]:
+        """Метрики попаданий по местам вызова (копия)."""
+        with self._lock:
+            return {site: CacheSiteStats(s.memory_hits, s.disk_hits, s.misses) for site, s in self._stats.items()}
+
+
+_cache: LLMResponseCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Возвращает общий кэш ответов (создается при первом обращении)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache(
+                    max_entries=LLM_CACHE_MAX_ENTRIES,
+                    disk_dir=LLM_CACHE_DIR or None,
+                    enabled=LLM_CACHE_ENABLED
+                )
+    return _cache
@@ -0,0 +1,121 @@
+"""
+Реестр долгоживущих клиентов Anthropic по API ключам.
+
+ПРОБЛЕМА:
+- send_msg_to_model создавал anthropic.Anthropic на каждый вызов, а
+  relevance_evaluator - anthropic.AsyncAnthropic на каждую оценку: каждый
+  короткий запрос (classify_query, Router Agent) заново открывал TCP/TLS
+  соединение к api.anthropic.com
+
+РЕШЕНИЕ:
+Один sync клиент на ключ и один async клиент на ключ и event loop (пул
+соединений httpx привязан к loop, в котором создан). Клиенты используют
+настроенный пул keep-alive соединений и переиспользуются всеми модулями.
+
+ИСПОЛЬЗОВАНИЕ:
+```python
+client = get_anthropic_client(api_key)
+response = client.messages.create(...)
+
+client = get_async_anthropic_client(api_key)
+response = await client.messages.create(...)
+
+# При остановке бота:
+await close_llm_clients()
+```
+"""
+
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any
+
+import anthropic
+import httpx
+
+from config import (
+    ANTHROPIC_POOL_MAX_CONNECTIONS, ANTHROPIC_POOL_MAX_KEEPALIVE, ANTHROPIC_POOL_KEEPALIVE_EXPIRY
+)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# (класс клиента, ключ) -> sync клиент
+_sync_clients: dict[tuple[Any, str], Any] = {}
+# event loop -> {(класс клиента, ключ) -> async клиент}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple[Any, str], Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=ANTHROPIC_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=ANTHROPIC_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=ANTHROPIC_POOL_KEEPALIVE_EXPIRY
+    )
+
+
+def get_anthropic_client(api_key: str | None) -> anthropic.Anthropic:
+    """Возвращает общий sync клиент для ключа (создает при первом обращении)."""
+    client_class = anthropic.Anthropic
+    cache_key = (client_class, api_key or "")
+
+    with _lock:
+        client = _sync_clients.get(cache_key)
+        if client is None:
+            client = client_class(
+                api_key=api_key or "",
+                http_client=anthropic.DefaultHttpxClient(limits=_pool_limits())
+            )
+            _sync_clients[cache_key] = client
+            logger.info(f"[LLMClients] Создан sync клиент Anthropic (клиентов: {len(_sync_clients)})")
+        return client
+
+
+def get_async_anthropic_client(api_key: str | None) -> anthropic.AsyncAnthropic:
+    """
+    Возвращает общий async клиент для ключа и текущего event loop.
+
+    Вне event loop возвращает новый клиент без кэширования.
+    """
+    client_class = anthropic.AsyncAnthropic
+    cache_key = (client_class, api_key or "")
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return client_class(api_key=api_key or "")
+
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(cache_key)
+        if client is None:
+            client = client_class(
+                api_key=api_key or "",
+                http_client=anthropic.DefaultAsyncHttpxClient(limits=_pool_limits())
+            )
+            clients[cache_key] = client
+            logger.info(f"[LLMClients] Создан async клиент Anthropic (клиентов в loop: {len(clients)})")
+        return client
+
+
+async def close_llm_clients() -> None:
+    """Закрывает все клиенты (async - только текущего event loop)."""
+    with _lock:
+        sync_clients = list(_sync_clients.values())
+        _sync_clients.clear()
+        async_clients = list(_async_clients.pop(asyncio.get_running_loop(), {}).values())
+
+    for client in sync_clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"[LLMClients] Ошибка закрытия sync клиента: {e}")
+
+    for client in async_clients:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"[LLMClients] Ошибка закрытия async клиента: {e}")
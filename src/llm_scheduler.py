@@ -0,0 +1,404 @@
+"""
+Глобальный приоритетный планировщик запросов к Claude API.
+
+ПРОБЛЕМА:
+- Быстрый поиск, глубокое исследование, анализ методологии, query expansion
+  и Router Agent используют одни и те же ключи Anthropic без координации
+- Глубокое исследование одного пользователя (сотни чанков) вытесняет
+  двухсекундный быстрый поиск остальных
+
+РЕШЕНИЕ:
+1. Полосы приоритета (lanes): interactive > router/expansion > deep search > batch analysis
+2. Общий лимит одновременных запросов; часть слотов зарезервирована для
+   interactive/router - фоновые полосы не могут занять их
+3. Справедливость между пользователями: внутри полосы слот получает
+   пользователь с наименьшим количеством выполняющихся запросов
+4. Общий учет лимитов по ключам (token bucket на токены и запросы в минуту):
+   все полосы расходуют общий бакет, но ждут его только фоновые полосы -
+   они оставляют запас для интерактивных запросов, которые никогда не
+   задерживаются планировщиком (для них остается штатный backoff на 429)
+
+Планировщик работает и из потоков (sync вызовы send_msg_to_model),
+и из event loop (send_msg_to_model_async, AsyncAnthropic). slot_sync в
+потоке event loop запрещен: ожидание заблокировало бы loop - sync вызовы
+из корутин выполняются через asyncio.to_thread.
+
+ИСПОЛЬЗОВАНИЕ:
+```python
+scheduler = get_llm_scheduler()
+
+with scheduler.slot_sync(LANE_ROUTER, api_key, tokens):
+    response = client.messages.create(...)
+
+async with scheduler.slot_async(LANE_DEEP_SEARCH, api_key, tokens):
+    async with session.post(...) as response:
+        ...
+```
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
+from config import (
+    ANTHROPIC_API_KEY, ANTHROPIC_API_KEY_2, ANTHROPIC_API_KEY_3, ANTHROPIC_API_KEY_4,
+    ANTHROPIC_API_KEY_5, ANTHROPIC_API_KEY_6, ANTHROPIC_API_KEY_7,
+    LLM_MAX_CONCURRENCY, LLM_RESERVED_INTERACTIVE_SLOTS
+)
+from request_context import RequestContext, get_current_request_context
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета (меньше = важнее)
+LANE_INTERACTIVE = 0   # Быстрый поиск, ответ пользователю
+LANE_ROUTER = 1        # Query expansion, Router Agent, улучшение вопроса, классификация
+LANE_DEEP_SEARCH = 2   # Извлечение цитат глубокого исследования
+LANE_BATCH = 3         # Анализ методологии, отчеты, расстановка ролей
+
+LANE_NAMES = {
+    LANE_INTERACTIVE: "interactive",
+    LANE_ROUTER: "router",
+    LANE_DEEP_SEARCH: "deep_search",
+    LANE_BATCH: "batch",
+}
+
+# Лимиты ключей Anthropic (в порядке ANTHROPIC_API_KEY, ANTHROPIC_API_KEY_2, ...)
+KEY_TOKEN_LIMITS_PER_MIN = [80000, 20000, 20000, 20000, 20000, 20000, 20000]
+KEY_REQUEST_LIMITS_PER_MIN = [2000, 50, 50, 50, 50, 50, 50]
+
+# Доля бакета ключа, которую фоновые полосы оставляют для interactive/router
+BACKGROUND_RATE_HEADROOM = 0.2
+
+# Шаг опроса отмены при ожидании слота (сек)
+WAIT_POLL_INTERVAL = 0.5
+
+
+class SchedulerMisuseError(RuntimeError):
+    """slot_sync вызван из потока event loop - ошибка программы, а не сбой Claude API."""
+
+
+def _is_background(lane: int) -> bool:
+    return lane >= LANE_DEEP_SEARCH
+
+
+def _in_event_loop_thread() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class KeyRateLimiter:
+    """
+    Token bucket лимитов одного API ключа (токены и запросы в минуту).
+
+    Резервирование может увести бакет в минус - следующие фоновые запросы
+    ждут пропорционально долгу, что дает общий учет для всех вызывающих.
+    """
+
+    def __init__(self, tokens_per_min: float, requests_per_min: float):
+        self.token_capacity = float(tokens_per_min)
+        self.request_capacity = float(requests_per_min)
+        self.token_rate = tokens_per_min / 60.0
+        self.request_rate = requests_per_min / 60.0
+        self._tokens = self.token_capacity
+        self._requests = self.request_capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.token_capacity, self._tokens + elapsed * self.token_rate)
+        self._requests = min(self.request_capacity, self._requests + elapsed * self.request_rate)
+
+    def reserve(self, tokens: int, background: bool = False) -> float:
+        """
+        Резервирует запрос и возвращает время ожидания (сек) до его отправки.
+
+        Args:
+            tokens: Оценка входных токенов запроса
+            background: Фоновая полоса - ждет, пока в бакете останется запас
+                        BACKGROUND_RATE_HEADROOM для интерактивных запросов.
+                        Интерактивные запросы только расходуют бакет (ожидание 0)
+        """
+        with self._lock:
+            self._refill_locked(time.monotonic())
+
+            wait = 0.0
+            if background:
+                # Запрос больше емкости бакета не должен ждать бесконечно
+                needed_tokens = min(tokens + self.token_capacity * BACKGROUND_RATE_HEADROOM, self.token_capacity)
+                needed_requests = min(1 + self.request_capacity * BACKGROUND_RATE_HEADROOM, self.request_capacity)
+
+                token_wait = max(0.0, (needed_tokens - self._tokens) / self.token_rate) if self.token_rate > 0 else 0.0
+                request_wait = max(0.0, (needed_requests - self._requests) / self.request_rate) if self.request_rate > 0 else 0.0
+                wait = max(token_wait, request_wait)
+
+            self._tokens -= tokens
+            self._requests -= 1
+            return wait
+
+
+@dataclass
+class _Waiter:
+    lane: int
+    user_id: Optional[int]
+    seq: int
+    granted: bool = False
+    event: Optional[threading.Event] = None
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    future: Optional[asyncio.Future] = None
+
+
+@dataclass
+class SchedulerStats:
+    """Снимок состояния планировщика (для логов и диагностики)."""
+    in_flight: int
+    waiting: int
+    in_flight_by_lane: dict[str, int] = field(default_factory=dict)
+    waiting_by_lane: dict[str, int] = field(default_factory=dict)
+
+
+class LLMScheduler:
+    """
+    Планировщик слотов и лимитов для всех запросов к Claude API.
+
+    Args:
+        max_concurrency: Максимум одновременных запросов к API
+        reserved_interactive_slots: Слоты, недоступные фоновым полосам
+    """
+
+    def __init__(self, max_concurrency: int, reserved_interactive_slots: int = 0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.reserved_interactive_slots = min(max(0, reserved_interactive_slots), self.max_concurrency - 1)
+        self._lock = threading.Lock()
+        self._waiters: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._in_flight_by_lane: dict[int, int] = {}
+        self._user_in_flight: dict[Optional[int], int] = {}
+        self._limiters: dict[str, KeyRateLimiter] = {}
+
+    # ---------- Лимиты ключей ----------
+
+    def get_rate_limiter(self, api_key: str | None) -> KeyRateLimiter:
+        """Возвращает (создает) общий rate limiter для ключа."""
+        key = api_key or ""
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = KeyRateLimiter(*_limits_for_key(key))
+                self._limiters[key] = limiter
+            return limiter
+
+    def reserve_rate(self, lane: int, api_key: str | None, tokens: int) -> float:
+        """Резервирует лимит ключа и возвращает время ожидания (сек)."""
+        return self.get_rate_limiter(api_key).reserve(tokens, background=_is_background(lane))
+
+    # ---------- Слоты ----------
+
+    def _can_run_locked(self, lane: int) -> bool:
+        limit = self.max_concurrency
+        if _is_background(lane):
+            limit -= self.reserved_interactive_slots
+        return self._in_flight < limit
+
+    def _grant_locked(self, waiter: _Waiter) -> None:
+        waiter.granted = True
+        self._in_flight += 1
+        self._in_flight_by_lane[waiter.lane] = self._in_flight_by_lane.get(waiter.lane, 0) + 1
+        self._user_in_flight[waiter.user_id] = self._user_in_flight.get(waiter.user_id, 0) + 1
+
+        if waiter.event is not None:
+            waiter.event.set()
+        elif waiter.future is not None and waiter.loop is not None:
+            waiter.loop.call_soon_threadsafe(_resolve_future, waiter.future)
+
+    def _dispatch_locked(self) -> None:
+        """Выдает свободные слоты ожидающим в порядке (полоса, нагрузка пользователя, очередь)."""
+        while self._waiters:
+            candidates = [w for w in self._waiters if self._can_run_locked(w.lane)]
+            if not candidates:
+                return
+            best = min(
+                candidates,
+                key=lambda w: (w.lane, self._user_in_flight.get(w.user_id, 0), w.seq)
+            )
+            self._waiters.remove(best)
+            self._grant_locked(best)
+
+    def _enqueue(self, lane: int, user_id: Optional[int], **kwargs) -> _Waiter:
+        waiter = _Waiter(lane=lane, user_id=user_id, seq=next(self._seq), **kwargs)
+        with self._lock:
+            self._waiters.append(waiter)
+            self._dispatch_locked()
+        return waiter
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """Снимает ожидание (отмена); если слот уже выдан - освобождает его."""
+        with self._lock:
+            if waiter.granted:
+                self._release_locked(waiter)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _release_locked(self, waiter: _Waiter) -> None:
+        self._in_flight -= 1
+        self._in_flight_by_lane[waiter.lane] -= 1
+        self._user_in_flight[waiter.user_id] -= 1
+        if not self._user_in_flight[waiter.user_id]:
+            del self._user_in_flight[waiter.user_id]
+        self._dispatch_locked()
+
+    def _release(self, waiter: _Waiter) -> None:
+        with self._lock:
+            self._release_locked(waiter)
+
+    @contextmanager
+    def slot_sync(
+        self,
+        lane: int,
+        api_key: str | None = None,
+        tokens: int = 0,
+        user_id: Optional[int] = None,
+        request_context: RequestContext | None = None
+    ):
+        """
+        Синхронно ожидает лимит ключа и слот, выполняет блок и освобождает слот.
+
+        Raises:
+            RequestCancelledError: Запрос отменен/истек во время ожидания
+            SchedulerMisuseError: Вызов из потока event loop (нужен asyncio.to_thread или slot_async)
+        """
+        if _in_event_loop_thread():
+            # Ожидание заблокировало бы сам loop (и корутины, которые должны освободить слоты)
+            raise SchedulerMisuseError(
+                f"[LLMScheduler] {LANE_NAMES[lane]}: slot_sync вызван из потока event loop - "
+                "используйте asyncio.to_thread или slot_async"
+            )
+
+        ctx = request_context or get_current_request_context()
+        user_id = _resolve_user(user_id, ctx)
+
+        wait = self.reserve_rate(lane, api_key, tokens)
+        if wait > 0:
+            logger.debug(f"[LLMScheduler] {LANE_NAMES[lane]}: ожидание лимита ключа {wait:.1f}s")
+            if ctx is not None:
+                ctx.sleep(wait)
+            else:
+                time.sleep(wait)
+
+        waiter = self._enqueue(lane, user_id, event=threading.Event())
+        try:
+            while not waiter.event.wait(WAIT_POLL_INTERVAL):
+                if ctx is not None:
+                    ctx.check()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    @asynccontextmanager
+    async def slot_async(
+        self,
+        lane: int,
+        api_key: str | None = None,
+        tokens: int = 0,
+        user_id: Optional[int] = None,
+        request_context: RequestContext | None = None
+    ):
+        """
+        Асинхронно ожидает лимит ключа и слот, выполняет блок и освобождает слот.
+
+        Raises:
+            RequestCancelledError: Запрос отменен/истек во время ожидания
+        """
+        ctx = request_context or get_current_request_context()
+        user_id = _resolve_user(user_id, ctx)
+
+        wait = self.reserve_rate(lane, api_key, tokens)
+        if wait > 0:
+            logger.debug(f"[LLMScheduler] {LANE_NAMES[lane]}: ожидание лимита ключа {wait:.1f}s")
+            if ctx is not None:
+                await ctx.asleep(wait)
+            else:
+                await asyncio.sleep(wait)
+
+        loop = asyncio.get_running_loop()
+        waiter = self._enqueue(lane, user_id, loop=loop, future=loop.create_future())
+        try:
+            while not waiter.future.done():
+                await asyncio.wait({waiter.future}, timeout=WAIT_POLL_INTERVAL)
+                if ctx is not None and not waiter.future.done():
+                    ctx.check()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    def get_stats(self) -> SchedulerStats:
+        with self._lock:
+            waiting_by_lane: dict[str, int] = {}
+            for w in self._waiters:
+                name = LANE_NAMES[w.lane]
+                waiting_by_lane[name] = waiting_by_lane.get(name, 0) + 1
+            return SchedulerStats(
+                in_flight=self._in_flight,
+                waiting=len(self._waiters),
+                in_flight_by_lane={LANE_NAMES[k]: v for k, v in self._in_flight_by_lane.items() if v},
+                waiting_by_lane=waiting_by_lane
+            )
+
+
+def _resolve_future(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(True)
+
+
+def _resolve_user(user_id: Optional[int], ctx: RequestContext | None) -> Optional[int]:
+    """Пользователь запроса: явный user_id или chat_id текущего контекста диалога."""
+    if user_id is not None:
+        return user_id
+    return ctx.chat_id if ctx is not None else None
+
+
+def _limits_for_key(api_key: str) -> tuple[int, int]:
+    """Лимиты (токены/мин, запросы/мин) по позиции ключа в конфигурации."""
+    keys = [
+        ANTHROPIC_API_KEY, ANTHROPIC_API_KEY_2, ANTHROPIC_API_KEY_3, ANTHROPIC_API_KEY_4,
+        ANTHROPIC_API_KEY_5, ANTHROPIC_API_KEY_6, ANTHROPIC_API_KEY_7
+    ]
+    for idx, key in enumerate(keys):
+        if key and key == api_key:
+            return KEY_TOKEN_LIMITS_PER_MIN[idx], KEY_REQUEST_LIMITS_PER_MIN[idx]
+    # Неизвестный ключ - консервативные лимиты дополнительного ключа
+    return KEY_TOKEN_LIMITS_PER_MIN[-1], KEY_REQUEST_LIMITS_PER_MIN[-1]
+
+
+_scheduler: LLMScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Возвращает глобальный планировщик (создается при первом обращении)."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, LLM_RESERVED_INTERACTIVE_SLOTS)
+    return _scheduler
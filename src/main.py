@@ -9,6 +9,12 @@ from run_analysis import init_rags
 from rag_persistence import save_rag_indices, load_rag_indices
 from storage import safe_filename
 from auth_manager import AuthManager
+from http_session import close_http_session
+from llm_clients import close_llm_clients
+from relevance_evaluator import load_report_descriptions
+from embedding_router import warm_up_embedding_router
+from descry_retriever import warm_up_descry_retriever
+from query_expander import load_descry
 import nest_asyncio
 
 nest_asyncio.apply()
@@ -239,6 +245,11 @@ async def load_rags():
 
         asyncio.create_task(periodic_save_rags())
         logging.info("RAG модели загружены")
+
+        # Модель bge-m3 уже загружена - векторизуем описания отчетов для локального Router Agent
+        # и разделы descry.md для улучшения вопросов
+        asyncio.create_task(warm_up_embedding_router(load_report_descriptions()))
+        asyncio.create_task(warm_up_descry_retriever(load_descry()))
     except Exception as e:
         logging.error(f"Ошибка при инициализации RAG моделей: {e}")
 
@@ -290,10 +301,17 @@ async def main():
 
     await app.start()
 
+    # Задачи обработки аудио, прерванные рестартом, возвращаются в очередь
+    await handlers.start_audio_job_queue(app)
+
     asyncio.create_task(load_rags())
     logging.info("Бот запущен. Ожидаю сообщений...")
     await idle()
+    if handlers.audio_job_queue is not None:
+        handlers.audio_job_queue.shutdown()
     await app.stop()
+    await close_http_session()
+    await close_llm_clients()
 
 
 if __name__ == "__main__":
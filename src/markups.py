@@ -24,6 +24,12 @@ def main_menu_markup():
         ]
     ])
 
+def pending_audio_markup():
+    """Переход к вводу данных по аудио, обработанному во время другого действия."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("        Ввести данные        ", callback_data="pending_audio")]
+    ])
+
 def storage_menu_markup():
     return InlineKeyboardMarkup([
         [InlineKeyboardButton("        Аудио файлы        ", callback_data="view||audio")],
@@ -286,6 +292,37 @@ def make_dialog_markup() -> InlineKeyboardMarkup:
         ]
     ])
 
+def make_deep_search_progress_markup() -> InlineKeyboardMarkup:
+    """
+    Клавиатура статуса глубокого исследования.
+
+    - Предварительный ответ: агрегировать цитаты, найденные к текущему моменту
+    - Отменить: остановить исследование (прекращает расход квоты API)
+    """
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("📝 Предварительный ответ", callback_data="deep_preliminary")],
+        [InlineKeyboardButton("✖️ Отменить", callback_data="cancel_request")]
+    ])
+
+def make_cancel_request_markup() -> InlineKeyboardMarkup:
+    """Кнопка отмены выполняющегося запроса диалога."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("✖️ Отменить", callback_data="cancel_request")]
+    ])
+
+def make_semantic_cache_markup() -> InlineKeyboardMarkup:
+    """
+    Меню после ответа из семантического кэша.
+
+    Структура:
+    - Строка 1: [Искать заново] - повторить вопрос мимо кэша
+    - Строки 2-3: меню выбора режима (make_dialog_markup)
+    """
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton("🔄 Искать заново", callback_data="semantic_cache_bypass")]]
+        + make_dialog_markup().inline_keyboard
+    )
+
 def help_menu_markup():
     text_ = (
         "Бот имеет два режима: 'Хранилище' и 'Режим диалога'\n\n"
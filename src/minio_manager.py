@@ -448,6 +448,101 @@ class MinIOManager:
         
         return self.retry_handler.execute_with_retry(delete_operation)
     
+    def audio_object_exists(self, object_name: str) -> bool:
+        """Check whether an object exists in the audio bucket"""
+        bucket_name = MINIO_AUDIO_BUCKET_NAME
+        if not bucket_name:
+            raise MinIOError("MINIO_AUDIO_BUCKET_NAME not configured")
+        
+        def stat_operation():
+            if not self.client:
+                raise MinIOError("MinIO client not initialized")
+            
+            try:
+                self.client.stat_object(bucket_name, object_name)
+                return True
+            except S3Error as e:
+                if e.code in ('NoSuchKey', 'NoSuchObject'):
+                    return False
+                raise MinIOError(f"Stat operation failed: {e}")
+        
+        return self.retry_handler.execute_with_retry(stat_operation)
+    
+    def put_text_object(self, object_name: str, text: str, metadata: dict[str, str] | None = None) -> bool:
+        """Store UTF-8 text (e.g. a transcript) in the audio bucket"""
+        bucket_name = MINIO_AUDIO_BUCKET_NAME
+        if not bucket_name:
+            raise MinIOUploadError("MINIO_AUDIO_BUCKET_NAME not configured")
+        
+        data = text.encode('utf-8')
+        
+        def put_operation():
+            if not self.client or not self.health_monitor:
+                raise MinIOUploadError("MinIO client not initialized")
+            
+            start_time = time.time()
+            
+            try:
+                self.client.put_object(
+                    bucket_name=bucket_name,
+                    object_name=object_name,
+                    data=io.BytesIO(data),
+                    length=len(data),
+                    content_type='text/plain; charset=utf-8',
+                    metadata=metadata or {}
+                )
+                
+                duration = time.time() - start_time
+                self.health_monitor.record_operation('upload', True, duration, len(data))
+                
+                logging.debug(f"Stored text object {object_name} in {bucket_name}")
+                return True
+            
+            except Exception as e:
+                duration = time.time() - start_time
+                self.health_monitor.record_operation('upload', False, duration)
+                raise MinIOUploadError(f"Text upload failed: {e}")
+        
+        return self.retry_handler.execute_with_retry(put_operation)
+    
+    def get_text_object(self, object_name: str) -> str | None:
+        """Read UTF-8 text from the audio bucket (None if the object does not exist)"""
+        bucket_name = MINIO_AUDIO_BUCKET_NAME
+        if not bucket_name:
+            raise MinIODownloadError("MINIO_AUDIO_BUCKET_NAME not configured")
+        
+        def get_operation():
+            if not self.client or not self.health_monitor:
+                raise MinIODownloadError("MinIO client not initialized")
+            
+            start_time = time.time()
+            
+            try:
+                response = self.client.get_object(bucket_name, object_name)
+                try:
+                    data = response.read()
+                finally:
+                    response.close()
+                    response.release_conn()
+                
+                duration = time.time() - start_time
+                self.health_monitor.record_operation('download', True, duration, len(data))
+                
+                return data.decode('utf-8')
+            
+            except S3Error as e:
+                if e.code in ('NoSuchKey', 'NoSuchObject'):
+                    return None
+                duration = time.time() - start_time
+                self.health_monitor.record_operation('download', False, duration)
+                raise MinIODownloadError(f"Text download failed: {e}")
+            except Exception as e:
+                duration = time.time() - start_time
+                self.health_monitor.record_operation('download', False, duration)
+                raise MinIODownloadError(f"Text download failed: {e}")
+        
+        return self.retry_handler.execute_with_retry(get_operation)
+    
     def list_user_audio_files(self, user_id: int | None = None, prefix: str | None = None, 
                              max_results: int = 1000) -> list[ObjectInfo]:
         """List audio files for specific user or with prefix"""
@@ -7,9 +7,10 @@
 
 Основной алгоритм:
 1. Загрузка описания БД из файла descry.md
-2. Формирование промпта с вопросом пользователя и описанием БД
-3. Отправка промпта в Claude для улучшения вопроса
-4. Возврат улучшенного вопроса или fallback к исходному при ошибках
+2. Выбор разделов описания БД, релевантных вопросу (descry_retriever)
+3. Формирование промпта с вопросом пользователя и выбранными разделами
+4. Отправка промпта в Claude для улучшения вопроса
+5. Возврат улучшенного вопроса или fallback к исходному при ошибках
 
 Модуль разработан для легкой интеграции в существующую логику бота.
 """
@@ -18,6 +19,10 @@ import os
 import logging
 from typing import Dict
 from analysis import send_msg_to_model
+from request_context import RequestCancelledError
+from llm_scheduler import LANE_ROUTER
+from llm_cache import CACHE_SITE_EXPAND_QUERY
+from descry_retriever import select_descry_content
 
 # Настройка логгера для диагностики работы модуля
 logger = logging.getLogger(__name__)
@@ -242,16 +247,10 @@ def expand_query(question: str, max_retries: int = 3) -> Dict[str, str]:
             "tokens_used": {"input_tokens": 0, "output_tokens": 0}
         }
 
-    # Шаг 4: Проверка размера descry.md
-    # Если файл очень большой (>50000 символов ≈ 12500 токенов)
-    # это может вызвать проблемы с контекстом Claude
-    if len(descry_content) > 50000:
-        # TODO: Реализовать chunking или summarization для больших файлов
-        # Возможные решения:
-        # 1. Разбить descry.md на части и делать несколько запросов
-        # 2. Использовать summarization для сжатия описания
-        # 3. Индексировать descry.md и искать только релевантные секции
-        pass
+    # Шаг 4: Выбор релевантных разделов descry.md
+    # В промпт попадают только близкие к вопросу разделы в пределах бюджета токенов,
+    # поэтому размер промпта не растет вместе с файлом (fallback - весь файл)
+    descry_content = select_descry_content(question, descry_content)
 
     # Шаг 5: Попытка улучшения через Claude API
     try:
@@ -271,7 +270,9 @@ def expand_query(question: str, max_retries: int = 3) -> Dict[str, str]:
             messages=[{"role": "user", "content": prompt}],
             max_tokens=1000,  # Улучшенный вопрос редко превышает 200 токенов
             model="claude-haiku-4-5-20251001",  # Claude Sonnet 4.5 (актуальная версия из CLAUDE.md)
-            return_usage=True
+            return_usage=True,
+            lane=LANE_ROUTER,  # Приоритет ниже быстрого поиска, выше глубокого исследования
+            cache_site=CACHE_SITE_EXPAND_QUERY  # Повторные вопросы (цикл уточнения) - из кэша
         )
 
         # Логирование полного ответа Claude
@@ -308,6 +309,9 @@ def expand_query(question: str, max_retries: int = 3) -> Dict[str, str]:
             "tokens_used": usage  # Добавлено: информация о использованных токенах
         }
 
+    except RequestCancelledError:
+        # Отмена/дедлайн запроса - не fallback, прерываем весь пайплайн
+        raise
     except Exception as e:
         # Шаг 8: Обработка ошибок (fallback)
         # При любой ошибке API или обработки - возвращаем исходный вопрос
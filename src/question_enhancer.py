@@ -37,6 +37,8 @@ from config import ANTHROPIC_API_KEY
 from index_selector import INDEX_MAPPING, INDEX_DISPLAY_NAMES
 from constants import CLAUDE_ERROR_MESSAGE
 from analysis import send_msg_to_model
+from request_context import RequestCancelledError
+from llm_scheduler import LANE_ROUTER
 
 # Константы модели
 HAIKU_MODEL = "claude-haiku-4-5-20251001"  # Модель Haiku 4.5 для улучшения вопроса
@@ -472,7 +474,8 @@ def enhance_question_for_index(
             max_tokens=MAX_TOKENS,
             model=HAIKU_MODEL,
             api_key=resolved_api_key,
-            return_usage=True
+            return_usage=True,
+            lane=LANE_ROUTER
         )
 
         elapsed = time.time() - start_time
@@ -495,6 +498,9 @@ def enhance_question_for_index(
 
         return sanitized_result, usage
 
+    except RequestCancelledError:
+        # Отмена/дедлайн запроса - не fallback, прерываем весь пайплайн
+        raise
     except Exception as e:
         # Fallback: вернуть validated_question при любой ошибке
         logger.exception(
@@ -8,6 +8,7 @@ JSON-контейнер и оцениваются за один API запрос
 Основная функция: evaluate_report_relevance()
     - Принимает вопрос пользователя и словарь описаний отчетов
     - Возвращает словарь с процентами релевантности (0-100) для каждого отчета
+    - Сначала локальная оценка по эмбеддингам (embedding_router), LLM - если она не уверена
     - Использует batch-запрос через evaluate_batch_relevance()
     - Один API вызов вместо 22 параллельных
 
@@ -16,11 +17,15 @@ JSON-контейнер и оцениваются за один API запрос
     - build_batch_relevance_prompt() - формирование промпта для batch-оценки
     - evaluate_batch_relevance() - выполнение batch-запроса к Claude API
     - get_cached_json_container() - загрузка/сохранение кэша JSON-контейнера
+      (ключ кэша - хэш содержимого описаний и бюджета токенов)
+    - compact_report_descriptions() - сжатие описаний до бюджета токенов
+      (краткие описания из generate_report_summaries.py или обрезка по JSONSizeEstimator)
 
 Примеры использования см. в tests/test_relevance_evaluator.py
 """
 
 import asyncio
+import hashlib
 import json
 import logging
 import os
@@ -35,7 +40,13 @@ from typing import Any, Dict, List
 import anthropic
 from anthropic import RateLimitError
 
-from config import ANTHROPIC_API_KEY
+from config import ANTHROPIC_API_KEY, RELEVANCE_CONTAINER_TOKEN_BUDGET
+from request_context import RequestCancelledError, get_current_request_context, check_current_request
+from llm_scheduler import get_llm_scheduler, LANE_ROUTER
+from llm_clients import get_async_anthropic_client
+from llm_cache import get_llm_cache, CACHE_SITE_BATCH_RELEVANCE
+from embedding_router import route_by_embeddings, descriptions_hash
+from utils_pkg import JSONSizeEstimator, truncate_text
 
 # Константы
 HAIKU_MODEL = "claude-haiku-4-5-20251001"  # Модель Haiku 4.5 для быстрой оценки
@@ -55,12 +66,19 @@ REPORT_DESCRIPTIONS_DIR = Path(__file__).parent.parent / "Description" / "Report
 # Путь к файлу кэша JSON-контейнера
 JSON_CACHE_PATH = Path(__file__).parent.parent / "cache" / "json_container_cache.json"
 
+# Краткие описания отчетов, подготовленные один раз офлайн (generate_report_summaries.py)
+REPORT_SUMMARIES_PATH = Path(__file__).parent.parent / "Description" / "report_summaries.json"
+
 # Версия формата кэша (для совместимости)
 CACHE_VERSION = "1.0"
 
 # Константы сообщений об ошибках
 ERROR_EMPTY_QUESTION = "Вопрос не может быть пустым"
 
+# Оценка токенов промпта для учета лимитов ключа в LLM-планировщике
+# (то же соотношение, что в JSONSizeEstimator)
+CHARS_PER_TOKEN = 3.0
+
 logger = logging.getLogger(__name__)
 
 
@@ -146,7 +164,7 @@ def get_default_cache_path() -> Path:
     return JSON_CACHE_PATH
 
 
-def save_json_cache(container: str, cache_path: Path) -> None:
+def save_json_cache(container: str, cache_path: Path, content_hash: str | None = None) -> None:
     """
     Сохраняет JSON-контейнер в файл кэша с метаданными.
 
@@ -156,6 +174,7 @@ def save_json_cache(container: str, cache_path: Path) -> None:
     Args:
         container: JSON-строка контейнера от build_json_container()
         cache_path: Путь к файлу кэша
+        content_hash: Хэш входных данных контейнера (container_content_hash())
 
     Raises:
         PermissionError: Если нет прав на запись в файл
@@ -180,6 +199,7 @@ def save_json_cache(container: str, cache_path: Path) -> None:
             "created_at": datetime.now().isoformat(),
             "total_reports": total_reports,
             "total_indices": total_indices,
+            "content_hash": content_hash,
             "container": container
         }
 
@@ -224,7 +244,7 @@ def save_json_cache(container: str, cache_path: Path) -> None:
                 pass  # Игнорируем ошибки при очистке
 
 
-def load_json_cache(cache_path: Path) -> str:
+def load_json_cache(cache_path: Path, content_hash: str | None = None) -> str:
     """
     Загружает JSON-контейнер из файла кэша.
 
@@ -232,6 +252,7 @@ def load_json_cache(cache_path: Path) -> str:
 
     Args:
         cache_path: Путь к файлу кэша
+        content_hash: Ожидаемый хэш входных данных (None - не проверяется)
 
     Returns:
         str: JSON-строка контейнера (только поле "container")
@@ -240,7 +261,8 @@ def load_json_cache(cache_path: Path) -> str:
         FileNotFoundError: Если файл кэша не существует
         json.JSONDecodeError: Если файл содержит невалидный JSON
         KeyError: Если в файле отсутствует поле "container"
-        ValueError: Если версия кэша несовместима или содержимое невалидно
+        ValueError: Если версия кэша несовместима, содержимое невалидно
+                    или кэш собран из других описаний (content_hash не совпал)
 
     Example:
         >>> container = load_json_cache(get_default_cache_path())
@@ -260,6 +282,10 @@ def load_json_cache(cache_path: Path) -> str:
                 f"ожидается {CACHE_VERSION}. Удалите файл кэша для пересоздания."
             )
 
+        # Проверка что кэш собран из тех же описаний и с тем же бюджетом
+        if content_hash is not None and cache_data.get("content_hash") != content_hash:
+            raise ValueError("Описания отчетов или бюджет токенов изменились - кэш устарел")
+
         # Извлекаем только контейнер
         if "container" not in cache_data:
             raise KeyError(f"В файле кэша отсутствует поле 'container': {cache_path}")
@@ -304,17 +330,21 @@ def load_json_cache(cache_path: Path) -> str:
 
 def get_cached_json_container(
     report_descriptions: Dict[str, str],
-    cache_path: Path | None = None
+    cache_path: Path | None = None,
+    token_budget: int | None = None
 ) -> str:
     """
     Получает JSON-контейнер из кэша или создает новый.
 
-    Если файл кэша существует - загружает контейнер из него.
-    Если нет - вызывает build_json_container(), сохраняет в кэш и возвращает.
+    Если кэш (в памяти или в файле) собран из тех же описаний с тем же
+    бюджетом токенов - возвращает его. Иначе вызывает build_json_container(),
+    сохраняет в кэш и возвращает.
 
     Args:
         report_descriptions: Словарь {имя_отчета: описание}
         cache_path: Путь к файлу кэша. Если None, используется JSON_CACHE_PATH
+        token_budget: Бюджет токенов описаний. Если None, используется
+                      RELEVANCE_CONTAINER_TOKEN_BUDGET
 
     Returns:
         str: JSON-строка контейнера
@@ -326,38 +356,155 @@ def get_cached_json_container(
         >>> # При последующих - загружает из кэша
 
     Notes:
-        - Для пересборки кэша просто удалите файл cache/json_container_cache.json
-        - Кэш персистентный (хранится в файловой системе)
+        - Кэш пересобирается автоматически при изменении любого описания,
+          краткого описания или бюджета токенов (ключ - хэш содержимого)
+        - Кэш персистентный (хранится в файловой системе) и дублируется в памяти
     """
+    global _container_memo
+
     if cache_path is None:
         cache_path = get_default_cache_path()
+    if token_budget is None:
+        token_budget = RELEVANCE_CONTAINER_TOKEN_BUDGET
+
+    summaries = load_report_summaries()
+    content_hash = container_content_hash(report_descriptions, token_budget, summaries)
+
+    # Кэш в памяти: без чтения файла на каждый вызов Router Agent
+    if _container_memo is not None and _container_memo[0] == (cache_path, content_hash):
+        return _container_memo[1]
 
     # Проверяем существование кэша
     if cache_path.exists():
         try:
-            container = load_json_cache(cache_path)
+            container = load_json_cache(cache_path, content_hash)
             logger.info(f"JSON-контейнер загружен из кэша: {cache_path}")
+            _container_memo = ((cache_path, content_hash), container)
             return container
         except (json.JSONDecodeError, KeyError, PermissionError, ValueError) as e:
-            # Кэш поврежден или несовместим - пересоздаем
-            logger.warning(f"Кэш поврежден или несовместим, пересоздаем: {e}")
+            # Кэш поврежден, несовместим или устарел - пересоздаем
+            logger.warning(f"Кэш поврежден или устарел, пересоздаем: {e}")
 
     # Кэш не существует или поврежден - создаем новый
     logger.info("Создание нового JSON-контейнера...")
-    container = build_json_container(report_descriptions)
+    container = build_json_container(report_descriptions, token_budget=token_budget, summaries=summaries)
 
     # Сохраняем в кэш
     try:
-        save_json_cache(container, cache_path)
+        save_json_cache(container, cache_path, content_hash)
         logger.info(f"JSON-контейнер создан и сохранен в кэш: {cache_path}")
     except OSError as e:
         # ИСПРАВЛЕНО: убран PermissionError из except, так как это подкласс OSError
         # Не удалось сохранить кэш - продолжаем работу без него
         logger.warning(f"Не удалось сохранить кэш: {e}")
 
+    _container_memo = ((cache_path, content_hash), container)
     return container
 
 
+# Последний использованный контейнер: ((путь кэша, хэш входных данных), контейнер)
+_container_memo: tuple[tuple[Path, str], str] | None = None
+
+
+def container_content_hash(
+    report_descriptions: Dict[str, str],
+    token_budget: int,
+    summaries: Dict[str, Dict[str, str]] | None = None
+) -> str:
+    """
+    Хэш входных данных JSON-контейнера (ключ кэша).
+
+    Меняется при изменении любого описания, краткого описания,
+    маппинга отчетов на индексы или бюджета токенов.
+    """
+    digest = hashlib.sha256()
+    digest.update(descriptions_hash(report_descriptions).encode("utf-8"))
+    digest.update(json.dumps(summaries or {}, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    digest.update(json.dumps(REPORT_TO_INDEX_MAPPING, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    digest.update(f"|{token_budget}|{CHARS_PER_TOKEN}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 текста описания (привязка краткого описания к версии исходного)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_report_summaries(path: Path | None = None) -> Dict[str, Dict[str, str]]:
+    """
+    Загружает краткие описания отчетов, подготовленные generate_report_summaries.py.
+
+    Returns:
+        Dict[str, Dict[str, str]]: {имя_отчета: {"source_hash": ..., "summary": ...}}.
+                                   Пустой словарь, если файла нет или он поврежден
+    """
+    path = path or REPORT_SUMMARIES_PATH
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return data if isinstance(data, dict) else {}
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Не удалось загрузить краткие описания отчетов {path}: {e}")
+        return {}
+
+
+def compact_report_descriptions(
+    report_descriptions: Dict[str, str],
+    token_budget: int,
+    summaries: Dict[str, Dict[str, str]] | None = None
+) -> tuple[Dict[str, str], str]:
+    """
+    Сжимает описания отчетов до бюджета токенов.
+
+    1. Описания помещаются в бюджет - без изменений
+    2. Иначе используются краткие описания (если source_hash совпадает
+       с текущим описанием - устаревшие краткие описания игнорируются)
+    3. Если и так не помещается - обрезка по стратегии JSONSizeEstimator
+       (recommended_truncation символов на описание)
+
+    Args:
+        report_descriptions: Словарь {имя_отчета: описание}
+        token_budget: Бюджет токенов описаний (0 или меньше - без ограничения)
+        summaries: Результат load_report_summaries()
+
+    Returns:
+        tuple[Dict[str, str], str]: (описания для контейнера, примененная стратегия)
+    """
+    if token_budget <= 0:
+        return dict(report_descriptions), "full_descriptions"
+
+    estimator = JSONSizeEstimator(chars_per_token=CHARS_PER_TOKEN, token_limit=token_budget)
+    estimation = estimator.estimate_from_descriptions(report_descriptions)
+    if estimation.within_limit:
+        return dict(report_descriptions), estimation.strategy
+
+    compact: Dict[str, str] = {}
+    summarized = 0
+    for name, description in report_descriptions.items():
+        summary = (summaries or {}).get(name) or {}
+        if summary.get("summary") and summary.get("source_hash") == text_hash(description):
+            compact[name] = summary["summary"]
+            summarized += 1
+        else:
+            compact[name] = description
+
+    estimation = estimator.estimate_from_descriptions(compact)
+    strategy = "summaries" if summarized else estimation.strategy
+    if not estimation.within_limit and estimation.recommended_truncation:
+        compact = {
+            name: truncate_text(description, estimation.recommended_truncation)
+            for name, description in compact.items()
+        }
+        strategy = f"summaries+{estimation.strategy}" if summarized else estimation.strategy
+
+    logger.info(
+        f"Описания отчетов сжаты до бюджета {token_budget} токенов: стратегия {strategy}, "
+        f"кратких описаний {summarized}/{len(report_descriptions)}"
+    )
+    return compact, strategy
+
+
 def load_report_descriptions() -> Dict[str, str]:
     """
     Загрузить все 22 описания отчетов из файловой системы.
@@ -435,7 +582,9 @@ def load_report_descriptions() -> Dict[str, str]:
 
 def build_json_container(
     report_descriptions: Dict[str, str],
-    report_to_index: Dict[str, str] | None = None
+    report_to_index: Dict[str, str] | None = None,
+    token_budget: int = 0,
+    summaries: Dict[str, Dict[str, str]] | None = None
 ) -> str:
     """
     Упаковывает все описания отчетов в JSON-контейнер для batch-оценки.
@@ -450,6 +599,9 @@ def build_json_container(
                             Обычно результат load_report_descriptions().
         report_to_index: Словарь {имя_отчета: имя_индекса}.
                         Если None, используется REPORT_TO_INDEX_MAPPING.
+        token_budget: Бюджет токенов описаний (0 - полные описания без обрезки).
+                      При превышении описания сжимаются compact_report_descriptions().
+        summaries: Краткие описания для сжатия (результат load_report_summaries()).
 
     Returns:
         JSON-строка со структурой:
@@ -484,7 +636,8 @@ def build_json_container(
         7
 
     Notes:
-        - Сохраняет полные описания без обрезки (помещается в ~55k токенов)
+        - По умолчанию сохраняет полные описания без обрезки (~55k токенов);
+          get_cached_json_container() передает RELEVANCE_CONTAINER_TOKEN_BUDGET
         - ID отчетов начинаются с 1 и идут по порядку сортировки по имени
         - Логирует размер итогового JSON в символах
     """
@@ -495,6 +648,9 @@ def build_json_container(
     # Использовать маппинг по умолчанию если не передан
     mapping = report_to_index if report_to_index is not None else REPORT_TO_INDEX_MAPPING
 
+    # Сжатие описаний до бюджета токенов (краткие описания или обрезка)
+    report_descriptions, _ = compact_report_descriptions(report_descriptions, token_budget, summaries)
+
     # Проверка что все отчеты из маппинга присутствуют
     missing_reports = set(mapping.keys()) - set(report_descriptions.keys())
     if missing_reports:
@@ -524,7 +680,7 @@ def build_json_container(
             "id": idx,
             "name": report_name,
             "index": index_name,
-            "description": description  # Полное описание без обрезки
+            "description": description  # Полное или сжатое до бюджета описание
         }
         reports.append(report_entry)
         report_id_by_name[report_name] = idx
@@ -987,15 +1143,22 @@ async def _make_batch_api_call(
         RateLimitError: При превышении лимита запросов
         Exception: При других ошибках API
     """
-    response = await asyncio.wait_for(
-        client.messages.create(
-            model=HAIKU_MODEL,
-            max_tokens=BATCH_MAX_TOKENS,
-            temperature=TEMPERATURE,
-            messages=[{"role": "user", "content": prompt}]
-        ),
-        timeout=BATCH_REQUEST_TIMEOUT
-    )
+    # Таймаут ограничен оставшимся временем текущего запроса диалога (если есть)
+    ctx = get_current_request_context()
+    estimated_tokens = int(len(prompt) / CHARS_PER_TOKEN)
+
+    # Router Agent идет через глобальный LLM-планировщик (полоса router)
+    async with get_llm_scheduler().slot_async(LANE_ROUTER, client.api_key, estimated_tokens):
+        timeout = ctx.timeout(BATCH_REQUEST_TIMEOUT) if ctx is not None else BATCH_REQUEST_TIMEOUT
+        response = await asyncio.wait_for(
+            client.messages.create(
+                model=HAIKU_MODEL,
+                max_tokens=BATCH_MAX_TOKENS,
+                temperature=TEMPERATURE,
+                messages=[{"role": "user", "content": prompt}]
+            ),
+            timeout=timeout
+        )
     # Извлекаем информацию о токенах из ответа
     usage = {
         "input_tokens": response.usage.input_tokens,
@@ -1115,7 +1278,11 @@ async def _handle_rate_limit(attempt: int, backoff: int) -> int:
         f"Rate limit (попытка {attempt}/{MAX_RETRIES}). "
         f"Ожидание {backoff}s перед повтором..."
     )
-    await asyncio.sleep(backoff)
+    ctx = get_current_request_context()
+    if ctx is not None:
+        await ctx.asleep(backoff)
+    else:
+        await asyncio.sleep(backoff)
     return backoff * 2
 
 
@@ -1175,16 +1342,33 @@ async def evaluate_batch_relevance(
         f"Начинаем batch-оценку релевантности для вопроса: '{question[:100]}...'"
     )
 
-    client = anthropic.AsyncAnthropic(api_key=resolved_api_key)
+    client = get_async_anthropic_client(resolved_api_key)
 
     backoff = 1
     start_time = time.time()
     empty_usage = {"input_tokens": 0, "output_tokens": 0}
 
+    # Повторный вопрос с теми же описаниями отчетов - ответ из кэша (без API)
+    cache = get_llm_cache()
+    cache_key = cache.make_key(HAIKU_MODEL, None, [{"role": "user", "content": prompt}], BATCH_MAX_TOKENS)
+    cached_text = cache.get(cache_key, CACHE_SITE_BATCH_RELEVANCE)
+    if cached_text is not None:
+        try:
+            return _process_batch_response(cached_text, start_time, empty_usage)
+        except ValueError as e:
+            logger.warning(f"Некорректный ответ в кэше batch-оценки, повторный запрос: {e}")
+
     for attempt in range(1, MAX_RETRIES + 1):
+        check_current_request()
         try:
             response_text, usage = await _make_batch_api_call(client, prompt)
-            return _process_batch_response(response_text, start_time, usage)
+            result = _process_batch_response(response_text, start_time, usage)
+            if result[0]:
+                cache.set(cache_key, response_text, CACHE_SITE_BATCH_RELEVANCE)
+            return result
+
+        except RequestCancelledError:
+            raise
 
         except RateLimitError:
             backoff = await _handle_rate_limit(attempt, backoff)
@@ -1192,6 +1376,8 @@ async def evaluate_batch_relevance(
                 return {}, empty_usage
 
         except asyncio.TimeoutError:
+            # Таймаут из-за дедлайна запроса - прерываем пайплайн, а не fallback
+            check_current_request()
             logger.error(
                 f"Timeout ({BATCH_REQUEST_TIMEOUT}s) для batch-запроса. "
                 f"Используется пустой словарь."
@@ -1324,7 +1510,7 @@ async def evaluate_single_report(
         True
     """
     async with semaphore:  # Ограничение concurrent запросов
-        client = anthropic.AsyncAnthropic(api_key=api_key)
+        client = get_async_anthropic_client(api_key)
         prompt = build_relevance_prompt(question, report_description)
 
         # Retry с exponential backoff
@@ -1333,16 +1519,19 @@ async def evaluate_single_report(
 
         for attempt in range(1, MAX_RETRIES + 1):
             try:
-                # Async запрос к Claude API с таймаутом
-                response = await asyncio.wait_for(
-                    client.messages.create(
-                        model=HAIKU_MODEL,
-                        max_tokens=MAX_TOKENS,
-                        temperature=TEMPERATURE,
-                        messages=[{"role": "user", "content": prompt}]
-                    ),
-                    timeout=REQUEST_TIMEOUT
-                )
+                # Async запрос к Claude API с таймаутом (через LLM-планировщик)
+                async with get_llm_scheduler().slot_async(
+                    LANE_ROUTER, api_key, int(len(prompt) / CHARS_PER_TOKEN)
+                ):
+                    response = await asyncio.wait_for(
+                        client.messages.create(
+                            model=HAIKU_MODEL,
+                            max_tokens=MAX_TOKENS,
+                            temperature=TEMPERATURE,
+                            messages=[{"role": "user", "content": prompt}]
+                        ),
+                        timeout=REQUEST_TIMEOUT
+                    )
 
                 # Извлечь текст ответа
                 answer = response.content[0].text.strip()
@@ -1411,7 +1600,8 @@ async def evaluate_single_report(
 async def evaluate_report_relevance(
     question: str,
     report_descriptions: Dict[str, str] | None = None,
-    api_key: str | None = None
+    api_key: str | None = None,
+    cache_path: Path | None = None
 ) -> tuple[Dict[str, float], dict[str, int]]:
     """
     Оценить релевантность всех отчетов для вопроса пользователя.
@@ -1427,6 +1617,7 @@ async def evaluate_report_relevance(
         report_descriptions: Словарь {имя_отчета: содержимое_файла}.
                             Если None, автоматически загружается через load_report_descriptions()
         api_key: Anthropic API key. Если None, используется ANTHROPIC_API_KEY из config
+        cache_path: Путь к файлу кэша JSON-контейнера. Если None, используется JSON_CACHE_PATH
 
     Returns:
         tuple[Dict[str, float], dict[str, int]]:
@@ -1438,9 +1629,10 @@ async def evaluate_report_relevance(
         FileNotFoundError: Если descriptions не переданы и не удалось загрузить из файлов
 
     Performance:
-        - Один API запрос вместо 22 параллельных
+        - Уверенная оценка эмбеддингов (embedding_router) - без API, миллисекунды
+        - Иначе один API запрос вместо 22 параллельных
         - JSON-контейнер содержит все описания (~55k токенов)
-        - Типичное время выполнения: 5-15 секунд
+        - Типичное время выполнения LLM-оценки: 5-15 секунд
 
     Example:
         >>> # Автоматическая загрузка описаний
@@ -1486,6 +1678,14 @@ async def evaluate_report_relevance(
         f"для вопроса: '{question[:100]}...'"
     )
 
+    # Локальный роутер на эмбеддингах bge-m3: миллисекунды вместо batch-запроса.
+    # Возвращает None, если лучшие индексы слишком близки - тогда решает LLM
+    local_scores = await route_by_embeddings(question, report_descriptions)
+    if local_scores is not None:
+        top_3 = sorted(local_scores.items(), key=lambda x: x[1], reverse=True)[:3]
+        logger.info(f"Оценка релевантности по эмбеддингам (без LLM), топ-3: {top_3}")
+        return local_scores, {"input_tokens": 0, "output_tokens": 0}
+
     # === BATCH-МЕХАНИЗМ ОЦЕНКИ РЕЛЕВАНТНОСТИ ===
     #
     # Вместо 22 параллельных запросов используем один batch-запрос:
@@ -1497,7 +1697,7 @@ async def evaluate_report_relevance(
     #    Это снижает количество API вызовов с 22 до 1, уменьшая latency и стоимость
 
     # Получить JSON-контейнер из кэша или создать новый
-    json_container = get_cached_json_container(report_descriptions)
+    json_container = get_cached_json_container(report_descriptions, cache_path=cache_path)
     logger.info(f"JSON-контейнер готов: {len(json_container)} символов")
 
     # Выполнить batch-оценку релевантности за один API запрос
@@ -0,0 +1,194 @@
+"""
+Контекст запроса диалога: дедлайн и токен отмены.
+
+ПРОБЛЕМА:
+- В run_dialog_mode нет бюджета времени: expand_query, Router Agent,
+  улучшение вопроса, поиск и run_deep_search могут бесконечно повторять
+  запросы и ждать backoff
+- Пользователь не может остановить зависший запрос - он продолжает
+  расходовать квоту API и занимать воркеры
+
+РЕШЕНИЕ:
+RequestContext хранит дедлайн и флаг отмены. Контекст текущего запроса
+доступен через contextvars (current_request_context), поэтому вложенные
+вызовы (send_msg_to_model, send_msg_to_model_async, воркеры глубокого
+исследования) видят его без явной передачи параметра. contextvars
+копируются в asyncio.create_task() и asyncio.to_thread().
+
+ИСПОЛЬЗОВАНИЕ:
+```python
+ctx = start_request_context(chat_id, timeout=DIALOG_REQUEST_TIMEOUT)
+token = current_request_context.set(ctx)
+try:
+    ...
+    check_current_request()   # RequestCancelledError если отменен/истек
+finally:
+    current_request_context.reset(token)
+    finish_request_context(chat_id, ctx)
+
+# Обработчик кнопки "Отменить":
+cancel_request(chat_id)
+```
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Шаг опроса флага отмены при асинхронном ожидании (сек)
+CANCEL_POLL_INTERVAL = 0.5
+
+
+class RequestCancelledError(Exception):
+    """Запрос отменен пользователем."""
+
+
+class DeadlineExceededError(RequestCancelledError):
+    """Превышен дедлайн запроса."""
+
+
+class RequestContext:
+    """
+    Дедлайн и токен отмены одного запроса пользователя.
+
+    Потокобезопасен: отмена через threading.Event видна как в event loop,
+    так и в синхронных вызовах, выполняемых в других потоках.
+
+    Attributes:
+        chat_id: ID чата, которому принадлежит запрос
+        deadline: Момент истечения (time.monotonic()) или None - без ограничения
+    """
+
+    def __init__(self, chat_id: int, timeout: float | None = None):
+        self.chat_id = chat_id
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """Отменяет запрос (идемпотентно)."""
+        if not self._cancelled.is_set():
+            logger.info(f"[RequestContext] chat_id={self.chat_id} запрос отменен")
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self) -> float | None:
+        """Оставшееся время в секундах (None - без дедлайна)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout(self, default: float | None = None) -> float | None:
+        """
+        Таймаут для очередного вызова API: минимум из default и оставшегося времени.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if default is None:
+            return remaining
+        return min(default, remaining)
+
+    def check(self) -> None:
+        """
+        Raises:
+            RequestCancelledError: Если запрос отменен
+            DeadlineExceededError: Если истек дедлайн
+        """
+        if self.cancelled:
+            raise RequestCancelledError("Запрос отменен пользователем")
+        if self.expired:
+            raise DeadlineExceededError("Превышено время ожидания ответа")
+
+    def sleep(self, seconds: float) -> None:
+        """Синхронное ожидание (backoff), прерываемое отменой и дедлайном."""
+        self.check()
+        self._cancelled.wait(self.timeout(seconds))
+        self.check()
+
+    async def asleep(self, seconds: float) -> None:
+        """Асинхронное ожидание (backoff/rate limit), прерываемое отменой и дедлайном."""
+        self.check()
+        end = time.monotonic() + (self.timeout(seconds) or 0.0)
+        while True:
+            left = end - time.monotonic()
+            if left <= 0:
+                break
+            await asyncio.sleep(min(CANCEL_POLL_INTERVAL, left))
+            self.check()
+        self.check()
+
+
+# Контекст текущего запроса (пробрасывается во вложенные вызовы)
+current_request_context: ContextVar[Optional[RequestContext]] = ContextVar(
+    "current_request_context", default=None
+)
+
+# Активные запросы по chat_id (для кнопки отмены)
+_active_contexts: dict[int, RequestContext] = {}
+
+
+def get_current_request_context() -> RequestContext | None:
+    """Возвращает контекст текущего запроса (или None вне пайплайна диалога)."""
+    return current_request_context.get()
+
+
+def check_current_request() -> None:
+    """Проверяет текущий контекст (no-op если контекста нет)."""
+    ctx = current_request_context.get()
+    if ctx is not None:
+        ctx.check()
+
+
+def start_request_context(chat_id: int, timeout: float | None = None) -> RequestContext:
+    """
+    Создает контекст запроса и регистрирует его для chat_id.
+
+    Предыдущий активный запрос этого чата отменяется - у пользователя
+    одновременно выполняется не более одного запроса диалога.
+    """
+    previous = _active_contexts.get(chat_id)
+    if previous is not None:
+        previous.cancel()
+
+    ctx = RequestContext(chat_id, timeout)
+    _active_contexts[chat_id] = ctx
+    return ctx
+
+
+def finish_request_context(chat_id: int, ctx: RequestContext) -> None:
+    """Снимает регистрацию контекста (если он еще актуален для chat_id)."""
+    if _active_contexts.get(chat_id) is ctx:
+        del _active_contexts[chat_id]
+
+
+def cancel_request(chat_id: int) -> bool:
+    """
+    Отменяет активный запрос пользователя.
+
+    Returns:
+        bool: True если был активный запрос
+    """
+    ctx = _active_contexts.get(chat_id)
+    if ctx is None:
+        return False
+    ctx.cancel()
+    return True
+
+
+def get_cancel_message(error: RequestCancelledError) -> str:
+    """Текст для пользователя по причине остановки запроса."""
+    if isinstance(error, DeadlineExceededError):
+        return "⏱ Превышено время ожидания ответа. Попробуйте упростить вопрос или повторить позже."
+    return "⏹ Запрос отменен."
@@ -0,0 +1,247 @@
+"""
+Расстановка ролей в длинных транскрипциях окнами.
+
+ПРОБЛЕМА:
+- assign_roles отправлял всю транскрипцию одним запросом: длинные интервью
+  упирались в лимит ответа модели (разметка обрывалась), а время ответа
+  росло вместе с текстом
+
+РЕШЕНИЕ:
+1. Текст делится на окна ~ASSIGN_ROLES_WINDOW_CHARS по границам предложений;
+   соседние окна перекрываются на ~ASSIGN_ROLES_OVERLAP_CHARS
+2. Окна размечаются параллельно (время ~ время одного окна)
+3. Сшивка: в перекрытии сравниваются метки текущего и предыдущего окна
+   (по позиции в нормализованном тексте); если окно разметило говорящих
+   наоборот, его метки меняются местами. Перекрытие берется из
+   предыдущего окна (у него больше контекста), дальше - текст текущего окна
+4. Результат собирается в реплики "[Сотрудник:] ..." / "[Клиент:] ..."
+5. Окно, для которого модель вернула ошибку или текст без меток, повторяется
+   (ASSIGN_WINDOW_ATTEMPTS раз); если метки так и не получены, предложения окна
+   остаются в тексте без меток - из транскрипции ничего не пропадает
+"""
+
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from config import ASSIGN_ROLES_WINDOW_CHARS, ASSIGN_ROLES_OVERLAP_CHARS, ASSIGN_ROLES_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+ROLE_EMPLOYEE = "Сотрудник"
+ROLE_CLIENT = "Клиент"
+ROLE_SWAP = {ROLE_EMPLOYEE: ROLE_CLIENT, ROLE_CLIENT: ROLE_EMPLOYEE}
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+_LABEL_RE = re.compile(rf"\[\s*({ROLE_EMPLOYEE}|{ROLE_CLIENT})\s*:?\s*\]:?")
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+# Попытки разметить одно окно (ошибка модели или ответ без меток)
+ASSIGN_WINDOW_ATTEMPTS = 2
+
+# Размеченное предложение: (метка, текст); None - окно не удалось разметить
+LabeledSentence = tuple[str | None, str]
+
+
+@dataclass(frozen=True)
+class RoleWindow:
+    """Окно текста: предложения [start, end), первые overlap - перекрытие с предыдущим окном."""
+    start: int
+    end: int
+    overlap: int
+
+
+def split_sentences(text: str) -> list[str]:
+    """Предложения текста (по . ! ? … и переводам строк)."""
+    sentences = []
+    for line in text.splitlines():
+        sentences.extend(part.strip() for part in _SENTENCE_END_RE.split(line) if part.strip())
+    return sentences
+
+
+def build_windows(
+    sentences: list[str],
+    window_chars: int = ASSIGN_ROLES_WINDOW_CHARS,
+    overlap_chars: int = ASSIGN_ROLES_OVERLAP_CHARS
+) -> list[RoleWindow]:
+    """
+    Окна по window_chars символов, перекрытие - последние предложения
+    предыдущего окна общей длиной до overlap_chars (минимум одно).
+    """
+    windows: list[RoleWindow] = []
+    start, overlap = 0, 0
+    while start < len(sentences):
+        end, size = start, 0
+        while end < len(sentences) and (end == start or size + len(sentences[end]) <= window_chars):
+            size += len(sentences[end]) + 1
+            end += 1
+        # Окно не продвинулось дальше перекрытия - берем хотя бы одно новое предложение
+        end = max(end, start + overlap + 1)
+        windows.append(RoleWindow(start, min(end, len(sentences)), overlap))
+        if end >= len(sentences):
+            break
+
+        next_start, tail = end, 0
+        while next_start - 1 > start + overlap and tail + len(sentences[next_start - 1]) <= overlap_chars:
+            next_start -= 1
+            tail += len(sentences[next_start]) + 1
+        if next_start == end and overlap_chars > 0 and end - 1 > start + overlap:
+            next_start -= 1
+        overlap = end - next_start
+        start = next_start
+    return windows
+
+
+def parse_labeled(text: str) -> list[LabeledSentence]:
+    """
+    Размеченный текст -> предложения с метками.
+
+    Текст до первой метки относится к первой метке.
+    """
+    parts = _LABEL_RE.split(text)
+    labeled: list[LabeledSentence] = []
+    leading = split_sentences(parts[0])
+    for i in range(1, len(parts), 2):
+        label, utterance = parts[i], parts[i + 1]
+        if leading:
+            labeled.extend((label, sentence) for sentence in leading)
+            leading = []
+        labeled.extend((label, sentence) for sentence in split_sentences(utterance))
+    return labeled
+
+
+def _normalize(text: str) -> str:
+    return _NON_WORD_RE.sub("", text.lower())
+
+
+def _spans(labeled: list[LabeledSentence]) -> list[tuple[int, int, str]]:
+    """(начало, конец, метка) предложений в нормализованных символах."""
+    spans, offset = [], 0
+    for label, sentence in labeled:
+        length = len(_normalize(sentence))
+        spans.append((offset, offset + length, label))
+        offset += length
+    return spans
+
+
+def _split_at(labeled: list[LabeledSentence], chars: int) -> int:
+    """Число первых предложений, покрывающих chars нормализованных символов."""
+    covered = 0
+    for i, (_, sentence) in enumerate(labeled):
+        if covered >= chars:
+            return i
+        covered += len(_normalize(sentence))
+    return len(labeled)
+
+
+def _labels_swapped(previous_tail: list[LabeledSentence], current_head: list[LabeledSentence]) -> bool:
+    """Метки перекрытия в текущем окне противоположны меткам предыдущего окна."""
+    previous_spans = _spans(previous_tail)
+    agree = disagree = 0
+    for start, end, label in _spans(current_head):
+        middle = (start + end) / 2
+        for prev_start, prev_end, prev_label in previous_spans:
+            if prev_start <= middle < prev_end:
+                if label is None or prev_label is None:
+                    pass
+                elif prev_label == label:
+                    agree += end - start
+                else:
+                    disagree += end - start
+                break
+    return disagree > agree
+
+
+def stitch_windows(
+    sentences: list[str],
+    windows: list[RoleWindow],
+    outputs: list[str | None]
+) -> list[LabeledSentence]:
+    """
+    Сшивает разметку окон в разметку всего текста.
+
+    Окно без разметки (None) входит в текст исходными предложениями без меток.
+    """
+    result: list[LabeledSentence] = []
+    for window, output in zip(windows, outputs):
+        if output is None:
+            labeled = [(None, sentence) for sentence in sentences[window.start:window.end]]
+        else:
+            labeled = parse_labeled(output)
+        if not result or window.overlap == 0:
+            result.extend(labeled)
+            continue
+
+        overlap_chars = sum(len(_normalize(s)) for s in sentences[window.start:window.start + window.overlap])
+        head_size = _split_at(labeled, overlap_chars)
+        head, body = labeled[:head_size], labeled[head_size:]
+
+        # Хвост уже собранного текста той же длины - перекрытие глазами предыдущего окна
+        tail_size = 0
+        tail_chars = 0
+        while tail_size < len(result) and tail_chars < overlap_chars:
+            tail_size += 1
+            tail_chars += len(_normalize(result[-tail_size][1]))
+        previous_tail = result[len(result) - tail_size:]
+
+        if _labels_swapped(previous_tail, head):
+            body = [(ROLE_SWAP.get(label, label), sentence) for label, sentence in body]
+        result.extend(body)
+    return result
+
+
+def format_labeled(labeled: list[LabeledSentence]) -> str:
+    """Предложения с метками -> реплики "[Метка:] текст" (по одной на строку, без метки - просто текст)."""
+    replicas: list[tuple[str | None, list[str]]] = []
+    for label, sentence in labeled:
+        if replicas and replicas[-1][0] == label:
+            replicas[-1][1].append(sentence)
+        else:
+            replicas.append((label, [sentence]))
+    return "\n".join(
+        f"[{label}:] {' '.join(parts)}" if label else " ".join(parts)
+        for label, parts in replicas
+    )
+
+
+def _assign_window_with_retries(assign_window: Callable[[str], str], window_text: str) -> str | None:
+    """Разметка окна; None - модель не вернула меток ролей ни с одной попытки."""
+    for attempt in range(1, ASSIGN_WINDOW_ATTEMPTS + 1):
+        output = assign_window(window_text)
+        if parse_labeled(output):
+            return output
+        logger.warning(
+            f"[RoleWindows] Ответ без меток ролей (попытка {attempt}/{ASSIGN_WINDOW_ATTEMPTS}): {output[:100]!r}"
+        )
+    return None
+
+
+def assign_roles_windowed(
+    text: str,
+    assign_window: Callable[[str], str],
+    window_chars: int = ASSIGN_ROLES_WINDOW_CHARS,
+    overlap_chars: int = ASSIGN_ROLES_OVERLAP_CHARS,
+    concurrency: int = ASSIGN_ROLES_CONCURRENCY
+) -> str:
+    """
+    Размечает текст окнами: assign_window(текст окна) -> размеченный текст окна.
+
+    Текст в одно окно (или window_chars <= 0) размечается одним вызовом как есть,
+    иначе окна размечаются параллельно (до concurrency одновременно) и сшиваются.
+    Окно без меток в ответе повторяется; не размеченное окно (или весь короткий
+    текст) остается в результате исходным текстом без меток.
+    """
+    sentences = split_sentences(text)
+    windows = build_windows(sentences, window_chars, overlap_chars) if window_chars > 0 else []
+    if len(windows) <= 1:
+        output = _assign_window_with_retries(assign_window, text)
+        return output if output is not None else text
+
+    logger.info(f"[RoleWindows] {len(windows)} окон, параллельно до {concurrency}")
+    window_texts = [" ".join(sentences[window.start:window.end]) for window in windows]
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(windows))), thread_name_prefix="assign-roles") as executor:
+        outputs = list(executor.map(lambda window_text: _assign_window_with_retries(assign_window, window_text), window_texts))
+
+    return format_labeled(stitch_windows(sentences, windows, outputs))
@@ -5,27 +5,36 @@ from pyrogram import Client
 from pyrogram.enums import ParseMode
 import re
 import asyncio
-import aiohttp
 from pathlib import Path
 from docx import Document
 import os
+import time
 from typing import List
 
-from config import ANTHROPIC_API_KEY, ANTHROPIC_API_KEY_2, ANTHROPIC_API_KEY_3, ANTHROPIC_API_KEY_4, ANTHROPIC_API_KEY_5, ANTHROPIC_API_KEY_6, ANTHROPIC_API_KEY_7, user_states
+from config import ANTHROPIC_API_KEY, ANTHROPIC_API_KEY_2, ANTHROPIC_API_KEY_3, ANTHROPIC_API_KEY_4, ANTHROPIC_API_KEY_5, ANTHROPIC_API_KEY_6, ANTHROPIC_API_KEY_7, user_states, DEEP_SEARCH_PROGRESS_INTERVAL, DIALOG_REQUEST_TIMEOUT, FAST_SEARCH_STREAM_INTERVAL, TELEGRAM_MESSAGE_THRESHOLD, SPECULATIVE_ROUTING_ENABLED, SPECULATIVE_ROUTING_TOP_K, ENHANCEMENT_PREFETCH_ENABLED, ENHANCEMENT_PREFETCH_TTL
 from utils import run_loading_animation, smart_send_text_unified, grouped_reports_to_string, get_username_from_chat
 from db_handler.db import fetch_prompts_for_scenario_reporttype_building, fetch_prompt_by_name
 from datamodels import mapping_report_type_names, mapping_building_names, REPORT_MAPPING, CLASSIFY_DESIGN, CLASSIFY_INTERVIEW
 from menus import send_main_menu
-from markups import interview_menu_markup, design_menu_markup, main_menu_markup, make_dialog_markup
+from markups import interview_menu_markup, design_menu_markup, main_menu_markup, make_dialog_markup, make_deep_search_progress_markup, make_cancel_request_markup, make_semantic_cache_markup
 from menu_manager import send_menu
 from message_tracker import track_and_send
-from analysis import analyze_methodology, classify_query, extract_from_chunk_parallel, aggregate_citations, classify_report_type, generate_db_answer, extract_from_chunk_parallel_async
+from http_session import get_http_session
+from semantic_cache import get_semantic_cache, embed_question, CachedAnswer
+from constants import CLAUDE_ERROR_MESSAGE
+from analysis import analyze_methodology, classify_query, extract_from_chunk_parallel, aggregate_citations, classify_report_type, generate_db_answer, stream_db_answer, extract_from_chunk_parallel_async, is_citation, DeepSearchProgress, STREAM_INTERRUPTED_NOTE
 from storage import save_user_input_to_db, build_reports_grouped, create_db_in_memory
 from query_expander import expand_query
 # Router Agent модули для интеллектуального выбора индекса
 from relevance_evaluator import evaluate_report_relevance, load_report_descriptions
+from embedding_router import top_indices_agree
 from index_selector import select_most_relevant_index, INDEX_MAPPING, INDEX_DISPLAY_NAMES, get_top_relevant_indices, format_index_recommendations
 from question_enhancer import enhance_question_for_index
+from analysis_dag import AnalysisNode, run_analysis_dag
+from request_context import (
+    RequestCancelledError, current_request_context, start_request_context,
+    finish_request_context, check_current_request, get_cancel_message
+)
 
 # Константы для UI и индексов
 MIN_RELEVANCE_SCORE = 10.0  # Минимальный порог релевантности для включения в рекомендации
@@ -510,7 +519,159 @@ def run_fast_search(text: str, rag) -> str:
     answer = generate_db_answer(text, rag)
     return answer
 
-def run_deep_search(content: str, text: str, chat_id: int, app: Client, category: str) -> str:
+# Курсор в конце текста, пока ответ генерируется
+STREAM_CURSOR = " ▌"
+STREAM_SWITCH_TO_FILE_TEXT = "📄 Ответ получается длинным - полный отчет будет отправлен файлом..."
+
+
+async def run_fast_search_streaming(
+    text: str,
+    rag,
+    chat_id: int,
+    app: Client,
+    header: str = "",
+    final_header: str | None = None
+) -> tuple[str, int | None]:
+    """
+    Быстрый поиск с потоковой выдачей ответа в Telegram.
+
+    Первый фрагмент ответа отправляется отдельным сообщением, далее оно
+    редактируется не чаще FAST_SEARCH_STREAM_INTERVAL секунд (без Markdown -
+    частичный текст может содержать незакрытую разметку). Когда итоговый
+    текст (final_header + ответ) превышает TELEGRAM_MESSAGE_THRESHOLD,
+    редактирование прекращается: ответ будет доставлен MD-файлом через
+    smart_send_text_unified, сообщение станет превью отчета.
+
+    Args:
+        text: Запрос пользователя
+        rag: RAG индекс
+        chat_id: ID чата
+        app: Pyrogram Client
+        header: Префикс ответа (например, категория запроса)
+        final_header: Префикс итогового текста с разметкой, по нему считается
+                      порог (None - header)
+
+    Returns:
+        tuple[str, int | None]: (полный ответ, ID сообщения с потоковым ответом
+                                 для финального редактирования или None, если
+                                 сообщение не создано)
+    """
+    final_header = header if final_header is None else final_header
+    logging.info("Формирование ответа (потоковая выдача)")
+    message_id: int | None = None
+    switched_to_file = False
+    last_edit = 0.0
+
+    async def on_text(partial: str) -> None:
+        nonlocal message_id, switched_to_file, last_edit
+        if switched_to_file:
+            return
+
+        if len(final_header) + len(partial) > TELEGRAM_MESSAGE_THRESHOLD:
+            switched_to_file = True
+            if message_id is not None:
+                await app.edit_message_text(chat_id, message_id, STREAM_SWITCH_TO_FILE_TEXT, parse_mode=ParseMode.DISABLED)
+            return
+
+        display = f"{header}{partial}"
+        now = time.monotonic()
+        if message_id is None:
+            sent = await app.send_message(chat_id, display + STREAM_CURSOR, parse_mode=ParseMode.DISABLED)
+            message_id = sent.id
+            last_edit = now
+        elif now - last_edit >= FAST_SEARCH_STREAM_INTERVAL:
+            await app.edit_message_text(chat_id, message_id, display + STREAM_CURSOR, parse_mode=ParseMode.DISABLED)
+            last_edit = now
+
+    answer = await stream_db_answer(text, rag, on_text=on_text)
+    return answer, message_id
+
+
+def format_eta(seconds: float) -> str:
+    """Форматирует оценку оставшегося времени для статуса ("~2 мин 10 с")."""
+    seconds = int(round(seconds))
+    if seconds <= 0:
+        return "почти готово"
+    minutes, sec = divmod(seconds, 60)
+    if minutes:
+        return f"~{minutes} мин {sec} с"
+    return f"~{sec} с"
+
+
+def format_deep_search_progress(progress: DeepSearchProgress) -> str:
+    """Текст статуса глубокого исследования по текущему прогрессу."""
+    return (
+        "🔬 Глубокое исследование\n\n"
+        f"Обработано чанков: {progress.done}/{progress.total}\n"
+        f"Найдено цитат: {progress.citations}\n"
+        f"Осталось: {format_eta(progress.eta_seconds)}"
+    )
+
+
+async def _send_preliminary_answer(
+    chat_id: int,
+    app: Client,
+    text: str,
+    progress: DeepSearchProgress,
+    aggregation_prompt: str
+) -> None:
+    """
+    Агрегирует цитаты, найденные к текущему моменту, и отправляет предварительный ответ.
+
+    Агрегация выполняется в отдельном потоке, чтобы не блокировать воркеры извлечения.
+    """
+    citations = progress.partial_citations()
+    done, total = progress.done, progress.total
+
+    if not citations:
+        await app.send_message(chat_id, f"Пока цитат не найдено (обработано {done}/{total} чанков).")
+        return
+
+    answer = await asyncio.to_thread(
+        aggregate_citations,
+        text=text,
+        citations=citations,
+        aggregation_prompt=aggregation_prompt
+    )
+    await smart_send_text_unified(
+        text=f"*Предварительный ответ* (обработано {done}/{total} чанков)\n\n{answer}",
+        chat_id=chat_id,
+        app=app,
+        username=await get_username_from_chat(chat_id, app),
+        question=text,
+        search_type="deep",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+
+async def run_deep_search(
+    content: str,
+    text: str,
+    chat_id: int,
+    app: Client,
+    category: str,
+    status_message_id: int | None = None
+) -> str:
+    """
+    Глубокое исследование: извлечение цитат из всех чанков и их агрегация.
+
+    Корутина: выполняется в event loop бота без вложенного run_until_complete,
+    поэтому сообщения других пользователей обрабатываются во время
+    исследования. Запросы к API идут через общую aiohttp-сессию, агрегация
+    цитат (синхронный клиент Anthropic) - в отдельном потоке.
+
+    Если передан status_message_id, статусное сообщение обновляется по мере
+    обработки чанков (не чаще DEEP_SEARCH_PROGRESS_INTERVAL секунд), а кнопка
+    "Предварительный ответ" позволяет получить ответ по уже найденным цитатам.
+
+    Args:
+        content: Отчеты категории (чанки разделены "# Чанк transcription_id N")
+        text: Запрос пользователя
+        chat_id: ID чата
+        app: Pyrogram Client
+        category: Категория запроса
+        status_message_id: ID статусного сообщения для показа прогресса (опционально)
+    """
     api_keys = [ANTHROPIC_API_KEY, ANTHROPIC_API_KEY_2, ANTHROPIC_API_KEY_3, ANTHROPIC_API_KEY_4, ANTHROPIC_API_KEY_5, ANTHROPIC_API_KEY_6, ANTHROPIC_API_KEY_7]
 
     chunks = re.split(r'^# Чанк transcription_id \d+', content, flags=re.MULTILINE)
@@ -519,33 +680,63 @@ def run_deep_search(content: str, text: str, chat_id: int, app: Client, category
     logging.info(f"Получено {len(chunks)} чанков для сценария {category}")
 
     if not chunks:
-        app.send_message(chat_id, f"Ошибка: не найдены отчеты для категории '{category}'")
+        await app.send_message(chat_id, f"Ошибка: не найдены отчеты для категории '{category}'")
         return
 
-    extract_prompt = fetch_prompt_by_name(prompt_name="prompt_extract")
-    aggregation_prompt = fetch_prompt_by_name(prompt_name="prompt_agg")
-
-    # === Асинхронный вызов extract_from_chunk_parallel_async ===
-    async def main():
-        async with aiohttp.ClientSession() as session:
-            return await extract_from_chunk_parallel_async(
-                text=text,
-                chunks=chunks,
-                extract_prompt=extract_prompt,
-                api_keys=api_keys,
-                session=session
+    extract_prompt = await asyncio.to_thread(fetch_prompt_by_name, prompt_name="prompt_extract")
+    aggregation_prompt = await asyncio.to_thread(fetch_prompt_by_name, prompt_name="prompt_agg")
+
+    # Предварительные ответы, запущенные по кнопке (дожидаемся до финальной агрегации)
+    preliminary_tasks: list[asyncio.Task] = []
+    last_update = 0.0
+
+    async def on_progress(progress: DeepSearchProgress) -> None:
+        nonlocal last_update
+
+        # Запрос предварительного ответа (флаг ставит обработчик кнопки deep_preliminary)
+        state = user_states.get(chat_id, {})
+        if state.pop("deep_search_preliminary", False):
+            logging.info(f"[Deep Search] chat_id={chat_id} запрошен предварительный ответ: {progress.citations} цитат")
+            preliminary_tasks.append(asyncio.create_task(
+                _send_preliminary_answer(chat_id, app, text, progress, aggregation_prompt)
+            ))
+
+        if status_message_id is None:
+            return
+
+        # Throttling: Telegram ограничивает частоту редактирования сообщений
+        now = time.monotonic()
+        is_last = progress.done >= progress.total
+        if not is_last and now - last_update < DEEP_SEARCH_PROGRESS_INTERVAL:
+            return
+        last_update = now
+
+        try:
+            await app.edit_message_text(
+                chat_id,
+                status_message_id,
+                format_deep_search_progress(progress),
+                reply_markup=None if is_last else make_deep_search_progress_markup()
             )
+        except Exception as e:
+            logging.debug(f"[Deep Search] Не удалось обновить статус: {e}")
 
-    try:
-        loop = asyncio.get_event_loop()
-        results = loop.run_until_complete(main())
-    except RuntimeError as e:
-        results = asyncio.run(main())
+    results = await extract_from_chunk_parallel_async(
+        text=text,
+        chunks=chunks,
+        extract_prompt=extract_prompt,
+        api_keys=api_keys,
+        session=await get_http_session(),
+        progress_callback=on_progress
+    )
+    if preliminary_tasks:
+        await asyncio.gather(*preliminary_tasks, return_exceptions=True)
 
-    citations = [r for r in results if r != "##not_found##" and not r.startswith("[ERROR]")]
+    citations = [r for r in results if is_citation(r)]
 
     if citations:
-        aggregated_answer = aggregate_citations(
+        aggregated_answer = await asyncio.to_thread(
+            aggregate_citations,
             text=text,
             citations=citations,
             aggregation_prompt=aggregation_prompt
@@ -686,6 +877,104 @@ async def show_expanded_query_menu(
             # Прокидываем другие исключения наверх
             raise
 
+    # Пока меню на экране - улучшаем вопрос под каждый рекомендованный индекс,
+    # чтобы выбор индекса сразу запускал поиск без дополнительного обращения к Claude
+    if top_indices:
+        start_enhancement_prefetch(chat_id, expanded, top_indices)
+
+
+PREFETCH_STATE_KEY = "prefetched_enhancements"
+
+
+def start_enhancement_prefetch(chat_id: int, question: str, top_indices: list[tuple]) -> None:
+    """
+    Запускает параллельное улучшение вопроса для всех top-K индексов.
+
+    enhance_question_for_index (синхронный вызов Claude) выполняется в отдельных
+    потоках. Задачи хранятся в user_states[chat_id]["prefetched_enhancements"]
+    с TTL (формат created_at/ttl как у сессий query expansion); предыдущие
+    незавершенные задачи пользователя отменяются.
+
+    Args:
+        chat_id: ID чата
+        question: Вопрос, который пойдет в поиск (улучшенный expand_query)
+        top_indices: Рекомендации Router Agent [(index_name, score), ...]
+    """
+    if not ENHANCEMENT_PREFETCH_ENABLED or not top_indices:
+        return
+
+    st = user_states.setdefault(chat_id, {})
+    _cancel_enhancement_prefetch(st.pop(PREFETCH_STATE_KEY, None))
+
+    report_descriptions = load_report_descriptions()
+    tasks = {
+        index_name: asyncio.create_task(asyncio.to_thread(
+            enhance_question_for_index,
+            question,
+            index_name,
+            report_descriptions,
+            top_indices=top_indices
+        ))
+        for index_name, _ in top_indices
+    }
+    st[PREFETCH_STATE_KEY] = {
+        "question": question,
+        "tasks": tasks,
+        "created_at": time.time(),
+        "ttl": ENHANCEMENT_PREFETCH_TTL
+    }
+    logging.info(f"[Enhancement Prefetch] chat_id={chat_id}: улучшение вопроса для индексов {list(tasks)}")
+
+
+def _cancel_enhancement_prefetch(prefetch: dict | None) -> None:
+    if prefetch:
+        for task in prefetch["tasks"].values():
+            task.cancel()
+
+
+async def take_prefetched_enhancement(chat_id: int, question: str, index_name: str) -> str | None:
+    """
+    Возвращает заранее улучшенный вопрос для выбранного индекса.
+
+    Если улучшение еще выполняется - дожидается его (без повторного вызова Claude).
+    Заранее улучшенные вопросы одноразовые: после выбора индекса удаляются.
+
+    Returns:
+        str | None: Улучшенный вопрос или None (нет prefetch для этого вопроса
+                    и индекса, истек TTL, ошибка улучшения)
+    """
+    prefetch = user_states.get(chat_id, {}).pop(PREFETCH_STATE_KEY, None)
+    if not prefetch:
+        return None
+
+    task = prefetch["tasks"].pop(index_name, None)
+    _cancel_enhancement_prefetch(prefetch)
+
+    expired = time.time() - prefetch["created_at"] > prefetch["ttl"]
+    if task is None or expired or prefetch["question"] != question:
+        if task is not None:
+            task.cancel()
+        return None
+
+    try:
+        # shield: отмена текущего запроса не отменяет задачу, и наоборот
+        enhanced_question, _ = await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # Отменена сама задача prefetch (не текущий запрос) - улучшаем заново
+        if not task.cancelled():
+            raise
+        return None
+    except Exception as e:
+        logging.warning(f"[Enhancement Prefetch] chat_id={chat_id}: ошибка улучшения для '{index_name}': {e}")
+        return None
+
+    # enhance_question_for_index возвращает исходный вопрос при ошибке
+    if not enhanced_question or enhanced_question == question:
+        return None
+
+    logging.info(f"[Enhancement Prefetch] chat_id={chat_id}: использован заранее улучшенный вопрос для '{index_name}'")
+    return enhanced_question
+
 
 async def _get_router_recommendations(text: str, chat_id: int) -> tuple[list[tuple] | None, dict[str, int]]:
     """
@@ -725,19 +1014,97 @@ async def _get_router_recommendations(text: str, chat_id: int) -> tuple[list[tup
 
         return top_indices, tokens_used
 
+    except RequestCancelledError:
+        raise
     except Exception as e:
         logging.warning(f"[Router Recommendations] Ошибка получения рекомендаций: {e}")
         logging.warning("[Router Recommendations] Продолжаем без рекомендаций индексов")
         return None, {"input_tokens": 0, "output_tokens": 0}
 
 
+def _sum_tokens(*usages: dict[str, int]) -> dict[str, int]:
+    """Суммирует токены нескольких вызовов Claude."""
+    return {
+        "input_tokens": sum(usage.get("input_tokens", 0) for usage in usages),
+        "output_tokens": sum(usage.get("output_tokens", 0) for usage in usages)
+    }
+
+
+async def expand_and_route(text: str, chat_id: int) -> tuple[dict, list[tuple] | None, dict[str, int]]:
+    """
+    Улучшает вопрос и получает рекомендации индексов для меню.
+
+    БЫЛО: expand_query() -> _get_router_recommendations(улучшенный вопрос) -
+    два последовательных обращения к Claude до показа меню.
+
+    СТАЛО (SPECULATIVE_ROUTING_ENABLED): Router Agent по исходному вопросу
+    запускается параллельно с expand_query. После улучшения вопроса локальная
+    модель bge-m3 проверяет, совпадают ли top-K индексов для исходного и
+    улучшенного вопроса: если да - спекулятивные рекомендации используются,
+    если нет - Router Agent повторяется для улучшенного вопроса.
+
+    expand_query (синхронный вызов Claude) выполняется в отдельном потоке,
+    чтобы не блокировать event loop.
+
+    Returns:
+        tuple[dict, list[tuple] | None, dict[str, int]]:
+            (результат expand_query, рекомендации индексов, суммарные токены).
+            Если вопрос не улучшен - рекомендации None
+    """
+    speculative_task = None
+    if SPECULATIVE_ROUTING_ENABLED:
+        speculative_task = asyncio.create_task(_get_router_recommendations(text, chat_id))
+
+    try:
+        expansion_result = await asyncio.to_thread(expand_query, text)
+    except BaseException:
+        if speculative_task is not None:
+            speculative_task.cancel()
+        raise
+
+    expansion_tokens = expansion_result.get("tokens_used", {"input_tokens": 0, "output_tokens": 0})
+    expanded = expansion_result["expanded"]
+    improved = expansion_result["used_descry"] and expanded != text
+
+    if speculative_task is None:
+        if not improved:
+            return expansion_result, None, expansion_tokens
+        top_indices, router_tokens = await _get_router_recommendations(expanded, chat_id)
+        return expansion_result, top_indices, _sum_tokens(expansion_tokens, router_tokens)
+
+    # Спекулятивные рекомендации нужны только для улучшенного вопроса:
+    # иначе меню не показывается, ждать Router Agent незачем
+    if not improved:
+        speculative_task.cancel()
+        return expansion_result, None, expansion_tokens
+
+    top_indices, speculative_tokens = await speculative_task
+
+    try:
+        agree = top_indices is not None and await asyncio.to_thread(
+            top_indices_agree, text, expanded, load_report_descriptions(), SPECULATIVE_ROUTING_TOP_K
+        )
+    except Exception as e:
+        logging.warning(f"[Speculative Routing] Проверка совпадения индексов недоступна: {e}")
+        agree = False
+
+    if agree:
+        logging.info(f"[Speculative Routing] chat_id={chat_id}: индексы совпали, рекомендации по исходному вопросу использованы")
+        return expansion_result, top_indices, _sum_tokens(expansion_tokens, speculative_tokens)
+
+    logging.info(f"[Speculative Routing] chat_id={chat_id}: индексы изменились после улучшения, повторный Router Agent")
+    top_indices, router_tokens = await _get_router_recommendations(expanded, chat_id)
+    return expansion_result, top_indices, _sum_tokens(expansion_tokens, speculative_tokens, router_tokens)
+
+
 # SonarCloud fix: async without await - убран async keyword
 def _process_manual_index_selection(
     chat_id: int,
     text_to_search: str,
     user_selected_index: str,
     rags: dict,
-    top_indices: list[tuple] | None
+    top_indices: list[tuple] | None,
+    prefetched_question: str | None = None
 ) -> tuple[str, str, bool]:
     """
     Обрабатывает ручной выбор индекса пользователем.
@@ -748,6 +1115,8 @@ def _process_manual_index_selection(
         user_selected_index: Выбранный пользователем индекс
         rags: Словарь RAG индексов
         top_indices: Топ-K рекомендаций для улучшения вопроса
+        prefetched_question: Вопрос, заранее улучшенный под этот индекс
+                             (take_prefetched_enhancement); None - улучшить сейчас
 
     Returns:
         tuple[str, str, bool]: (улучшенный_запрос, имя_сценария, успех)
@@ -756,18 +1125,22 @@ def _process_manual_index_selection(
     logging.info("[Manual Index] Пропускаем автоматический Router Agent")
 
     try:
-        # Загружаем описания отчетов для улучшения вопроса
-        report_descriptions = load_report_descriptions()
-        logging.info(f"[Manual Index] Загружено {len(report_descriptions)} описаний отчетов")
+        if prefetched_question:
+            # Вопрос улучшен заранее, пока пользователь выбирал индекс
+            enhanced_question = prefetched_question
+        else:
+            # Загружаем описания отчетов для улучшения вопроса
+            report_descriptions = load_report_descriptions()
+            logging.info(f"[Manual Index] Загружено {len(report_descriptions)} описаний отчетов")
 
-        # Улучшаем вопрос для выбранного индекса с контекстом топ-3
-        # Возвращает tuple (enhanced_question, tokens_used)
-        enhanced_question, _ = enhance_question_for_index(
-            text_to_search,
-            user_selected_index,
-            report_descriptions,
-            top_indices=top_indices
-        )
+            # Улучшаем вопрос для выбранного индекса с контекстом топ-3
+            # Возвращает tuple (enhanced_question, tokens_used)
+            enhanced_question, _ = enhance_question_for_index(
+                text_to_search,
+                user_selected_index,
+                report_descriptions,
+                top_indices=top_indices
+            )
         logging.info(f"[Manual Index] Вопрос улучшен для индекса '{user_selected_index}'")
         logging.debug(f"[Manual Index] Улучшенный вопрос: {enhanced_question[:150]}...")
 
@@ -785,6 +1158,8 @@ def _process_manual_index_selection(
 
         return enhanced_question, scenario_name, True
 
+    except RequestCancelledError:
+        raise
     except Exception as e:
         logging.error(f"[Manual Index] Ошибка при обработке ручного выбора: {e}")
         logging.warning("[Manual Index] Откат к автоматическому Router Agent")
@@ -852,7 +1227,8 @@ async def _run_router_agent(
         else:
             logging.info(f"[Router] Улучшение вопроса для индекса '{selected_index}'...")
             # enhance_question_for_index теперь возвращает tuple (enhanced_question, tokens_used)
-            enhanced_question, _ = enhance_question_for_index(
+            enhanced_question, _ = await asyncio.to_thread(
+                enhance_question_for_index,
                 text_to_search,
                 selected_index,
                 report_descriptions,
@@ -874,13 +1250,15 @@ async def _run_router_agent(
 
         return enhanced_question, scenario_name, rag, category
 
+    except RequestCancelledError:
+        raise
     except Exception as e:
         # Fallback: откат к старой системе классификации
         logging.warning(f"[Router] Ошибка Router Agent: {e}")
         logging.warning("[Router] Откат к fallback-системе классификации (classify_query)...")
 
         try:
-            category = classify_query(text_to_search)
+            category = await asyncio.to_thread(classify_query, text_to_search)
             logging.info(f"[Fallback] Определен сценарий: {category}")
 
             if category.lower() == "дизайн":
@@ -895,6 +1273,8 @@ async def _run_router_agent(
 
             return text_to_search, scenario_name, rag, category
 
+        except RequestCancelledError:
+            raise
         except Exception as fallback_error:
             logging.error(f"[Fallback] Критическая ошибка в fallback-системе: {fallback_error}")
             raise ValueError(f"Не удалось определить сценарий ни через Router Agent, ни через fallback: {fallback_error}")
@@ -969,7 +1349,7 @@ async def _execute_search_and_send_response(
     category: str,
     username: str,
     conversation_id: str | None
-) -> None:
+) -> str:
     """
     Выполняет поиск и отправляет результат пользователю.
 
@@ -984,28 +1364,44 @@ async def _execute_search_and_send_response(
         category: Категория запроса
         username: Имя пользователя
         conversation_id: ID диалога
+
+    Returns:
+        str: Текст ответа (без заголовка категории)
     """
+    stream_message_id = None
+    response_header = f"*Категория запроса:* {category}\n\n"
     if deep_search:
-        await track_and_send(
+        status_message = await track_and_send(
             chat_id=chat_id,
             app=app,
             text="Запущено Глубокое Исследование",
+            reply_markup=make_deep_search_progress_markup(),
             message_type="status_message"
         )
         logging.info("Запущено Глубокое исследование")
-        answer = run_deep_search(content, text=text_to_search, chat_id=chat_id, app=app, category=category)
+        answer = await run_deep_search(
+            content, text=text_to_search, chat_id=chat_id, app=app, category=category,
+            status_message_id=status_message.id
+        )
     else:
         # Шаг 3.5: Изменен текст статуса на более информативный - решает проблему непонятного статуса
         await track_and_send(
             chat_id=chat_id,
             app=app,
             text="Анализирую...",
+            reply_markup=make_cancel_request_markup(),
             message_type="status_message"
         )
         logging.info("Запущен быстрый поиск")
-        answer = run_fast_search(text=text_to_search, rag=rag)
+        # Потоковая выдача: пользователь видит ответ по мере генерации,
+        # event loop остается свободным для кнопки "Отменить"
+        answer, stream_message_id = await run_fast_search_streaming(
+            text_to_search, rag, chat_id=chat_id, app=app,
+            header=f"Категория запроса: {category}\n\n",
+            final_header=response_header
+        )
 
-    formatted_response = f"*Категория запроса:* {category}\n\n{answer}"
+    formatted_response = f"{response_header}{answer}"
 
     # Умная отправка с автоматическим выбором между сообщением и MD файлом
     await smart_send_text_unified(
@@ -1016,12 +1412,14 @@ async def _execute_search_and_send_response(
         question=original_text,
         search_type="deep" if deep_search else "fast",
         parse_mode=ParseMode.MARKDOWN,
-        conversation_id=conversation_id
+        conversation_id=conversation_id,
+        edit_message_id=stream_message_id
     )
 
     max_log_length = 3000
     answer_to_log = answer if len(answer) <= max_log_length else answer[:max_log_length] + "... [обрезано]"
     logging.info(f"Ответ отправлен | Ответ: {answer_to_log}")
+    return answer
 
 
 async def run_dialog_mode(
@@ -1036,6 +1434,45 @@ async def run_dialog_mode(
     """
     Основная функция режима диалога.
 
+    Запускает пайплайн диалога в контексте запроса с дедлайном
+    DIALOG_REQUEST_TIMEOUT и токеном отмены (кнопка "Отменить").
+    Контекст пробрасывается через contextvars во все вызовы Claude API
+    (send_msg_to_model, send_msg_to_model_async, воркеры глубокого исследования).
+
+    Args: см. _run_dialog_pipeline
+    """
+    chat_id = message.chat.id
+    request_context = start_request_context(chat_id, timeout=DIALOG_REQUEST_TIMEOUT)
+    token = current_request_context.set(request_context)
+    try:
+        await _run_dialog_pipeline(
+            message, app, rags,
+            deep_search=deep_search,
+            conversation_id=conversation_id,
+            skip_expansion=skip_expansion,
+            top_indices=top_indices
+        )
+    except RequestCancelledError as e:
+        # Отмена на этапах до поиска (expand_query, Router Agent, улучшение вопроса)
+        logging.info(f"[Dialog] chat_id={chat_id} запрос остановлен: {e}")
+        await app.send_message(chat_id, get_cancel_message(e))
+    finally:
+        current_request_context.reset(token)
+        finish_request_context(chat_id, request_context)
+
+
+async def _run_dialog_pipeline(
+    message,
+    app: Client,
+    rags: dict,
+    deep_search: bool = False,
+    conversation_id: str = None,
+    skip_expansion: bool = False,
+    top_indices: list[tuple] | None = None
+):
+    """
+    Пайплайн режима диалога.
+
     ЗАДАЧА 2.3: Добавлен параметр top_indices для передачи в enhance_question_for_index
     чтобы улучшить качество enhanced_question на основе контекста топ-3 индексов.
 
@@ -1053,21 +1490,31 @@ async def run_dialog_mode(
     text = message.text
     chat_id = message.chat.id
 
+    # Исходный вопрос пользователя (до улучшения) - ключ семантического кэша ответов
+    cache_question = user_states.get(chat_id, {}).get("dialog_question") or text
+
+    # Семантический кэш: недавний ответ на похожий вопрос выдается до expand_query
+    # и Router Agent - без обращений к Claude. При ручном выборе индекса ищем
+    # только в нем, иначе во всех индексах ("Искать заново" - semantic_cache_bypass -
+    # идет мимо кэша)
+    if not user_states.get(chat_id, {}).get("semantic_cache_bypass"):
+        preselected_index = user_states.get(chat_id, {}).get("selected_index")
+        cache_index = ROUTER_TO_RAG_MAPPING.get(preselected_index, preselected_index) if preselected_index else None
+        cached = await find_semantic_cache_answer(cache_question, deep_search, index_name=cache_index)
+        if cached is not None:
+            await send_semantic_cache_answer(
+                chat_id, app, message, cached, deep_search, conversation_id, question=cache_question
+            )
+            return
+
     # ============ ФАЗА 1: QUERY EXPANSION ============
     if not skip_expansion:
-        expansion_result = expand_query(text)
+        # expand_query и Router Agent (параллельно при спекулятивной маршрутизации)
+        expansion_result, recommended_indices, total_tokens = await expand_and_route(text, chat_id)
 
         # Если вопрос улучшен - показываем меню с рекомендациями
         if expansion_result["used_descry"] and expansion_result["expanded"] != text:
-            top_indices, router_tokens = await _get_router_recommendations(expansion_result["expanded"], chat_id)
-
-            # Агрегация токенов: expand_query + оценка релевантности индексов
-            expansion_tokens = expansion_result.get("tokens_used", {"input_tokens": 0, "output_tokens": 0})
-            total_tokens = {
-                "input_tokens": expansion_tokens["input_tokens"] + router_tokens["input_tokens"],
-                "output_tokens": expansion_tokens["output_tokens"] + router_tokens["output_tokens"]
-            }
-            logging.info(f"[Tokens Aggregation] expand_query: {expansion_tokens}, router: {router_tokens}, total: {total_tokens}")
+            logging.info(f"[Tokens Aggregation] expand_query + router: {total_tokens}")
 
             await show_expanded_query_menu(
                 chat_id=chat_id,
@@ -1077,7 +1524,7 @@ async def run_dialog_mode(
                 conversation_id=conversation_id,
                 deep_search=deep_search,
                 refine_count=0,
-                top_indices=top_indices,
+                top_indices=recommended_indices,
                 tokens_used=total_tokens  # Передаем суммарные токены для показа
             )
             return  # Ожидаем callback от пользователя
@@ -1086,14 +1533,20 @@ async def run_dialog_mode(
     else:
         text_to_search = text
 
+    check_current_request()
+
     # ============ ФАЗА 2: ВЫБОР ИНДЕКСА ============
     user_selected_index = user_states.get(chat_id, {}).get("selected_index")
 
     if user_selected_index:
         # Ручной выбор индекса пользователем
-        # SonarCloud fix: функция больше не async, вызываем синхронно
-        text_to_search, scenario_name, success = _process_manual_index_selection(
-            chat_id, text_to_search, user_selected_index, rags, top_indices
+        # Вопрос, улучшенный под этот индекс заранее (пока было показано меню)
+        prefetched_question = await take_prefetched_enhancement(chat_id, text_to_search, user_selected_index)
+        # Синхронная функция (улучшение вопроса через Claude) - в отдельном потоке
+        text_to_search, scenario_name, success = await asyncio.to_thread(
+            _process_manual_index_selection,
+            chat_id, text_to_search, user_selected_index, rags, top_indices,
+            prefetched_question=prefetched_question
         )
         skip_router_agent = success
     else:
@@ -1112,6 +1565,8 @@ async def run_dialog_mode(
         rag = rags[scenario_name]
         category = scenario_name
 
+    check_current_request()
+
     # ============ ФАЗА 3: ПОДГОТОВКА КОНТЕНТА ============
     try:
         content = build_reports_grouped(scenario_name=scenario_name, report_type=None)
@@ -1134,7 +1589,7 @@ async def run_dialog_mode(
 
     # ============ ФАЗА 4: ВЫПОЛНЕНИЕ ПОИСКА ============
     try:
-        await _execute_search_and_send_response(
+        answer = await _execute_search_and_send_response(
             chat_id=chat_id,
             app=app,
             text_to_search=text_to_search,
@@ -1147,29 +1602,23 @@ async def run_dialog_mode(
             conversation_id=conversation_id
         )
 
+        if _is_cacheable_answer(answer):
+            question_vector = await embed_question(cache_question)
+            if question_vector is not None:
+                get_semantic_cache().store(
+                    question_vector, cache_question, answer,
+                    index_name=scenario_name, category=category, deep_search=deep_search
+                )
+
+    except RequestCancelledError as e:
+        logging.info(f"[Dialog] chat_id={chat_id} поиск остановлен: {e}")
+        await app.send_message(chat_id, get_cancel_message(e))
     except Exception as e:
         error_message = f"Произошла ошибка: {str(e)}"
         logging.error(f"Произошла ошибка: {e}", exc_info=True)
         await app.send_message(chat_id, error_message)
     finally:
-        # КРИТИЧНО: Восстанавливаем step = "dialog_mode" после завершения поиска
-        # Это позволяет пользователю задать следующий вопрос без повторного входа в чат
-        if chat_id in user_states:
-            user_states[chat_id]["step"] = "dialog_mode"
-            # Очищаем временные данные поиска
-            user_states[chat_id].pop("pending_question", None)
-            user_states[chat_id].pop("raw_search_mode", None)
-            user_states[chat_id].pop("selected_index", None)  # Очищаем старый выбор индекса
-            # Сброс режима поиска в Быстрый поиск после завершения диалога (req: err_task.txt п.4)
-            user_states[chat_id]["deep_search"] = False
-            logging.info(f"[State Restore] chat_id={chat_id} step restored to dialog_mode, deep_search reset to False")
-        else:
-            # Создаем минимальное состояние если отсутствует
-            user_states[chat_id] = {
-                "step": "dialog_mode",
-                "deep_search": False
-            }
-            logging.info(f"[State Create] chat_id={chat_id} created with dialog_mode")
+        _restore_dialog_state(chat_id)
 
         # После ответа показываем меню выбора режима
         await send_menu(
@@ -1180,6 +1629,112 @@ async def run_dialog_mode(
             reply_markup=make_dialog_markup()
         )
 
+
+def _is_cacheable_answer(answer: str | None) -> bool:
+    """Ответ можно сохранить в семантический кэш (не ошибка и не прерванный поток)."""
+    return bool(answer) and answer != CLAUDE_ERROR_MESSAGE and not answer.endswith(STREAM_INTERRUPTED_NOTE)
+
+
+async def find_semantic_cache_answer(
+    question: str,
+    deep_search: bool,
+    index_name: str | None = None
+) -> CachedAnswer | None:
+    """
+    Ищет недавний ответ на похожий вопрос к индексу index_name (None - во всех индексах текущих версий).
+
+    Returns:
+        CachedAnswer | None: Ответ или None (промах, кэш выключен, модель недоступна)
+    """
+    question_vector = await embed_question(question)
+    if question_vector is None:
+        return None
+    return get_semantic_cache().lookup(question_vector, deep_search=deep_search, index_name=index_name)
+
+
+async def send_semantic_cache_answer(
+    chat_id: int,
+    app: Client,
+    message,
+    cached: CachedAnswer,
+    deep_search: bool,
+    conversation_id: str | None,
+    question: str | None = None
+) -> None:
+    """
+    Отправляет ответ из семантического кэша вместо поиска.
+
+    question - исходный вопрос пользователя (None - message.text).
+
+    Вопрос сохраняется в user_states["semantic_cache_question"] - кнопка
+    "Искать заново" запускает для него обычный путь (handlers.handle_semantic_cache_bypass).
+    """
+    username = await get_username_from_chat(chat_id, app)
+
+    if conversation_id:
+        await _save_user_message_to_conversation(
+            chat_id, message.id, message.text, conversation_id, deep_search
+        )
+
+    age_minutes = max(1, int((time.time() - cached.created_at) // 60))
+    formatted_response = (
+        f"*Категория запроса:* {cached.category}\n"
+        f"♻️ Ответ на похожий вопрос ({age_minutes} мин назад): «{cached.question}»\n\n"
+        f"{cached.answer}"
+    )
+
+    await smart_send_text_unified(
+        text=formatted_response,
+        chat_id=chat_id,
+        app=app,
+        username=username,
+        question=message.text,
+        search_type="deep" if deep_search else "fast",
+        parse_mode=ParseMode.MARKDOWN,
+        conversation_id=conversation_id
+    )
+    logging.info(
+        f"[SemanticCache] chat_id={chat_id}: ответ из кэша "
+        f"(сходство {cached.similarity:.3f}, индекс '{cached.index_name}')"
+    )
+
+    _restore_dialog_state(chat_id)
+    user_states[chat_id]["semantic_cache_question"] = question or message.text
+
+    await send_menu(
+        chat_id=chat_id,
+        app=app,
+        text="♻️ Ответ взят из кэша похожих вопросов.\n\n"
+             "Нажмите «Искать заново» для нового поиска или задайте следующий вопрос 👇",
+        reply_markup=make_semantic_cache_markup()
+    )
+
+
+def _restore_dialog_state(chat_id: int) -> None:
+    """Возвращает пользователя в dialog_mode после ответа (или ошибки) диалога."""
+    # КРИТИЧНО: Восстанавливаем step = "dialog_mode" после завершения поиска
+    # Это позволяет пользователю задать следующий вопрос без повторного входа в чат
+    if chat_id in user_states:
+        user_states[chat_id]["step"] = "dialog_mode"
+        # Очищаем временные данные поиска
+        user_states[chat_id].pop("pending_question", None)
+        user_states[chat_id].pop("raw_search_mode", None)
+        user_states[chat_id].pop("selected_index", None)  # Очищаем старый выбор индекса
+        user_states[chat_id].pop("deep_search_preliminary", None)
+        user_states[chat_id].pop("dialog_question", None)
+        user_states[chat_id].pop("semantic_cache_bypass", None)
+        # Сброс режима поиска в Быстрый поиск после завершения диалога (req: err_task.txt п.4)
+        user_states[chat_id]["deep_search"] = False
+        logging.info(f"[State Restore] chat_id={chat_id} step restored to dialog_mode, deep_search reset to False")
+    else:
+        # Создаем минимальное состояние если отсутствует
+        user_states[chat_id] = {
+            "step": "dialog_mode",
+            "deep_search": False
+        }
+        logging.info(f"[State Create] chat_id={chat_id} created with dialog_mode")
+
+
 async def run_analysis_pass(
     chat_id: int,
     source_text: str,
@@ -1190,11 +1745,16 @@ async def run_analysis_pass(
     app: Client,
     transcription_text: str,
     is_show_analysis: bool=True,
-    conversation_id: str = None
+    conversation_id: str = None,
+    api_key: str | None = None
 ) -> str:
     """
     Один «проход» анализа: крутит спиннер, вызывает analyze_methodology,
     возвращает (и сразу отправляет) результат пользователю.
+
+    analyze_methodology (синхронные вызовы Claude) выполняется в отдельном
+    потоке, чтобы параллельные проходы не блокировали event loop.
+    api_key - ключ из пула для этого прохода (None - ANTHROPIC_API_KEY).
     """
     # Отправляем системное сообщение-статус через MessageTracker
     msg_ = await track_and_send(
@@ -1208,7 +1768,7 @@ async def run_analysis_pass(
     sp_th.start()
 
     try:
-        audit_text = analyze_methodology(source_text, prompts)
+        audit_text = await asyncio.to_thread(analyze_methodology, source_text, prompts, api_key or ANTHROPIC_API_KEY)
 
         if is_show_analysis:
             # Получаем username
@@ -1294,87 +1854,43 @@ async def run_analysis_with_spinner(chat_id: int, processed_texts: dict[int, str
 
         # Сгруппируем. Например, part1 = все промпты, где run_part=1
         #               part2 = все промпты, где run_part=2
+        # part1 и part2 независимы и выполняются параллельно,
+        # JSON-промпты (количественный анализ) ждут оба результата.
+        # Если run_part не заполнен — part1 или part2 будут пусты и пропускаются.
         part1 = [(p, rp) for (p, rp) in ordinary_prompts if rp == 1]
         part2 = [(p, rp) for (p, rp) in ordinary_prompts if rp == 2]
-
-        # Если run_part не заполнен — part1 или part2 будут пусты,
-        # можно подстраховаться проверкой. В простом случае:
-        if part1:
-            # Первый проход
-            result1 = await run_analysis_pass(
-                chat_id=chat_id,
-                source_text=txt,
-                label=label,
-                scenario_name=scenario_name,
-                data=data,
-                app=app,
-                prompts=part1,
-                is_show_analysis=False,
-                transcription_text=transcription_text
-            )
-
-            logging.info("Отчет с общими факторами сформирован")
-            # Вывести результат пользователю (уже внутри run_analysis_pass)
-        if part2:
-            # Второй проход
-            result2 = await run_analysis_pass(
-                chat_id=chat_id,
-                source_text=txt,
-                label=label,
-                scenario_name=scenario_name,
-                data=data,
-                app=app,
-                prompts=part2,
-                is_show_analysis=False,
-                transcription_text=transcription_text
-            )
-
-            logging.info("Отчет с неизученными факторами сформирован")
-            # Вывести результат пользователю (уже внутри run_analysis_pass)
-        await run_analysis_pass(
-            chat_id=chat_id,
-            source_text=result1 + "\n" + result2,
-            label=label,
-            scenario_name=scenario_name,
-            data=data,
-            app=app,
-            prompts=json_prompts,
-            is_show_analysis=True,
-            transcription_text=transcription_text
-        )
-
-        logging.info("Проведён количественный анализ")
+        nodes = [
+            AnalysisNode("part1", part1),
+            AnalysisNode("part2", part2),
+            AnalysisNode("json", json_prompts, depends_on=("part1", "part2"), is_show_analysis=True),
+        ]
     else:
         # Любой другой отчёт — один проход, игнорируем run_part
         # Считаем, что prompts_list содержит один набор (или много промптов),
         # но все они обрабатываются в один вызов analyze_methodology.
-        result = await run_analysis_pass(
-            chat_id=chat_id,
-            source_text=txt,
-            label=label,
-            scenario_name=scenario_name,
-            data=data,
-            app=app,
-            prompts=ordinary_prompts,
-            is_show_analysis=False,
-            transcription_text=transcription_text
-        )
-
-        logging.info("Отчёт сформирован")
+        nodes = [
+            AnalysisNode("report", ordinary_prompts),
+            AnalysisNode("json", json_prompts, depends_on=("report",), is_show_analysis=True),
+        ]
 
-        await run_analysis_pass(
+    async def run_node(node: AnalysisNode, source_text: str, api_key: str | None) -> str:
+        return await run_analysis_pass(
             chat_id=chat_id,
-            source_text=result,
+            source_text=source_text,
             label=label,
             scenario_name=scenario_name,
             data=data,
             app=app,
-            prompts=json_prompts,
-            is_show_analysis=True,
-            transcription_text=transcription_text
+            prompts=node.prompts,
+            is_show_analysis=node.is_show_analysis,
+            transcription_text=transcription_text,
+            api_key=api_key
         )
 
-        logging.info("Проведён количественный анализ")
+    # Независимые проходы - параллельно на разных ключах пула
+    api_keys = [ANTHROPIC_API_KEY, ANTHROPIC_API_KEY_2, ANTHROPIC_API_KEY_3, ANTHROPIC_API_KEY_4, ANTHROPIC_API_KEY_5, ANTHROPIC_API_KEY_6, ANTHROPIC_API_KEY_7]
+    await run_analysis_dag(nodes, txt, run_node, api_keys)
+    logging.info("Отчёт сформирован, проведён количественный анализ")
 
     if scenario_name == CATEGORY_INTERVIEW:
         await send_menu(chat_id, app, "Какой отчёт хотите посмотреть дальше?", interview_menu_markup())
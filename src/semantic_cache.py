@@ -0,0 +1,281 @@
+"""
+Семантический кэш ответов режима диалога.
+
+ПРОБЛЕМА:
+- Аналитики часто задают по сути один и тот же вопрос ("проблемы с вентиляцией",
+  "жалобы на вентиляцию") к одному индексу, и каждый раз оплачивают полный
+  путь: expand_query, Router Agent, поиск по индексу и генерацию ответа
+
+РЕШЕНИЕ:
+1. Ответы хранятся в корзинах с ключом (имя индекса, версия индекса)
+2. Вопрос векторизуется уже загруженной моделью bge-m3 (нормализованные
+   эмбеддинги), похожесть - косинусное сходство (скалярное произведение)
+3. Если недавний ответ (моложе SEMANTIC_CACHE_TTL) того же режима поиска
+   похож не меньше чем на SEMANTIC_CACHE_THRESHOLD - он возвращается сразу
+4. При пересборке индекса (handlers.set_rags с новым объектом индекса)
+   версия индекса увеличивается, а его корзины удаляются
+5. Поиск выполняется по эмбеддингу исходного вопроса до expand_query и
+   Router Agent: в корзине заранее выбранного вручную индекса, иначе во всех
+   индексах. Ответ сохраняется после поиска под исходным вопросом пользователя
+   в корзину индекса, по которому искали
+6. Обход кэша - кнопка "Искать заново" под ответом из кэша: вопрос идет
+   обычным путем, новый ответ заменяет ответы на похожие вопросы к тому же индексу
+
+ИСПОЛЬЗОВАНИЕ:
+```python
+cache = get_semantic_cache()
+vector = await embed_question(question)
+hit = cache.lookup(vector, deep_search=False)
+if hit is None:
+    answer = ...  # полный пайплайн
+    cache.store(vector, question, answer, index_name, category, deep_search=False)
+```
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+from config import (
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_MAX_ENTRIES
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    """Закэшированный ответ на вопрос."""
+    question: str
+    answer: str
+    index_name: str
+    category: str
+    deep_search: bool
+    vector: np.ndarray
+    created_at: float
+    similarity: float = 1.0
+
+
+def _normalize(vector: Any) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+class SemanticAnswerCache:
+    """
+    Кэш ответов по семантической близости вопросов.
+
+    Args:
+        threshold: Минимальное косинусное сходство вопросов для попадания
+        ttl: Время жизни ответа (сек)
+        max_entries_per_index: Максимум ответов в корзине одного индекса (старые вытесняются)
+        enabled: False - lookup всегда промах, store ничего не делает
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        ttl: float = 3600,
+        max_entries_per_index: int = 200,
+        enabled: bool = True
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries_per_index = max(1, max_entries_per_index)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # (имя индекса, версия) -> ответы в порядке добавления
+        self._buckets: dict[tuple[str, int], list[CachedAnswer]] = {}
+        # имя индекса -> текущая версия
+        self._versions: dict[str, int] = {}
+        # имя индекса -> id объекта индекса, для которого выставлена версия
+        self._index_ids: dict[str, int] = {}
+
+    def get_version(self, index_name: str) -> int:
+        """Текущая версия индекса (0 - индекс еще не регистрировался)."""
+        with self._lock:
+            return self._versions.get(index_name, 0)
+
+    def invalidate_index(self, index_name: str) -> None:
+        """Увеличивает версию индекса и удаляет все его ответы."""
+        with self._lock:
+            self._invalidate_locked(index_name)
+
+    def _invalidate_locked(self, index_name: str) -> None:
+        self._versions[index_name] = self._versions.get(index_name, 0) + 1
+        for key in [key for key in self._buckets if key[0] == index_name]:
+            del self._buckets[key]
+
+    def sync_index_versions(self, rags: dict[str, Any]) -> list[str]:
+        """
+        Сверяет загруженные индексы с зарегистрированными.
+
+        Индекс, объект которого сменился (пересборка или перезагрузка) или
+        который исчез из rags, получает новую версию - его ответы больше не выдаются.
+
+        Returns:
+            list[str]: Имена инвалидированных индексов
+        """
+        invalidated = []
+        with self._lock:
+            for name in set(self._index_ids) - set(rags):
+                self._invalidate_locked(name)
+                del self._index_ids[name]
+                invalidated.append(name)
+
+            for name, index in rags.items():
+                index_id = id(index)
+                if self._index_ids.get(name) != index_id:
+                    if name in self._index_ids:
+                        self._invalidate_locked(name)
+                        invalidated.append(name)
+                    self._index_ids[name] = index_id
+
+        if invalidated:
+            logger.info(f"[SemanticCache] Индексы пересобраны, кэш ответов сброшен: {invalidated}")
+        return invalidated
+
+    def lookup(
+        self,
+        vector: Any,
+        deep_search: bool,
+        index_name: str | None = None
+    ) -> CachedAnswer | None:
+        """
+        Ищет самый похожий недавний ответ.
+
+        Args:
+            vector: Эмбеддинг вопроса
+            deep_search: Режим поиска (ответы быстрого поиска и глубокого исследования не смешиваются)
+            index_name: Искать только в корзине этого индекса (None - во всех индексах)
+
+        Returns:
+            CachedAnswer | None: Ответ с полем similarity или None
+        """
+        if not self.enabled:
+            return None
+
+        query = _normalize(vector)
+        now = time.time()
+        best: CachedAnswer | None = None
+        best_similarity = self.threshold
+
+        with self._lock:
+            for (name, version), entries in self._buckets.items():
+                if version != self._versions.get(name, 0):
+                    continue
+                if index_name is not None and name != index_name:
+                    continue
+                # Удаляем устаревшие ответы
+                entries[:] = [entry for entry in entries if now - entry.created_at < self.ttl]
+                for entry in entries:
+                    if entry.deep_search != deep_search:
+                        continue
+                    similarity = float(entry.vector @ query)
+                    if similarity >= best_similarity:
+                        best, best_similarity = entry, similarity
+
+        if best is None:
+            return None
+        logger.info(
+            f"[SemanticCache] Попадание: индекс '{best.index_name}', "
+            f"сходство {best_similarity:.3f} с вопросом '{best.question[:80]}'"
+        )
+        return CachedAnswer(
+            question=best.question,
+            answer=best.answer,
+            index_name=best.index_name,
+            category=best.category,
+            deep_search=best.deep_search,
+            vector=best.vector,
+            created_at=best.created_at,
+            similarity=best_similarity
+        )
+
+    def store(
+        self,
+        vector: Any,
+        question: str,
+        answer: str,
+        index_name: str,
+        category: str,
+        deep_search: bool
+    ) -> None:
+        """Сохраняет ответ в корзину текущей версии индекса (ответы на похожие вопросы к этому индексу удаляются)."""
+        if not self.enabled or not answer:
+            return
+
+        entry = CachedAnswer(
+            question=question,
+            answer=answer,
+            index_name=index_name,
+            category=category,
+            deep_search=deep_search,
+            vector=_normalize(vector),
+            created_at=time.time()
+        )
+        with self._lock:
+            key = (index_name, self._versions.get(index_name, 0))
+            entries = self._buckets.setdefault(key, [])
+            # Новый ответ заменяет ответы на похожие вопросы к этому индексу (например, после "Искать заново")
+            entries[:] = [
+                old for old in entries
+                if old.deep_search != deep_search or float(old.vector @ entry.vector) < self.threshold
+            ]
+            entries.append(entry)
+            del entries[:-self.max_entries_per_index]
+
+    def clear(self) -> None:
+        """Удаляет все ответы (версии индексов сохраняются)."""
+        with self._lock:
+            self._buckets.clear()
+
+
+_cache: SemanticAnswerCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticAnswerCache:
+    """Возвращает общий семантический кэш (создается при первом обращении)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticAnswerCache(
+                    threshold=SEMANTIC_CACHE_THRESHOLD,
+                    ttl=SEMANTIC_CACHE_TTL,
+                    max_entries_per_index=SEMANTIC_CACHE_MAX_ENTRIES,
+                    enabled=SEMANTIC_CACHE_ENABLED
+                )
+    return _cache
+
+
+async def embed_question(question: str) -> np.ndarray | None:
+    """
+    Векторизует вопрос моделью bge-m3 вне event loop.
+
+    Returns:
+        np.ndarray | None: Нормализованный эмбеддинг или None (кэш выключен / модель недоступна)
+    """
+    if not get_semantic_cache().enabled:
+        return None
+
+    def _encode() -> np.ndarray:
+        # Ленивый импорт: utils тянет pyrogram и langchain
+        from utils import get_embedding_model
+        model = get_embedding_model()
+        if model is None:
+            raise RuntimeError("Модель эмбеддингов недоступна")
+        return np.asarray(model.encode([question], normalize_embeddings=True, convert_to_numpy=True)[0], dtype=np.float32)
+
+    try:
+        return await asyncio.to_thread(_encode)
+    except Exception as e:
+        logger.warning(f"[SemanticCache] Не удалось векторизовать вопрос: {e}")
+        return None
@@ -12,6 +12,7 @@ from langchain.schema import Document
 
 from config import STORAGE_DIRS, DB_CONFIG
 from analysis import transcribe_audio, assign_roles
+from transcription_cache import transcribe_with_cache
 from datamodels import translit_map
 from utils import clean_text, get_embedding_model, split_markdown_text, CustomSentenceTransformerEmbeddings
 
@@ -245,7 +246,7 @@ def process_stored_file(category: str, filename: str, chat_id: int, app: Client)
 
     try:
         if category == "audio":
-            raw_ = transcribe_audio(path_)
+            raw_ = transcribe_with_cache(path_, transcribe_audio, chat_id=chat_id)
             try:
                 roles_ = assign_roles(raw_)
                 # app.edit_message_text(chat_id, msg_.id, "✅ Роли в диалоге расставлены.")
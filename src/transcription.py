@@ -0,0 +1,424 @@
+"""
+Параллельная транскрибация аудио по чанкам.
+
+ПРОБЛЕМА:
+- transcribe_audio_raw экспортировал и отправлял в Whisper 3-минутные чанки
+  строго по очереди: 2-часовое интервью = 40 последовательных запросов
+- Ошибка чанка молча превращалась в "" - из транскрипции пропадал фрагмент
+
+РЕШЕНИЕ:
+1. Чанки экспортируются и отправляются параллельно, не более
+   TRANSCRIPTION_CONCURRENCY одновременно (ThreadPoolExecutor)
+2. Результаты собираются в исходном порядке чанков
+3. Упавший чанк повторяется отдельно (TRANSCRIPTION_CHUNK_RETRIES раз
+   с экспоненциальной паузой); ошибки ключа/региона/запроса не повторяются
+4. Если чанк так и не распознан - TranscriptionError с номерами чанков
+   (вместо транскрипции с пропусками)
+5. Файл не декодируется целиком (AudioSegment.from_file держал в памяти PCM
+   всей записи - гигабайты для длинного WAV): длительность берется из ffprobe
+   (format=duration, если там N/A - длительность аудиопотока; без длительности -
+   AudioDurationError вместо пустой транскрипции), каждый чанк вырезается и
+   кодируется отдельным процессом ffmpeg
+   (-ss/-t, вывод в pipe). Память ограничена размером чанка x TRANSCRIPTION_CONCURRENCY
+6. Границы чанков ставятся в паузы речи: ffmpeg silencedetect находит паузы,
+   в окне +-TRANSCRIPTION_SILENCE_WINDOW_S вокруг целевой границы выбирается
+   самая длинная пауза (в пределах TRANSCRIPTION_MIN/MAX_CHUNK_S). Без паузы
+   в окне - жесткий разрез. Границы детерминированы (зависят только от файла)
+7. Чанки кодируются профилем для распознавания речи (TRANSCRIPTION_UPLOAD_PROFILE):
+   моно 16 кГц (частота модели Whisper) с низким битрейтом вместо стерео MP3
+   исходной частоты - загрузка чанка в разы меньше
+"""
+
+import logging
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Sequence, TypeVar
+
+from openai import AuthenticationError, BadRequestError, PermissionDeniedError
+
+from config import (
+    TRANSCRIPTION_CONCURRENCY, TRANSCRIPTION_CHUNK_RETRIES,
+    TRANSCRIPTION_SILENCE_SPLIT_ENABLED, TRANSCRIPTION_SILENCE_WINDOW_S,
+    TRANSCRIPTION_MIN_CHUNK_S, TRANSCRIPTION_MAX_CHUNK_S,
+    TRANSCRIPTION_SILENCE_NOISE_DB, TRANSCRIPTION_SILENCE_MIN_S,
+    TRANSCRIPTION_UPLOAD_PROFILE
+)
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, которые повтор не исправит (ключ, регион, формат файла)
+NON_RETRYABLE_ERRORS = (AuthenticationError, PermissionDeniedError, BadRequestError)
+
+# Первая пауза перед повтором чанка (сек), удваивается с каждой попыткой
+RETRY_BACKOFF = 1.0
+
+# Длина чанка по умолчанию (мс)
+DEFAULT_CHUNK_LENGTH_MS = 3 * 60_000
+
+# Утилиты ffmpeg (установлены в Docker образе)
+FFMPEG_BINARY = "ffmpeg"
+FFPROBE_BINARY = "ffprobe"
+
+# Строки вывода silencedetect: "silence_start: 12.5", "silence_end: 13.1 | silence_duration: 0.6"
+_SILENCE_RE = re.compile(r"silence_(start|end):\s*(-?[\d.]+)")
+
+ChunkT = TypeVar("ChunkT")
+
+
+@dataclass(frozen=True)
+class AudioChunk:
+    """Фрагмент записи для транскрибации (позиция в исходном файле)."""
+    index: int
+    start_s: float
+    duration_s: float
+
+
+@dataclass(frozen=True)
+class UploadProfile:
+    """Параметры кодирования чанка для загрузки в Whisper (None - как в исходнике)."""
+    name: str
+    container: str
+    extension: str
+    codec: str
+    channels: int | None = None
+    sample_rate: int | None = None
+    bitrate: str | None = None
+
+    def ffmpeg_args(self) -> list[str]:
+        """Аргументы кодирования ffmpeg для вывода чанка."""
+        args = ["-c:a", self.codec]
+        if self.channels:
+            args += ["-ac", str(self.channels)]
+        if self.sample_rate:
+            args += ["-ar", str(self.sample_rate)]
+        if self.bitrate:
+            args += ["-b:a", self.bitrate]
+        return args + ["-f", self.container]
+
+
+UPLOAD_PROFILES = {
+    # Opus - лучшее качество речи на низком битрейте
+    "speech_opus": UploadProfile("speech_opus", "ogg", "ogg", "libopus", channels=1, sample_rate=16000, bitrate="24k"),
+    "speech_mp3": UploadProfile("speech_mp3", "mp3", "mp3", "libmp3lame", channels=1, sample_rate=16000, bitrate="48k"),
+    # Прежнее поведение: MP3 с каналами и частотой исходника
+    "legacy": UploadProfile("legacy", "mp3", "mp3", "libmp3lame"),
+}
+
+
+def get_upload_profile(name: str | None = None) -> UploadProfile:
+    """Профиль кодирования по имени (None - TRANSCRIPTION_UPLOAD_PROFILE, неизвестное имя - speech_mp3)."""
+    name = name or TRANSCRIPTION_UPLOAD_PROFILE
+    profile = UPLOAD_PROFILES.get(name)
+    if profile is None:
+        logger.warning(f"[Transcription] Неизвестный профиль загрузки '{name}', используется speech_mp3")
+        profile = UPLOAD_PROFILES["speech_mp3"]
+    return profile
+
+
+class TranscriptionError(Exception):
+    """Часть чанков не удалось распознать после всех повторов."""
+
+    def __init__(self, failed_chunks: list[int], total_chunks: int):
+        self.failed_chunks = failed_chunks
+        self.total_chunks = total_chunks
+        super().__init__(
+            f"Не удалось распознать {len(failed_chunks)} из {total_chunks} чанков: {failed_chunks}"
+        )
+
+
+def transcribe_with_retries(
+    transcribe_chunk: Callable[[ChunkT], str],
+    chunk: ChunkT,
+    index: int,
+    retries: int = TRANSCRIPTION_CHUNK_RETRIES,
+    backoff: float = RETRY_BACKOFF
+) -> str:
+    """
+    Транскрибирует один чанк с повторами при ошибке.
+
+    Raises:
+        Исключение последней попытки (или сразу - для NON_RETRYABLE_ERRORS)
+    """
+    attempt = 0
+    while True:
+        try:
+            return transcribe_chunk(chunk)
+        except NON_RETRYABLE_ERRORS:
+            raise
+        except Exception as e:
+            if attempt >= retries:
+                logger.error(f"[Transcription] Чанк {index}: ошибка после {attempt + 1} попыток: {e}")
+                raise
+            delay = backoff * (2 ** attempt)
+            attempt += 1
+            logger.warning(f"[Transcription] Чанк {index}: ошибка ({e}), повтор {attempt}/{retries} через {delay:.0f}s")
+            time.sleep(delay)
+
+
+def transcribe_chunks_parallel(
+    chunks: Sequence[ChunkT],
+    transcribe_chunk: Callable[[ChunkT], str],
+    concurrency: int = TRANSCRIPTION_CONCURRENCY,
+    retries: int = TRANSCRIPTION_CHUNK_RETRIES,
+    backoff: float = RETRY_BACKOFF,
+    on_chunk_done: Callable[[int, str], None] | None = None
+) -> list[str]:
+    """
+    Транскрибирует чанки параллельно и возвращает тексты в порядке чанков.
+
+    Args:
+        chunks: Чанки аудио (порядок = порядок в записи)
+        transcribe_chunk: Экспорт и распознавание одного чанка -> текст
+        concurrency: Максимум одновременно обрабатываемых чанков
+        retries: Повторы одного чанка при ошибке
+        backoff: Первая пауза перед повтором (сек)
+        on_chunk_done: Вызывается из рабочего потока сразу после распознавания
+                       чанка (позиция в chunks, текст) - например, для чекпоинта
+
+    Returns:
+        list[str]: Тексты чанков в исходном порядке
+
+    Raises:
+        TranscriptionError: Часть чанков не распознана после всех повторов
+        NON_RETRYABLE_ERRORS: Ошибка ключа/региона/запроса (остальные чанки отменяются)
+    """
+    if not chunks:
+        return []
+
+    workers = max(1, min(concurrency, len(chunks)))
+    logger.info(f"[Transcription] {len(chunks)} чанков, параллельно до {workers}")
+
+    def run(index: int, chunk: ChunkT) -> str:
+        text = transcribe_with_retries(transcribe_chunk, chunk, index, retries, backoff)
+        if on_chunk_done is not None:
+            on_chunk_done(index, text)
+        return text
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcribe") as executor:
+        futures = [executor.submit(run, index, chunk) for index, chunk in enumerate(chunks)]
+
+        texts: list[str] = []
+        failed: list[int] = []
+        for index, future in enumerate(futures):
+            try:
+                texts.append(future.result())
+            except NON_RETRYABLE_ERRORS:
+                for pending in futures:
+                    pending.cancel()
+                raise
+            except Exception:
+                failed.append(index)
+                texts.append("")
+
+    if failed:
+        raise TranscriptionError(failed, len(chunks))
+    return texts
+
+
+class AudioDurationError(RuntimeError):
+    """ffprobe не определил длительность записи (файл поврежден или формат без длительности)."""
+
+
+def _ffprobe_duration(file_path: str, entries: list[str]) -> float:
+    """Значение длительности из ffprobe по entries (ValueError - ошибка ffprobe или N/A)."""
+    result = subprocess.run(
+        [
+            FFPROBE_BINARY, "-v", "error",
+            *entries,
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            file_path
+        ],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise ValueError(result.stderr.strip())
+    # Первая строка: у потока длительность может повторяться для нескольких записей
+    lines = result.stdout.strip().splitlines()
+    return float(lines[0] if lines else "")
+
+
+def probe_duration(file_path: str) -> float:
+    """
+    Длительность аудиофайла (сек) по метаданным ffprobe - без декодирования.
+
+    Контейнеры без длительности в заголовке (потоковый webm/ogg и т.п.) дают
+    format=duration "N/A" - тогда берется длительность первого аудиопотока.
+
+    Raises:
+        AudioDurationError: ffprobe завершился с ошибкой или не вернул длительность
+    """
+    try:
+        return _ffprobe_duration(file_path, ["-show_entries", "format=duration"])
+    except ValueError as format_error:
+        logger.warning(f"[Transcription] Нет format=duration для {file_path} ({format_error}), пробуем аудиопоток")
+    try:
+        return _ffprobe_duration(file_path, ["-select_streams", "a:0", "-show_entries", "stream=duration"])
+    except ValueError as e:
+        raise AudioDurationError(f"ffprobe не определил длительность {file_path}: {e}") from e
+
+
+def plan_chunks(duration_s: float, chunk_length_s: float) -> list[AudioChunk]:
+    """Делит запись на последовательные чанки по chunk_length_s (последний - остаток)."""
+    chunks: list[AudioChunk] = []
+    start_s = 0.0
+    while start_s < duration_s:
+        chunks.append(AudioChunk(
+            index=len(chunks),
+            start_s=start_s,
+            duration_s=min(chunk_length_s, duration_s - start_s)
+        ))
+        start_s += chunk_length_s
+    return chunks
+
+
+def export_chunk(file_path: str, chunk: AudioChunk, profile: UploadProfile | None = None) -> bytes:
+    """
+    Вырезает и кодирует один чанк процессом ffmpeg (вывод в pipe).
+
+    Args:
+        profile: Профиль кодирования (None - TRANSCRIPTION_UPLOAD_PROFILE)
+
+    -ss перед -i - быстрый переход к позиции без декодирования начала файла;
+    декодируется только сам чанк.
+
+    Raises:
+        RuntimeError: ffmpeg завершился с ошибкой
+    """
+    profile = profile or get_upload_profile()
+    result = subprocess.run(
+        [
+            FFMPEG_BINARY, "-nostdin", "-v", "error",
+            "-ss", f"{chunk.start_s:.3f}",
+            "-t", f"{chunk.duration_s:.3f}",
+            "-i", file_path,
+            "-vn",
+            *profile.ffmpeg_args(),
+            "pipe:1"
+        ],
+        capture_output=True
+    )
+    if result.returncode != 0:
+        stderr = result.stderr.decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"ffmpeg: ошибка экспорта чанка {chunk.index}: {stderr}")
+    return result.stdout
+
+
+def detect_silences(
+    file_path: str,
+    noise_db: int = TRANSCRIPTION_SILENCE_NOISE_DB,
+    min_silence_s: float = TRANSCRIPTION_SILENCE_MIN_S
+) -> list[tuple[float, float]]:
+    """
+    Паузы в записи по ffmpeg silencedetect (файл читается потоком, без PCM в памяти).
+
+    Returns:
+        list[tuple[float, float]]: (начало, конец) пауз в секундах по возрастанию
+
+    Raises:
+        RuntimeError: ffmpeg завершился с ошибкой
+    """
+    result = subprocess.run(
+        [
+            FFMPEG_BINARY, "-nostdin", "-hide_banner", "-nostats",
+            "-i", file_path,
+            "-vn",
+            "-af", f"silencedetect=noise={noise_db}dB:d={min_silence_s}",
+            "-f", "null", "-"
+        ],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg silencedetect: {result.stderr.strip()[-500:]}")
+
+    silences: list[tuple[float, float]] = []
+    start: float | None = None
+    for kind, value in _SILENCE_RE.findall(result.stderr):
+        if kind == "start":
+            start = max(float(value), 0.0)
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+    if start is not None:
+        # Запись заканчивается паузой - конца в выводе нет
+        silences.append((start, float("inf")))
+    return silences
+
+
+def _pick_boundary(
+    silences: list[tuple[float, float]],
+    target: float,
+    low: float,
+    high: float
+) -> float | None:
+    """
+    Точка разреза в самой длинной паузе внутри [low, high].
+
+    Равные паузы - ближайшая к target, затем более ранняя. None - пауз в окне нет.
+    """
+    best: tuple[float, float, float] | None = None  # (-длина, расстояние до target, точка)
+    for start, end in silences:
+        overlap_start, overlap_end = max(start, low), min(end, high)
+        if overlap_start > overlap_end:
+            continue
+        point = min(max((start + end) / 2, overlap_start), overlap_end)
+        key = (-(overlap_end - overlap_start), abs(point - target), point)
+        if best is None or key < best:
+            best = key
+    return best[2] if best is not None else None
+
+
+def plan_chunks_at_silences(
+    duration_s: float,
+    silences: list[tuple[float, float]],
+    target_s: float,
+    window_s: float = TRANSCRIPTION_SILENCE_WINDOW_S,
+    min_s: float = TRANSCRIPTION_MIN_CHUNK_S,
+    max_s: float = TRANSCRIPTION_MAX_CHUNK_S
+) -> list[AudioChunk]:
+    """
+    Делит запись на чанки ~target_s с границами в паузах речи.
+
+    Для каждой границы пауза ищется в окне target_s +- window_s, ограниченном
+    длиной чанка [min_s, max_s]; если пауз нет - разрез на target_s. Хвост
+    короче max_s становится последним чанком. Результат зависит только от
+    входных данных (границы округляются до миллисекунд).
+    """
+    min_s = min(min_s, target_s)
+    max_s = max(max_s, target_s)
+
+    boundaries = [0.0]
+    while duration_s - boundaries[-1] > max_s:
+        prev = boundaries[-1]
+        target = prev + target_s
+        low = prev + max(min_s, target_s - window_s)
+        high = prev + min(max_s, target_s + window_s)
+        point = _pick_boundary(silences, target, low, high)
+        boundaries.append(round(point if point is not None else target, 3))
+    boundaries.append(duration_s)
+
+    return [
+        AudioChunk(index=i, start_s=start, duration_s=end - start)
+        for i, (start, end) in enumerate(zip(boundaries, boundaries[1:]))
+        if end > start
+    ]
+
+
+def plan_transcription_chunks(file_path: str, duration_s: float, chunk_length_s: float) -> list[AudioChunk]:
+    """
+    План чанков для транскрибации: по паузам речи или (выключено/ошибка ffmpeg)
+    жесткие разрезы каждые chunk_length_s.
+    """
+    if TRANSCRIPTION_SILENCE_SPLIT_ENABLED:
+        try:
+            silences = detect_silences(file_path)
+            chunks = plan_chunks_at_silences(duration_s, silences, chunk_length_s)
+            logger.info(f"[Transcription] {len(chunks)} чанков по паузам речи ({len(silences)} пауз)")
+            return chunks
+        except Exception as e:
+            logger.warning(f"[Transcription] Поиск пауз недоступен, жесткие границы чанков: {e}")
+    return plan_chunks(duration_s, chunk_length_s)
@@ -0,0 +1,214 @@
+"""
+Бэкенды распознавания чанков для transcribe_audio_raw.
+
+ПРОБЛЕМА:
+- Каждая транскрибация шла в удаленный Whisper (TRANSCRIPTION_MODEL_NAME,
+  OPENAI_BASE_URL): пропускная способность ограничена лимитами API и
+  скоростью загрузки, массовая офлайн-обработка архива невозможна
+
+РЕШЕНИЕ:
+1. transcribe_audio_raw (нарезка, параллелизм, повторы, чекпоинты) не знает,
+   кто распознает чанк: это делает TranscriptionBackend.transcribe_chunk
+2. openai - прежнее поведение: чанк кодируется профилем загрузки и
+   отправляется в Whisper API
+3. local - faster-whisper (CTranslate2) на CPU с int8-весами: чанк
+   декодируется ffmpeg в PCM 16 кГц моно и распознается в процессе.
+   Модель загружается один раз; LOCAL_WHISPER_WORKERS чанков распознаются
+   параллельно, ядра CPU делятся между ними поровну - заняты все ядра
+4. Бэкенд выбирается TRANSCRIPTION_BACKEND; faster-whisper - необязательная
+   зависимость (нужна только для local)
+5. cache_params() бэкенда входит в ключ кэша транскрипций (transcription_cache)
+
+ИСПОЛЬЗОВАНИЕ:
+```python
+backend = get_transcription_backend("local")
+text = transcribe_audio_raw(path, backend=backend)
+```
+"""
+
+import io
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+from openai import OpenAI
+
+from config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, TRANSCRIPTION_MODEL_NAME,
+    TRANSCRIPTION_BACKEND, TRANSCRIPTION_CONCURRENCY,
+    LOCAL_WHISPER_MODEL, LOCAL_WHISPER_COMPUTE_TYPE, LOCAL_WHISPER_WORKERS,
+    LOCAL_WHISPER_CPU_THREADS, LOCAL_WHISPER_LANGUAGE, LOCAL_WHISPER_BEAM_SIZE
+)
+from transcription import AudioChunk, UploadProfile, export_chunk, get_upload_profile
+
+# Условный импорт для faster_whisper
+try:
+    from faster_whisper import WhisperModel
+    _faster_whisper_available = True
+except ImportError:
+    _faster_whisper_available = False
+    WhisperModel = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_OPENAI = "openai"
+BACKEND_LOCAL = "local"
+
+# Вход модели faster-whisper: PCM 16 бит, моно, 16 кГц без контейнера
+PCM_PROFILE = UploadProfile("pcm_16k", "s16le", "pcm", "pcm_s16le", channels=1, sample_rate=16000)
+
+
+def has_faster_whisper() -> bool:
+    """Проверяет доступность библиотеки faster_whisper."""
+    return _faster_whisper_available
+
+
+class TranscriptionBackend(ABC):
+    """Распознавание одного чанка аудиофайла (вызывается из нескольких потоков)."""
+
+    name: str = ""
+    # Сколько чанков распознавать одновременно
+    concurrency: int = 1
+
+    @abstractmethod
+    def transcribe_chunk(self, file_path: str, chunk: AudioChunk) -> str:
+        """Текст чанка chunk файла file_path."""
+
+    @abstractmethod
+    def cache_params(self) -> dict:
+        """Параметры бэкенда, от которых зависит текст транскрипции (входят в ключ кэша)."""
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """Whisper API: чанк кодируется профилем загрузки и отправляется в OpenAI."""
+
+    name = BACKEND_OPENAI
+
+    def __init__(
+        self,
+        model_name: str | None = TRANSCRIPTION_MODEL_NAME,
+        api_key: str | None = OPENAI_API_KEY,
+        base_url: str | None = OPENAI_BASE_URL,
+        upload_profile: str | None = None,
+        concurrency: int = TRANSCRIPTION_CONCURRENCY
+    ):
+        self.model_name = model_name or "whisper-1"
+        self.profile = get_upload_profile(upload_profile)
+        self.concurrency = concurrency
+        self.client = OpenAI(api_key=api_key or "", base_url=base_url)
+
+    def transcribe_chunk(self, file_path: str, chunk: AudioChunk) -> str:
+        # Вырезаем и кодируем чанк профилем для речи (ffmpeg, только этот фрагмент)
+        chunk_io = io.BytesIO(export_chunk(file_path, chunk, self.profile))
+        chunk_io.name = f"chunk.{self.profile.extension}"
+
+        # Отправляем чанк на транскрипцию
+        response = self.client.audio.transcriptions.create(
+            model=self.model_name,
+            file=chunk_io
+        )
+        return response.text
+
+    def cache_params(self) -> dict:
+        # Без "backend": ключи транскрипций Whisper API, сохраненных до появления бэкендов, не меняются
+        return {"model": self.model_name, "upload_profile": self.profile.name}
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    faster-whisper на CPU.
+
+    Args:
+        model: Размер модели или путь к сконвертированной модели
+        compute_type: Квантование весов (int8, int8_float32, float32)
+        workers: Сколько чанков распознается одновременно
+        cpu_threads: Потоков CPU на всю модель (0 - все ядра), делятся между workers
+        language: Язык записей (None/"" - автоопределение)
+        beam_size: Ширина beam search
+
+    Raises:
+        RuntimeError: faster_whisper не установлен
+    """
+
+    name = BACKEND_LOCAL
+
+    def __init__(
+        self,
+        model: str = LOCAL_WHISPER_MODEL,
+        compute_type: str = LOCAL_WHISPER_COMPUTE_TYPE,
+        workers: int = LOCAL_WHISPER_WORKERS,
+        cpu_threads: int = LOCAL_WHISPER_CPU_THREADS,
+        language: str | None = LOCAL_WHISPER_LANGUAGE,
+        beam_size: int = LOCAL_WHISPER_BEAM_SIZE
+    ):
+        if not has_faster_whisper():
+            raise RuntimeError("Для TRANSCRIPTION_BACKEND=local установите faster-whisper: pip install faster-whisper")
+
+        self.model_name = model
+        self.compute_type = compute_type
+        self.concurrency = max(1, workers)
+        self.language = language or None
+        self.beam_size = beam_size
+
+        # cpu_threads в CTranslate2 - потоки одного worker: делим ядра между workers
+        total_threads = cpu_threads or os.cpu_count() or 1
+        self.threads_per_worker = max(1, total_threads // self.concurrency)
+
+        logger.info(
+            f"[Transcription] Загрузка faster-whisper '{model}' ({compute_type}, "
+            f"{self.concurrency} x {self.threads_per_worker} потоков)"
+        )
+        self.model = WhisperModel(
+            model,
+            device="cpu",
+            compute_type=compute_type,
+            cpu_threads=self.threads_per_worker,
+            num_workers=self.concurrency
+        )
+
+    def transcribe_chunk(self, file_path: str, chunk: AudioChunk) -> str:
+        pcm = export_chunk(file_path, chunk, PCM_PROFILE)
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+        segments, _info = self.model.transcribe(audio, language=self.language, beam_size=self.beam_size)
+        # segments - генератор: распознавание идет при итерации
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+    def cache_params(self) -> dict:
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "compute_type": self.compute_type,
+            "language": self.language,
+            "beam_size": self.beam_size,
+        }
+
+
+# Локальная модель загружается один раз на процесс (сотни МБ - гигабайты весов)
+_local_backend: LocalWhisperBackend | None = None
+_local_backend_lock = threading.Lock()
+
+
+def get_transcription_backend(name: str | None = None, **openai_kwargs) -> TranscriptionBackend:
+    """
+    Бэкенд по имени (None - TRANSCRIPTION_BACKEND).
+
+    openai_kwargs (model_name, api_key, base_url, upload_profile, concurrency)
+    передаются OpenAIWhisperBackend.
+
+    Raises:
+        ValueError: Неизвестное имя бэкенда
+        RuntimeError: local без установленного faster_whisper
+    """
+    global _local_backend
+    name = name or TRANSCRIPTION_BACKEND
+    if name == BACKEND_OPENAI:
+        return OpenAIWhisperBackend(**openai_kwargs)
+    if name == BACKEND_LOCAL:
+        with _local_backend_lock:
+            if _local_backend is None:
+                _local_backend = LocalWhisperBackend()
+            return _local_backend
+    raise ValueError(f"Неизвестный бэкенд транскрибации '{name}' (ожидается {BACKEND_OPENAI} или {BACKEND_LOCAL})")
@@ -0,0 +1,173 @@
+"""
+Кэш транскрипций по содержимому аудио.
+
+ПРОБЛЕМА:
+- Пользователи повторно загружают ту же запись (исправили подпись, выбрали
+  другой тип отчета) - каждый раз полная транскрибация Whisper
+- Объект в MinIO назывался именем файла из Telegram: разные записи с одним
+  именем перезаписывали друг друга, одна запись под разными именами
+  хранилась несколько раз
+
+РЕШЕНИЕ:
+1. SHA-256 содержимого файла (читается блоками) - идентичность записи
+2. Объект аудио в MinIO - "<sha256><расширение>" (исходное имя - в метаданных),
+   повторно одна и та же запись не загружается
+3. Транскрипция хранится рядом с аудио: transcripts/<sha256>_<хэш параметров>.txt.
+   Параметры - cache_params() бэкенда (модель, профиль кодирования, декодирование),
+   длина чанка и настройки границ по паузам: их изменение дает новый ключ,
+   устаревший текст не возвращается
+4. Ошибки MinIO не ломают транскрибацию - кэш просто пропускается
+5. Ключ кэша - также id задачи чекпоинтов (transcription_jobs): повторная
+   отправка файла после сбоя продолжает с готовых чанков
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Callable
+
+from config import (
+    TRANSCRIPTION_CACHE_ENABLED, TRANSCRIPTION_JOBS_ENABLED,
+    TRANSCRIPTION_SILENCE_SPLIT_ENABLED, TRANSCRIPTION_SILENCE_WINDOW_S,
+    TRANSCRIPTION_MIN_CHUNK_S, TRANSCRIPTION_MAX_CHUNK_S,
+    TRANSCRIPTION_SILENCE_NOISE_DB, TRANSCRIPTION_SILENCE_MIN_S
+)
+from transcription import DEFAULT_CHUNK_LENGTH_MS
+from transcription_backends import TranscriptionBackend, get_transcription_backend
+
+logger = logging.getLogger(__name__)
+
+# Префикс объектов транскрипций в бакете аудио
+TRANSCRIPT_PREFIX = "transcripts/"
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    """SHA-256 содержимого файла (блоками, без загрузки файла в память)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def audio_object_name(audio_hash: str, file_name: str) -> str:
+    """Имя объекта аудио в MinIO: хэш содержимого + расширение исходного файла."""
+    return f"{audio_hash}{Path(file_name).suffix.lower()}"
+
+
+def transcription_params(backend: TranscriptionBackend | None = None) -> dict:
+    """Параметры, от которых зависит текст транскрипции (backend None - TRANSCRIPTION_BACKEND)."""
+    backend = backend or get_transcription_backend()
+    params = {
+        **backend.cache_params(),
+        "chunk_length_ms": DEFAULT_CHUNK_LENGTH_MS,
+        "silence_split": TRANSCRIPTION_SILENCE_SPLIT_ENABLED,
+    }
+    if TRANSCRIPTION_SILENCE_SPLIT_ENABLED:
+        params.update({
+            "silence_window_s": TRANSCRIPTION_SILENCE_WINDOW_S,
+            "min_chunk_s": TRANSCRIPTION_MIN_CHUNK_S,
+            "max_chunk_s": TRANSCRIPTION_MAX_CHUNK_S,
+            "silence_noise_db": TRANSCRIPTION_SILENCE_NOISE_DB,
+            "silence_min_s": TRANSCRIPTION_SILENCE_MIN_S,
+        })
+    return params
+
+
+def transcription_cache_key(audio_hash: str, params: dict | None = None) -> str:
+    """Ключ кэша: хэш аудио + хэш параметров транскрибации."""
+    params = params if params is not None else transcription_params()
+    params_hash = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{audio_hash}_{params_hash[:16]}"
+
+
+class TranscriptionCache:
+    """
+    Транскрипции в бакете аудио MinIO.
+
+    Args:
+        storage: Объект с методами get_text_object/put_text_object
+                 (None - общий MinIOManager, создается при первом обращении)
+    """
+
+    def __init__(self, storage=None):
+        self._storage = storage
+
+    def _get_storage(self):
+        if self._storage is None:
+            from minio_manager import get_minio_manager
+            self._storage = get_minio_manager()
+        return self._storage
+
+    @staticmethod
+    def object_name(key: str) -> str:
+        return f"{TRANSCRIPT_PREFIX}{key}.txt"
+
+    def get(self, key: str) -> str | None:
+        """Сохраненная транскрипция или None (нет в кэше, MinIO недоступен)."""
+        try:
+            return self._get_storage().get_text_object(self.object_name(key))
+        except Exception as e:
+            logger.warning(f"[TranscriptionCache] Чтение кэша недоступно: {e}")
+            return None
+
+    def set(self, key: str, text: str, metadata: dict[str, str] | None = None) -> None:
+        """Сохраняет транскрипцию (ошибки MinIO только логируются)."""
+        try:
+            self._get_storage().put_text_object(self.object_name(key), text, metadata=metadata)
+        except Exception as e:
+            logger.warning(f"[TranscriptionCache] Не удалось сохранить транскрипцию: {e}")
+
+
+_cache: TranscriptionCache | None = None
+
+
+def get_transcription_cache() -> TranscriptionCache:
+    """Возвращает общий экземпляр кэша транскрипций."""
+    global _cache
+    if _cache is None:
+        _cache = TranscriptionCache()
+    return _cache
+
+
+def transcribe_with_cache(
+    file_path: str,
+    transcribe: Callable[..., str],
+    audio_hash: str | None = None,
+    chat_id: int | None = None
+) -> str:
+    """
+    Транскрипция файла из кэша или через transcribe с сохранением в кэш.
+
+    Args:
+        file_path: Путь к аудиофайлу
+        transcribe: Функция транскрибации (например, analysis.transcribe_audio);
+                    при TRANSCRIPTION_JOBS_ENABLED получает job_id и chat_id
+        audio_hash: SHA-256 файла, если уже посчитан (None - считается здесь)
+        chat_id: Владелец задачи транскрибации (для команды /transcription)
+    """
+    if not TRANSCRIPTION_CACHE_ENABLED and not TRANSCRIPTION_JOBS_ENABLED:
+        return transcribe(file_path)
+
+    audio_hash = audio_hash or file_sha256(file_path)
+    key = transcription_cache_key(audio_hash)
+    cache = get_transcription_cache()
+
+    if TRANSCRIPTION_CACHE_ENABLED:
+        cached = cache.get(key)
+        if cached is not None:
+            logger.info(f"[TranscriptionCache] Транскрипция {audio_hash[:12]} взята из кэша ({len(cached)} символов)")
+            return cached
+
+    if TRANSCRIPTION_JOBS_ENABLED:
+        text = transcribe(file_path, job_id=key, chat_id=chat_id)
+    else:
+        text = transcribe(file_path)
+
+    # Пустой результат (ошибка чтения файла) не кэшируем
+    if text and TRANSCRIPTION_CACHE_ENABLED:
+        cache.set(key, text, metadata={"audio_sha256": audio_hash})
+    return text
@@ -0,0 +1,278 @@
+"""
+Возобновляемая транскрибация: чекпоинты результатов по чанкам.
+
+ПРОБЛЕМА:
+- Рестарт бота или сбой Whisper в середине файла терял все распознанные
+  чанки: повторная обработка начиналась с нуля, длинные записи
+  оплачивались дважды
+
+РЕШЕНИЕ:
+1. Задача транскрибации (job) - JSON файл в TRANSCRIPTION_JOBS_DIR; id задачи -
+   ключ кэша транскрипций (SHA-256 аудио + параметры), поэтому повторная
+   отправка того же файла после сбоя попадает в ту же задачу
+2. Каждый чанк (индекс, границы, статус, текст) записывается сразу после
+   распознавания (атомарная запись файла)
+3. При повторном запуске готовые чанки берутся из чекпоинта, распознаются
+   только оставшиеся. План чанков сверяется: если границы изменились,
+   задача начинается заново
+4. Команда /transcription показывает прогресс задач пользователя
+5. Завершенные задачи старше TRANSCRIPTION_JOBS_TTL_DAYS удаляются
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Sequence
+
+from config import (
+    TRANSCRIPTION_CONCURRENCY, TRANSCRIPTION_CHUNK_RETRIES, TRANSCRIPTION_JOBS_DIR, TRANSCRIPTION_JOBS_TTL_DAYS
+)
+from transcription import RETRY_BACKOFF, AudioChunk, TranscriptionError, transcribe_chunks_parallel
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_DONE = "done"
+JOB_STATUS_FAILED = "failed"
+# Задача "running", которую не выполняет текущий процесс (бот перезапускался)
+JOB_STATUS_INTERRUPTED = "interrupted"
+
+CHUNK_STATUS_DONE = "done"
+CHUNK_STATUS_FAILED = "failed"
+
+JOB_STATUS_LABELS = {
+    JOB_STATUS_RUNNING: "⏳ выполняется",
+    JOB_STATUS_DONE: "✅ завершена",
+    JOB_STATUS_FAILED: "❌ ошибка",
+    JOB_STATUS_INTERRUPTED: "⏸ прервана",
+}
+
+
+def _chunk_plan(chunks: Sequence[AudioChunk]) -> list[list[float]]:
+    return [[round(chunk.start_s, 3), round(chunk.duration_s, 3)] for chunk in chunks]
+
+
+class TranscriptionJobStore:
+    """
+    Чекпоинты задач транскрибации (один JSON файл на задачу).
+
+    Args:
+        jobs_dir: Директория файлов задач
+        ttl_days: Срок хранения завершенных задач
+    """
+
+    def __init__(self, jobs_dir: str | Path = TRANSCRIPTION_JOBS_DIR, ttl_days: int = TRANSCRIPTION_JOBS_TTL_DAYS):
+        self.jobs_dir = Path(jobs_dir)
+        self.ttl_days = ttl_days
+        self._lock = threading.Lock()
+        # Задачи, которые выполняет этот процесс
+        self._active: set[str] = set()
+
+    def _path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _read(self, job_id: str) -> dict[str, Any] | None:
+        path = self._path(job_id)
+        if not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"[TranscriptionJobs] Поврежденный чекпоинт {path.name}: {e}")
+            return None
+
+    def _write(self, job: dict[str, Any]) -> None:
+        job["updated_at"] = datetime.now().isoformat()
+        path = self._path(job["job_id"])
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Атомарная запись: временный файл + rename
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[TranscriptionJobs] Не удалось сохранить чекпоинт {job['job_id']}: {e}")
+
+    def start(
+        self,
+        job_id: str,
+        chunks: Sequence[AudioChunk],
+        chat_id: int | None = None,
+        file_name: str = ""
+    ) -> dict[int, str]:
+        """
+        Открывает задачу (новую или прерванную).
+
+        Returns:
+            dict[int, str]: Уже распознанные чанки {индекс: текст}
+        """
+        self.prune()
+        plan = _chunk_plan(chunks)
+        with self._lock:
+            job = self._read(job_id)
+            if job is None or job.get("plan") != plan:
+                if job is not None:
+                    logger.info(f"[TranscriptionJobs] План чанков задачи {job_id[:12]} изменился, начинаем заново")
+                job = {
+                    "job_id": job_id,
+                    "created_at": datetime.now().isoformat(),
+                    "plan": plan,
+                    "chunks": {},
+                }
+            job.update({
+                "chat_id": chat_id if chat_id is not None else job.get("chat_id"),
+                "file_name": file_name or job.get("file_name", ""),
+                "status": JOB_STATUS_RUNNING,
+                "total_chunks": len(plan),
+                "error": None,
+            })
+            self._active.add(job_id)
+            self._write(job)
+
+        finished = {
+            int(index): record["text"]
+            for index, record in job["chunks"].items()
+            if record.get("status") == CHUNK_STATUS_DONE
+        }
+        if finished:
+            logger.info(
+                f"[TranscriptionJobs] Задача {job_id[:12]}: продолжение, "
+                f"готово {len(finished)}/{len(plan)} чанков"
+            )
+        return finished
+
+    def record_chunk(self, job_id: str, index: int, text: str | None = None, error: str | None = None) -> None:
+        """Сохраняет результат чанка (text) или ошибку (error)."""
+        with self._lock:
+            job = self._read(job_id)
+            if job is None:
+                return
+            job["chunks"][str(index)] = (
+                {"status": CHUNK_STATUS_FAILED, "error": error}
+                if error is not None else
+                {"status": CHUNK_STATUS_DONE, "text": text or ""}
+            )
+            self._write(job)
+
+    def finish(self, job_id: str, error: str | None = None) -> None:
+        """Закрывает задачу: done или failed (с error)."""
+        with self._lock:
+            self._active.discard(job_id)
+            job = self._read(job_id)
+            if job is None:
+                return
+            job["status"] = JOB_STATUS_FAILED if error else JOB_STATUS_DONE
+            job["error"] = error
+            self._write(job)
+
+    def load(self, job_id: str) -> dict[str, Any] | None:
+        """Задача с актуальным статусом (running без исполнителя -> interrupted)."""
+        with self._lock:
+            job = self._read(job_id)
+            if job is not None and job.get("status") == JOB_STATUS_RUNNING and job_id not in self._active:
+                job["status"] = JOB_STATUS_INTERRUPTED
+            return job
+
+    def list_jobs(self, chat_id: int, limit: int = 5) -> list[dict[str, Any]]:
+        """Последние задачи пользователя (новые первыми)."""
+        if not self.jobs_dir.exists():
+            return []
+        jobs = []
+        for path in self.jobs_dir.glob("*.json"):
+            job = self.load(path.stem)
+            if job is not None and job.get("chat_id") == chat_id:
+                jobs.append(job)
+        jobs.sort(key=lambda job: job.get("updated_at", ""), reverse=True)
+        return jobs[:limit]
+
+    def prune(self) -> int:
+        """Удаляет завершенные и прерванные задачи старше ttl_days."""
+        if not self.jobs_dir.exists():
+            return 0
+        cutoff = time.time() - self.ttl_days * 24 * 3600
+        removed = 0
+        for path in self.jobs_dir.glob("*.json"):
+            try:
+                if path.stem not in self._active and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError as e:
+                logger.warning(f"[TranscriptionJobs] Не удалось удалить {path.name}: {e}")
+        return removed
+
+
+_store: TranscriptionJobStore | None = None
+
+
+def get_transcription_job_store() -> TranscriptionJobStore:
+    """Возвращает общее хранилище задач транскрибации."""
+    global _store
+    if _store is None:
+        _store = TranscriptionJobStore()
+    return _store
+
+
+def transcribe_chunks_resumable(
+    job_id: str,
+    chunks: Sequence[AudioChunk],
+    transcribe_chunk: Callable[[AudioChunk], str],
+    chat_id: int | None = None,
+    file_name: str = "",
+    concurrency: int = TRANSCRIPTION_CONCURRENCY,
+    retries: int = TRANSCRIPTION_CHUNK_RETRIES,
+    backoff: float = RETRY_BACKOFF,
+    store: TranscriptionJobStore | None = None
+) -> list[str]:
+    """
+    transcribe_chunks_parallel с чекпоинтом: готовые чанки задачи не распознаются повторно.
+
+    Returns:
+        list[str]: Тексты всех чанков в исходном порядке
+
+    Raises:
+        TranscriptionError: Часть чанков не распознана (готовые остаются в чекпоинте)
+    """
+    store = store or get_transcription_job_store()
+    finished = store.start(job_id, chunks, chat_id=chat_id, file_name=file_name)
+    pending = [chunk for chunk in chunks if chunk.index not in finished]
+
+    def checkpoint(position: int, text: str) -> None:
+        store.record_chunk(job_id, pending[position].index, text)
+
+    try:
+        texts = transcribe_chunks_parallel(
+            pending, transcribe_chunk,
+            concurrency=concurrency, retries=retries, backoff=backoff, on_chunk_done=checkpoint
+        )
+    except TranscriptionError as e:
+        failed = [pending[position].index for position in e.failed_chunks]
+        for index in failed:
+            store.record_chunk(job_id, index, error="не распознан после повторов")
+        store.finish(job_id, error=f"Не распознаны чанки {failed}")
+        raise TranscriptionError(failed, len(chunks)) from e
+    except BaseException as e:
+        store.finish(job_id, error=str(e) or type(e).__name__)
+        raise
+
+    finished.update((chunk.index, text) for chunk, text in zip(pending, texts))
+    store.finish(job_id)
+    return [finished[chunk.index] for chunk in chunks]
+
+
+def format_job_progress(job: dict[str, Any]) -> str:
+    """Строка прогресса задачи для команды /transcription."""
+    done = sum(1 for record in job.get("chunks", {}).values() if record.get("status") == CHUNK_STATUS_DONE)
+    total = job.get("total_chunks", 0)
+    status = JOB_STATUS_LABELS.get(job.get("status"), job.get("status", ""))
+    updated = job.get("updated_at", "")[:16].replace("T", " ")
+
+    line = f"🎙 {job.get('file_name') or job['job_id'][:12]}\n{status}: {done}/{total} чанков ({updated})"
+    if job.get("status") in (JOB_STATUS_FAILED, JOB_STATUS_INTERRUPTED):
+        line += "\nОтправьте файл повторно - готовые чанки не будут распознаваться заново"
+    return line
@@ -295,6 +295,31 @@ def _save_to_conversation_with_retry(
     )
 
 
+async def _send_or_edit_streamed(
+    chat_id: int,
+    app: Client,
+    text: str,
+    parse_mode: Optional[ParseMode],
+    edit_message_id: Optional[int]
+):
+    """
+    Заменяет текст сообщения edit_message_id (потоковая выдача) на text или отправляет новое.
+
+    При ошибке редактирования старое сообщение удаляется, чтобы в чате
+    не оставался недописанный ответ с курсором.
+    """
+    if edit_message_id is not None:
+        try:
+            return await app.edit_message_text(chat_id, edit_message_id, text, parse_mode=parse_mode)
+        except Exception as e:
+            logging.warning(f"Failed to edit streamed message, sending new one: {e}")
+            try:
+                await app.delete_messages(chat_id, edit_message_id)
+            except Exception as delete_error:
+                logging.warning(f"Failed to delete streamed message: {delete_error}")
+    return await app.send_message(chat_id, text, parse_mode=parse_mode)
+
+
 async def smart_send_text_unified(
     text: str,
     chat_id: int,
@@ -303,7 +328,8 @@ async def smart_send_text_unified(
     question: str = "",
     search_type: str = "fast",
     parse_mode: Optional[ParseMode] = None,
-    conversation_id: Optional[str] = None
+    conversation_id: Optional[str] = None,
+    edit_message_id: Optional[int] = None
 ) -> bool:
     """
     Единая async функция для умной отправки текста.
@@ -318,6 +344,9 @@ async def smart_send_text_unified(
         search_type: Тип поиска ("fast" или "deep")
         parse_mode: Режим парсинга для сообщений
         conversation_id: ID мультичата (если None, сохранение в conversations не выполняется)
+        edit_message_id: ID сообщения потоковой выдачи ответа. Заменяется итоговым
+                         текстом (длинный текст - превью перед MD-файлом); при ошибке
+                         редактирования удаляется, отправляется новое сообщение
 
     Returns:
         bool: True если отправка успешна
@@ -334,7 +363,7 @@ async def smart_send_text_unified(
         if len(text) <= TELEGRAM_MESSAGE_THRESHOLD:
             # Короткое сообщение - отправляем как обычное сообщение
             try:
-                sent_message = await app.send_message(chat_id, text, parse_mode=parse_mode)
+                sent_message = await _send_or_edit_streamed(chat_id, app, text, parse_mode, edit_message_id)
 
                 # Async сохранение в conversations с retry (если передан conversation_id)
                 if conversation_id:
@@ -369,7 +398,8 @@ async def smart_send_text_unified(
                 preview_message = f"📄 **Ваш отчет готов!**\n\n{preview}\n\n📎 Полный отчет отправлен файлом."
 
                 try:
-                    await app.send_message(chat_id, preview_message, parse_mode=parse_mode)
+                    # Сообщение потоковой выдачи становится превью
+                    await _send_or_edit_streamed(chat_id, app, preview_message, parse_mode, edit_message_id)
                 except Exception as e:
                     logging.error(f"Failed to send preview: {e}")
                     # Продолжаем без превью
@@ -9,6 +9,7 @@ from .json_size_estimator import (
     estimate_json_size,
     calculate_file_stats,
     get_truncation_strategy,
+    truncate_text,
     JSONSizeEstimator,
 )
 
@@ -16,5 +17,6 @@ __all__ = [
     'estimate_json_size',
     'calculate_file_stats',
     'get_truncation_strategy',
+    'truncate_text',
     'JSONSizeEstimator',
 ]
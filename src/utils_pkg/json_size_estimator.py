@@ -284,6 +284,36 @@ class JSONSizeEstimator:
             return ('truncate_minimal', max(100, max_chars_per_file))
 
 
+def truncate_text(text: str, max_chars: int) -> str:
+    """
+    Обрезает текст описания до max_chars символов по границе абзаца/предложения.
+
+    Args:
+        text: Текст описания.
+        max_chars: Максимальная длина результата (с маркером обрезки).
+
+    Returns:
+        Исходный текст, если он короче лимита, иначе обрезанный текст с "…".
+
+    Example:
+        >>> truncate_text('Первое предложение. Второе предложение.', 25)
+        'Первое предложение. …'
+    """
+    if len(text) <= max_chars:
+        return text
+
+    cut = text[:max(0, max_chars - 2)]
+    # Предпочитаем границу абзаца, затем предложения, затем слова -
+    # если она не отрезает больше половины доступной длины
+    for separator in ('\n\n', '. ', '\n', ' '):
+        position = cut.rfind(separator)
+        if position >= len(cut) // 2:
+            cut = cut[:position + (1 if separator == '. ' else 0)]
+            break
+
+    return cut.rstrip() + ' …'
+
+
 def estimate_json_size(
     descriptions: dict[str, str],
     chars_per_token: float = CHARS_PER_TOKEN_RU,
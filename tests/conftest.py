@@ -6,18 +6,23 @@ Pytest фикстуры и конфигурация для тестов VoxPerso
 - Тестовых пользователей (активные, заблокированные)
 - Утилиты для очистки данных между тестами
 - Моки для внешних зависимостей
+- Импорт настоящих модулей, подмененных Mock в других тестах
 
 Автор: test-automator
 Дата: 7 ноября 2025
 Проект: VoxPersona User Management Tests
 """
 
+import asyncio
+import importlib
 import sys
 import tempfile
 import shutil
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Generator
+from typing import Callable, Generator
+from types import ModuleType
+from unittest.mock import Mock
 import pytest
 
 # Добавить src в PYTHONPATH для импорта модулей
@@ -314,6 +319,58 @@ def mock_user_dict():
     return _create_mock_user
 
 
+# Настоящие модули, которые тестовые файлы могут подменить Mock в sys.modules
+# (запоминаются перед сборкой каждого тестового файла)
+_real_modules: dict[str, ModuleType] = {}
+
+
+def _remember_real_modules() -> None:
+    for name, module in list(sys.modules.items()):
+        if not isinstance(module, Mock):
+            _real_modules.setdefault(name, module)
+
+
+@pytest.fixture
+def real_module() -> Generator[Callable[[str], ModuleType], None, None]:
+    """
+    Импорт настоящего модуля из src.
+
+    Некоторые тестовые файлы (test_query_choice) при сборке подменяют модули
+    в sys.modules на Mock: тесты, собранные после них, получили бы Mock вместо
+    модуля. На время теста Mock заменяются настоящими модулями (запомненными
+    до подмены или импортированными заново), после теста Mock возвращаются.
+
+    Example:
+        >>> def test_expand(real_module):
+        ...     run_analysis = real_module("run_analysis")
+    """
+    replaced: dict[str, ModuleType] = {}
+
+    def _import(name: str) -> ModuleType:
+        mocked = [module_name for module_name, module in sys.modules.items() if isinstance(module, Mock)]
+        for module_name in mocked:
+            replaced.setdefault(module_name, sys.modules[module_name])
+            if module_name in _real_modules:
+                sys.modules[module_name] = _real_modules[module_name]
+            else:
+                del sys.modules[module_name]
+
+        # pyrogram при импорте берет текущий event loop, а asyncio.run в других тестах его сбрасывает
+        try:
+            asyncio.get_event_loop_policy().get_event_loop()
+        except RuntimeError:
+            asyncio.set_event_loop(asyncio.new_event_loop())
+
+        module = importlib.import_module(name)
+        _remember_real_modules()
+        return module
+
+    yield _import
+
+    for module_name, module in replaced.items():
+        sys.modules[module_name] = module
+
+
 # Pytest хуки для настройки тестовой среды
 
 def pytest_configure(config):
@@ -358,3 +415,9 @@ def pytest_collection_modifyitems(config, items):
         # Добавить маркер slow для тестов с "slow" в имени
         if "slow" in item.name:
             item.add_marker(pytest.mark.slow)
+
+
+def pytest_collectstart(collector):
+    """Запоминает настоящие модули до импорта тестового файла (см. real_module)."""
+    if isinstance(collector, pytest.Module):
+        _remember_real_modules()
@@ -0,0 +1,99 @@
+"""
+Тесты параллельного выполнения проходов анализа методологии (analysis_dag).
+
+Проверяют:
+- Топологический порядок и ошибки графа (цикл, неизвестная зависимость)
+- Одновременное выполнение независимых проходов
+- Передачу результатов зависимостей в зависимый проход
+- Назначение разных ключей пула независимым проходам
+- Пропуск проходов без промптов
+"""
+
+import sys
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from analysis_dag import AnalysisNode, run_analysis_dag, topological_order
+
+PROMPTS = [("промпт", 1)]
+
+
+def general_factors_nodes():
+    return [
+        AnalysisNode("json", PROMPTS, depends_on=("part1", "part2")),
+        AnalysisNode("part1", PROMPTS),
+        AnalysisNode("part2", PROMPTS),
+    ]
+
+
+class TestTopologicalOrder:
+    def test_dependencies_first(self):
+        names = [node.name for node in topological_order(general_factors_nodes())]
+
+        assert names.index("json") > names.index("part1")
+        assert names.index("json") > names.index("part2")
+
+    def test_cycle_rejected(self):
+        nodes = [AnalysisNode("a", PROMPTS, depends_on=("b",)), AnalysisNode("b", PROMPTS, depends_on=("a",))]
+
+        with pytest.raises(ValueError):
+            topological_order(nodes)
+
+    def test_unknown_dependency_rejected(self):
+        with pytest.raises(ValueError):
+            topological_order([AnalysisNode("json", PROMPTS, depends_on=("part3",))])
+
+
+class TestRunAnalysisDag:
+    def test_independent_chains_run_concurrently(self):
+        calls = []
+
+        async def run_node(node, source_text, api_key):
+            calls.append((node.name, source_text, api_key))
+            await asyncio.sleep(0.2)
+            return f"<{node.name}>"
+
+        started = time.monotonic()
+        results = asyncio.run(run_analysis_dag(general_factors_nodes(), "транскрипция", run_node, ["k1", "k2", "k3"]))
+
+        # part1 и part2 параллельно (0.2 сек), затем json (0.2 сек)
+        assert time.monotonic() - started < 0.55
+        assert results == {"part1": "<part1>", "part2": "<part2>", "json": "<json>"}
+
+        by_name = {name: (source, key) for name, source, key in calls}
+        assert by_name["part1"][0] == "транскрипция"
+        assert by_name["json"][0] == "<part1>\n<part2>"
+        assert by_name["part1"][1] != by_name["part2"][1]
+
+    def test_empty_node_skipped(self):
+        seen = []
+
+        async def run_node(node, source_text, api_key):
+            seen.append(node.name)
+            return f"<{node.name}>"
+
+        nodes = [
+            AnalysisNode("part1", PROMPTS),
+            AnalysisNode("part2", []),
+            AnalysisNode("json", PROMPTS, depends_on=("part1", "part2")),
+        ]
+        results = asyncio.run(run_analysis_dag(nodes, "транскрипция", run_node, [None, ""]))
+
+        assert "part2" not in seen
+        assert results["part2"] is None
+        assert results["json"] == "<json>"
+
+    def test_failure_propagates(self):
+        async def run_node(node, source_text, api_key):
+            if node.name == "part1":
+                raise RuntimeError("ошибка прохода")
+            return "ok"
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(run_analysis_dag(general_factors_nodes(), "транскрипция", run_node))
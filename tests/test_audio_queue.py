@@ -0,0 +1,189 @@
+"""
+Тесты фоновой очереди обработки аудио.
+
+Проверяют:
+- Глобальный и пользовательский лимит одновременных задач
+- Порядок запуска и позицию в очереди
+- Колбэки завершения и ошибки
+- Восстановление незавершенных задач после рестарта
+- Снятие задач, исчерпавших AUDIO_QUEUE_MAX_ATTEMPTS запусков
+- Удержание задач пользователя до release() (hold_after_complete)
+"""
+
+import asyncio
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from audio_queue import AudioJobQueue, AudioJobAttemptsError, JOB_DONE, JOB_FAILED
+
+
+class Recorder:
+    """Обработка задачи с учетом одновременно выполняемых (по пользователям)."""
+
+    def __init__(self, duration=0.05):
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.running: dict[int, int] = {}
+        self.max_total = 0
+        self.max_per_user = 0
+        self.started: list[str] = []
+
+    def __call__(self, job):
+        with self.lock:
+            self.started.append(job.payload["name"])
+            self.running[job.chat_id] = self.running.get(job.chat_id, 0) + 1
+            self.max_total = max(self.max_total, sum(self.running.values()))
+            self.max_per_user = max(self.max_per_user, max(self.running.values()))
+        time.sleep(self.duration)
+        with self.lock:
+            self.running[job.chat_id] -= 1
+        if job.payload.get("fail"):
+            raise RuntimeError("Whisper недоступен")
+        return job.payload["name"].upper()
+
+
+class TestLimits:
+    def test_global_and_per_user_limits(self):
+        recorder = Recorder()
+
+        async def scenario():
+            queue = AudioJobQueue(recorder, max_concurrent=2, per_user_limit=1, jobs_path=None)
+            for name, chat_id in [("a1", 1), ("a2", 1), ("b1", 2), ("c1", 3)]:
+                await queue.submit(chat_id, {"name": name})
+            await queue.join()
+            queue.shutdown()
+
+        asyncio.run(scenario())
+
+        assert recorder.max_total == 2
+        assert recorder.max_per_user == 1
+        # Вторая задача пользователя 1 не задерживает задачи других пользователей
+        assert recorder.started.index("b1") < recorder.started.index("a2")
+
+    def test_queue_position(self):
+        async def scenario():
+            queue = AudioJobQueue(Recorder(), max_concurrent=1, jobs_path=None)
+            first = await queue.submit(1, {"name": "a"})
+            second = await queue.submit(2, {"name": "b"})
+            third = await queue.submit(3, {"name": "c"})
+            positions = [queue.position(job.job_id) for job in (first, second, third)]
+            await queue.join()
+            queue.shutdown()
+            return positions, queue.position(third.job_id)
+
+        positions, after = asyncio.run(scenario())
+
+        assert positions == [0, 1, 2]
+        assert after == 0
+
+
+class TestCallbacks:
+    def test_complete_and_error_callbacks(self):
+        events = []
+
+        async def on_complete(job, result):
+            events.append(("done", job.chat_id, result, job.status))
+
+        async def on_error(job, error):
+            events.append(("error", job.chat_id, str(error), job.status))
+
+        async def scenario():
+            queue = AudioJobQueue(Recorder(0), on_complete=on_complete, on_error=on_error, jobs_path=None)
+            await queue.submit(1, {"name": "ok"})
+            await queue.submit(2, {"name": "bad", "fail": True})
+            await queue.join()
+            queue.shutdown()
+
+        asyncio.run(scenario())
+
+        assert sorted(events) == [
+            ("done", 1, "OK", JOB_DONE),
+            ("error", 2, "Whisper недоступен", JOB_FAILED),
+        ]
+
+
+class TestHold:
+    def test_next_user_job_waits_for_release(self):
+        recorder = Recorder(0)
+
+        async def scenario():
+            queue = AudioJobQueue(recorder, jobs_path=None, hold_after_complete=True)
+            await queue.submit(1, {"name": "a1"})
+            await queue.submit(1, {"name": "a2"})
+            await queue.submit(2, {"name": "b1"})
+            await queue.join()
+            held = list(recorder.started)
+            queue.release(1)
+            await queue.join()
+            queue.shutdown()
+            return held
+
+        held = asyncio.run(scenario())
+
+        # Задача другого пользователя не ждет принятия результата a1
+        assert sorted(held) == ["a1", "b1"]
+        assert recorder.started[-1] == "a2"
+
+
+class TestPersistence:
+    def test_unfinished_jobs_restored(self, tmp_path):
+        jobs_path = tmp_path / "audio_jobs.json"
+        gate = threading.Event()
+
+        def blocked(job):
+            gate.wait(5)
+
+        async def before_restart():
+            queue = AudioJobQueue(blocked, max_concurrent=1, jobs_path=jobs_path)
+            await queue.submit(1, {"name": "a"})
+            await queue.submit(2, {"name": "b"})
+            queue.shutdown()
+            return json.loads(jobs_path.read_text(encoding="utf-8"))
+
+        # Рестарт во время выполнения первой задачи
+        saved = asyncio.run(before_restart())
+        gate.set()
+        assert [(job["payload"]["name"], job["status"]) for job in saved] == [("a", "running"), ("b", "queued")]
+
+        recorder = Recorder(0)
+
+        async def after_restart():
+            queue = AudioJobQueue(recorder, jobs_path=jobs_path)
+            restored = await queue.restore()
+            await queue.join()
+            queue.shutdown()
+            return restored
+
+        assert asyncio.run(after_restart()) == 2
+        assert sorted(recorder.started) == ["a", "b"]
+        assert json.loads(jobs_path.read_text(encoding="utf-8")) == []
+
+    def test_exhausted_job_dropped_on_restore(self, tmp_path):
+        jobs_path = tmp_path / "audio_jobs.json"
+        jobs_path.write_text(json.dumps([
+            {"job_id": "crash", "chat_id": 1, "payload": {"name": "crash"}, "status": "running", "attempts": 3},
+            {"job_id": "retry", "chat_id": 2, "payload": {"name": "retry"}, "status": "running", "attempts": 2},
+        ]), encoding="utf-8")
+        recorder = Recorder(0)
+        errors = []
+
+        async def on_error(job, error):
+            errors.append((job.chat_id, job.status, type(error)))
+
+        async def after_restart():
+            queue = AudioJobQueue(recorder, on_error=on_error, jobs_path=jobs_path, max_attempts=3)
+            restored = await queue.restore()
+            await queue.join()
+            queue.shutdown()
+            return restored
+
+        assert asyncio.run(after_restart()) == 1
+        assert recorder.started == ["retry"]
+        assert errors == [(1, JOB_FAILED, AudioJobAttemptsError)]
+        assert json.loads(jobs_path.read_text(encoding="utf-8")) == []
@@ -0,0 +1,72 @@
+"""
+Тесты транскрибации аудио с параллельной загрузкой в хранилище (audio_utils).
+
+Проверяют:
+- Ошибка загрузки не отменяет транскрипцию и передается в on_upload_error
+- Возврат только после завершения загрузки: временный файл удаляется после нее
+"""
+
+import os
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import audio_utils
+
+
+class TestTranscribeAudioWithUpload:
+    def test_upload_failure_keeps_transcript(self, tmp_path):
+        path = tmp_path / "interview.ogg"
+        path.write_bytes(b"OggS")
+        processed_texts: dict[int, str] = {}
+        on_upload_error = MagicMock()
+
+        def upload():
+            raise ConnectionError("MinIO недоступен")
+
+        with patch.object(audio_utils, "transcribe_with_cache", return_value="Добрый день."):
+            text = audio_utils.transcribe_audio_with_upload(
+                str(path), 1, processed_texts, upload=upload, on_upload_error=on_upload_error
+            )
+
+        assert text == "Добрый день."
+        assert processed_texts[1] == "Добрый день."
+        on_upload_error.assert_called_once()
+        assert isinstance(on_upload_error.call_args.args[0], ConnectionError)
+
+    @pytest.mark.parametrize("transcription_fails", [False, True])
+    def test_tmp_file_removed_after_upload_finished(self, tmp_path, transcription_fails):
+        path = tmp_path / "interview.ogg"
+        path.write_bytes(b"OggS")
+        transcribed = threading.Event()
+        file_seen_by_upload: list[bool] = []
+
+        def upload():
+            # Загрузка заканчивается позже транскрибации
+            transcribed.wait(timeout=5)
+            file_seen_by_upload.append(path.exists())
+
+        def transcribe(*args, **kwargs):
+            transcribed.set()
+            if transcription_fails:
+                raise RuntimeError("Whisper недоступен")
+            return "Добрый день."
+
+        # Как в process_audio_job: временный файл удаляется сразу после выхода
+        try:
+            with patch.object(audio_utils, "transcribe_with_cache", side_effect=transcribe):
+                audio_utils.transcribe_audio_with_upload(
+                    str(path), 1, {}, upload=upload, on_upload_error=MagicMock()
+                )
+        except RuntimeError:
+            assert transcription_fails
+        finally:
+            os.remove(path)
+
+        assert file_seen_by_upload == [True]
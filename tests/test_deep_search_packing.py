@@ -0,0 +1,128 @@
+"""
+Тесты упаковки мелких чанков в запросы извлечения глубокого исследования.
+
+Проверяют:
+- Упаковку блоков до бюджета токенов (pack_chunks)
+- Разбор JSON-ответа упакованного запроса (parse_packed_extraction)
+- Сопоставление результатов с исходными индексами чанков
+- Повтор поодиночке для чанков без результата
+"""
+
+import sys
+import json
+import asyncio
+from pathlib import Path
+from unittest.mock import patch
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import analysis
+from analysis import pack_chunks, parse_packed_extraction, extract_from_chunk_parallel_async
+
+
+class TestPackChunks:
+    def test_small_blocks_packed_within_budget(self):
+        tokens = [100, 200, 300, 400, 500]
+        packs = pack_chunks(tokens, token_budget=800, max_blocks=10)
+
+        assert sorted(idx for pack in packs for idx in pack) == [0, 1, 2, 3, 4]
+        assert all(sum(tokens[idx] for idx in pack) <= 800 for pack in packs)
+        assert len(packs) == 2
+
+    def test_oversized_block_sent_alone(self):
+        packs = pack_chunks([5000, 100, 100], token_budget=1000, max_blocks=10)
+
+        assert [0] in packs
+        assert [1, 2] in packs
+
+    def test_max_blocks_respected(self):
+        packs = pack_chunks([10] * 7, token_budget=1000, max_blocks=3)
+
+        assert all(len(pack) <= 3 for pack in packs)
+        assert len(packs) == 3
+
+    def test_disabled(self):
+        assert pack_chunks([10, 20], token_budget=0, max_blocks=10) == [[0], [1]]
+
+    def test_packs_ordered_by_first_block(self):
+        packs = pack_chunks([900, 100, 800, 100], token_budget=1000, max_blocks=10)
+
+        assert [pack[0] for pack in packs] == sorted(pack[0] for pack in packs)
+        assert all(pack == sorted(pack) for pack in packs)
+
+
+class TestParsePackedExtraction:
+    def test_valid_json_in_code_block(self):
+        response = '```json\n{"results": [{"document": 1, "result": "Цитата"}, {"document": 2, "result": "##not_found##"}]}\n```'
+
+        assert parse_packed_extraction(response, 2) == {0: "Цитата", 1: "##not_found##"}
+
+    def test_invalid_response(self):
+        assert parse_packed_extraction("Цитата без JSON", 2) == {}
+        assert parse_packed_extraction(None, 2) == {}
+        assert parse_packed_extraction('{"results": "oops"}', 2) == {}
+
+    def test_out_of_range_documents_ignored(self):
+        response = json.dumps({"results": [{"document": 5, "result": "X"}, {"document": 1, "result": ""}]})
+
+        assert parse_packed_extraction(response, 2) == {0: "##not_found##"}
+
+
+class TestPackedExtraction:
+    def test_results_mapped_to_original_indices(self):
+        calls = []
+
+        async def fake_send(session, messages, system, model, api_key, err, **kwargs):
+            content = messages[0]["content"]
+            calls.append(content)
+            results = []
+            for number in range(1, content.count("Документ ") + 1):
+                block = content.split(f"Документ {number}:\n")[1].split("\n\n")[0]
+                results.append({"document": number, "result": f"Цитата: {block}"})
+            return json.dumps({"results": results}, ensure_ascii=False)
+
+        async def run():
+            with patch.object(analysis, "send_msg_to_model_async", side_effect=fake_send):
+                return await extract_from_chunk_parallel_async(
+                    text="вопрос",
+                    chunks=["блок 0", "блок 1", "блок 2", "блок 3"],
+                    extract_prompt="prompt",
+                    api_keys=["key1"],
+                    session=None,
+                    pack_token_budget=10000,
+                    pack_max_blocks=10
+                )
+
+        results = asyncio.run(run())
+
+        assert len(calls) == 1
+        assert results == ["Цитата: блок 0", "Цитата: блок 1", "Цитата: блок 2", "Цитата: блок 3"]
+
+    def test_missing_results_retried_individually(self):
+        calls = []
+
+        async def fake_send(session, messages, system, model, api_key, err, **kwargs):
+            content = messages[0]["content"]
+            calls.append(content)
+            if content.startswith("Документ 1:"):
+                # Модель вернула результат только для первого документа пакета
+                return json.dumps({"results": [{"document": 1, "result": "##not_found##"}]})
+            return "Цитата"
+
+        async def run():
+            with patch.object(analysis, "send_msg_to_model_async", side_effect=fake_send):
+                return await extract_from_chunk_parallel_async(
+                    text="вопрос",
+                    chunks=["блок 0", "блок 1", "блок 2"],
+                    extract_prompt="prompt",
+                    api_keys=["key1"],
+                    session=None,
+                    pack_token_budget=10000,
+                    pack_max_blocks=10
+                )
+
+        results = asyncio.run(run())
+
+        assert results == ["##not_found##", "Цитата", "Цитата"]
+        assert len(calls) == 3
@@ -0,0 +1,190 @@
+"""
+Тесты прогресса глубокого исследования (DeepSearchProgress, progress_callback).
+
+Проверяют:
+- Подсчет обработанных чанков и найденных цитат
+- Оценку ETA по лимитам rate limiter
+- Вызов progress_callback из extract_from_chunk_parallel_async
+- Форматирование статуса
+- Выполнение run_deep_search в event loop без блокировки других задач
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import analysis
+import run_analysis
+from analysis import DeepSearchProgress, is_citation, extract_from_chunk_parallel_async
+from run_analysis import format_deep_search_progress, format_eta
+from request_context import RequestContext, RequestCancelledError
+
+
+class TestIsCitation:
+    def test_citation(self):
+        assert is_citation("Цитата из отчета")
+
+    def test_not_found_and_errors(self):
+        assert not is_citation("##not_found##")
+        assert not is_citation("[ERROR] 500: boom")
+        assert not is_citation(None)
+        assert not is_citation("")
+
+
+class TestDeepSearchProgress:
+    def test_mark_done_counts_citations(self):
+        progress = DeepSearchProgress(total=3, pending_tokens=300, token_rate=100.0, req_rate=10.0)
+
+        progress.mark_done("Цитата", 100)
+        progress.mark_done("##not_found##", 100)
+
+        assert progress.done == 2
+        assert progress.citations == 1
+        assert progress.pending_tokens == 100
+
+    def test_eta_lower_bound_from_rate_limiter(self):
+        progress = DeepSearchProgress(total=4, pending_tokens=1000, token_rate=100.0, req_rate=10.0)
+
+        # 1000 токенов при 100 токенов/сек = 10 сек (больше чем 4 запроса при 10 req/s)
+        assert progress.estimate_eta() == pytest.approx(10.0)
+
+    def test_eta_zero_when_finished(self):
+        progress = DeepSearchProgress(total=1, pending_tokens=10, token_rate=100.0, req_rate=10.0)
+        progress.mark_done("Цитата", 10)
+
+        assert progress.eta_seconds == 0.0
+
+    def test_partial_citations_keep_chunk_order(self):
+        progress = DeepSearchProgress(total=3, results=["A", "##not_found##", None])
+
+        assert progress.partial_citations() == ["A"]
+
+
+class TestExtractProgressCallback:
+    def test_callback_called_for_every_chunk(self):
+        snapshots = []
+
+        async def on_progress(progress: DeepSearchProgress):
+            snapshots.append((progress.done, progress.citations))
+
+        async def fake_send(session, messages, system, model, api_key, err, **kwargs):
+            return "##not_found##" if "пусто" in messages[0]["content"] else "Цитата"
+
+        async def run():
+            with patch.object(analysis, "send_msg_to_model_async", side_effect=fake_send):
+                return await extract_from_chunk_parallel_async(
+                    text="вопрос",
+                    chunks=["чанк 1", "пусто", "чанк 3"],
+                    extract_prompt="prompt",
+                    api_keys=["key1", "key2"],
+                    session=None,
+                    progress_callback=on_progress
+                )
+
+        results = asyncio.run(run())
+
+        assert results == ["Цитата", "##not_found##", "Цитата"]
+        # Первый вызов - начальное состояние, далее по одному на чанк
+        assert snapshots[0] == (0, 0)
+        assert snapshots[-1] == (3, 2)
+        assert len(snapshots) == 4
+
+    def test_callback_error_does_not_break_extraction(self):
+        async def broken_callback(progress: DeepSearchProgress):
+            raise RuntimeError("Telegram недоступен")
+
+        async def fake_send(*args, **kwargs):
+            return "Цитата"
+
+        async def run():
+            with patch.object(analysis, "send_msg_to_model_async", side_effect=fake_send):
+                return await extract_from_chunk_parallel_async(
+                    text="вопрос",
+                    chunks=["чанк 1", "чанк 2"],
+                    extract_prompt="prompt",
+                    api_keys=["key1"],
+                    session=None,
+                    progress_callback=broken_callback
+                )
+
+        assert asyncio.run(run()) == ["Цитата", "Цитата"]
+
+
+class TestExtractCancellation:
+    def test_cancel_stops_workers_and_raises(self):
+        ctx = RequestContext(chat_id=1)
+        calls = []
+
+        async def fake_send(*args, **kwargs):
+            calls.append(1)
+            ctx.cancel()  # Пользователь нажал "Отменить" во время первого запроса
+            return "Цитата"
+
+        async def run():
+            with patch.object(analysis, "send_msg_to_model_async", side_effect=fake_send):
+                return await extract_from_chunk_parallel_async(
+                    text="вопрос",
+                    chunks=[f"чанк {i}" for i in range(10)],
+                    extract_prompt="prompt",
+                    api_keys=["key1"],
+                    session=None,
+                    request_context=ctx
+                )
+
+        with pytest.raises(RequestCancelledError):
+            asyncio.run(run())
+        assert len(calls) == 1
+
+
+class TestProgressFormatting:
+    def test_format_eta(self):
+        assert format_eta(0) == "почти готово"
+        assert format_eta(42) == "~42 с"
+        assert format_eta(130) == "~2 мин 10 с"
+
+    def test_format_progress(self):
+        progress = DeepSearchProgress(total=10, done=4, citations=2, eta_seconds=65)
+        text = format_deep_search_progress(progress)
+
+        assert "4/10" in text
+        assert "Найдено цитат: 2" in text
+        assert "~1 мин 5 с" in text
+
+
+class TestDeepSearchCoroutine:
+    def test_other_tasks_served_during_deep_search(self):
+        ticks = []
+
+        async def fake_extract(**kwargs):
+            await asyncio.sleep(0.05)
+            return ["Цитата", "##not_found##"]
+
+        async def other_user():
+            for _ in range(3):
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            with patch.object(run_analysis, "fetch_prompt_by_name", return_value="prompt"), \
+                 patch.object(run_analysis, "extract_from_chunk_parallel_async", side_effect=fake_extract), \
+                 patch.object(run_analysis, "aggregate_citations", return_value="Ответ") as aggregate:
+                answer, _ = await asyncio.gather(
+                    run_analysis.run_deep_search(
+                        "# Чанк transcription_id 1\nтекст\n# Чанк transcription_id 2\nтекст",
+                        text="вопрос", chat_id=1, app=None, category="Интервью"
+                    ),
+                    other_user()
+                )
+                return answer, aggregate.call_args.kwargs["citations"]
+
+        answer, citations = asyncio.run(run())
+
+        assert answer == "Ответ"
+        assert citations == ["Цитата"]
+        assert len(ticks) == 3
@@ -0,0 +1,159 @@
+"""
+Тесты выбора релевантных разделов descry.md для улучшения вопроса.
+
+Проверяют:
+- Разбиение на разделы по заголовкам с путем заголовков
+- Дробление длинных разделов по абзацам
+- Выбор top-N разделов в пределах бюджета токенов (в порядке файла)
+- Fallback на весь файл (поиск выключен, модель недоступна, файл в бюджете)
+- Передачу выбранных разделов в промпт expand_query
+"""
+
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import descry_retriever
+from descry_retriever import DescryRetriever, split_descry_sections, select_descry_content
+
+
+DESCRY = """# Описание БД
+
+Вводный текст.
+
+## Дизайн
+
+### Освещение
+
+Освещение залов, светильники, яркость.
+
+### Мебель
+
+Мебель, кресла, диваны, столы.
+
+## Интервью
+
+### Факторы выбора
+
+Цена, сервис, персонал.
+"""
+
+KEYWORDS = ["освещ", "мебел", "цена", "вводн"]
+
+
+class FakeModel:
+    """Эмбеддинги по ключевым словам (детерминированные, без bge-m3)."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, normalize_embeddings=True, convert_to_numpy=True):
+        self.calls += 1
+        vectors = []
+        for text in texts:
+            lower = text.lower()
+            vector = np.array([lower.count(word) for word in KEYWORDS] + [0.1], dtype=np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return np.array(vectors)
+
+
+class TestSplitSections:
+    def test_sections_with_heading_path(self):
+        sections = split_descry_sections(DESCRY)
+
+        assert [section.title for section in sections] == [
+            "Описание БД",
+            "Дизайн > Освещение",
+            "Дизайн > Мебель",
+            "Интервью > Факторы выбора",
+        ]
+        assert sections[1].text == "Освещение залов, светильники, яркость."
+
+    def test_long_section_split_by_paragraphs(self):
+        paragraph = "абзац " * 100
+        content = "## Большой раздел\n\n" + "\n\n".join([paragraph] * 10)
+
+        with patch.object(descry_retriever, "MAX_SECTION_CHARS", 1500):
+            sections = split_descry_sections(content)
+
+        assert len(sections) > 1
+        assert all(section.title == "Большой раздел" for section in sections)
+        assert all(len(section.text) <= 1500 for section in sections)
+
+
+class TestSelect:
+    def test_top_sections_in_file_order(self):
+        retriever = DescryRetriever(model=FakeModel(), cache_dir=None)
+
+        selected = retriever.select("Какая мебель и освещение?", DESCRY, top_n=2, token_budget=10000)
+
+        assert selected.index("Освещение залов") < selected.index("Мебель, кресла")
+        assert "Цена, сервис" not in selected
+        assert "[Дизайн > Мебель]" in selected
+
+    def test_token_budget_respected(self):
+        retriever = DescryRetriever(model=FakeModel(), cache_dir=None)
+
+        with patch.object(descry_retriever, "count_tokens", side_effect=lambda text: len(text)):
+            selected = retriever.select("мебель", DESCRY, top_n=10, token_budget=60)
+
+        assert len(selected) <= 60
+        assert "Мебель, кресла" in selected
+
+    def test_sections_embedded_once(self, tmp_path):
+        model = FakeModel()
+        retriever = DescryRetriever(model=model, cache_dir=tmp_path)
+
+        retriever.select("мебель", DESCRY, top_n=2, token_budget=10000)
+        retriever.select("освещение", DESCRY, top_n=2, token_budget=10000)
+
+        # 1 вызов на разделы + по 1 на каждый вопрос
+        assert model.calls == 3
+        assert list(tmp_path.glob("descry_embeddings_*.npy"))
+
+        # Новый экземпляр берет векторы разделов из дискового кэша
+        model_2 = FakeModel()
+        DescryRetriever(model=model_2, cache_dir=tmp_path).fit(DESCRY)
+        assert model_2.calls == 0
+
+
+class TestSelectDescryContent:
+    def test_disabled_returns_full_file(self):
+        with patch.object(descry_retriever, "DESCRY_RETRIEVAL_ENABLED", False):
+            assert select_descry_content("мебель", DESCRY, top_n=1, token_budget=1) == DESCRY
+
+    def test_small_file_sent_whole(self):
+        with patch.object(descry_retriever, "DESCRY_RETRIEVAL_ENABLED", True), \
+                patch.object(descry_retriever, "count_tokens", return_value=10):
+            assert select_descry_content("мебель", DESCRY, top_n=1, token_budget=100) == DESCRY
+
+    def test_model_unavailable_returns_full_file(self):
+        retriever = DescryRetriever(model=None, cache_dir=None)
+        with patch.object(descry_retriever, "DESCRY_RETRIEVAL_ENABLED", True), \
+                patch.object(descry_retriever, "get_descry_retriever", return_value=retriever), \
+                patch.object(retriever, "_get_model", return_value=None):
+            assert select_descry_content("мебель", DESCRY, top_n=1, token_budget=5) == DESCRY
+
+    def test_selected_sections_used_in_expansion_prompt(self, real_module):
+        query_expander = real_module("query_expander")
+
+        retriever = DescryRetriever(model=FakeModel(), cache_dir=None)
+        with patch.object(descry_retriever, "DESCRY_RETRIEVAL_ENABLED", True), \
+                patch.object(descry_retriever, "DESCRY_RETRIEVAL_TOP_N", 1), \
+                patch.object(descry_retriever, "DESCRY_RETRIEVAL_TOKEN_BUDGET", 100), \
+                patch.object(descry_retriever, "get_descry_retriever", return_value=retriever), \
+                patch.object(descry_retriever, "count_tokens", side_effect=lambda text: len(text)), \
+                patch.object(query_expander, "load_descry", return_value=DESCRY), \
+                patch.object(query_expander, "load_query_expansion_prompt", return_value="{question}\n{descry_content}"), \
+                patch.object(query_expander, "send_msg_to_model", return_value=("Улучшенный вопрос", {"input_tokens": 1, "output_tokens": 1})) as send:
+            result = query_expander.expand_query("какая мебель?")
+
+        prompt = send.call_args.kwargs["messages"][0]["content"]
+        assert result["expanded"] == "Улучшенный вопрос"
+        assert "Мебель, кресла" in prompt
+        assert "Цена, сервис" not in prompt
@@ -0,0 +1,146 @@
+"""
+Тесты локального Router Agent на эмбеддингах (embedding_router).
+
+Проверяют:
+- Разбиение описаний на абзацы и перевод сходства в шкалу 0-100
+- Оценку отчетов по косинусному сходству (формат Dict[str, float])
+- Дисковый кэш векторов описаний
+- Порог уверенности и fallback на LLM в evaluate_report_relevance
+- Совпадение лучших индексов до и после улучшения вопроса (top_indices_agree)
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import embedding_router
+import relevance_evaluator
+from embedding_router import EmbeddingRouter, split_description, similarity_to_score, is_confident, top_indices_agree
+
+VOCABULARY = ["освещение", "вентиляция", "бронирование", "персонал"]
+
+FILLER = " Дополнительный текст абзаца для достижения минимальной длины секции описания."
+
+DESCRIPTIONS = {
+    "Структурированный_отчет_аудита": "# Заголовок\n\nосвещение освещение в номерах и лобби." + FILLER,
+    "Заполняемость_и_бронирование": "бронирование и заполняемость отеля по сезонам." + FILLER,
+    "Клиентский_опыт": "персонал и вентиляция глазами гостя." + FILLER,
+}
+
+
+class FakeModel:
+    """Эмбеддинги-"мешок слов" по словарю VOCABULARY (нормированные)."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, normalize_embeddings=True, convert_to_numpy=True):
+        self.calls += 1
+        vectors = np.array([[text.count(word) + 0.01 for word in VOCABULARY] for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class TestHelpers:
+    def test_split_skips_headings(self):
+        sections = split_description(DESCRIPTIONS["Структурированный_отчет_аудита"])
+
+        assert len(sections) == 1
+        assert sections[0].startswith("освещение")
+
+    def test_similarity_to_score_clamped(self):
+        assert similarity_to_score(0.0) == 0.0
+        assert similarity_to_score(1.0) == 100.0
+        assert 0.0 < similarity_to_score(0.5) < 100.0
+
+
+class TestEmbeddingRouter:
+    def test_scores_all_reports(self):
+        router = EmbeddingRouter(model=FakeModel(), cache_dir=None)
+
+        scores = router.score("Какое освещение в номерах?", DESCRIPTIONS)
+
+        assert set(scores) == set(DESCRIPTIONS)
+        assert all(0.0 <= score <= 100.0 for score in scores.values())
+        assert max(scores, key=scores.get) == "Структурированный_отчет_аудита"
+
+    def test_descriptions_embedded_once(self):
+        model = FakeModel()
+        router = EmbeddingRouter(model=model, cache_dir=None)
+
+        router.score("освещение", DESCRIPTIONS)
+        router.score("бронирование", DESCRIPTIONS)
+
+        # 1 вызов на описания + по одному на каждый вопрос
+        assert model.calls == 3
+
+    def test_disk_cache_reused(self, tmp_path):
+        EmbeddingRouter(model=FakeModel(), cache_dir=tmp_path).fit(DESCRIPTIONS)
+        model = FakeModel()
+
+        EmbeddingRouter(model=model, cache_dir=tmp_path).fit(DESCRIPTIONS)
+
+        assert model.calls == 0
+
+
+class TestConfidence:
+    def test_clear_winner(self):
+        assert is_confident({"Структурированный_отчет_аудита": 90.0, "Обследование": 20.0}, margin=8, min_score=30)
+
+    def test_too_close(self):
+        assert not is_confident({"Структурированный_отчет_аудита": 60.0, "Обследование": 57.0}, margin=8, min_score=30)
+
+    def test_too_low(self):
+        assert not is_confident({"Структурированный_отчет_аудита": 20.0}, margin=8, min_score=30)
+
+
+class TestTopIndicesAgree:
+    def test_same_best_index(self):
+        router = EmbeddingRouter(model=FakeModel(), cache_dir=None)
+        with patch.object(embedding_router, "get_embedding_router", return_value=router):
+            assert top_indices_agree("освещение", "освещение в номерах и лобби", DESCRIPTIONS, top_k=1)
+
+    def test_best_index_changed(self):
+        router = EmbeddingRouter(model=FakeModel(), cache_dir=None)
+        with patch.object(embedding_router, "get_embedding_router", return_value=router):
+            assert not top_indices_agree("освещение", "бронирование номеров", DESCRIPTIONS, top_k=1)
+
+
+class TestEvaluateReportRelevanceRouting:
+    def test_confident_local_scores_skip_llm(self):
+        local = {"Структурированный_отчет_аудита": 90.0}
+        batch = AsyncMock()
+
+        async def run():
+            with patch.object(relevance_evaluator, "route_by_embeddings", AsyncMock(return_value=local)), \
+                 patch.object(relevance_evaluator, "evaluate_batch_relevance", batch):
+                return await relevance_evaluator.evaluate_report_relevance("вопрос", DESCRIPTIONS, api_key="key")
+
+        scores, tokens = asyncio.run(run())
+
+        assert scores == local
+        assert tokens == {"input_tokens": 0, "output_tokens": 0}
+        batch.assert_not_awaited()
+
+    def test_unsure_falls_back_to_llm(self):
+        batch = AsyncMock(return_value=({"Обследование": 70.0}, {"input_tokens": 10, "output_tokens": 5}))
+
+        async def run():
+            with patch.object(relevance_evaluator, "route_by_embeddings", AsyncMock(return_value=None)), \
+                 patch.object(relevance_evaluator, "evaluate_batch_relevance", batch), \
+                 patch.object(relevance_evaluator, "get_cached_json_container", return_value="{}"):
+                return await relevance_evaluator.evaluate_report_relevance("вопрос", DESCRIPTIONS, api_key="key")
+
+        scores, tokens = asyncio.run(run())
+
+        assert scores == {"Обследование": 70.0}
+        batch.assert_awaited_once()
+
+    def test_route_disabled_returns_none(self):
+        with patch.object(embedding_router, "ROUTER_EMBEDDING_ENABLED", False):
+            assert asyncio.run(embedding_router.route_by_embeddings("вопрос", DESCRIPTIONS)) is None
@@ -0,0 +1,103 @@
+"""
+Тесты заблаговременного улучшения вопроса под рекомендованные индексы.
+
+Проверяют:
+- Параллельное улучшение вопроса для всех top-K индексов (в отдельных потоках)
+- Выдачу заранее улучшенного вопроса при выборе индекса без вызова Claude
+- Отказ от prefetch: другой вопрос, другой индекс, истекший TTL, ошибка улучшения
+- Использование prefetch в _process_manual_index_selection
+"""
+
+import sys
+import asyncio
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import run_analysis
+
+CHAT_ID = 777
+TOP_INDICES = [("Dizayn", 80.0), ("Intervyu", 60.0), ("Itogovye_otchety", 40.0)]
+TOKENS = {"input_tokens": 10, "output_tokens": 5}
+
+
+def fake_enhance(question, index_name, report_descriptions, top_indices=None):
+    time.sleep(0.2)
+    return f"{question} [{index_name}]", dict(TOKENS)
+
+
+def run_prefetch(take_question="вопрос", take_index="Intervyu", enhance=fake_enhance, advance=0.0):
+    async def run():
+        run_analysis.start_enhancement_prefetch(CHAT_ID, "вопрос", TOP_INDICES)
+        if advance:
+            run_analysis.user_states[CHAT_ID][run_analysis.PREFETCH_STATE_KEY]["created_at"] -= advance
+        # Меню на экране: пользователь выбирает индекс
+        await asyncio.sleep(0.05)
+        return await run_analysis.take_prefetched_enhancement(CHAT_ID, take_question, take_index)
+
+    with patch.object(run_analysis, "ENHANCEMENT_PREFETCH_ENABLED", True), \
+            patch.object(run_analysis, "load_report_descriptions", return_value={}), \
+            patch.object(run_analysis, "enhance_question_for_index", side_effect=enhance) as mock:
+        try:
+            return asyncio.run(run()), mock
+        finally:
+            run_analysis.user_states.pop(CHAT_ID, None)
+
+
+class TestEnhancementPrefetch:
+    def test_all_indices_enhanced_concurrently(self):
+        started = time.monotonic()
+
+        result, mock = run_prefetch()
+
+        assert result == "вопрос [Intervyu]"
+        # Улучшения для трех индексов шли параллельно (по 0.2 сек каждое)
+        assert time.monotonic() - started < 0.5
+        assert {call.args[1] for call in mock.call_args_list} == {name for name, _ in TOP_INDICES}
+
+    def test_other_question_not_used(self):
+        result, _ = run_prefetch(take_question="другой вопрос")
+
+        assert result is None
+
+    def test_index_outside_top_k_not_used(self):
+        result, _ = run_prefetch(take_index="Otchety_po_dizaynu")
+
+        assert result is None
+
+    def test_expired_prefetch_not_used(self):
+        result, _ = run_prefetch(advance=run_analysis.ENHANCEMENT_PREFETCH_TTL + 1)
+
+        assert result is None
+
+    def test_failed_enhancement_not_used(self):
+        # enhance_question_for_index при ошибке возвращает исходный вопрос
+        result, _ = run_prefetch(enhance=lambda question, *args, **kwargs: (question, {"input_tokens": 0, "output_tokens": 0}))
+
+        assert result is None
+
+    def test_disabled_no_prefetch(self):
+        with patch.object(run_analysis, "ENHANCEMENT_PREFETCH_ENABLED", False):
+            run_analysis.start_enhancement_prefetch(CHAT_ID, "вопрос", TOP_INDICES)
+
+        assert run_analysis.PREFETCH_STATE_KEY not in run_analysis.user_states.get(CHAT_ID, {})
+
+
+class TestManualIndexSelection:
+    def test_prefetched_question_skips_claude(self):
+        enhance = MagicMock()
+        run_analysis.user_states[CHAT_ID] = {"selected_index": "Dizayn"}
+        try:
+            with patch.object(run_analysis, "enhance_question_for_index", enhance):
+                result = run_analysis._process_manual_index_selection(
+                    CHAT_ID, "вопрос", "Dizayn", {"Дизайн": object()}, TOP_INDICES,
+                    prefetched_question="вопрос [Dizayn]"
+                )
+        finally:
+            run_analysis.user_states.pop(CHAT_ID, None)
+
+        assert result == ("вопрос [Dizayn]", "Дизайн", True)
+        enhance.assert_not_called()
@@ -0,0 +1,197 @@
+"""
+Тесты потоковой выдачи ответа быстрого поиска.
+
+Проверяют:
+- Накопление текста из SSE-потока (stream_db_answer)
+- Первое сообщение и throttling редактирований (run_fast_search_streaming)
+- Переключение на доставку MD-файлом после TELEGRAM_MESSAGE_THRESHOLD
+  (порог - по итоговому тексту с заголовком в разметке)
+- Финальное редактирование сообщения в smart_send_text_unified (ответ или превью
+  MD-файла), удаление сообщения с курсором при ошибке редактирования
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import analysis
+import run_analysis
+import utils
+
+
+class _FakeStream:
+    def __init__(self, deltas):
+        self._deltas = deltas
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        for delta in self._deltas:
+            yield delta
+
+
+def _fake_client(deltas):
+    client = MagicMock()
+    client.messages.stream.return_value = _FakeStream(deltas)
+    return client
+
+
+class TestStreamDbAnswer:
+    def test_accumulates_deltas(self):
+        seen = []
+
+        async def on_text(text):
+            seen.append(text)
+
+        async def run():
+            with patch.object(analysis, "_build_db_answer_request", return_value=("system", [{"role": "user", "content": "q"}])), \
+                 patch.object(analysis, "get_async_anthropic_client", return_value=_fake_client(["Отв", "ет", "!"])):
+                return await analysis.stream_db_answer("вопрос", db_index=None, on_text=on_text)
+
+        assert asyncio.run(run()) == "Ответ!"
+        assert seen == ["Отв", "Ответ", "Ответ!"]
+
+    def test_on_text_error_does_not_break_stream(self):
+        async def on_text(text):
+            raise RuntimeError("Telegram недоступен")
+
+        async def run():
+            with patch.object(analysis, "_build_db_answer_request", return_value=("system", [{"role": "user", "content": "q"}])), \
+                 patch.object(analysis, "get_async_anthropic_client", return_value=_fake_client(["А", "Б"])):
+                return await analysis.stream_db_answer("вопрос", db_index=None, on_text=on_text)
+
+        assert asyncio.run(run()) == "АБ"
+
+
+def _fake_stream_answer(parts):
+    async def fake(text, rag, on_text):
+        answer = ""
+        for part in parts:
+            answer += part
+            await on_text(answer)
+        return answer
+    return fake
+
+
+def _make_app():
+    app = MagicMock()
+    app.send_message = AsyncMock(return_value=SimpleNamespace(id=42))
+    app.edit_message_text = AsyncMock(return_value=SimpleNamespace(id=42))
+    app.delete_messages = AsyncMock(return_value=1)
+    return app
+
+
+class TestRunFastSearchStreaming:
+    def test_first_token_sent_then_edits_throttled(self):
+        app = _make_app()
+
+        async def run():
+            with patch.object(run_analysis, "stream_db_answer", side_effect=_fake_stream_answer(["a", "b", "c"])), \
+                 patch.object(run_analysis, "FAST_SEARCH_STREAM_INTERVAL", 3600):
+                return await run_analysis.run_fast_search_streaming("q", None, chat_id=1, app=app, header="H: ")
+
+        answer, message_id = asyncio.run(run())
+
+        assert answer == "abc"
+        assert message_id == 42
+        app.send_message.assert_awaited_once()
+        assert app.send_message.call_args[0][1].startswith("H: a")
+        app.edit_message_text.assert_not_awaited()
+
+    def test_edits_without_throttle(self):
+        app = _make_app()
+
+        async def run():
+            with patch.object(run_analysis, "stream_db_answer", side_effect=_fake_stream_answer(["a", "b", "c"])), \
+                 patch.object(run_analysis, "FAST_SEARCH_STREAM_INTERVAL", 0):
+                return await run_analysis.run_fast_search_streaming("q", None, chat_id=1, app=app)
+
+        asyncio.run(run())
+
+        assert app.edit_message_text.await_count == 2
+
+    def test_switches_to_file_when_long(self):
+        app = _make_app()
+
+        async def run():
+            with patch.object(run_analysis, "stream_db_answer", side_effect=_fake_stream_answer(["a" * 5, "b" * 10, "c"])), \
+                 patch.object(run_analysis, "FAST_SEARCH_STREAM_INTERVAL", 0), \
+                 patch.object(run_analysis, "TELEGRAM_MESSAGE_THRESHOLD", 10):
+                return await run_analysis.run_fast_search_streaming("q", None, chat_id=1, app=app)
+
+        answer, message_id = asyncio.run(run())
+
+        assert answer == "a" * 5 + "b" * 10 + "c"
+        assert message_id == 42
+        assert app.edit_message_text.call_args[0][2] == run_analysis.STREAM_SWITCH_TO_FILE_TEXT
+        assert app.edit_message_text.await_count == 1
+
+    def test_threshold_counts_final_header(self):
+        app = _make_app()
+
+        async def run():
+            with patch.object(run_analysis, "stream_db_answer", side_effect=_fake_stream_answer(["a" * 5, "b"])), \
+                 patch.object(run_analysis, "FAST_SEARCH_STREAM_INTERVAL", 0), \
+                 patch.object(run_analysis, "TELEGRAM_MESSAGE_THRESHOLD", 10):
+                return await run_analysis.run_fast_search_streaming(
+                    "q", None, chat_id=1, app=app, header="K: ", final_header="*K:* "
+                )
+
+        asyncio.run(run())
+
+        # "K: aaaaab" (9) укладывается в порог, итоговый "*K:* aaaaab" (11) - нет
+        assert app.send_message.call_args[0][1].startswith("K: aaaaa")
+        assert app.edit_message_text.call_args[0][2] == run_analysis.STREAM_SWITCH_TO_FILE_TEXT
+
+
+class TestSmartSendEdit:
+    def test_short_text_edits_streamed_message(self):
+        app = _make_app()
+
+        ok = asyncio.run(utils.smart_send_text_unified(
+            text="Готовый ответ", chat_id=1, app=app, username="user", edit_message_id=42
+        ))
+
+        assert ok
+        app.edit_message_text.assert_awaited_once()
+        app.send_message.assert_not_awaited()
+
+    def test_edit_failure_falls_back_to_send(self):
+        app = _make_app()
+        app.edit_message_text = AsyncMock(side_effect=RuntimeError("MESSAGE_ID_INVALID"))
+
+        ok = asyncio.run(utils.smart_send_text_unified(
+            text="Готовый ответ", chat_id=1, app=app, username="user", edit_message_id=42
+        ))
+
+        assert ok
+        app.send_message.assert_awaited_once()
+        app.delete_messages.assert_awaited_once_with(1, 42)
+
+    def test_long_text_turns_streamed_message_into_preview(self):
+        app = _make_app()
+        app.send_document = AsyncMock(return_value=SimpleNamespace(id=43))
+        md_storage = SimpleNamespace(md_storage_manager=MagicMock())
+        md_storage.md_storage_manager.save_md_report.return_value = "/tmp/report.md"
+
+        with patch.dict(sys.modules, {"md_storage": md_storage}), \
+             patch.object(utils, "TELEGRAM_MESSAGE_THRESHOLD", 10):
+            ok = asyncio.run(utils.smart_send_text_unified(
+                text="Очень длинный готовый ответ", chat_id=1, app=app, username="user", edit_message_id=42
+            ))
+
+        assert ok
+        app.edit_message_text.assert_awaited_once()
+        assert "Ваш отчет готов" in app.edit_message_text.call_args[0][2]
+        app.send_message.assert_not_awaited()
+        app.send_document.assert_awaited_once()
@@ -0,0 +1,44 @@
+"""
+Тесты общей aiohttp-сессии (http_session).
+
+Проверяют:
+- Переиспользование сессии в пределах event loop
+- Создание новой сессии при смене event loop
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from http_session import get_http_session, close_http_session
+
+
+def test_session_reused_within_loop():
+    async def run():
+        first = await get_http_session()
+        second = await get_http_session()
+        same = first is second
+        await close_http_session()
+        return same, first.closed
+
+    same, closed = asyncio.run(run())
+    assert same
+    assert closed
+
+
+def test_new_session_for_new_loop():
+    async def get():
+        return await get_http_session()
+
+    async def get_and_close():
+        session = await get_http_session()
+        await close_http_session()
+        return session
+
+    first = asyncio.run(get())
+    second = asyncio.run(get_and_close())
+
+    assert first is not second
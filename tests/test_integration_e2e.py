@@ -215,7 +215,7 @@ def expected_indices() -> List[str]:
 
 @pytest.mark.asyncio
 @pytest.mark.slow
-async def test_full_router_workflow():
+async def test_full_router_workflow(tmp_path):
     """
     Тест полного цикла Router Agent: вопрос -> оценка -> выбор -> улучшение.
 
@@ -246,7 +246,9 @@ async def test_full_router_workflow():
         f"Ожидалось {EXPECTED_REPORTS_COUNT} описания, загружено {len(report_descriptions)}"
 
     # Шаг 2: Оценка релевантности всех отчетов (1 batch API запрос)
-    relevance = await evaluate_report_relevance(question, report_descriptions)
+    relevance = await evaluate_report_relevance(
+        question, report_descriptions, cache_path=tmp_path / "json_container_cache.json"
+    )
 
     # Проверка результатов оценки
     assert len(relevance) == EXPECTED_REPORTS_COUNT, \
@@ -318,7 +320,7 @@ def _load_report_descriptions_or_skip():
 
 
 async def _evaluate_single_question(question: str, expected_index: str,
-                                     report_descriptions: dict) -> dict:
+                                     report_descriptions: dict, cache_path: Path) -> dict:
     """
     Оценивает один вопрос и возвращает результаты.
 
@@ -326,11 +328,12 @@ async def _evaluate_single_question(question: str, expected_index: str,
         question: Текст вопроса
         expected_index: Ожидаемый индекс
         report_descriptions: Описания отчетов
+        cache_path: Путь к файлу кэша JSON-контейнера
 
     Returns:
         dict: Результат оценки с метриками accuracy@1 и recall@3
     """
-    relevance = await evaluate_report_relevance(question, report_descriptions)
+    relevance = await evaluate_report_relevance(question, report_descriptions, cache_path=cache_path)
     top_indices = get_top_relevant_indices(relevance, INDEX_MAPPING, top_k=3)
 
     top_3_names = [idx for idx, score in top_indices]
@@ -405,7 +408,7 @@ def _print_index_stats(results: list) -> None:
 
 @pytest.mark.asyncio
 @pytest.mark.slow
-async def test_router_on_golden_dataset(golden_dataset):
+async def test_router_on_golden_dataset(golden_dataset, tmp_path):
     """
     Тест Router Agent на эталонном наборе из 21 вопроса.
 
@@ -435,7 +438,8 @@ async def test_router_on_golden_dataset(golden_dataset):
         result = await _evaluate_single_question(
             item["question"],
             item["expected_index"],
-            report_descriptions
+            report_descriptions,
+            tmp_path / "json_container_cache.json"
         )
 
         if result["correct_at_1"]:
@@ -462,7 +466,7 @@ async def test_router_on_golden_dataset(golden_dataset):
 # ============================================================================
 
 @pytest.mark.asyncio
-async def test_router_fallback_on_error(mock_report_descriptions):
+async def test_router_fallback_on_error(mock_report_descriptions, tmp_path):
     """
     Тест что при ошибке Router используется fallback поведение.
 
@@ -492,7 +496,9 @@ async def test_router_fallback_on_error(mock_report_descriptions):
                return_value={}):
 
         # При пустом результате batch все отчеты получат оценку 0.0
-        relevance = await evaluate_report_relevance(question, mock_report_descriptions)
+        relevance = await evaluate_report_relevance(
+            question, mock_report_descriptions, cache_path=tmp_path / "json_container_cache.json"
+        )
 
         # Проверяем что функция вернула результат (может быть пустой словарь или словарь с 0.0)
         # При пустом batch-результате - словарь должен быть пустым
@@ -586,7 +592,7 @@ async def test_manual_index_selection(expected_indices):
 
 @pytest.mark.asyncio
 @pytest.mark.slow
-async def test_router_performance():
+async def test_router_performance(tmp_path):
     """
     Тест что Router выполняется за <= 5 секунд.
 
@@ -614,7 +620,9 @@ async def test_router_performance():
 
     # Полный цикл Router Agent
     # Этап 1: Оценка релевантности (1 batch запрос для всех 22 отчетов)
-    relevance = await evaluate_report_relevance(question, report_descriptions)
+    relevance = await evaluate_report_relevance(
+        question, report_descriptions, cache_path=tmp_path / "json_container_cache.json"
+    )
 
     # Этап 2: Выбор индекса (локальная операция, мгновенно)
     index = select_most_relevant_index(relevance, INDEX_MAPPING)
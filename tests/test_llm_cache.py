@@ -0,0 +1,132 @@
+"""
+Тесты кэша ответов Claude API (llm_cache).
+
+Проверяют:
+- Ключ кэша по модели, system, messages и max_tokens
+- LRU вытеснение и TTL
+- Дисковый уровень (переживает пересоздание кэша)
+- Метрики попаданий по местам вызова
+- Пропуск API-вызова в send_msg_to_model при попадании
+- Ошибка планировщика (вызов из event loop) пробрасывается, а не становится ответом
+"""
+
+import sys
+import time
+import asyncio
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import analysis
+from llm_cache import LLMResponseCache, CACHE_SITE_CLASSIFY_QUERY
+from llm_scheduler import SchedulerMisuseError
+
+MESSAGES = [{"role": "user", "content": "вопрос"}]
+
+
+class TestCacheKey:
+    def test_key_depends_on_all_parts(self):
+        key = LLMResponseCache.make_key("model", "system", MESSAGES, 100)
+
+        assert key == LLMResponseCache.make_key("model", "system", MESSAGES, 100)
+        assert key != LLMResponseCache.make_key("other", "system", MESSAGES, 100)
+        assert key != LLMResponseCache.make_key("model", "другой", MESSAGES, 100)
+        assert key != LLMResponseCache.make_key("model", "system", [{"role": "user", "content": "x"}], 100)
+        assert key != LLMResponseCache.make_key("model", "system", MESSAGES, 200)
+
+
+class TestMemoryTier:
+    def test_hit_and_miss_metrics(self):
+        cache = LLMResponseCache(max_entries=10)
+
+        assert cache.get("k", "site") is None
+        cache.set("k", "ответ", "site")
+        assert cache.get("k", "site") == "ответ"
+
+        stats = cache.get_stats()["site"]
+        assert stats.misses == 1
+        assert stats.memory_hits == 1
+        assert stats.hit_rate == 0.5
+
+    def test_lru_eviction(self):
+        cache = LLMResponseCache(max_entries=2)
+        cache.set("a", "1", "site")
+        cache.set("b", "2", "site")
+        cache.get("a", "site")  # "a" становится самым свежим
+        cache.set("c", "3", "site")
+
+        assert cache.get("b", "site") is None
+        assert cache.get("a", "site") == "1"
+
+    def test_ttl_expired(self):
+        cache = LLMResponseCache()
+        cache.set("k", "ответ", "site", ttl=0.01)
+        time.sleep(0.02)
+
+        assert cache.get("k", "site") is None
+
+    def test_disabled(self):
+        cache = LLMResponseCache(enabled=False)
+        cache.set("k", "ответ", "site")
+
+        assert cache.get("k", "site") is None
+
+
+class TestDiskTier:
+    def test_survives_new_instance(self, tmp_path):
+        LLMResponseCache(disk_dir=tmp_path).set("k", "ответ", "site")
+        cache = LLMResponseCache(disk_dir=tmp_path)
+
+        assert cache.get("k", "site") == "ответ"
+        assert cache.get_stats()["site"].disk_hits == 1
+
+    def test_corrupted_file_is_miss(self, tmp_path):
+        (tmp_path / "k.json").write_text("not json", encoding="utf-8")
+
+        assert LLMResponseCache(disk_dir=tmp_path).get("k", "site") is None
+
+
+class TestSendMsgToModelCache:
+    def test_repeat_call_skips_api(self):
+        cache = LLMResponseCache()
+        client = MagicMock()
+        client.messages.create.return_value = MagicMock(content=[MagicMock(text='{"category": "Интервью"}')])
+
+        with patch.object(analysis, "get_llm_cache", return_value=cache), \
+             patch.object(analysis, "get_anthropic_client", return_value=client):
+            first = analysis.send_msg_to_model(messages=MESSAGES, system="s", cache_site=CACHE_SITE_CLASSIFY_QUERY)
+            second, usage = analysis.send_msg_to_model(
+                messages=MESSAGES, system="s", cache_site=CACHE_SITE_CLASSIFY_QUERY, return_usage=True
+            )
+
+        assert first == second == '{"category": "Интервью"}'
+        assert usage == {"input_tokens": 0, "output_tokens": 0}
+        assert client.messages.create.call_count == 1
+
+    def test_errors_not_cached(self):
+        cache = LLMResponseCache()
+        client = MagicMock()
+        client.messages.create.side_effect = RuntimeError("API недоступен")
+
+        with patch.object(analysis, "get_llm_cache", return_value=cache), \
+             patch.object(analysis, "get_anthropic_client", return_value=client):
+            analysis.send_msg_to_model(messages=MESSAGES, err="ошибка", cache_site=CACHE_SITE_CLASSIFY_QUERY)
+            analysis.send_msg_to_model(messages=MESSAGES, err="ошибка", cache_site=CACHE_SITE_CLASSIFY_QUERY)
+
+        assert client.messages.create.call_count == 2
+
+    def test_scheduler_misuse_reraised(self):
+        client = MagicMock()
+
+        async def run():
+            return analysis.send_msg_to_model(messages=MESSAGES, err="ошибка")
+
+        with patch.object(analysis, "get_anthropic_client", return_value=client):
+            with pytest.raises(SchedulerMisuseError):
+                asyncio.run(run())
+
+        client.messages.create.assert_not_called()
@@ -0,0 +1,54 @@
+"""
+Тесты реестра клиентов Anthropic (llm_clients).
+
+Проверяют:
+- Один sync клиент на API ключ
+- Один async клиент на ключ в пределах event loop
+- Закрытие клиентов при остановке
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from llm_clients import get_anthropic_client, get_async_anthropic_client, close_llm_clients
+
+
+def test_sync_client_shared_per_key():
+    first = get_anthropic_client("key-a")
+
+    assert get_anthropic_client("key-a") is first
+    assert get_anthropic_client("key-b") is not first
+
+
+def test_async_client_shared_within_loop():
+    async def run():
+        first = get_async_anthropic_client("key-a")
+        second = get_async_anthropic_client("key-a")
+        other = get_async_anthropic_client("key-b")
+        await close_llm_clients()
+        return first, second, other
+
+    first, second, other = asyncio.run(run())
+    assert first is second
+    assert other is not first
+
+
+def test_async_client_per_loop():
+    async def get():
+        return get_async_anthropic_client("key-a")
+
+    first = asyncio.run(get())
+    second = asyncio.run(get())
+
+    assert first is not second
+
+
+def test_close_resets_sync_clients():
+    first = get_anthropic_client("key-c")
+    asyncio.run(close_llm_clients())
+
+    assert get_anthropic_client("key-c") is not first
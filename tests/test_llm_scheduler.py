@@ -0,0 +1,194 @@
+"""
+Тесты глобального LLM-планировщика (llm_scheduler).
+
+Проверяют:
+- Приоритет полос при выдаче освободившихся слотов
+- Резерв слотов для interactive/router
+- Справедливость между пользователями внутри полосы
+- Token bucket лимитов ключа и запас для интерактивных запросов
+- Отмену ожидания слота через RequestContext
+- Запрет slot_sync в потоке event loop (только через asyncio.to_thread)
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from llm_scheduler import (
+    LLMScheduler,
+    KeyRateLimiter,
+    LANE_INTERACTIVE,
+    LANE_ROUTER,
+    LANE_DEEP_SEARCH,
+    LANE_BATCH,
+)
+from request_context import RequestContext, RequestCancelledError
+
+
+class TestKeyRateLimiter:
+    def test_full_bucket_no_wait(self):
+        limiter = KeyRateLimiter(tokens_per_min=6000, requests_per_min=60)
+
+        assert limiter.reserve(1000, background=True) == 0.0
+
+    def test_debt_causes_wait_for_background(self):
+        limiter = KeyRateLimiter(tokens_per_min=6000, requests_per_min=600)
+        limiter.reserve(6000)
+
+        # Бакет пуст: 600 токенов + запас 1200 при 100 токенов/сек = ~18 сек
+        assert limiter.reserve(600, background=True) == pytest.approx(18.0, abs=0.1)
+
+    def test_interactive_never_waits_but_consumes(self):
+        limiter = KeyRateLimiter(tokens_per_min=6000, requests_per_min=600)
+
+        assert limiter.reserve(6000) == 0.0
+        assert limiter.reserve(6000) == 0.0
+        # Долг интерактивных запросов задерживает фоновые
+        assert limiter.reserve(10, background=True) > 60.0
+
+    def test_background_keeps_headroom(self):
+        limiter = KeyRateLimiter(tokens_per_min=6000, requests_per_min=600)
+        limiter.reserve(5000)  # Осталось 1000 токенов (запас 20% = 1200)
+
+        assert limiter.reserve(100, background=True) > 0.0
+
+    def test_oversized_request_does_not_wait_forever(self):
+        limiter = KeyRateLimiter(tokens_per_min=600, requests_per_min=60)
+
+        assert limiter.reserve(100000, background=True) == 0.0
+
+
+def _hold_slots(scheduler: LLMScheduler, lanes_users: list[tuple[int, int]]):
+    """Занимает слоты, возвращает список (waiter) для ручного освобождения."""
+    return [scheduler._enqueue(lane, user) for lane, user in lanes_users]
+
+
+class TestSlotScheduling:
+    def test_priority_lane_granted_first(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        holder = _hold_slots(scheduler, [(LANE_INTERACTIVE, 1)])[0]
+
+        batch = scheduler._enqueue(LANE_BATCH, 2)
+        deep = scheduler._enqueue(LANE_DEEP_SEARCH, 3)
+        interactive = scheduler._enqueue(LANE_INTERACTIVE, 4)
+
+        scheduler._release(holder)
+        assert interactive.granted
+        assert not deep.granted and not batch.granted
+
+        scheduler._release(interactive)
+        assert deep.granted
+        assert not batch.granted
+
+    def test_reserved_slots_not_used_by_background(self):
+        scheduler = LLMScheduler(max_concurrency=3, reserved_interactive_slots=1)
+
+        first = scheduler._enqueue(LANE_DEEP_SEARCH, 1)
+        second = scheduler._enqueue(LANE_DEEP_SEARCH, 1)
+        third = scheduler._enqueue(LANE_DEEP_SEARCH, 1)
+        router = scheduler._enqueue(LANE_ROUTER, 2)
+
+        assert first.granted and second.granted
+        assert not third.granted
+        assert router.granted
+
+    def test_user_fairness_within_lane(self):
+        scheduler = LLMScheduler(max_concurrency=2)
+        heavy_a, heavy_b = _hold_slots(scheduler, [(LANE_DEEP_SEARCH, 1), (LANE_DEEP_SEARCH, 1)])
+
+        # Пользователь 1 поставил в очередь раньше, но у него уже 2 запроса в работе
+        heavy_next = scheduler._enqueue(LANE_DEEP_SEARCH, 1)
+        light = scheduler._enqueue(LANE_DEEP_SEARCH, 2)
+
+        scheduler._release(heavy_a)
+        assert light.granted
+        assert not heavy_next.granted
+
+    def test_stats(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        _hold_slots(scheduler, [(LANE_INTERACTIVE, 1)])
+        scheduler._enqueue(LANE_BATCH, 2)
+
+        stats = scheduler.get_stats()
+        assert stats.in_flight == 1
+        assert stats.waiting == 1
+        assert stats.waiting_by_lane == {"batch": 1}
+
+
+class TestSlotContextManagers:
+    def test_sync_slot_released(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+
+        with scheduler.slot_sync(LANE_INTERACTIVE, "key", 10):
+            assert scheduler.get_stats().in_flight == 1
+        assert scheduler.get_stats().in_flight == 0
+
+    def test_sync_slot_in_event_loop_rejected(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+
+        async def run():
+            with scheduler.slot_sync(LANE_INTERACTIVE, "key", 10):
+                pass
+
+        with pytest.raises(RuntimeError, match="asyncio.to_thread"):
+            asyncio.run(run())
+        assert scheduler.get_stats().in_flight == 0
+
+    def test_sync_slot_via_to_thread_respects_concurrency(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        holder = _hold_slots(scheduler, [(LANE_INTERACTIVE, 1)])[0]
+
+        def call():
+            with scheduler.slot_sync(LANE_INTERACTIVE, "key", 10):
+                pass
+
+        async def run():
+            task = asyncio.create_task(asyncio.to_thread(call))
+            await asyncio.sleep(0.05)
+            # Слот занят: вызов ждет в очереди, а не выдается сверх лимита
+            assert scheduler.get_stats().waiting == 1
+            assert scheduler.get_stats().in_flight == 1
+            scheduler._release(holder)
+            await task
+
+        asyncio.run(run())
+        assert scheduler.get_stats().in_flight == 0
+
+    def test_async_slots_respect_concurrency(self):
+        scheduler = LLMScheduler(max_concurrency=2)
+        active = 0
+        peak = 0
+
+        async def call():
+            nonlocal active, peak
+            async with scheduler.slot_async(LANE_DEEP_SEARCH, "key", 10):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        async def run():
+            await asyncio.gather(*(call() for _ in range(6)))
+
+        asyncio.run(run())
+        assert peak == 2
+        assert scheduler.get_stats().in_flight == 0
+
+    def test_async_wait_cancelled_by_request_context(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        _hold_slots(scheduler, [(LANE_INTERACTIVE, 1)])
+        ctx = RequestContext(chat_id=2)
+        ctx.cancel()
+
+        async def run():
+            async with scheduler.slot_async(LANE_BATCH, "key", 10, request_context=ctx):
+                pass
+
+        with pytest.raises(RequestCancelledError):
+            asyncio.run(run())
+        assert scheduler.get_stats().waiting == 0
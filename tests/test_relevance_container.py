@@ -0,0 +1,119 @@
+"""
+Тесты сжатого JSON-контейнера для оценки релевантности.
+
+Проверяют:
+- Полные описания при бюджете 0 и при описаниях в пределах бюджета
+- Обрезку описаний по стратегии JSONSizeEstimator при превышении бюджета
+- Использование кратких описаний только с совпадающим source_hash
+- Пересборку кэша при изменении описаний (ключ - хэш содержимого)
+"""
+
+import json
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import relevance_evaluator
+from relevance_evaluator import (
+    build_json_container, compact_report_descriptions, get_cached_json_container, text_hash
+)
+from utils_pkg import truncate_text
+
+
+PARAGRAPH = "Отчет описывает освещение, мебель и навигацию в зале ожидания. " * 10
+
+DESCRIPTIONS = {
+    "Отчет 1": "\n\n".join([PARAGRAPH] * 5),
+    "Отчет 2": "\n\n".join([PARAGRAPH] * 5),
+}
+
+MAPPING = {"Отчет 1": "Дизайн", "Отчет 2": "Интервью", "Старый отчет": "Дизайн"}
+
+
+def container_descriptions(container: str) -> dict[str, str]:
+    data = json.loads(container)
+    return {report["name"]: report["description"] for report in data["reports"]}
+
+
+class TestCompactDescriptions:
+    def test_zero_budget_keeps_full_descriptions(self):
+        compact, strategy = compact_report_descriptions(DESCRIPTIONS, token_budget=0)
+
+        assert compact == DESCRIPTIONS
+        assert strategy == "full_descriptions"
+
+    def test_within_budget_unchanged(self):
+        compact, _ = compact_report_descriptions(DESCRIPTIONS, token_budget=100000)
+
+        assert compact == DESCRIPTIONS
+
+    def test_over_budget_truncated(self):
+        compact, strategy = compact_report_descriptions(DESCRIPTIONS, token_budget=500)
+
+        assert strategy.startswith("truncate_")
+        assert all(len(text) <= 502 for text in compact.values())
+        assert all(text.endswith("…") for text in compact.values())
+
+    def test_matching_summaries_used(self):
+        summaries = {
+            "Отчет 1": {"source_hash": text_hash(DESCRIPTIONS["Отчет 1"]), "summary": "Освещение и мебель."},
+            "Отчет 2": {"source_hash": "устаревший", "summary": "Старое краткое описание."},
+        }
+
+        compact, strategy = compact_report_descriptions(DESCRIPTIONS, token_budget=1500, summaries=summaries)
+
+        assert compact["Отчет 1"] == "Освещение и мебель."
+        # Краткое описание устарело - описание обрезается
+        assert compact["Отчет 2"] != "Старое краткое описание."
+        assert compact["Отчет 2"].startswith("Отчет описывает")
+        assert strategy.startswith("summaries")
+
+    def test_build_json_container_default_is_full(self):
+        container = build_json_container(DESCRIPTIONS, report_to_index=MAPPING)
+
+        assert container_descriptions(container) == DESCRIPTIONS
+
+
+class TestTruncateText:
+    def test_cut_at_sentence_boundary(self):
+        text = "Первое предложение. Второе предложение. Третье предложение."
+
+        assert truncate_text(text, 45) == "Первое предложение. Второе предложение. …"
+
+    def test_short_text_unchanged(self):
+        assert truncate_text("Коротко.", 100) == "Коротко."
+
+
+class TestCachedContainer:
+    def test_cache_rebuilt_when_descriptions_change(self, tmp_path):
+        cache_path = tmp_path / "json_container_cache.json"
+        with patch.object(relevance_evaluator, "load_report_summaries", return_value={}), \
+                patch.object(relevance_evaluator, "_container_memo", None), \
+                patch.object(relevance_evaluator, "REPORT_TO_INDEX_MAPPING", MAPPING):
+            first = get_cached_json_container(DESCRIPTIONS, cache_path=cache_path, token_budget=0)
+            assert get_cached_json_container(DESCRIPTIONS, cache_path=cache_path, token_budget=0) == first
+
+            changed = dict(DESCRIPTIONS, **{"Отчет 2": "Новое описание отчета."})
+            second = get_cached_json_container(changed, cache_path=cache_path, token_budget=0)
+
+        assert container_descriptions(second)["Отчет 2"] == "Новое описание отчета."
+        cached = json.loads(cache_path.read_text(encoding="utf-8"))
+        assert cached["container"] == second
+
+    def test_stale_file_cache_ignored(self, tmp_path):
+        cache_path = tmp_path / "json_container_cache.json"
+        relevance_evaluator.save_json_cache(
+            build_json_container({"Старый отчет": "Старое описание"}, report_to_index=MAPPING),
+            cache_path,
+            content_hash="другие описания"
+        )
+
+        with patch.object(relevance_evaluator, "load_report_summaries", return_value={}), \
+                patch.object(relevance_evaluator, "_container_memo", None), \
+                patch.object(relevance_evaluator, "REPORT_TO_INDEX_MAPPING", MAPPING):
+            container = get_cached_json_container(DESCRIPTIONS, cache_path=cache_path, token_budget=0)
+
+        assert "Старый отчет" not in container_descriptions(container)
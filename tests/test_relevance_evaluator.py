@@ -1110,7 +1110,7 @@ async def test_evaluate_single_report_timeout():
 # === ТЕСТЫ ОСНОВНОЙ ФУНКЦИИ С BATCH МЕХАНИЗМОМ ===
 
 @pytest.mark.asyncio
-async def test_evaluate_report_relevance_uses_batch_mechanism(full_report_descriptions):
+async def test_evaluate_report_relevance_uses_batch_mechanism(full_report_descriptions, tmp_path):
     """
     Тест что evaluate_report_relevance использует batch-механизм.
 
@@ -1129,7 +1129,8 @@ async def test_evaluate_report_relevance_uses_batch_mechanism(full_report_descri
             result = await evaluate_report_relevance(
                 question=question,
                 report_descriptions=full_report_descriptions,
-                api_key=api_key
+                api_key=api_key,
+                cache_path=tmp_path / "json_container_cache.json"
             )
 
             # Должен вызвать batch-функцию
@@ -1143,7 +1144,7 @@ async def test_evaluate_report_relevance_uses_batch_mechanism(full_report_descri
 
 
 @pytest.mark.asyncio
-async def test_evaluate_report_relevance_success_with_batch(full_report_descriptions):
+async def test_evaluate_report_relevance_success_with_batch(full_report_descriptions, tmp_path):
     """
     Тест успешной оценки релевантности через batch-механизм.
 
@@ -1174,7 +1175,8 @@ async def test_evaluate_report_relevance_success_with_batch(full_report_descript
         result = await evaluate_report_relevance(
             question=question,
             report_descriptions=full_report_descriptions,
-            api_key=api_key
+            api_key=api_key,
+            cache_path=tmp_path / "json_container_cache.json"
         )
 
         # Проверки
@@ -1185,7 +1187,7 @@ async def test_evaluate_report_relevance_success_with_batch(full_report_descript
 
 
 @pytest.mark.asyncio
-async def test_evaluate_report_relevance_auto_load_descriptions():
+async def test_evaluate_report_relevance_auto_load_descriptions(tmp_path):
     """
     Тест автоматической загрузки описаний отчетов.
 
@@ -1209,7 +1211,8 @@ async def test_evaluate_report_relevance_auto_load_descriptions():
             result = await evaluate_report_relevance(
                 question=question,
                 report_descriptions=None,  # Явно не передаем
-                api_key=api_key
+                api_key=api_key,
+                cache_path=tmp_path / "json_container_cache.json"
             )
 
             # Должны быть обработаны загруженные описания
@@ -1273,7 +1276,7 @@ async def test_evaluate_report_relevance_empty_descriptions():
 
 
 @pytest.mark.asyncio
-async def test_relevance_score_range(full_report_descriptions):
+async def test_relevance_score_range(full_report_descriptions, tmp_path):
     """
     Тест диапазона значений релевантности.
 
@@ -1302,7 +1305,8 @@ async def test_relevance_score_range(full_report_descriptions):
         result = await evaluate_report_relevance(
             question=question,
             report_descriptions=full_report_descriptions,
-            api_key=api_key
+            api_key=api_key,
+            cache_path=tmp_path / "json_container_cache.json"
         )
 
         # Все значения должны быть в диапазоне [0, 100]
@@ -1314,7 +1318,7 @@ async def test_relevance_score_range(full_report_descriptions):
 
 @pytest.mark.integration
 @pytest.mark.asyncio
-async def test_evaluate_report_relevance_real_api():
+async def test_evaluate_report_relevance_real_api(tmp_path):
     """
     Интеграционный тест с реальным Anthropic API.
 
@@ -1350,7 +1354,8 @@ async def test_evaluate_report_relevance_real_api():
 
     result = await evaluate_report_relevance(
         question=question,
-        report_descriptions=mini_descriptions
+        report_descriptions=mini_descriptions,
+        cache_path=tmp_path / "json_container_cache.json"
     )
 
     elapsed = time.time() - start_time
@@ -1380,7 +1385,7 @@ async def test_evaluate_report_relevance_real_api():
 # === ТЕСТЫ EDGE CASES ===
 
 @pytest.mark.asyncio
-async def test_evaluate_report_relevance_unicode_question(full_report_descriptions):
+async def test_evaluate_report_relevance_unicode_question(full_report_descriptions, tmp_path):
     """
     Тест обработки вопроса с unicode символами (русский).
 
@@ -1403,13 +1408,14 @@ async def test_evaluate_report_relevance_unicode_question(full_report_descriptio
             result = await evaluate_report_relevance(
                 question=question,
                 report_descriptions=full_report_descriptions,
-                api_key=api_key
+                api_key=api_key,
+                cache_path=tmp_path / "json_container_cache.json"
             )
             assert len(result) == 22
 
 
 @pytest.mark.asyncio
-async def test_batch_fallback_to_single_on_error(full_report_descriptions):
+async def test_batch_fallback_to_single_on_error(full_report_descriptions, tmp_path):
     """
     Тест что batch-механизм используется по умолчанию.
 
@@ -1427,7 +1433,8 @@ async def test_batch_fallback_to_single_on_error(full_report_descriptions):
         result = await evaluate_report_relevance(
             question=question,
             report_descriptions=full_report_descriptions,
-            api_key=api_key
+            api_key=api_key,
+            cache_path=tmp_path / "json_container_cache.json"
         )
 
         # Batch должен быть вызван
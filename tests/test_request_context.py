@@ -0,0 +1,128 @@
+"""
+Тесты контекста запроса (дедлайн и токен отмены).
+
+Проверяют:
+- Отмену и истечение дедлайна
+- Прерывание sleep/asleep при отмене
+- Проброс контекста через contextvars в задачи и потоки
+- Реестр активных запросов по chat_id (кнопка "Отменить")
+"""
+
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from request_context import (
+    RequestContext,
+    RequestCancelledError,
+    DeadlineExceededError,
+    current_request_context,
+    get_current_request_context,
+    check_current_request,
+    start_request_context,
+    finish_request_context,
+    cancel_request,
+    get_cancel_message,
+)
+
+
+class TestRequestContext:
+    def test_no_deadline(self):
+        ctx = RequestContext(chat_id=1)
+
+        assert ctx.remaining() is None
+        assert ctx.timeout(30) == 30
+        ctx.check()
+
+    def test_cancel(self):
+        ctx = RequestContext(chat_id=1, timeout=60)
+        ctx.cancel()
+
+        with pytest.raises(RequestCancelledError):
+            ctx.check()
+
+    def test_deadline_exceeded(self):
+        ctx = RequestContext(chat_id=1, timeout=0.01)
+        time.sleep(0.02)
+
+        with pytest.raises(DeadlineExceededError):
+            ctx.check()
+
+    def test_timeout_capped_by_remaining(self):
+        ctx = RequestContext(chat_id=1, timeout=5)
+
+        assert ctx.timeout(60) <= 5
+        assert ctx.timeout(1) == 1
+
+    def test_sleep_interrupted_by_cancel(self):
+        ctx = RequestContext(chat_id=1)
+        threading.Timer(0.05, ctx.cancel).start()
+
+        start = time.monotonic()
+        with pytest.raises(RequestCancelledError):
+            ctx.sleep(10)
+        assert time.monotonic() - start < 2
+
+    def test_asleep_interrupted_by_deadline(self):
+        ctx = RequestContext(chat_id=1, timeout=0.1)
+
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            asyncio.run(ctx.asleep(10))
+        assert time.monotonic() - start < 2
+
+
+class TestContextPropagation:
+    def test_check_without_context_is_noop(self):
+        assert get_current_request_context() is None
+        check_current_request()
+
+    def test_context_visible_in_thread_and_task(self):
+        ctx = RequestContext(chat_id=1)
+
+        async def run():
+            token = current_request_context.set(ctx)
+            try:
+                in_thread = await asyncio.to_thread(get_current_request_context)
+                in_task = await asyncio.create_task(asyncio.sleep(0, result=get_current_request_context()))
+                return in_thread, in_task
+            finally:
+                current_request_context.reset(token)
+
+        in_thread, in_task = asyncio.run(run())
+        assert in_thread is ctx
+        assert in_task is ctx
+
+
+class TestActiveRequests:
+    def test_cancel_active_request(self):
+        ctx = start_request_context(chat_id=100, timeout=60)
+
+        assert cancel_request(100) is True
+        assert ctx.cancelled
+
+        finish_request_context(100, ctx)
+        assert cancel_request(100) is False
+
+    def test_new_request_cancels_previous(self):
+        first = start_request_context(chat_id=101)
+        second = start_request_context(chat_id=101)
+
+        assert first.cancelled
+        assert not second.cancelled
+
+        # Завершение старого контекста не снимает регистрацию нового
+        finish_request_context(101, first)
+        assert cancel_request(101) is True
+        finish_request_context(101, second)
+
+    def test_cancel_messages(self):
+        assert "время" in get_cancel_message(DeadlineExceededError())
+        assert "отменен" in get_cancel_message(RequestCancelledError())
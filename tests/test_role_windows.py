@@ -0,0 +1,169 @@
+"""
+Тесты расстановки ролей окнами.
+
+Проверяют:
+- Разбиение на предложения и окна с перекрытием
+- Разбор размеченного ответа модели
+- Сшивку окон: перекрытие без дублей, исправление перепутанных меток
+- Параллельную разметку окон и один запрос для короткого текста
+- Повтор окна без меток и сохранение предложений окна, которое не удалось разметить
+"""
+
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from role_windows import (
+    assign_roles_windowed, build_windows, format_labeled, parse_labeled, split_sentences, stitch_windows
+)
+
+
+# Реплики чередуются: четные предложения - сотрудник, нечетные - клиент
+SENTENCES = [f"Предложение номер {i} про отель и сервис." for i in range(40)]
+TEXT = " ".join(SENTENCES)
+
+
+def true_label(sentence: str) -> str:
+    number = int(re.search(r"номер (\d+)", sentence).group(1))
+    return "Сотрудник" if number % 2 == 0 else "Клиент"
+
+
+def fake_assign(window_text: str, swap: bool = False) -> str:
+    """Ответ модели для окна (swap - говорящие перепутаны)."""
+    lines = []
+    for sentence in split_sentences(window_text):
+        label = true_label(sentence)
+        if swap:
+            label = "Клиент" if label == "Сотрудник" else "Сотрудник"
+        lines.append(f"[{label}:] {sentence}")
+    return "\n".join(lines)
+
+
+class TestWindows:
+    def test_split_sentences(self):
+        assert split_sentences("Добрый день! Как дела?\nХорошо… Спасибо.") == [
+            "Добрый день!", "Как дела?", "Хорошо…", "Спасибо."
+        ]
+
+    def test_windows_cover_text_with_overlap(self):
+        windows = build_windows(SENTENCES, window_chars=400, overlap_chars=100)
+
+        assert len(windows) > 2
+        assert windows[0].start == 0 and windows[0].overlap == 0
+        assert windows[-1].end == len(SENTENCES)
+        for previous, current in zip(windows, windows[1:]):
+            assert current.overlap >= 1
+            assert current.start == previous.end - current.overlap
+
+    def test_single_window_for_short_text(self):
+        assert len(build_windows(SENTENCES[:3], window_chars=10000, overlap_chars=100)) == 1
+
+    def test_parse_labeled(self):
+        labeled = parse_labeled("[Сотрудник:] Здравствуйте. Чем помочь?\n[Клиент:] Номер на двоих.")
+
+        assert labeled == [
+            ("Сотрудник", "Здравствуйте."), ("Сотрудник", "Чем помочь?"), ("Клиент", "Номер на двоих.")
+        ]
+
+
+class TestStitch:
+    def test_overlap_not_duplicated(self):
+        windows = build_windows(SENTENCES, window_chars=400, overlap_chars=100)
+        outputs = [fake_assign(" ".join(SENTENCES[w.start:w.end])) for w in windows]
+
+        labeled = stitch_windows(SENTENCES, windows, outputs)
+
+        assert [sentence for _, sentence in labeled] == SENTENCES
+        assert all(label == true_label(sentence) for label, sentence in labeled)
+
+    def test_swapped_window_labels_fixed(self):
+        windows = build_windows(SENTENCES, window_chars=400, overlap_chars=100)
+        outputs = [
+            fake_assign(" ".join(SENTENCES[w.start:w.end]), swap=(i % 2 == 1))
+            for i, w in enumerate(windows)
+        ]
+
+        labeled = stitch_windows(SENTENCES, windows, outputs)
+
+        assert all(label == true_label(sentence) for label, sentence in labeled)
+
+    def test_format_merges_consecutive_sentences(self):
+        text = format_labeled([("Клиент", "Да."), ("Клиент", "Конечно."), ("Сотрудник", "Спасибо.")])
+
+        assert text == "[Клиент:] Да. Конечно.\n[Сотрудник:] Спасибо."
+
+
+class TestAssignRolesWindowed:
+    def test_windows_assigned_in_parallel(self):
+        active = 0
+        max_active = 0
+        calls = 0
+        lock = threading.Lock()
+
+        def assign_window(window_text):
+            nonlocal active, max_active, calls
+            with lock:
+                active += 1
+                calls += 1
+                max_active = max(max_active, active)
+            time.sleep(0.05)
+            with lock:
+                active -= 1
+            return fake_assign(window_text)
+
+        result = assign_roles_windowed(TEXT, assign_window, window_chars=400, overlap_chars=100, concurrency=4)
+
+        assert calls > 2
+        assert max_active > 1
+        assert all(label == true_label(sentence) for label, sentence in parse_labeled(result))
+        assert len(parse_labeled(result)) == len(SENTENCES)
+
+    def test_short_text_single_request(self):
+        calls = []
+
+        def assign_window(window_text):
+            calls.append(window_text)
+            return "[Клиент:] Да."
+
+        assert assign_roles_windowed("Да.", assign_window, window_chars=400) == "[Клиент:] Да."
+        assert calls == ["Да."]
+
+    def test_failed_window_retried(self):
+        attempts: dict[str, int] = {}
+        lock = threading.Lock()
+
+        def assign_window(window_text):
+            with lock:
+                attempts[window_text] = attempts.get(window_text, 0) + 1
+                first_attempt = attempts[window_text] == 1
+            if first_attempt and "номер 20 " in window_text:
+                return "Ошибка assign_roles"
+            return fake_assign(window_text)
+
+        result = assign_roles_windowed(TEXT, assign_window, window_chars=400, overlap_chars=100)
+
+        labeled = parse_labeled(result)
+        assert [sentence for _, sentence in labeled] == SENTENCES
+        assert all(label == true_label(sentence) for label, sentence in labeled)
+
+    def test_unlabeled_window_keeps_sentences(self):
+        def assign_window(window_text):
+            if "номер 20 " in window_text:
+                return "Ошибка assign_roles"
+            return fake_assign(window_text)
+
+        result = assign_roles_windowed(TEXT, assign_window, window_chars=400, overlap_chars=100)
+
+        assert split_sentences(result.replace("[Сотрудник:] ", "").replace("[Клиент:] ", "")) == SENTENCES
+        assert "Ошибка" not in result
+        # Предложения не размеченного окна - отдельной строкой без метки
+        unlabeled = [line for line in result.splitlines() if not line.startswith("[")]
+        assert unlabeled and "Предложение номер 20 " in " ".join(unlabeled)
+
+    def test_short_text_error_returns_original(self):
+        assert assign_roles_windowed("Да. Конечно.", lambda _: "Ошибка assign_roles", window_chars=400) == "Да. Конечно."
@@ -0,0 +1,179 @@
+"""
+Тесты семантического кэша ответов режима диалога.
+
+Проверяют:
+- Попадание для похожего вопроса выше порога и промах ниже порога
+- Разделение ответов быстрого поиска и глубокого исследования
+- Истечение TTL
+- Инвалидацию при пересборке индекса (sync_index_versions)
+- Замену ответа на похожий вопрос новым ответом
+- Выдачу ответа из кэша до expand_query и Router Agent (_run_dialog_pipeline)
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+import numpy as np
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from semantic_cache import SemanticAnswerCache
+
+
+def vec(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def make_cache(**kwargs):
+    params = {"threshold": 0.9, "ttl": 3600, "max_entries_per_index": 10}
+    params.update(kwargs)
+    return SemanticAnswerCache(**params)
+
+
+class TestLookup:
+    def test_similar_question_hit(self):
+        cache = make_cache()
+        cache.store(vec(1, 0, 0), "проблемы с вентиляцией", "Ответ", "Интервью", "Интервью", deep_search=False)
+
+        hit = cache.lookup(vec(0.95, 0.1, 0), deep_search=False)
+
+        assert hit is not None
+        assert hit.answer == "Ответ"
+        assert hit.index_name == "Интервью"
+        assert hit.similarity >= 0.9
+
+    def test_dissimilar_question_miss(self):
+        cache = make_cache()
+        cache.store(vec(1, 0, 0), "вентиляция", "Ответ", "Интервью", "Интервью", deep_search=False)
+
+        assert cache.lookup(vec(0.5, 0.8, 0), deep_search=False) is None
+
+    def test_best_match_returned(self):
+        cache = make_cache()
+        cache.store(vec(1, 0.4, 0), "вопрос 1", "Ответ 1", "Интервью", "Интервью", deep_search=False)
+        cache.store(vec(1, 0, 0.6), "вопрос 2", "Ответ 2", "Дизайн", "Дизайн", deep_search=False)
+
+        assert cache.lookup(vec(1, 0.35, 0), deep_search=False).answer == "Ответ 1"
+        assert cache.lookup(vec(1, 0.3, 0), deep_search=False, index_name="Дизайн") is None
+
+    def test_search_modes_not_mixed(self):
+        cache = make_cache()
+        cache.store(vec(1, 0, 0), "вопрос", "Глубокий ответ", "Интервью", "Интервью", deep_search=True)
+
+        assert cache.lookup(vec(1, 0, 0), deep_search=False) is None
+        assert cache.lookup(vec(1, 0, 0), deep_search=True).answer == "Глубокий ответ"
+
+    def test_expired_answer_miss(self):
+        cache = make_cache(ttl=60)
+        with patch("semantic_cache.time.time", return_value=1000.0):
+            cache.store(vec(1, 0, 0), "вопрос", "Ответ", "Интервью", "Интервью", deep_search=False)
+        with patch("semantic_cache.time.time", return_value=1061.0):
+            assert cache.lookup(vec(1, 0, 0), deep_search=False) is None
+
+    def test_disabled(self):
+        cache = make_cache(enabled=False)
+        cache.store(vec(1, 0, 0), "вопрос", "Ответ", "Интервью", "Интервью", deep_search=False)
+
+        assert cache.lookup(vec(1, 0, 0), deep_search=False) is None
+
+
+class TestStore:
+    def test_new_answer_replaces_similar(self):
+        cache = make_cache()
+        cache.store(vec(1, 0, 0), "вопрос", "Старый ответ", "Интервью", "Интервью", deep_search=False)
+        cache.store(vec(0.98, 0.05, 0), "вопрос", "Новый ответ", "Интервью", "Интервью", deep_search=False)
+
+        assert cache.lookup(vec(1, 0, 0), deep_search=False, index_name="Интервью").answer == "Новый ответ"
+
+    def test_similar_answer_other_index_kept(self):
+        cache = make_cache()
+        cache.store(vec(1, 0, 0), "вопрос", "Ответ по интервью", "Интервью", "Интервью", deep_search=False)
+        cache.store(vec(0.98, 0.05, 0), "вопрос", "Ответ по дизайну", "Дизайн", "Дизайн", deep_search=False)
+
+        assert cache.lookup(vec(1, 0, 0), deep_search=False, index_name="Интервью").answer == "Ответ по интервью"
+        assert cache.lookup(vec(1, 0, 0), deep_search=False, index_name="Дизайн").answer == "Ответ по дизайну"
+
+    def test_max_entries_per_index(self):
+        cache = make_cache(max_entries_per_index=2)
+        for axis in range(3):
+            vector = np.zeros(3, dtype=np.float32)
+            vector[axis] = 1
+            cache.store(vector, f"вопрос {axis}", f"Ответ {axis}", "Интервью", "Интервью", deep_search=False)
+
+        assert cache.lookup(vec(1, 0, 0), deep_search=False) is None
+        assert cache.lookup(vec(0, 0, 1), deep_search=False).answer == "Ответ 2"
+
+
+class TestIndexVersions:
+    def test_rebuilt_index_invalidated(self):
+        cache = make_cache()
+        interview, design = object(), object()
+        cache.sync_index_versions({"Интервью": interview, "Дизайн": design})
+        cache.store(vec(1, 0, 0), "вопрос 1", "Ответ 1", "Интервью", "Интервью", deep_search=False)
+        cache.store(vec(0, 1, 0), "вопрос 2", "Ответ 2", "Дизайн", "Дизайн", deep_search=False)
+        version = cache.get_version("Интервью")
+
+        invalidated = cache.sync_index_versions({"Интервью": object(), "Дизайн": design})
+
+        assert invalidated == ["Интервью"]
+        assert cache.get_version("Интервью") == version + 1
+        assert cache.lookup(vec(1, 0, 0), deep_search=False) is None
+        assert cache.lookup(vec(0, 1, 0), deep_search=False).answer == "Ответ 2"
+
+    def test_same_indices_keep_answers(self):
+        cache = make_cache()
+        rags = {"Интервью": object()}
+        cache.sync_index_versions(rags)
+        cache.store(vec(1, 0, 0), "вопрос", "Ответ", "Интервью", "Интервью", deep_search=False)
+
+        assert cache.sync_index_versions(dict(rags)) == []
+        assert cache.lookup(vec(1, 0, 0), deep_search=False) is not None
+
+    def test_removed_index_invalidated(self):
+        cache = make_cache()
+        cache.sync_index_versions({"Интервью": object()})
+        cache.store(vec(1, 0, 0), "вопрос", "Ответ", "Интервью", "Интервью", deep_search=False)
+
+        assert cache.sync_index_versions({}) == ["Интервью"]
+        assert cache.lookup(vec(1, 0, 0), deep_search=False) is None
+
+
+@pytest.fixture
+def run_analysis(real_module):
+    return real_module("run_analysis")
+
+
+def run_pipeline(run_analysis, state, cached):
+    message = SimpleNamespace(text="Какие замечания по освещению?", chat=SimpleNamespace(id=7), id=1)
+    lookup = AsyncMock(return_value=cached)
+    expand = AsyncMock(side_effect=AssertionError("expand_query не должен вызываться"))
+    send = AsyncMock()
+
+    async def run():
+        with patch.dict(run_analysis.user_states, {7: state}), \
+                patch.object(run_analysis, "find_semantic_cache_answer", lookup), \
+                patch.object(run_analysis, "send_semantic_cache_answer", send), \
+                patch.object(run_analysis, "expand_and_route", expand):
+            await run_analysis._run_dialog_pipeline(message, app=None, rags={})
+
+    asyncio.run(run())
+    return lookup, send
+
+
+class TestDialogPipelineLookup:
+    def test_hit_skips_expansion_and_routing(self, run_analysis):
+        lookup, send = run_pipeline(run_analysis, {"step": "dialog_mode"}, cached=object())
+
+        assert lookup.call_args.kwargs["index_name"] is None
+        send.assert_awaited_once()
+
+    def test_preselected_index_scopes_lookup(self, run_analysis):
+        lookup, _ = run_pipeline(run_analysis, {"selected_index": "Dizayn"}, cached=object())
+
+        assert lookup.call_args.kwargs["index_name"] == "Дизайн"
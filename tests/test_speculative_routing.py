@@ -0,0 +1,115 @@
+"""
+Тесты спекулятивной маршрутизации при улучшении вопроса (expand_and_route).
+
+Проверяют:
+- Параллельный запуск expand_query (в отдельном потоке) и Router Agent
+- Повторное использование рекомендаций при совпадении лучших индексов
+- Повторный Router Agent для улучшенного вопроса при расхождении
+- Отмену спекулятивного Router Agent, если вопрос не улучшен
+- Последовательный режим при выключенной спекулятивной маршрутизации
+"""
+
+import sys
+import asyncio
+import time
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+TOKENS = {"input_tokens": 10, "output_tokens": 5}
+TOP_INDICES = [("Dizayn", 80.0), ("Intervyu", 40.0)]
+
+
+def expansion(question, expanded="Улучшенный вопрос"):
+    return {"original": question, "expanded": expanded, "used_descry": True, "tokens_used": dict(TOKENS)}
+
+
+@pytest.fixture
+def run_analysis(real_module):
+    return real_module("run_analysis")
+
+
+def run_expand_and_route(run_analysis, router, agree=True, enabled=True, expanded="Улучшенный вопрос"):
+    with patch.object(run_analysis, "SPECULATIVE_ROUTING_ENABLED", enabled), \
+            patch.object(run_analysis, "expand_query", side_effect=lambda q: expansion(q, expanded)), \
+            patch.object(run_analysis, "_get_router_recommendations", router), \
+            patch.object(run_analysis, "load_report_descriptions", return_value={}), \
+            patch.object(run_analysis, "top_indices_agree", return_value=agree):
+        return asyncio.run(run_analysis.expand_and_route("вопрос", chat_id=1))
+
+
+class TestExpandAndRoute:
+    def test_runs_concurrently(self, run_analysis):
+        def slow_expand(question):
+            time.sleep(0.3)
+            return expansion(question)
+
+        async def slow_router(text, chat_id):
+            await asyncio.sleep(0.3)
+            return TOP_INDICES, dict(TOKENS)
+
+        started = time.monotonic()
+        with patch.object(run_analysis, "SPECULATIVE_ROUTING_ENABLED", True), \
+                patch.object(run_analysis, "expand_query", side_effect=slow_expand), \
+                patch.object(run_analysis, "_get_router_recommendations", side_effect=slow_router), \
+                patch.object(run_analysis, "load_report_descriptions", return_value={}), \
+                patch.object(run_analysis, "top_indices_agree", return_value=True):
+            _, top_indices, _ = asyncio.run(run_analysis.expand_and_route("вопрос", chat_id=1))
+
+        assert top_indices == TOP_INDICES
+        assert time.monotonic() - started < 0.55
+
+    def test_agreeing_indices_reused(self, run_analysis):
+        router = AsyncMock(return_value=(TOP_INDICES, dict(TOKENS)))
+
+        result, top_indices, tokens = run_expand_and_route(run_analysis, router, agree=True)
+
+        assert result["expanded"] == "Улучшенный вопрос"
+        assert top_indices == TOP_INDICES
+        router.assert_awaited_once_with("вопрос", 1)
+        assert tokens == {"input_tokens": 20, "output_tokens": 10}
+
+    def test_changed_indices_rerouted(self, run_analysis):
+        router = AsyncMock(side_effect=[(TOP_INDICES, dict(TOKENS)), ([("Intervyu", 90.0)], dict(TOKENS))])
+
+        _, top_indices, tokens = run_expand_and_route(run_analysis, router, agree=False)
+
+        assert top_indices == [("Intervyu", 90.0)]
+        assert router.await_args_list[1].args == ("Улучшенный вопрос", 1)
+        assert tokens == {"input_tokens": 30, "output_tokens": 15}
+
+    def test_not_improved_returns_no_indices(self, run_analysis):
+        router = AsyncMock(return_value=(TOP_INDICES, dict(TOKENS)))
+
+        _, top_indices, _ = run_expand_and_route(run_analysis, router, expanded="вопрос")
+
+        assert top_indices is None
+
+    def test_not_improved_cancels_speculative_router(self, run_analysis):
+        finished = []
+
+        async def slow_router(text, chat_id):
+            await asyncio.sleep(1)
+            finished.append(text)
+            return TOP_INDICES, dict(TOKENS)
+
+        started = time.monotonic()
+        _, top_indices, tokens = run_expand_and_route(run_analysis, slow_router, expanded="вопрос")
+
+        # Меню не показывается - Router Agent не ждем
+        assert top_indices is None
+        assert time.monotonic() - started < 0.5
+        assert finished == []
+        assert tokens == TOKENS
+
+    def test_disabled_routes_expanded_question(self, run_analysis):
+        router = AsyncMock(return_value=(TOP_INDICES, dict(TOKENS)))
+
+        _, top_indices, _ = run_expand_and_route(run_analysis, router, enabled=False)
+
+        assert top_indices == TOP_INDICES
+        router.assert_awaited_once_with("Улучшенный вопрос", 1)
@@ -0,0 +1,225 @@
+"""
+Тесты параллельной транскрибации аудио по чанкам (transcription).
+
+Проверяют:
+- Сборку текстов в исходном порядке чанков при параллельной обработке
+- Ограничение числа одновременно обрабатываемых чанков
+- Повтор упавшего чанка и TranscriptionError после исчерпания повторов
+- Немедленный проброс неповторяемых ошибок (ключ/регион)
+- Потоковую нарезку через ffprobe/ffmpeg: план чанков и вырезание одного чанка
+- Длительность аудиопотока, если format=duration - N/A
+- Границы чанков в паузах речи (окно, min/max длина, детерминированность)
+- Кодирование чанков профилем для речи (моно 16 кГц, низкий битрейт)
+"""
+
+import subprocess
+import sys
+import random
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import transcription
+from transcription import (
+    AudioChunk, AudioDurationError, TranscriptionError, detect_silences, export_chunk, plan_chunks, plan_chunks_at_silences,
+    get_upload_profile, probe_duration, transcribe_chunks_parallel
+)
+
+
+class TestTranscribeChunksParallel:
+    def test_ordered_reassembly(self):
+        def transcribe(chunk):
+            time.sleep(random.uniform(0, 0.02))
+            return f"текст {chunk}"
+
+        texts = transcribe_chunks_parallel(list(range(20)), transcribe, concurrency=5)
+
+        assert texts == [f"текст {i}" for i in range(20)]
+
+    def test_concurrency_bounded_and_parallel(self):
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def transcribe(chunk):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.05)
+            with lock:
+                active -= 1
+            return str(chunk)
+
+        started = time.monotonic()
+        transcribe_chunks_parallel(list(range(8)), transcribe, concurrency=4)
+
+        assert peak == 4
+        # 8 чанков по 0.05 сек при 4 потоках ~ 0.1 сек (последовательно - 0.4)
+        assert time.monotonic() - started < 0.3
+
+    def test_failed_chunk_retried(self):
+        attempts = {}
+
+        def transcribe(chunk):
+            attempts[chunk] = attempts.get(chunk, 0) + 1
+            if chunk == 1 and attempts[chunk] < 3:
+                raise ConnectionError("timeout")
+            return str(chunk)
+
+        texts = transcribe_chunks_parallel([0, 1, 2], transcribe, retries=3, backoff=0)
+
+        assert texts == ["0", "1", "2"]
+        assert attempts == {0: 1, 1: 3, 2: 1}
+
+    def test_exhausted_retries_raise(self):
+        def transcribe(chunk):
+            if chunk in (1, 3):
+                raise ConnectionError("timeout")
+            return str(chunk)
+
+        with pytest.raises(TranscriptionError) as exc_info:
+            transcribe_chunks_parallel([0, 1, 2, 3], transcribe, retries=1, backoff=0)
+
+        assert exc_info.value.failed_chunks == [1, 3]
+        assert exc_info.value.total_chunks == 4
+
+    def test_non_retryable_error_not_retried(self):
+        calls = []
+
+        def transcribe(chunk):
+            calls.append(chunk)
+            raise KeyError("invalid key")
+
+        with patch.object(transcription, "NON_RETRYABLE_ERRORS", (KeyError,)):
+            with pytest.raises(KeyError):
+                transcribe_chunks_parallel([0], transcribe, retries=3, backoff=0)
+
+        assert calls == [0]
+
+
+class TestStreamingSegmentation:
+    def test_plan_chunks_covers_duration(self):
+        chunks = plan_chunks(400.0, 180.0)
+
+        assert [(c.start_s, c.duration_s) for c in chunks] == [(0.0, 180.0), (180.0, 180.0), (360.0, 40.0)]
+        assert [c.index for c in chunks] == [0, 1, 2]
+        assert plan_chunks(0.0, 180.0) == []
+
+    def test_probe_duration_parses_ffprobe_output(self):
+        completed = subprocess.CompletedProcess([], 0, stdout="7261.48\n", stderr="")
+        with patch.object(transcription.subprocess, "run", return_value=completed) as run:
+            assert probe_duration("big.wav") == pytest.approx(7261.48)
+
+        assert run.call_args.args[0][0] == transcription.FFPROBE_BINARY
+        assert run.call_args.args[0][-1] == "big.wav"
+
+    def test_probe_duration_error(self):
+        completed = subprocess.CompletedProcess([], 1, stdout="", stderr="Invalid data found")
+        with patch.object(transcription.subprocess, "run", return_value=completed):
+            with pytest.raises(AudioDurationError):
+                probe_duration("broken.wav")
+
+    def test_probe_duration_falls_back_to_stream(self):
+        results = [
+            subprocess.CompletedProcess([], 0, stdout="N/A\n", stderr=""),
+            subprocess.CompletedProcess([], 0, stdout="95.5\n", stderr=""),
+        ]
+        with patch.object(transcription.subprocess, "run", side_effect=results) as run:
+            assert probe_duration("voice.webm") == pytest.approx(95.5)
+
+        assert "stream=duration" in run.call_args.args[0]
+
+    def test_probe_duration_unknown_raises(self):
+        completed = subprocess.CompletedProcess([], 0, stdout="N/A\n", stderr="")
+        with patch.object(transcription.subprocess, "run", return_value=completed):
+            with pytest.raises(AudioDurationError, match="длительность"):
+                probe_duration("voice.webm")
+
+    def test_export_chunk_seeks_before_input(self):
+        completed = subprocess.CompletedProcess([], 0, stdout=b"mp3-bytes", stderr=b"")
+        with patch.object(transcription.subprocess, "run", return_value=completed) as run:
+            data = export_chunk("big.wav", AudioChunk(index=2, start_s=360.0, duration_s=40.0))
+
+        args = run.call_args.args[0]
+        assert data == b"mp3-bytes"
+        # -ss до -i: переход к позиции без декодирования начала файла
+        assert args.index("-ss") < args.index("-i")
+        assert args[args.index("-ss") + 1] == "360.000"
+        assert args[args.index("-t") + 1] == "40.000"
+        assert args[-1] == "pipe:1"
+
+    def test_export_chunk_speech_profile(self):
+        completed = subprocess.CompletedProcess([], 0, stdout=b"ogg-bytes", stderr=b"")
+        with patch.object(transcription.subprocess, "run", return_value=completed) as run:
+            export_chunk("big.wav", AudioChunk(index=0, start_s=0.0, duration_s=180.0), get_upload_profile("speech_opus"))
+
+        args = run.call_args.args[0]
+        assert args[args.index("-ac") + 1] == "1"
+        assert args[args.index("-ar") + 1] == "16000"
+        assert args[args.index("-c:a") + 1] == "libopus"
+        assert args[args.index("-f") + 1] == "ogg"
+        # Кодирование - после входного файла
+        assert args.index("-c:a") > args.index("-i")
+
+    def test_unknown_profile_falls_back_to_speech_mp3(self):
+        assert get_upload_profile("flac-hd").name == "speech_mp3"
+        assert get_upload_profile("legacy").ffmpeg_args() == ["-c:a", "libmp3lame", "-f", "mp3"]
+
+
+SILENCEDETECT_STDERR = """Input #0, wav, from 'talk.wav':
+[silencedetect @ 0x1] silence_start: 171.2
+[silencedetect @ 0x1] silence_end: 171.6 | silence_duration: 0.4
+[silencedetect @ 0x1] silence_start: 188.0
+[silencedetect @ 0x1] silence_end: 189.5 | silence_duration: 1.5
+[silencedetect @ 0x1] silence_start: 395.0
+"""
+
+
+class TestSilenceBoundaries:
+    def test_detect_silences_parses_output(self):
+        completed = subprocess.CompletedProcess([], 0, stdout="", stderr=SILENCEDETECT_STDERR)
+        with patch.object(transcription.subprocess, "run", return_value=completed):
+            silences = detect_silences("talk.wav")
+
+        assert silences[:2] == [(171.2, 171.6), (188.0, 189.5)]
+        # Запись заканчивается паузой
+        assert silences[2] == (395.0, float("inf"))
+
+    def test_boundary_in_longest_silence_within_window(self):
+        silences = [(171.2, 171.6), (188.0, 189.5)]
+
+        chunks = plan_chunks_at_silences(400.0, silences, target_s=180, window_s=20, min_s=120, max_s=210)
+
+        assert chunks[1].start_s == 188.75
+        assert chunks[0].duration_s == 188.75
+        assert chunks[-1].start_s + chunks[-1].duration_s == 400.0
+
+    def test_hard_cut_without_silence_in_window(self):
+        chunks = plan_chunks_at_silences(380.0, [(50.0, 52.0)], target_s=180, window_s=20, min_s=120, max_s=210)
+
+        assert [c.start_s for c in chunks] == [0.0, 180.0]
+
+    def test_chunk_length_bounds(self):
+        # Пауза в окне, но за пределом максимальной длины чанка
+        silences = [(195.0, 198.0), (360.0, 361.0)]
+
+        chunks = plan_chunks_at_silences(600.0, silences, target_s=180, window_s=20, min_s=120, max_s=190)
+
+        assert all(c.duration_s <= 190 for c in chunks)
+        assert chunks[1].start_s == 180.0
+        assert chunks[2].start_s == 360.5
+
+    def test_deterministic(self):
+        silences = [(float(t), float(t) + 0.8) for t in range(7, 3600, 13)]
+
+        first = plan_chunks_at_silences(3600.0, silences, target_s=180)
+
+        assert first == plan_chunks_at_silences(3600.0, list(silences), target_s=180)
+        assert sum(c.duration_s for c in first) == pytest.approx(3600.0)
@@ -0,0 +1,145 @@
+"""
+Тесты бэкендов транскрибации.
+
+Проверяют:
+- Локальный faster-whisper: деление ядер CPU между workers, PCM 16 кГц на вход модели
+- Ошибку local без установленного faster_whisper и неизвестное имя бэкенда
+- Одну загрузку локальной модели на процесс
+- Загрузку чанка в Whisper API профилем загрузки (openai)
+- Обязательные методы бэкенда (абстрактный TranscriptionBackend)
+- Отдельный ключ кэша транскрипций для локальной модели (из cache_params бэкенда)
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import transcription
+import transcription_backends
+import transcription_cache
+from transcription import AudioChunk
+from transcription_backends import LocalWhisperBackend, get_transcription_backend
+
+
+class FakeWhisperModel:
+    """WhisperModel faster-whisper: запоминает параметры и входное аудио."""
+
+    instances: list["FakeWhisperModel"] = []
+
+    def __init__(self, model, **kwargs):
+        self.model = model
+        self.kwargs = kwargs
+        self.audio = None
+        FakeWhisperModel.instances.append(self)
+
+    def transcribe(self, audio, language=None, beam_size=5):
+        self.audio = audio
+        segments = (SimpleNamespace(text=text) for text in [" Добрый день.", " Нужен номер на двоих. "])
+        return segments, SimpleNamespace(language=language)
+
+
+def local_backend_patches(cpu_count=8):
+    return (
+        patch.object(transcription_backends, "WhisperModel", FakeWhisperModel),
+        patch.object(transcription_backends, "_faster_whisper_available", True),
+        patch.object(transcription_backends.os, "cpu_count", return_value=cpu_count),
+    )
+
+
+class TestLocalBackend:
+    def test_cores_split_between_workers(self):
+        model_patch, available_patch, cpu_patch = local_backend_patches(cpu_count=8)
+        with model_patch, available_patch, cpu_patch:
+            backend = LocalWhisperBackend(model="small", compute_type="int8", workers=2, cpu_threads=0)
+
+        assert backend.concurrency == 2
+        assert backend.model.kwargs == {"device": "cpu", "compute_type": "int8", "cpu_threads": 4, "num_workers": 2}
+
+    def test_chunk_decoded_to_pcm(self):
+        samples = np.array([0, 16384, -32768], dtype=np.int16)
+        completed = subprocess.CompletedProcess([], 0, stdout=samples.tobytes(), stderr=b"")
+        model_patch, available_patch, cpu_patch = local_backend_patches()
+        with model_patch, available_patch, cpu_patch:
+            backend = LocalWhisperBackend(model="small", workers=1, language="ru")
+        with patch.object(transcription.subprocess, "run", return_value=completed) as run:
+            text = backend.transcribe_chunk("/tmp/interview.m4a", AudioChunk(0, 0.0, 180.0))
+
+        args = run.call_args.args[0]
+        assert args[args.index("-f") + 1] == "s16le"
+        assert args[args.index("-ar") + 1] == "16000"
+        assert backend.model.audio.dtype == np.float32
+        assert backend.model.audio.tolist() == [0.0, 0.5, -1.0]
+        assert text == "Добрый день. Нужен номер на двоих."
+
+    def test_missing_faster_whisper(self):
+        with patch.object(transcription_backends, "_faster_whisper_available", False):
+            with pytest.raises(RuntimeError, match="faster-whisper"):
+                LocalWhisperBackend()
+
+
+class TestBackendSelection:
+    def test_local_model_loaded_once(self):
+        FakeWhisperModel.instances = []
+        model_patch, available_patch, cpu_patch = local_backend_patches()
+        with model_patch, available_patch, cpu_patch, \
+                patch.object(transcription_backends, "_local_backend", None):
+            first = get_transcription_backend("local")
+            second = get_transcription_backend("local")
+
+        assert first is second
+        assert len(FakeWhisperModel.instances) == 1
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            get_transcription_backend("gpu-cluster")
+
+    def test_openai_backend_uploads_encoded_chunk(self):
+        completed = subprocess.CompletedProcess([], 0, stdout=b"ogg-bytes", stderr=b"")
+        backend = get_transcription_backend("openai", model_name="whisper-1", api_key="sk-test", upload_profile="speech_opus")
+        create = MagicMock(return_value=SimpleNamespace(text="Добрый день."))
+
+        backend.client = SimpleNamespace(audio=SimpleNamespace(transcriptions=SimpleNamespace(create=create)))
+
+        with patch.object(transcription.subprocess, "run", return_value=completed):
+            text = backend.transcribe_chunk("/tmp/interview.m4a", AudioChunk(0, 0.0, 180.0))
+
+        uploaded = create.call_args.kwargs["file"]
+        assert text == "Добрый день."
+        assert create.call_args.kwargs["model"] == "whisper-1"
+        assert uploaded.name == "chunk.ogg" and uploaded.getvalue() == b"ogg-bytes"
+
+
+class TestBackendInterface:
+    def test_backend_must_implement_methods(self):
+        class ChunkOnlyBackend(transcription_backends.TranscriptionBackend):
+            def transcribe_chunk(self, file_path, chunk):
+                return ""
+
+        with pytest.raises(TypeError):
+            ChunkOnlyBackend()
+
+
+class TestCacheKey:
+    def test_local_backend_has_own_cache_key(self):
+        remote_backend = get_transcription_backend("openai", model_name="whisper-1", api_key="sk-test")
+        model_patch, available_patch, cpu_patch = local_backend_patches()
+        with model_patch, available_patch, cpu_patch:
+            local_backend = LocalWhisperBackend(model="small", language="ru", beam_size=3)
+
+        remote = transcription_cache.transcription_params(remote_backend)
+        local = transcription_cache.transcription_params(local_backend)
+
+        assert "backend" not in remote
+        assert local["backend"] == "local"
+        assert local["model"] == "small" and local["language"] == "ru" and local["beam_size"] == 3
+        assert "upload_profile" not in local
+        assert transcription_cache.transcription_cache_key("abc", remote) != \
+            transcription_cache.transcription_cache_key("abc", local)
@@ -0,0 +1,110 @@
+"""
+Тесты кэша транскрипций по SHA-256 аудио.
+
+Проверяют:
+- Хэш содержимого файла и имя объекта MinIO по хэшу
+- Смену ключа при изменении параметров транскрибации
+- Повторную транскрибацию той же записи из кэша (без вызова Whisper)
+- Работу без кэша при недоступном MinIO
+"""
+
+import hashlib
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import transcription_cache
+from transcription_cache import (
+    TranscriptionCache, audio_object_name, file_sha256, transcribe_with_cache, transcription_cache_key
+)
+
+
+class FakeStorage:
+    """Текстовые объекты в памяти вместо MinIO."""
+
+    def __init__(self):
+        self.objects: dict[str, str] = {}
+
+    def get_text_object(self, object_name):
+        return self.objects.get(object_name)
+
+    def put_text_object(self, object_name, text, metadata=None):
+        self.objects[object_name] = text
+        return True
+
+
+class BrokenStorage:
+    def get_text_object(self, object_name):
+        raise ConnectionError("MinIO недоступен")
+
+    def put_text_object(self, object_name, text, metadata=None):
+        raise ConnectionError("MinIO недоступен")
+
+
+def write_audio(tmp_path, name="interview.WAV", data=b"RIFF" + b"\x01" * 5000):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+class TestIdentity:
+    def test_file_sha256_matches_content(self, tmp_path):
+        path = write_audio(tmp_path)
+
+        with patch.object(transcription_cache, "HASH_BLOCK_SIZE", 1000):
+            assert file_sha256(path) == hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+    def test_object_name_from_hash(self):
+        assert audio_object_name("abc123", "Интервью 1.WAV") == "abc123.wav"
+
+    def test_key_depends_on_params(self):
+        base = {"model": "whisper-1", "chunk_length_ms": 180000}
+
+        assert transcription_cache_key("abc", base) == transcription_cache_key("abc", dict(base))
+        assert transcription_cache_key("abc", base) != transcription_cache_key("abc", dict(base, model="other"))
+        assert transcription_cache_key("abc", base).startswith("abc_")
+
+
+class TestTranscribeWithCache:
+    def test_reupload_served_from_cache(self, tmp_path):
+        first = write_audio(tmp_path, "voice_1.ogg")
+        reupload = write_audio(tmp_path, "voice_2.ogg")
+        calls = []
+
+        def transcribe(path):
+            calls.append(path)
+            return "Текст интервью"
+
+        with patch.object(transcription_cache, "TRANSCRIPTION_CACHE_ENABLED", True), \
+                patch.object(transcription_cache, "_cache", TranscriptionCache(FakeStorage())):
+            assert transcribe_with_cache(first, transcribe) == "Текст интервью"
+            assert transcribe_with_cache(reupload, transcribe) == "Текст интервью"
+
+        assert calls == [first]
+
+    def test_empty_transcript_not_cached(self, tmp_path):
+        path = write_audio(tmp_path)
+        storage = FakeStorage()
+
+        with patch.object(transcription_cache, "TRANSCRIPTION_CACHE_ENABLED", True), \
+                patch.object(transcription_cache, "_cache", TranscriptionCache(storage)):
+            transcribe_with_cache(path, lambda _: "")
+
+        assert storage.objects == {}
+
+    def test_storage_errors_fall_back_to_transcription(self, tmp_path):
+        path = write_audio(tmp_path)
+
+        with patch.object(transcription_cache, "TRANSCRIPTION_CACHE_ENABLED", True), \
+                patch.object(transcription_cache, "_cache", TranscriptionCache(BrokenStorage())):
+            assert transcribe_with_cache(path, lambda _: "Текст") == "Текст"
+
+    def test_disabled_skips_hashing(self, tmp_path):
+        with patch.object(transcription_cache, "TRANSCRIPTION_CACHE_ENABLED", False), \
+                patch.object(transcription_cache, "file_sha256") as sha:
+            assert transcribe_with_cache(str(tmp_path / "missing.wav"), lambda _: "Текст") == "Текст"
+
+        sha.assert_not_called()
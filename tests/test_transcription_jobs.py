@@ -0,0 +1,105 @@
+"""
+Тесты возобновляемой транскрибации (чекпоинты по чанкам).
+
+Проверяют:
+- Сохранение каждого чанка сразу после распознавания
+- Продолжение задачи после сбоя без повторного распознавания готовых чанков
+- Сброс чекпоинта при изменении плана чанков
+- Статус прерванной задачи и строку прогресса для /transcription
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Добавить src в PYTHONPATH для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from transcription import AudioChunk, TranscriptionError, plan_chunks
+from transcription_jobs import (
+    JOB_STATUS_DONE, JOB_STATUS_FAILED, JOB_STATUS_INTERRUPTED,
+    TranscriptionJobStore, format_job_progress, transcribe_chunks_resumable
+)
+
+
+CHUNKS = plan_chunks(500.0, 100.0)
+
+
+class FlakyWhisper:
+    """Распознает чанки, кроме перечисленных в failing."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls: list[int] = []
+
+    def __call__(self, chunk: AudioChunk) -> str:
+        self.calls.append(chunk.index)
+        if chunk.index in self.failing:
+            raise ConnectionError("timeout")
+        return f"текст {chunk.index}"
+
+
+def run(store, whisper, chunks=CHUNKS, job_id="job-1"):
+    return transcribe_chunks_resumable(
+        job_id, chunks, whisper, chat_id=42, file_name="talk.wav", retries=0, backoff=0, store=store
+    )
+
+
+class TestResumableTranscription:
+    def test_resume_after_failure(self, tmp_path):
+        store = TranscriptionJobStore(tmp_path)
+
+        with pytest.raises(TranscriptionError) as exc_info:
+            transcribe_chunks_resumable(
+                "job-1", CHUNKS, FlakyWhisper(failing={3}), chat_id=42, concurrency=2, retries=0, backoff=0, store=store
+            )
+        assert exc_info.value.failed_chunks == [3]
+        assert store.load("job-1")["status"] == JOB_STATUS_FAILED
+
+        # Повторный запуск (новый процесс) распознает только упавший чанк
+        whisper = FlakyWhisper()
+        texts = run(TranscriptionJobStore(tmp_path), whisper)
+
+        assert whisper.calls == [3]
+        assert texts == [f"текст {i}" for i in range(5)]
+        assert store.load("job-1")["status"] == JOB_STATUS_DONE
+
+    def test_chunk_checkpointed_before_job_ends(self, tmp_path):
+        store = TranscriptionJobStore(tmp_path)
+        seen_done = []
+
+        def whisper(chunk):
+            job = store.load("job-1")
+            seen_done.append(sum(1 for record in job["chunks"].values() if record["status"] == "done"))
+            return "текст"
+
+        transcribe_chunks_resumable("job-1", CHUNKS, whisper, store=store, concurrency=1)
+
+        assert seen_done == [0, 1, 2, 3, 4]
+
+    def test_changed_plan_restarts_job(self, tmp_path):
+        store = TranscriptionJobStore(tmp_path)
+        run(store, FlakyWhisper())
+
+        whisper = FlakyWhisper()
+        run(store, whisper, chunks=plan_chunks(500.0, 250.0))
+
+        assert whisper.calls == [0, 1]
+
+
+class TestProgress:
+    def test_interrupted_job_shown_with_progress(self, tmp_path):
+        store = TranscriptionJobStore(tmp_path)
+        store.start("job-1", CHUNKS, chat_id=42, file_name="talk.wav")
+        store.record_chunk("job-1", 0, "текст 0")
+        store.record_chunk("job-1", 1, "текст 1")
+
+        # Бот перезапущен: задача "running" без исполнителя
+        jobs = TranscriptionJobStore(tmp_path).list_jobs(42)
+
+        assert [job["status"] for job in jobs] == [JOB_STATUS_INTERRUPTED]
+        progress = format_job_progress(jobs[0])
+        assert "talk.wav" in progress
+        assert "2/5" in progress
+        assert TranscriptionJobStore(tmp_path).list_jobs(7) == []